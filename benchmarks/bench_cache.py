@@ -0,0 +1,100 @@
+"""
+Benchmark du cache des lectures (GestionnaireDeTable(..., taille_cache=...), voir serveur/cache.py)
+pour une table de chaque stockage (format 2 en lignes, en colonnes, format 3 compact) :
+- pages : parcours de toute la table sans cache, puis avec les pages décodées en cache,
+  puis juste après l'INSERT d'une ligne (seule la derniere page est relue)
+- résultats : le meme SELECT filtré répété par MoteurSQL, sans cache puis avec le cache des résultats
+chaque durée est le meilleur de 5 essais ; les compteurs du cache sont affichés a la fin
+
+usage : python benchmarks/bench_cache.py [nbr_lignes] [taille_cache_mo]
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+TAILLE_LOT = 50000
+STOCKAGES = ('row', 'columnar', 'compact')
+REQUETE = "SELECT cle, nom FROM bench_{stockage} WHERE taille > 45.5 AND actif = true"
+
+
+def verifier(resultat):
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def remplir(moteur, stockage, nbr_lignes):
+    nom_table = f'bench_{stockage}'
+    verifier(moteur.executer(
+        f"CREATE TABLE {nom_table} (cle INT, taille FLOAT, nom TEXT, actif BOOL) WITH (storage = '{stockage}')"))
+    for debut in range(0, nbr_lignes, TAILLE_LOT):
+        moteur.executemany(f"INSERT INTO {nom_table} VALUES (?, ?, ?, ?)", [
+            (i, 1.5 + i % 50, f'nom {i % 1000}', i % 2 == 0) for i in range(debut, min(debut + TAILLE_LOT, nbr_lignes))
+        ])
+
+
+def chronometrer(fonction, avant=None):
+    """le meilleur de 5 essais, et le dernier résultat. avant : appelée (hors chrono) avant chaque essai"""
+    durees = []
+    for _ in range(5):
+        if avant is not None:
+            avant()
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+    return min(durees), resultat
+
+
+def main():
+    nbr_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    taille_cache = (int(sys.argv[2]) if len(sys.argv) > 2 else 256) << 20
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        sans_cache = MoteurSQL(dossier)
+        for stockage in STOCKAGES:
+            remplir(sans_cache, stockage, nbr_lignes)
+        avec_cache = MoteurSQL(dossier, taille_cache=taille_cache) #meme dossier : memes tables
+        print(f"{nbr_lignes} lignes par table, cache de {taille_cache >> 20} Mo")
+
+        for stockage in STOCKAGES:
+            nom_table = f'bench_{stockage}'
+            print(f"\n{stockage}")
+            gestionnaires = (sans_cache.gestionnaire, avec_cache.gestionnaire)
+            parcours = [lambda g=gestionnaire: len(g.lire_table(nom_table)) for gestionnaire in gestionnaires]
+            froid, reference = chronometrer(parcours[0])
+            chaud, lues = chronometrer(parcours[1])
+            if lues != reference:
+                raise Exception(f"{stockage} : {lues} lignes lues avec le cache, {reference} sans")
+            numeros = iter(range(nbr_lignes, nbr_lignes + 5))
+            ajout, _ = chronometrer(parcours[1], lambda: avec_cache.gestionnaire.inserer_ligne(nom_table, {
+                'cle': next(numeros), 'taille': 1.5, 'nom': 'ajout', 'actif': True}))
+            print(f"  toute la table    sans cache {froid:7.3f} s   pages en cache {chaud:7.3f} s   x{froid / chaud:6.1f}"
+                  f"   après un INSERT {ajout:7.3f} s")
+
+            requete = REQUETE.format(stockage=stockage)
+            froid, reference = chronometrer(lambda: verifier(sans_cache.executer(requete)))
+            chaud, lignes = chronometrer(lambda: verifier(avec_cache.executer(requete)))
+            if lignes != reference:
+                raise Exception(f"{stockage} : résultat différent avec le cache")
+            print(f"  SELECT filtré     sans cache {froid:7.3f} s   résultat en cache {chaud:7.3f} s   x{froid / chaud:6.0f}"
+                  f"   {len(lignes)} ligne(s)")
+
+        statistiques = avec_cache.gestionnaire.cache.statistiques()
+        print("\ncache : " + ", ".join(f"{nom} {valeur}" for nom, valeur in statistiques.items()))
+        sans_cache.gestionnaire.fermer()
+        avec_cache.gestionnaire.fermer()
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
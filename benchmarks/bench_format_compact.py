@@ -0,0 +1,127 @@
+"""
+Benchmark du format 3 (lignes compactes : bitmap des nulls, varints, BOOL dans le bitmap) contre le format 1
+(un marqueur par valeur, 4 octets de padding par null, longueur des textes sur 4 octets) et le format 2 (slots + tas)
+sur deux tables :
+- dense : cle INT, taille FLOAT, nom TEXT, actif BOOL, sans null
+- clairsemée : 10 colonnes (petits entiers, textes courts, BOOL), environ 60 % de null
+pour chacune : octets par ligne (table + tas), puis durée d'un parcours de toute la table, d'une seule colonne INT
+et d'un parcours filtré sur une colonne : meilleur et médiane de NBR_ESSAIS essais (l'écart entre les deux
+montre le bruit de la machine)
+
+usage : python benchmarks/bench_format_compact.py [nbr_lignes]
+"""
+
+import sys
+import os
+import time
+import statistics
+import random
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.stockage import GestionnaireDeTable
+
+TAILLE_LOT = 50000
+NBR_ESSAIS = 7
+FORMATS = (1, 2, 3)
+DENSE = [('cle', 'INT'), ('taille', 'FLOAT'), ('nom', 'TEXT'), ('actif', 'BOOL')]
+CLAIRSEMEE = [('capteur', 'INT'), ('etat', 'INT'), ('code', 'TEXT'), ('note', 'TEXT'), ('valeur', 'FLOAT'),
+              ('alerte', 'BOOL'), ('valide', 'BOOL'), ('manuel', 'BOOL'), ('essai', 'INT'), ('zone', 'TEXT')]
+
+
+def ligne_dense(i, hasard):
+    return {'cle': i, 'taille': 1.5 + i % 50, 'nom': f'nom {i % 1000}', 'actif': i % 2 == 0}
+
+
+def ligne_clairsemee(i, hasard):
+    def peut_etre(valeur, proportion=0.6):
+        return None if hasard.random() < proportion else valeur
+    return {
+        'capteur': i % 200, 'etat': peut_etre(hasard.randrange(4)), 'code': peut_etre(f'C{hasard.randrange(100)}'),
+        'note': peut_etre('a vérifier', 0.95), 'valeur': peut_etre(hasard.random() * 100, 0.5),
+        'alerte': peut_etre(hasard.random() < 0.1), 'valide': peut_etre(True), 'manuel': peut_etre(False, 0.9),
+        'essai': peut_etre(hasard.randrange(-10, 10), 0.8), 'zone': peut_etre('nord', 0.7),
+    }
+
+
+TABLES = [
+    ('dense', DENSE, ligne_dense, 'cle', lambda valeurs: valeurs[1] % 10 == 0),
+    ('clairsemée', CLAIRSEMEE, ligne_clairsemee, 'capteur', lambda valeurs: valeurs[1] == 7),
+]
+
+
+def remplir(gestionnaire, nom_table, colonnes, fabriquer, nbr_lignes, version):
+    gestionnaire.creer_table(nom_table, list(colonnes), version=version)
+    hasard = random.Random(1) #les memes lignes pour chaque format
+    for debut in range(0, nbr_lignes, TAILLE_LOT):
+        gestionnaire.inserer_lignes(nom_table, [
+            fabriquer(i, hasard) for i in range(debut, min(debut + TAILLE_LOT, nbr_lignes))
+        ])
+
+
+def taille_fichiers(gestionnaire, nom_table):
+    """octets de la table et de son tas (format 2)"""
+    chemins = [gestionnaire.chemin_table(nom_table), gestionnaire.chemin_tas(nom_table)]
+    return sum(os.path.getsize(chemin) for chemin in chemins if os.path.exists(chemin))
+
+
+def mesures(gestionnaire, nom_table, colonne_int, filtre):
+    """les parcours chronométrés : [(nom, fonction)]. Le _id n'est pas renvoyé (texte aléatoire au format 1)"""
+    return [
+        ('toute la table', lambda: [{k: v for k, v in ligne.items() if k != '_id'}
+                                    for ligne in gestionnaire.iter_lignes(nom_table)]),
+        (f'une colonne ({colonne_int})',
+         lambda: [ligne[colonne_int] for ligne in gestionnaire.iter_lignes(nom_table, [colonne_int])]),
+        ('filtré', lambda: sum(1 for _ in gestionnaire.iter_lignes(
+            nom_table, None, filtre=filtre, colonnes_filtre=[colonne_int]))),
+    ]
+
+
+def chronometrer(fonctions):
+    """
+    le meilleur et la médiane des essais de chaque fonction, et leurs résultats (pour vérifier que tous les formats
+    donnent le meme). Chaque essai passe par tous les formats : un ralentissement de la machine les touche tous
+    """
+    durees = [[] for _ in fonctions]
+    resultats = [None] * len(fonctions)
+    for _ in range(NBR_ESSAIS):
+        for numero, fonction in enumerate(fonctions):
+            debut = time.perf_counter()
+            resultats[numero] = fonction()
+            durees[numero].append(time.perf_counter() - debut)
+    return [(min(duree), statistics.median(duree)) for duree in durees], resultats
+
+
+def main():
+    nbr_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        gestionnaire = GestionnaireDeTable(dossier, avec_journal=False)
+        print(f"{nbr_lignes} lignes par table, meilleur / médiane de {NBR_ESSAIS} essais")
+        for nom, colonnes, fabriquer, colonne_int, filtre in TABLES:
+            print(f"\ntable {nom} ({len(colonnes)} colonnes)")
+            tables = {}
+            for version in FORMATS:
+                nom_table = tables[version] = f"bench_{nom[:5]}_v{version}"
+                remplir(gestionnaire, nom_table, colonnes, fabriquer, nbr_lignes, version)
+                print(f"  format {version} : {taille_fichiers(gestionnaire, nom_table) / nbr_lignes:6.1f} o/ligne")
+
+            parcours = {version: mesures(gestionnaire, nom_table, colonne_int, filtre)
+                        for version, nom_table in tables.items()}
+            for numero, (mesure, _) in enumerate(parcours[FORMATS[0]]):
+                durees, resultats = chronometrer([parcours[version][numero][1] for version in FORMATS])
+                if any(resultat != resultats[0] for resultat in resultats):
+                    raise Exception(f"{nom} : résultat différent selon le format pour '{mesure}'")
+                print(f"  {mesure:<22}" + "".join(
+                    f"   format {version} {meilleur:6.3f} / {mediane:6.3f} s"
+                    for version, (meilleur, mediane) in zip(FORMATS, durees)))
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
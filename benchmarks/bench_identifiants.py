@@ -0,0 +1,80 @@
+"""
+Benchmark des _id : SERIAL (16 caracteres aléatoires dans le tas, l'ancien _id) contre BIGSERIAL
+(compteur de l'en-tête, 8 octets dans la ligne) pour une table au format 2, en lignes puis en colonnes
+- octets par ligne : table + tas (ou fichiers des colonnes), divisés par le nombre de lignes
+- executemany : lignes/s d'un gros lot (génération des _id comprise)
+- INSERT d'une ligne : latence moyenne dans une transaction (sans fsync), puis validée seule (journal synchronisé)
+
+usage : python benchmarks/bench_identifiants.py [nbr_lignes] [nbr_insert]
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+IDENTIFIANTS = (('SERIAL', "_id SERIAL, "), ('BIGSERIAL', "")) #BIGSERIAL : le _id par défaut
+
+
+def verifier(resultat):
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def octets_table(moteur, nom_table):
+    """la taille de tous les fichiers de la table (sans ses index)"""
+    gestionnaire = moteur.gestionnaire
+    chemins = [gestionnaire.chemin_table(nom_table), gestionnaire.chemin_tas(nom_table)]
+    chemins += gestionnaire.fichiers_colonnes(nom_table)
+    return sum(os.path.getsize(chemin) for chemin in chemins if os.path.exists(chemin))
+
+
+def main():
+    nbr_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    nbr_insert = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    lignes = [(i, f'nom_{i % 100}') for i in range(nbr_lignes)]
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        moteur = MoteurSQL(dossier)
+        print(f"{nbr_lignes} lignes (cle INT, nom TEXT), {nbr_insert} INSERT d'une ligne")
+        for stockage in ('row', 'columnar'):
+            for type_id, colonne_id in IDENTIFIANTS:
+                nom_table = f'{type_id.lower()}_{stockage}'
+                verifier(moteur.executer(
+                    f"CREATE TABLE {nom_table} ({colonne_id}cle INT, nom TEXT) WITH (storage = '{stockage}')"))
+                vide = octets_table(moteur, nom_table)
+
+                debut = time.perf_counter()
+                moteur.executemany(f"INSERT INTO {nom_table} VALUES (?, ?)", lignes)
+                debit = nbr_lignes / (time.perf_counter() - debut)
+                par_ligne = (octets_table(moteur, nom_table) - vide) / nbr_lignes
+
+                verifier(moteur.executer("BEGIN"))
+                debut = time.perf_counter()
+                for i in range(nbr_insert):
+                    verifier(moteur.executer(f"INSERT INTO {nom_table} VALUES ({i}, 'nouveau')"))
+                transaction = (time.perf_counter() - debut) / nbr_insert * 1e6
+                verifier(moteur.executer("ROLLBACK"))
+
+                debut = time.perf_counter()
+                for i in range(nbr_insert // 10): #un fsync par requete
+                    verifier(moteur.executer(f"INSERT INTO {nom_table} VALUES ({i}, 'nouveau')"))
+                seule = (time.perf_counter() - debut) / (nbr_insert // 10) * 1e6
+
+                print(f"{stockage:<9} {type_id:<10} {par_ligne:6.1f} o/ligne   executemany {debit:9.0f} lignes/s"
+                      f"   INSERT : transaction {transaction:7.1f} us   validé seul {seule:8.1f} us")
+        moteur.gestionnaire.fermer()
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
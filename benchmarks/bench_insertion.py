@@ -0,0 +1,87 @@
+"""
+Benchmark des insertions : lignes/seconde selon la méthode utilisée
+- une requete INSERT par ligne (boucle sur executer)
+- un INSERT multi-lignes : VALUES (...), (...), ...
+- executemany
+- COPY FROM un fichier CSV
+
+usage : python benchmarks/bench_insertion.py [nbr_lignes]
+"""
+
+import sys
+import os
+import csv
+import time
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+
+def generer_lignes(nbr_lignes):
+    """des lignes synthétiques (nom, age, taille, actif)"""
+    return [(f'nom_{i}', i % 90, 1.5 + i % 50, i % 2 == 0) for i in range(nbr_lignes)]
+
+
+def en_sql(ligne):
+    """formatte un tuple python en tuple SQL"""
+    nom, age, taille, actif = ligne
+    return f"('{nom}', {age}, {taille}, {'true' if actif else 'false'})"
+
+
+def chronometrer(nom, nbr_lignes, fonction):
+    """execute la fonction et affiche le débit en lignes/seconde"""
+    debut = time.perf_counter()
+    fonction()
+    duree = time.perf_counter() - debut
+    print(f"{nom:<28} {duree:8.3f} s {nbr_lignes / duree:12.0f} lignes/s")
+    return duree
+
+
+def main():
+    nbr_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    lignes = generer_lignes(nbr_lignes)
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        moteur = MoteurSQL(dossier)
+        creation = "CREATE TABLE {} (nom TEXT, age INT, taille FLOAT, actif BOOL)"
+        for table in ('boucle', 'multi', 'many', 'copie'):
+            moteur.executer(creation.format(table))
+
+        print(f"{nbr_lignes} lignes")
+
+        def boucle():
+            for ligne in lignes:
+                moteur.executer(f"INSERT INTO boucle VALUES {en_sql(ligne)}")
+
+        def multi():
+            moteur.executer("INSERT INTO multi VALUES " + ", ".join(en_sql(ligne) for ligne in lignes))
+
+        def many():
+            moteur.executemany("INSERT INTO many VALUES (?, ?, ?, ?)", lignes)
+
+        chemin_csv = os.path.join(dossier, 'lignes.csv')
+        with open(chemin_csv, 'w', newline='', encoding='utf-8') as fichier:
+            csv.writer(fichier).writerows(lignes)
+
+        def copie():
+            moteur.executer(f"COPY copie FROM '{chemin_csv}'")
+
+        reference = chronometrer("executer en boucle", nbr_lignes, boucle)
+        for nom, fonction in (("INSERT multi-lignes", multi), ("executemany", many), ("COPY FROM csv", copie)):
+            duree = chronometrer(nom, nbr_lignes, fonction)
+            print(f"{'':<28} x{reference / duree:.1f} par rapport a la boucle")
+
+        for table in ('boucle', 'multi', 'many', 'copie'): #toutes les méthodes doivent donner le meme nombre de lignes
+            resultat = moteur.executer(f"SELECT * FROM {table}")
+            assert len(resultat['data']) == nbr_lignes, (table, resultat['message'])
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
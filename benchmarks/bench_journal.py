@@ -0,0 +1,73 @@
+"""
+Benchmark du journal (write-ahead log) : commits/seconde selon le nombre de threads qui écrivent,
+avec et sans commit groupé (les validations simultanées partagent un fsync)
+Chaque thread fait des INSERT d'une ligne dans sa propre table : un INSERT = un commit
+
+usage : python benchmarks/bench_journal.py [nbr_commits_par_thread]
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.stockage import GestionnaireDeTable
+
+NBR_THREADS = (1, 4, 16)
+
+
+def mesurer(dossier, nbr_threads, nbr_commits, commit_groupe):
+    """lance nbr_threads threads de nbr_commits INSERT chacun, renvoie (durée, nbr de fsync du journal)"""
+    gestionnaire = GestionnaireDeTable(dossier, commit_groupe=commit_groupe)
+    try:
+        tables = [f't{commit_groupe:d}_{nbr_threads}_{i}' for i in range(nbr_threads)]
+        for table in tables:
+            gestionnaire.creer_table(table, [('nom', 'TEXT'), ('age', 'INT')])
+        gestionnaire.point_de_controle()
+        fsync_avant = gestionnaire.journal.nbr_fsync
+
+        def ecrire(table):
+            for i in range(nbr_commits):
+                gestionnaire.inserer_lignes(table, [{'nom': f'nom_{i}', 'age': i % 90}])
+
+        threads = [threading.Thread(target=ecrire, args=(table,)) for table in tables]
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duree = time.perf_counter() - debut
+
+        for table in tables: #aucun commit perdu
+            assert gestionnaire.compter_lignes(table) == nbr_commits, table
+        return duree, gestionnaire.journal.nbr_fsync - fsync_avant
+    finally:
+        gestionnaire.fermer()
+
+
+def main():
+    nbr_commits = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        print(f"{nbr_commits} commits par thread")
+        for nbr_threads in NBR_THREADS:
+            total = nbr_threads * nbr_commits
+            resultats = {}
+            for commit_groupe in (False, True):
+                duree, nbr_fsync = mesurer(dossier, nbr_threads, nbr_commits, commit_groupe)
+                resultats[commit_groupe] = duree
+                nom = f"{nbr_threads} thread(s), {'groupé' if commit_groupe else 'un fsync/commit'}"
+                print(f"{nom:<34} {duree:8.3f} s {total / duree:10.0f} commits/s {nbr_fsync:8} fsync")
+            print(f"{'':<34} x{resultats[False] / resultats[True]:.1f} avec le commit groupé")
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
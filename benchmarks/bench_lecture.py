@@ -0,0 +1,75 @@
+"""
+Benchmark des parcours de table : débit de lire_table en Mo/s et en lignes/s
+- format 1 : lignes de taille variable, décodées valeur par valeur (decoder_ligne)
+- format 2 : slots de taille fixe décodés par bloc avec le struct.Struct de la table, colonne par colonne
+chacun lu avec read() par blocs de 64 Ko, puis avec le fichier projeté en mémoire (mmap),
+pour toutes les colonnes puis pour une seule colonne INT (les textes ne sont alors pas décodés)
+
+usage : python benchmarks/bench_lecture.py [nbr_lignes]
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.stockage import GestionnaireDeTable
+
+COLONNES = [('cle', 'INT'), ('taille', 'FLOAT'), ('nom', 'TEXT'), ('actif', 'BOOL')]
+TAILLE_LOT = 50000
+
+
+def remplir(gestionnaire, nom_table, nbr_lignes, version):
+    gestionnaire.creer_table(nom_table, COLONNES, version=version)
+    for debut in range(0, nbr_lignes, TAILLE_LOT):
+        gestionnaire.inserer_lignes(nom_table, [
+            {'cle': i, 'taille': 1.5 + i % 50, 'nom': f'nom numéro {i}', 'actif': i % 2 == 0}
+            for i in range(debut, min(debut + TAILLE_LOT, nbr_lignes))
+        ])
+
+
+def taille_fichiers(gestionnaire, nom_table):
+    """octets de la table et de son tas (format 2)"""
+    chemins = [gestionnaire.chemin_table(nom_table), gestionnaire.chemin_tas(nom_table)]
+    return sum(os.path.getsize(chemin) for chemin in chemins if os.path.exists(chemin))
+
+
+def chronometrer(nom, octets, fonction):
+    """le meilleur de 3 essais, affiché en Mo/s et lignes/s"""
+    durees = []
+    for _ in range(3):
+        debut = time.perf_counter()
+        nbr_lignes = fonction()
+        durees.append(time.perf_counter() - debut)
+    duree = min(durees)
+    print(f"{nom:<40} {duree:8.3f} s {octets / duree / 1e6:9.1f} Mo/s {nbr_lignes / duree:12.0f} lignes/s")
+
+
+def main():
+    nbr_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        gestionnaire = GestionnaireDeTable(dossier, avec_journal=False)
+        for version in (1, 2):
+            nom_table = f'bench_v{version}'
+            remplir(gestionnaire, nom_table, nbr_lignes, version)
+            octets = taille_fichiers(gestionnaire, nom_table)
+            print(f"format {version} : {nbr_lignes} lignes, {octets / 1e6:.1f} Mo")
+            for lecture_mmap in (False, True):
+                gestionnaire.lecture_mmap = lecture_mmap
+                methode = 'mmap' if lecture_mmap else 'read'
+                chronometrer(f"  lire_table, {methode}", octets,
+                             lambda: len(gestionnaire.lire_table(nom_table)))
+                chronometrer(f"  une colonne INT, {methode}", octets,
+                             lambda: sum(1 for _ in gestionnaire.iter_lignes(nom_table, ['cle'])))
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark des parcours parallèles : meme requete avec 1 a N processus (MoteurSQL(parallel_workers=...))
+- SELECT filtré : les lignes gardées sont décodées dans les processus puis renvoyées au programme principal
+- COUNT / SUM filtrés : seuls les agrégats partiels de chaque plage reviennent
+1 processus = le parcours habituel, dans le programme. Le démarrage du pool n'est pas compté (requete d'échauffement)
+
+usage : python benchmarks/bench_parallele.py [nbr_lignes] [max_processus]
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+TAILLE_LOT = 50000
+REQUETES = [
+    ('SELECT filtré', "SELECT cle, nom FROM bench WHERE taille > 40.5 AND nom LIKE 'nom 1%'"),
+    ('COUNT / SUM', "SELECT COUNT(*), SUM(cle), SUM(taille) FROM bench WHERE actif = true"),
+    ('COUNT / SUM GROUP BY', "SELECT actif, COUNT(*), SUM(taille) FROM bench GROUP BY actif"),
+]
+
+
+def verifier(resultat):
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def remplir(moteur, nbr_lignes):
+    verifier(moteur.executer("CREATE TABLE bench (cle INT, taille FLOAT, nom TEXT, actif BOOL)"))
+    for debut in range(0, nbr_lignes, TAILLE_LOT):
+        moteur.executemany("INSERT INTO bench VALUES (?, ?, ?, ?)", [
+            (i, 1.5 + i % 50, f'nom {i}', i % 2 == 0) for i in range(debut, min(debut + TAILLE_LOT, nbr_lignes))
+        ])
+
+
+def chronometrer(moteur, requete):
+    """le meilleur de 3 essais, et le résultat (pour vérifier que tous les essais donnent le meme)"""
+    durees = []
+    for _ in range(3):
+        debut = time.perf_counter()
+        lignes = verifier(moteur.executer(requete))
+        durees.append(time.perf_counter() - debut)
+    return min(durees), lignes
+
+
+def main():
+    nbr_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    max_processus = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        moteur = MoteurSQL(dossier)
+        remplir(moteur, nbr_lignes)
+        moteur.gestionnaire.fermer()
+        print(f"{nbr_lignes} lignes, {os.cpu_count()} coeur(s)")
+
+        references = {}
+        for nbr_processus in range(1, max_processus + 1):
+            moteur = MoteurSQL(dossier, parallel_workers=nbr_processus)
+            verifier(moteur.executer(REQUETES[1][1])) #échauffement : démarrage des processus
+            for nom, requete in REQUETES:
+                duree, lignes = chronometrer(moteur, requete)
+                reference = references.setdefault(nom, (duree, lignes))
+                if lignes != reference[1]:
+                    raise Exception(f"{nom} : résultat différent avec {nbr_processus} processus")
+                print(f"{nom:<22} {nbr_processus:3d} processus {duree:8.3f} s   x{reference[0] / duree:5.2f}"
+                      f"   {len(lignes)} ligne(s)")
+            moteur.gestionnaire.fermer()
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark des requetes préparées et du cache de plans : cout du parser par requete, avant et apres
+- parser : la requete parsée a chaque fois (MoteurSQL.planifier), ce que coutait chaque executer avant le cache
+- cache : le plan retrouvé dans le cache LRU (meme texte de requete)
+- puis de bout en bout, pour un SELECT par index et un INSERT (dans une transaction, sans écriture disque) :
+  une requete texte différente a chaque fois (valeurs dans le texte : parsée a chaque fois)
+  contre une requete préparée exécutée avec des paramètres
+
+usage : python benchmarks/bench_requetes_preparees.py [nbr_requetes] [nbr_lignes]
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+REQUETES = [
+    ('INSERT', "INSERT INTO bench VALUES (?, 'nom', 1.5, true)"),
+    ('SELECT', "SELECT * FROM bench WHERE cle = ?"),
+    ('SELECT', "SELECT nom, COUNT(*) FROM bench WHERE cle BETWEEN ? AND ? AND actif = true "
+               "GROUP BY nom ORDER BY nom LIMIT 10"),
+    ('UPDATE', "UPDATE bench SET nom = ?, taille = 2.5 WHERE cle = ? OR nom LIKE 'x%'"),
+    ('DELETE', "DELETE FROM bench WHERE cle IN (?, ?, ?) AND actif = false"),
+]
+
+
+def verifier(resultat):
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def chronometrer(nbr_requetes, fonction):
+    """durée moyenne d'un appel, en microsecondes"""
+    debut = time.perf_counter()
+    for i in range(nbr_requetes):
+        fonction(i)
+    return (time.perf_counter() - debut) / nbr_requetes * 1e6
+
+
+def main():
+    nbr_requetes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nbr_lignes = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    try:
+        moteur = MoteurSQL(dossier)
+        verifier(moteur.executer("CREATE TABLE bench (cle INT, nom TEXT, taille FLOAT, actif BOOL)"))
+        moteur.executemany("INSERT INTO bench VALUES (?, ?, ?, ?)",
+                           [(i, f'nom_{i % 100}', 1.5, i % 2 == 0) for i in range(nbr_lignes)])
+        verifier(moteur.executer("CREATE INDEX idx_cle ON bench (cle)"))
+
+        print(f"cout du parser par requete ({nbr_requetes} requetes)")
+        for sorte, requete in REQUETES:
+            parser = chronometrer(nbr_requetes, lambda i: moteur.planifier(requete, sorte))
+            moteur.plan(requete)
+            cache = chronometrer(nbr_requetes, lambda i: moteur.plan(requete))
+            print(f"{requete[:44]:<46} parser {parser:8.1f} us   cache {cache:6.2f} us   x{parser / cache:6.0f}")
+
+        print(f"\nde bout en bout, table de {nbr_lignes} lignes")
+        texte = chronometrer(nbr_requetes, lambda i: verifier(
+            moteur.executer(f"SELECT * FROM bench WHERE cle = {i % nbr_lignes}")))
+        preparee = moteur.prepare("SELECT * FROM bench WHERE cle = ?")
+        prepare = chronometrer(nbr_requetes, lambda i: verifier(preparee.executer((i % nbr_lignes,))))
+        print(f"{'SELECT par index':<20} texte {texte:8.1f} us   préparée {prepare:8.1f} us   x{texte / prepare:5.2f}")
+
+        verifier(moteur.executer("BEGIN"))
+        texte = chronometrer(nbr_requetes, lambda i: verifier(
+            moteur.executer(f"INSERT INTO bench VALUES ({i}, 'nom_{i}', 1.5, true)")))
+        preparee = moteur.prepare("INSERT INTO bench VALUES (?, ?, 1.5, true)")
+        prepare = chronometrer(nbr_requetes, lambda i: verifier(preparee.executer((i, f'nom_{i}'))))
+        verifier(moteur.executer("ROLLBACK"))
+        print(f"{'INSERT (transaction)':<20} texte {texte:8.1f} us   préparée {prepare:8.1f} us   x{texte / prepare:5.2f}")
+        moteur.gestionnaire.fermer()
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
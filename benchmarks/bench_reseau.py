@@ -0,0 +1,150 @@
+"""
+Benchmark du serveur réseau : générateur de charge, latence p50 / p99 et requetes/seconde
+Le serveur tourne dans ce programme (un thread asyncio), les clients sont des threads qui partagent un Pool
+- point : SELECT d'une ligne par un index (90 %) et INSERT d'une ligne (10 %), une requete par aller-retour
+- pipeline : les memes requetes envoyées par paquets de TAILLE_PIPELINE avant de lire les réponses
+- parcours : des SELECT de toute une autre table (envoyés par lots) en meme temps que les requetes 'point' :
+  les longs parcours ne doivent pas bloquer les autres connexions
+
+usage : python benchmarks/bench_reseau.py [nbr_requetes_par_client] [nbr_lignes]
+"""
+
+import sys
+import os
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import threading
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.reseau import Serveur
+from serveur.client import Pool
+
+NBR_CLIENTS = (1, 4, 16)
+TAILLE_PIPELINE = 16
+
+
+def demarrer(serveur):
+    """lance le serveur dans un thread, renvoie la fonction qui l'arrete"""
+    pret = threading.Event()
+    etat = {}
+
+    async def servir():
+        await serveur.demarrer()
+        etat['boucle'], etat['tache'] = asyncio.get_running_loop(), asyncio.current_task()
+        pret.set()
+        await serveur.servir()
+
+    def lancer():
+        try:
+            asyncio.run(servir())
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=lancer)
+    thread.start()
+    pret.wait()
+
+    def arreter():
+        etat['boucle'].call_soon_threadsafe(etat['tache'].cancel)
+        thread.join()
+        serveur.fermer()
+    return arreter
+
+
+def requete_point(hasard, nbr_lignes):
+    if hasard.random() < 0.1:
+        return f"INSERT INTO bench VALUES ({hasard.randrange(nbr_lignes)}, 'nouvelle')"
+    return f"SELECT * FROM bench WHERE cle = {hasard.randrange(nbr_lignes)}"
+
+
+def verifier(resultat):
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+
+
+def charger(pool, nbr_clients, nbr_requetes, nbr_lignes, pipeline=1, parcours=0):
+    """nbr_clients threads de nbr_requetes requetes chacun, renvoie (latences en s, durée)"""
+    latences = [[] for _ in range(nbr_clients)]
+
+    def client(numero):
+        hasard = random.Random(numero)
+        with pool.connexion() as connexion:
+            for _ in range(nbr_requetes // pipeline):
+                requetes = [requete_point(hasard, nbr_lignes) for _ in range(pipeline)]
+                debut = time.perf_counter()
+                if pipeline == 1:
+                    reponses = [connexion.executer(requetes[0])]
+                else:
+                    reponses = connexion.executer_plusieurs(requetes)
+                duree = time.perf_counter() - debut
+                for reponse in reponses:
+                    verifier(reponse)
+                latences[numero].extend([duree] * pipeline) #une requete du paquet attend tout le paquet
+
+    arret = threading.Event()
+
+    def parcourir():
+        with pool.connexion() as connexion:
+            while not arret.is_set():
+                for _ in connexion.curseur("SELECT * FROM parcours"):
+                    pass
+
+    clients = [threading.Thread(target=client, args=(numero,)) for numero in range(nbr_clients)]
+    lecteurs = [threading.Thread(target=parcourir) for _ in range(parcours)]
+    debut = time.perf_counter()
+    for thread in clients + lecteurs:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    duree = time.perf_counter() - debut
+    arret.set()
+    for thread in lecteurs:
+        thread.join()
+    return sorted(latence for latences_client in latences for latence in latences_client), duree
+
+
+def centile(latences, fraction):
+    return latences[min(len(latences) - 1, int(fraction * len(latences)))]
+
+
+def afficher(nom, latences, duree):
+    print(f"{nom:<34} p50 {centile(latences, 0.5) * 1000:7.3f} ms   p99 {centile(latences, 0.99) * 1000:7.3f} ms"
+          f"   {len(latences) / duree:8.0f} requetes/s")
+
+
+def main():
+    nbr_requetes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    nbr_lignes = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    serveur = Serveur(dossier, port=0, travailleurs=8)
+    arreter = demarrer(serveur)
+    pool = Pool('127.0.0.1', serveur.port, taille=max(NBR_CLIENTS) + 2)
+    try:
+        verifier(pool.executer("CREATE TABLE bench (cle INT, valeur TEXT)"))
+        verifier(pool.executer("CREATE TABLE parcours (cle INT, valeur TEXT)"))
+        for debut in range(0, nbr_lignes, 5000):
+            valeurs = ', '.join(f"({i}, 'valeur {i}')" for i in range(debut, min(debut + 5000, nbr_lignes)))
+            verifier(pool.executer(f"INSERT INTO bench VALUES {valeurs}"))
+            verifier(pool.executer(f"INSERT INTO parcours VALUES {valeurs}"))
+        verifier(pool.executer("CREATE INDEX idx_cle ON bench (cle)"))
+
+        print(f"{nbr_requetes} requetes par client, table de {nbr_lignes} lignes")
+        for nbr_clients in NBR_CLIENTS:
+            afficher(f"point, {nbr_clients} client(s)", *charger(pool, nbr_clients, nbr_requetes, nbr_lignes))
+            afficher(f"pipeline x{TAILLE_PIPELINE}, {nbr_clients} client(s)",
+                     *charger(pool, nbr_clients, nbr_requetes, nbr_lignes, pipeline=TAILLE_PIPELINE))
+        afficher("point, 4 client(s) + 2 parcours", *charger(pool, 4, nbr_requetes, nbr_lignes, parcours=2))
+    finally:
+        pool.fermer()
+        arreter()
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
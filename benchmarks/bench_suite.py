@@ -0,0 +1,273 @@
+"""
+Suite de benchmarks reproductible des chemins chauds du stockage et du moteur, sur des tables synthétiques
+(largeur, nbr de lignes, proportion de NULL et longueur des TEXT au choix, memes valeurs a chaque lancement) :
+- insertion_lot : remplissage de la table par executemany, en lots de 50000 (une seule fois)
+- ouverture : MoteurSQL sur le dossier puis un premier SELECT COUNT(*) (en-tête et métadonnées relus)
+- parcours_complet : lire_table (toutes les colonnes décodées)
+- projection : SELECT cle, c1 FROM ...
+- select_filtre : SELECT * FROM ... WHERE cle >= ... (un dixieme des lignes gardées, sans index)
+- insertion_ligne : INSERT d'une ligne par requete texte (parsée a chaque fois), durée par ligne
+- analyse_select / analyse_insert : le parser seul (MoteurSQL.planifier), durée par requete
+chaque durée est le meilleur de --essais essais. Les résultats sont écrits en JSON (--sortie) ; avec --reference,
+ils sont comparés a ceux d'un lancement précédent avec les memes paramètres, et le programme sort avec le code 1
+si une mesure est plus lente que la référence de plus de --seuil (0.25 = 25 %)
+
+usage : python benchmarks/bench_suite.py [--lignes 10000,100000] [--stockages row,columnar,compact,v1]
+        [--largeur 8] [--nulls 0.2] [--texte 16] [--essais 3] [--unitaires 1000]
+        [--sortie bench_suite.json] [--reference reference.json] [--seuil 0.25]
+"""
+
+import sys
+import os
+import gc
+import json
+import time
+import random
+import shutil
+import string
+import argparse
+import platform
+import tempfile
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur import format_fixe
+from serveur.moteur_sql import MoteurSQL, STOCKAGES
+
+VERSION_RESULTATS = 1 #a changer si les mesures changent de sens : une référence d'une autre version est refusée
+TAILLE_LOT = 50000
+TAILLE_RESERVE = 4096 #valeurs tirées d'avance par colonne (tirer chaque valeur coute plus que ce qu'on mesure)
+TYPES = ('INT', 'FLOAT', 'TEXT', 'BOOL') #types des colonnes c1, c2, ... a tour de role
+FORMATS = dict(STOCKAGES, v1=(1, format_fixe.STOCKAGE_LIGNES)) #le format 1 pour mesurer decoder_valeur
+ANALYSES = [
+    ('analyse_select', 'SELECT', "SELECT cle, c1, COUNT(*) FROM bench WHERE cle BETWEEN 10 AND 5000 AND c1 IS NOT NULL "
+                                 "GROUP BY cle, c1 ORDER BY cle DESC LIMIT 10"),
+    ('analyse_insert', 'INSERT', "INSERT INTO bench VALUES (1, 2, 3.5, 'texte', true, NULL, 4.5, 'autre', false)"),
+]
+
+
+def lire_arguments():
+    parser = argparse.ArgumentParser(description="suite de benchmarks du stockage et du moteur SQL")
+    parser.add_argument('--lignes', default='10000,100000',
+                        help="tailles des tables, séparées par des virgules (ex: 10000,100000,1000000,10000000)")
+    parser.add_argument('--stockages', default='row,columnar,compact', help=f"parmi {', '.join(FORMATS)}")
+    parser.add_argument('--largeur', type=int, default=8, help="colonnes en plus de cle (INT, FLOAT, TEXT, BOOL ...)")
+    parser.add_argument('--nulls', type=float, default=0.2, help="proportion de NULL dans les colonnes autres que cle")
+    parser.add_argument('--texte', type=int, default=16, help="longueur des TEXT (caracteres)")
+    parser.add_argument('--essais', type=int, default=3, help="essais par mesure, le meilleur est gardé")
+    parser.add_argument('--unitaires', type=int, default=1000, help="INSERT d'une ligne par essai")
+    parser.add_argument('--graine', type=int, default=1, help="graine des valeurs générées")
+    parser.add_argument('--sortie', default='bench_suite.json', help="fichier JSON des résultats")
+    parser.add_argument('--reference', help="résultats JSON d'un lancement précédent a comparer")
+    parser.add_argument('--seuil', type=float, default=0.25, help="ralentissement toléré par rapport a la référence")
+    arguments = parser.parse_args()
+    arguments.lignes = [int(nbr) for nbr in arguments.lignes.split(',')]
+    arguments.stockages = arguments.stockages.split(',')
+    for stockage in arguments.stockages:
+        if stockage not in FORMATS:
+            parser.error(f"stockage inconnu : {stockage} ({', '.join(FORMATS)})")
+    if arguments.largeur < 1:
+        parser.error("--largeur doit valoir au moins 1")
+    return arguments
+
+
+def colonnes_table(largeur):
+    """cle INT (jamais NULL, croissante) puis c1 ... c<largeur> de types INT, FLOAT, TEXT, BOOL a tour de role"""
+    return [('cle', 'INT')] + [(f'c{numero}', TYPES[(numero - 1) % len(TYPES)]) for numero in range(1, largeur + 1)]
+
+
+def reserves_valeurs(colonnes, nulls, longueur_texte, graine):
+    """pour chaque colonne autre que cle, TAILLE_RESERVE valeurs tirées d'avance (None avec la proportion nulls)"""
+    hasard = random.Random(graine)
+    lettres = string.ascii_letters + string.digits #pas de guillemet : les valeurs vont aussi dans le texte des INSERT
+    reserves = []
+    for _, type_col in colonnes[1:]:
+        valeurs = []
+        for _ in range(TAILLE_RESERVE):
+            if hasard.random() < nulls:
+                valeurs.append(None)
+            elif type_col == 'INT':
+                valeurs.append(hasard.randrange(-1_000_000, 1_000_000))
+            elif type_col == 'FLOAT':
+                valeurs.append(round(hasard.uniform(-1000, 1000), 3))
+            elif type_col == 'TEXT':
+                valeurs.append(''.join(hasard.choice(lettres) for _ in range(longueur_texte)))
+            else:
+                valeurs.append(hasard.random() < 0.5)
+        reserves.append(valeurs)
+    return reserves
+
+
+def generer_lignes(reserves, debut, fin):
+    """les lignes debut a fin-1 (tuples), toujours les memes pour un numéro donné"""
+    return [(i,) + tuple(valeurs[(i * 7919 + numero * 104729) % TAILLE_RESERVE]
+                         for numero, valeurs in enumerate(reserves))
+            for i in range(debut, fin)]
+
+
+def texte_sql(valeur):
+    """une valeur dans le texte d'un INSERT"""
+    if valeur is None:
+        return 'NULL'
+    if isinstance(valeur, bool):
+        return 'true' if valeur else 'false'
+    if isinstance(valeur, str):
+        return f"'{valeur}'"
+    return repr(valeur)
+
+
+def verifier(resultat):
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def chronometrer(essais, fonction, avant=None):
+    """le meilleur de essais appels (ramasse-miettes vidé avant et coupé pendant chaque appel)"""
+    durees = []
+    for _ in range(essais):
+        if avant is not None:
+            avant()
+        gc.collect()
+        gc.disable()
+        try:
+            debut = time.perf_counter()
+            fonction()
+            durees.append(time.perf_counter() - debut)
+        finally:
+            gc.enable()
+    return min(durees)
+
+
+def mesurer_table(arguments, dossier, stockage, nbr_lignes, colonnes, reserves):
+    """les mesures d'une table : {nom: (secondes, lignes traitées)}"""
+    nom_table = f'bench_{stockage}_{nbr_lignes}'
+    version, octet_stockage = FORMATS[stockage]
+    moteur = MoteurSQL(dossier)
+    moteur.gestionnaire.creer_table(nom_table, list(colonnes), version=version, stockage=octet_stockage)
+    requete_lot = f"INSERT INTO {nom_table} VALUES ({', '.join('?' for _ in colonnes)})"
+    mesures = {}
+
+    duree = 0.0 #seulement executemany, sans la génération des lignes
+    for depart in range(0, nbr_lignes, TAILLE_LOT):
+        lot = generer_lignes(reserves, depart, min(depart + TAILLE_LOT, nbr_lignes))
+        debut = time.perf_counter()
+        verifier(moteur.executemany(requete_lot, lot))
+        duree += time.perf_counter() - debut
+    mesures['insertion_lot'] = (duree, nbr_lignes)
+
+    def ouvrir():
+        autre = MoteurSQL(dossier)
+        verifier(autre.executer(f"SELECT COUNT(*) FROM {nom_table}"))
+        autre.gestionnaire.fermer()
+    mesures['ouverture'] = (chronometrer(arguments.essais, ouvrir), 1)
+
+    gestionnaire = moteur.gestionnaire
+    mesures['parcours_complet'] = (chronometrer(arguments.essais, lambda: gestionnaire.lire_table(nom_table)),
+                                   nbr_lignes)
+    mesures['projection'] = (chronometrer(arguments.essais, lambda: verifier(
+        moteur.executer(f"SELECT cle, c1 FROM {nom_table}"))), nbr_lignes)
+    seuil = nbr_lignes - nbr_lignes // 10
+    mesures['select_filtre'] = (chronometrer(arguments.essais, lambda: verifier(
+        moteur.executer(f"SELECT * FROM {nom_table} WHERE cle >= {seuil}"))), nbr_lignes)
+
+    #INSERT d'une ligne : des numéros de cle après ceux de la table, une requete texte différente a chaque fois
+    departs = iter(range(nbr_lignes, nbr_lignes + arguments.unitaires * arguments.essais, arguments.unitaires))
+    requetes = []
+    def preparer_unitaires():
+        depart = next(departs)
+        requetes[:] = [f"INSERT INTO {nom_table} VALUES ({', '.join(texte_sql(valeur) for valeur in ligne)})"
+                       for ligne in generer_lignes(reserves, depart, depart + arguments.unitaires)]
+    def inserer_unitaires():
+        for requete in requetes:
+            verifier(moteur.executer(requete))
+    duree = chronometrer(arguments.essais, inserer_unitaires, preparer_unitaires)
+    mesures['insertion_ligne'] = (duree / arguments.unitaires, 1)
+
+    gestionnaire.fermer()
+    return mesures
+
+
+def mesurer_analyses(arguments, dossier):
+    """le cout du parser seul, par requete (sans table : planifier ne la lit pas)"""
+    moteur = MoteurSQL(dossier)
+    mesures = {}
+    for nom, type_requete, requete in ANALYSES:
+        repetitions = 1000
+        duree = chronometrer(arguments.essais,
+                             lambda: [moteur.planifier(requete, type_requete) for _ in range(repetitions)])
+        mesures[nom] = (duree / repetitions, 1)
+    moteur.gestionnaire.fermer()
+    return mesures
+
+
+def comparer(resultats, reference, seuil):
+    """affiche les écarts avec la référence, renvoie les mesures plus lentes de plus de seuil"""
+    if reference.get('version') != resultats['version'] or reference.get('parametres') != resultats['parametres']:
+        raise Exception("La référence n'a pas été mesurée avec les memes paramètres : "
+                        f"{reference.get('parametres')} contre {resultats['parametres']}")
+    regressions = []
+    print(f"\ncomparaison avec la référence (seuil {seuil:.0%})")
+    for cle, mesure in resultats['mesures'].items():
+        ancienne = reference['mesures'].get(cle)
+        if ancienne is None:
+            print(f"  {cle:<45} absente de la référence")
+            continue
+        rapport = mesure['secondes'] / ancienne['secondes'] if ancienne['secondes'] else 1.0
+        regression = rapport > 1 + seuil
+        if regression:
+            regressions.append(cle)
+        print(f"  {cle:<45} {ancienne['secondes']:11.6f} s -> {mesure['secondes']:11.6f} s   x{rapport:5.2f}"
+              + ("   REGRESSION" if regression else ""))
+    return regressions
+
+
+def main():
+    arguments = lire_arguments()
+    colonnes = colonnes_table(arguments.largeur)
+    reserves = reserves_valeurs(colonnes, arguments.nulls, arguments.texte, arguments.graine)
+    resultats = {
+        'version': VERSION_RESULTATS,
+        'parametres': {'largeur': arguments.largeur, 'nulls': arguments.nulls, 'texte': arguments.texte,
+                       'graine': arguments.graine, 'essais': arguments.essais, 'unitaires': arguments.unitaires},
+        'machine': {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                    'systeme': platform.platform(), 'processeurs': os.cpu_count()},
+        'mesures': {}, #'<stockage>/<nbr_lignes>/<mesure>' ou 'parser/<mesure>' -> {secondes, par_seconde}
+    }
+    dossier = tempfile.mkdtemp(prefix='rotterdb_bench_')
+
+    def noter(prefixe, mesures):
+        for nom, (secondes, lignes) in mesures.items():
+            resultats['mesures'][f"{prefixe}/{nom}"] = {
+                'secondes': secondes, 'par_seconde': lignes / secondes if secondes else None} #lignes/s ou requetes/s
+            print(f"  {nom:<20} {secondes:11.6f} s" + (f" {lignes / secondes:14.0f} lignes/s" if lignes > 1 else ""))
+
+    try:
+        print(f"{len(colonnes)} colonnes, {arguments.nulls:.0%} de NULL, TEXT de {arguments.texte} caracteres")
+        print("\nparser")
+        noter('parser', mesurer_analyses(arguments, dossier))
+        for nbr_lignes in arguments.lignes:
+            for stockage in arguments.stockages:
+                print(f"\n{stockage}, {nbr_lignes} lignes")
+                noter(f"{stockage}/{nbr_lignes}", mesurer_table(arguments, dossier, stockage, nbr_lignes,
+                                                                colonnes, reserves))
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    with open(arguments.sortie, 'w', encoding='utf-8') as fichier:
+        json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+    print(f"\nrésultats écrits dans {arguments.sortie}")
+
+    if arguments.reference:
+        with open(arguments.reference, encoding='utf-8') as fichier:
+            reference = json.load(fichier)
+        regressions = comparer(resultats, reference, arguments.seuil)
+        if regressions:
+            print(f"\n{len(regressions)} régression(s) au-dela de {arguments.seuil:.0%} : {', '.join(regressions)}")
+            sys.exit(1)
+        print("\naucune régression")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Test de crash du journal (WAL) : un programme écrivain est tué (SIGKILL) a un moment tiré au hasard, puis le dossier
+est rouvert (le journal est rejoué) et on vérifie, pour une table en lignes puis une table en colonnes :
+- durabilité : chaque écriture acquittée (executer a rendu la main) est présente apres la reprise ;
+  seule l'écriture en cours au moment du kill peut etre présente ou non
+- atomicité : un lot de TAILLE_LOT lignes (un INSERT, un UPDATE ou un DELETE, ou une transaction BEGIN ... COMMIT
+  sur deux lots) est vu en entier ou pas du tout, avec la meme valeur sur toutes ses lignes
+- index : les lignes trouvées par l'index sur lot (égalité et intervalle) sont celles du parcours de la table,
+  et COUNT(*) (lu dans l'en-tête) compte les lignes du parcours
+l'écrivain envoie chaque écriture au programme principal avant de la commencer et apres son acquittement
+
+usage : python benchmarks/crash_journal.py [nbr_crashs_par_table] [delai_max_ms]
+"""
+
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+import collections
+import multiprocessing
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+TAILLE_LOT = 20 #lignes par lot
+LOTS_PAR_TOUR = 100000 #les lots d'un tour : tour * LOTS_PAR_TOUR + n (jamais deux fois le meme numéro)
+
+
+def verifier(resultat):
+    """renvoie les données d'une requete, lève une exception si elle a échoué"""
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def valeurs_lot(lot, valeur):
+    """le texte VALUES des lignes d'un lot : txt répete le lot et la valeur (une ligne mélangée se voit)"""
+    return ', '.join(f"({lot}, {num}, {valeur}, 'lot {lot} valeur {valeur}')" for num in range(TAILLE_LOT))
+
+
+def appliquer(etat, operation):
+    """l'état (lot -> valeur) apres l'opération"""
+    etat = dict(etat)
+    sorte = operation[0]
+    if sorte == 'tx':
+        for sous_operation in operation[1]:
+            etat = appliquer(etat, sous_operation)
+    elif sorte in ('ins', 'upd'):
+        etat[operation[1]] = operation[2]
+    elif sorte == 'del':
+        del etat[operation[1]]
+    return etat #'vac' : rien ne change
+
+
+def ecrivain(dossier, table, tour, lots, connexion):
+    """
+    le programme tué : écrit sans fin, et envoie ('debut', op) avant chaque écriture puis ('fait', op)
+    apres son acquittement (Connection.send écrit directement dans le tube : rien n'est perdu au kill)
+    """
+    hasard = random.Random(tour)
+    moteur = MoteurSQL(dossier) #rejoue le journal du crash précédent
+    connexion.send(('pret', None))
+    lots = list(lots)
+    suivant = tour * LOTS_PAR_TOUR
+    while True:
+        tirage = hasard.random()
+        if tirage < 0.45 or not lots:
+            suivant += 1
+            operation = ('ins', suivant, 0)
+        elif tirage < 0.7:
+            operation = ('upd', hasard.choice(lots), hasard.randrange(1, 1000))
+        elif tirage < 0.85:
+            operation = ('del', hasard.choice(lots))
+        elif tirage < 0.98:
+            suivant += 1
+            operation = ('tx', [('ins', suivant, 0), ('del', hasard.choice(lots))])
+        else:
+            operation = ('vac',)
+        connexion.send(('debut', operation))
+        executer(moteur, table, operation)
+        connexion.send(('fait', operation))
+        lots = list(appliquer(dict.fromkeys(lots, 0), operation))
+
+
+def executer(moteur, table, operation):
+    sorte = operation[0]
+    if sorte == 'ins':
+        verifier(moteur.executer(f"INSERT INTO {table} VALUES {valeurs_lot(operation[1], operation[2])}"))
+    elif sorte == 'upd':
+        lot, valeur = operation[1], operation[2]
+        verifier(moteur.executer(
+            f"UPDATE {table} SET valeur = {valeur}, txt = 'lot {lot} valeur {valeur}' WHERE lot = {lot}"))
+    elif sorte == 'del':
+        verifier(moteur.executer(f"DELETE FROM {table} WHERE lot = {operation[1]}"))
+    elif sorte == 'tx': #plusieurs écritures validées ensemble
+        verifier(moteur.executer("BEGIN"))
+        for sous_operation in operation[1]:
+            executer(moteur, table, sous_operation)
+        verifier(moteur.executer("COMMIT"))
+    else:
+        verifier(moteur.executer(f"VACUUM {table}"))
+
+
+def lire_etat(moteur, table):
+    """l'état (lot -> valeur) lu par un parcours, apres les vérifications d'atomicité et des index"""
+    lignes = verifier(moteur.executer(f"SELECT lot, num, valeur, txt FROM {table}"))
+    lots = collections.defaultdict(list)
+    for ligne in lignes:
+        if ligne['txt'] != f"lot {ligne['lot']} valeur {ligne['valeur']}":
+            raise Exception(f"ligne mélangée : {ligne}")
+        lots[ligne['lot']].append(ligne)
+    etat = {}
+    for lot, lignes_lot in lots.items():
+        if sorted(ligne['num'] for ligne in lignes_lot) != list(range(TAILLE_LOT)):
+            raise Exception(f"lot {lot} vu avec {len(lignes_lot)} ligne(s) sur {TAILLE_LOT}")
+        if len({ligne['valeur'] for ligne in lignes_lot}) != 1:
+            raise Exception(f"lot {lot} a moitié modifié")
+        etat[lot] = lignes_lot[0]['valeur']
+
+    nbr = list(verifier(moteur.executer(f"SELECT COUNT(*) FROM {table}"))[0].values())[0]
+    if nbr != len(lignes):
+        raise Exception(f"COUNT(*) = {nbr}, le parcours lit {len(lignes)} ligne(s)")
+    parcours = sorted((ligne['lot'], ligne['num'], ligne['valeur']) for ligne in lignes)
+    if etat: #par l'index : IN sur tous les lots (égalité), puis un intervalle qui les couvre tous
+        liste = ', '.join(str(lot) for lot in etat)
+        for condition in (f"lot IN ({liste})", f"lot >= {min(etat)} AND lot <= {max(etat)}"):
+            par_index = verifier(moteur.executer(f"SELECT lot, num, valeur FROM {table} WHERE {condition}"))
+            if sorted((ligne['lot'], ligne['num'], ligne['valeur']) for ligne in par_index) != parcours:
+                raise Exception(f"l'index ne trouve pas les lignes du parcours ({condition.split()[1]})")
+    return etat
+
+
+def tester(dossier, stockage, nbr_crashs, delai_max):
+    table = f'crash_{stockage}'
+    moteur = MoteurSQL(dossier)
+    verifier(moteur.executer(
+        f"CREATE TABLE {table} (lot INT, num INT, valeur INT, txt TEXT) WITH (storage = '{stockage}')"))
+    verifier(moteur.executer(f"CREATE INDEX idx_{table} ON {table} (lot)"))
+    moteur.gestionnaire.fermer()
+
+    contexte = multiprocessing.get_context('spawn') #un programme neuf, comme apres un vrai crash
+    etat = {} #lot -> valeur des écritures acquittées
+    nbr_faites = 0
+    nbr_en_cours_gardees = 0
+    debut = time.perf_counter()
+    for tour in range(1, nbr_crashs + 1):
+        reception, envoi = contexte.Pipe(duplex=False)
+        enfant = contexte.Process(target=ecrivain, args=(dossier, table, tour, sorted(etat), envoi))
+        enfant.start()
+        envoi.close() #sinon la lecture ne verrait jamais la fin du tube
+        reception.recv() #'pret' : le journal est rejoué, on tue pendant les écritures
+        time.sleep(random.uniform(0, delai_max))
+        enfant.kill() #SIGKILL : ni finally, ni fermeture du journal
+        enfant.join()
+
+        en_cours = None #l'écriture commencée et pas acquittée : faite ou non
+        messages = []
+        while True:
+            try:
+                messages.append(reception.recv())
+            except EOFError:
+                break
+        reception.close()
+        for sorte, operation in messages:
+            if sorte == 'debut':
+                en_cours = operation
+            else:
+                etat = appliquer(etat, operation)
+                en_cours = None
+                nbr_faites += 1
+
+        moteur = MoteurSQL(dossier) #rejoue le journal
+        lu = lire_etat(moteur, table)
+        moteur.gestionnaire.fermer()
+        if lu != etat:
+            if en_cours is None or lu != appliquer(etat, en_cours):
+                manquants = sorted(set(etat) - set(lu))[:5]
+                raise Exception(f"{stockage}, crash {tour} : écriture acquittée perdue ou en trop "
+                                f"(en cours : {en_cours}, lots manquants : {manquants})")
+            etat = lu
+            nbr_en_cours_gardees += 1
+
+    moteur = MoteurSQL(dossier) #apres un point de controle (fermer) : toujours le meme état
+    if lire_etat(moteur, table) != etat:
+        raise Exception(f"{stockage} : état différent apres le point de controle")
+    moteur.gestionnaire.fermer()
+    print(f"{stockage:<9} {nbr_crashs} crash(s) {time.perf_counter() - debut:8.3f} s {nbr_faites:6} écritures "
+          f"acquittées, {nbr_en_cours_gardees} en cours gardée(s), {len(etat) * TAILLE_LOT:7} lignes : ok")
+
+
+def main():
+    nbr_crashs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delai_max = (int(sys.argv[2]) if len(sys.argv) > 2 else 500) / 1000
+    dossier = tempfile.mkdtemp(prefix='rotterdb_crash_')
+
+    try:
+        for stockage in ('row', 'columnar'):
+            tester(dossier, stockage, nbr_crashs, delai_max)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
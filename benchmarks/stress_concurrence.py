@@ -0,0 +1,194 @@
+"""
+Test de charge des verrous : un MoteurSQL partagé par des threads qui écrivent et des threads qui lisent,
+puis plusieurs programmes sur le meme dossier
+- chaque écrivain insère des lots de TAILLE_LOT lignes (un INSERT multi-lignes), en modifie (UPDATE)
+  et en supprime (DELETE) : un lot est toujours écrit, modifié ou supprimé en entier
+- chaque lecteur relit la table en boucle et vérifie qu'aucune lecture n'est déchirée : un lot est vu
+  en entier ou pas du tout, avec la meme valeur sur toutes ses lignes, et chaque ligne est valide
+- a la fin, aucune ligne perdue : COUNT(*) et le contenu de chaque lot sont ceux attendus
+
+usage : python benchmarks/stress_concurrence.py [nbr_ecrivains] [nbr_lecteurs] [nbr_lots_par_ecrivain] [nbr_programmes]
+"""
+
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+import threading
+import collections
+import multiprocessing
+
+#On ajoute la racine du projet au path Python pour les import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serveur.moteur_sql import MoteurSQL
+
+TAILLE_LOT = 50 #lignes par INSERT
+
+
+def verifier(resultat):
+    """renvoie les données d'une requete, lève une exception si elle a échoué"""
+    if resultat['status'] != 'success':
+        raise Exception(resultat['message'])
+    return resultat['data']
+
+
+def ecrire(moteur, table, ecrivain, nbr_lots, attendus):
+    """insère nbr_lots lots numérotés pour cet écrivain, en modifie et en supprime certains. attendus : lot -> valeur"""
+    hasard = random.Random(ecrivain)
+    for numero in range(nbr_lots):
+        lot = ecrivain * 1_000_000 + numero
+        valeurs = ', '.join(f"({lot}, {i}, 0, 'texte {lot} {i}')" for i in range(TAILLE_LOT))
+        verifier(moteur.executer(f"INSERT INTO {table} VALUES {valeurs}"))
+        attendus[lot] = 0
+        tirage = hasard.random()
+        if tirage < 0.2 and attendus: #un lot deja écrit est modifié en entier
+            cible = hasard.choice(list(attendus))
+            verifier(moteur.executer(f"UPDATE {table} SET valeur = {numero + 1} WHERE lot = {cible}"))
+            attendus[cible] = numero + 1
+        elif tirage < 0.3: #ou supprimé en entier
+            cible = hasard.choice(list(attendus))
+            verifier(moteur.executer(f"DELETE FROM {table} WHERE lot = {cible}"))
+            del attendus[cible]
+
+
+def capturer(erreurs, fonction, *arguments):
+    """lance la fonction dans un thread en notant son exception (sinon elle ne serait qu'affichée)"""
+    try:
+        fonction(*arguments)
+    except Exception as erreur:
+        erreurs.append(f"{fonction.__name__} : {erreur}")
+
+
+def lire(moteur, table, arret, erreurs, nbr_lectures):
+    """relit la table jusqu'a l'arret et note les lectures déchirées"""
+    while not arret.is_set():
+        lignes = verifier(moteur.executer(f"SELECT lot, num, valeur, txt FROM {table}"))
+        lots = collections.defaultdict(list)
+        for ligne in lignes:
+            if ligne['txt'] != f"texte {ligne['lot']} {ligne['num']}" or not 0 <= ligne['num'] < TAILLE_LOT:
+                erreurs.append(f"ligne invalide : {ligne}")
+            lots[ligne['lot']].append(ligne)
+        for lot, lignes_lot in lots.items():
+            if len(lignes_lot) != TAILLE_LOT:
+                erreurs.append(f"lot {lot} vu avec {len(lignes_lot)} ligne(s) sur {TAILLE_LOT}")
+            if len({ligne['valeur'] for ligne in lignes_lot}) != 1:
+                erreurs.append(f"lot {lot} vu a moitié modifié")
+        nbr_lectures.append(len(lignes))
+
+
+def controler(moteur, table, attendus):
+    """aucune ligne perdue : le nombre de lignes et le contenu de chaque lot"""
+    nbr = list(verifier(moteur.executer(f"SELECT COUNT(*) FROM {table}"))[0].values())[0]
+    assert nbr == len(attendus) * TAILLE_LOT, (table, nbr, len(attendus) * TAILLE_LOT)
+    lots = collections.Counter()
+    for ligne in verifier(moteur.executer(f"SELECT lot, valeur FROM {table}")):
+        assert attendus.get(ligne['lot']) == ligne['valeur'], (table, ligne, attendus.get(ligne['lot']))
+        lots[ligne['lot']] += 1
+    assert set(lots) == set(attendus) and set(lots.values()) <= {TAILLE_LOT}, table
+    return nbr
+
+
+def threads(dossier, stockage, nbr_ecrivains, nbr_lecteurs, nbr_lots):
+    """écrivains et lecteurs sur un MoteurSQL partagé"""
+    moteur = MoteurSQL(dossier)
+    table = f'stress_{stockage}'
+    verifier(moteur.executer(f"CREATE TABLE {table} (lot INT, num INT, valeur INT, txt TEXT) WITH (storage = '{stockage}')"))
+    attendus = [{} for _ in range(nbr_ecrivains)]
+    erreurs = []
+    nbr_lectures = []
+    arret = threading.Event()
+
+    ecrivains = [
+        threading.Thread(target=capturer, args=(erreurs, ecrire, moteur, table, ecrivain, nbr_lots, attendus[ecrivain]))
+        for ecrivain in range(nbr_ecrivains)
+    ]
+    lecteurs = [threading.Thread(target=capturer, args=(erreurs, lire, moteur, table, arret, erreurs, nbr_lectures))
+                for _ in range(nbr_lecteurs)]
+    debut = time.perf_counter()
+    for thread in ecrivains + lecteurs:
+        thread.start()
+    for thread in ecrivains:
+        thread.join()
+    arret.set()
+    for thread in lecteurs:
+        thread.join()
+    duree = time.perf_counter() - debut
+
+    assert not erreurs, erreurs[:10]
+    tous = {lot: valeur for attendus_ecrivain in attendus for lot, valeur in attendus_ecrivain.items()}
+    nbr = controler(moteur, table, tous)
+    moteur.gestionnaire.fermer()
+    print(f"{stockage:<9} {nbr_ecrivains} écrivain(s), {nbr_lecteurs} lecteur(s) {duree:8.3f} s "
+          f"{len(nbr_lectures):6} lectures {nbr:8} lignes : ok")
+
+
+def programme(dossier, table, ecrivain, nbr_lots, resultats):
+    """un autre programme : son propre MoteurSQL sur le meme dossier, un écrivain et un lecteur"""
+    attendus = {}
+    erreurs = []
+    try:
+        moteur = MoteurSQL(dossier)
+        arret = threading.Event()
+        lecteur = threading.Thread(target=capturer, args=(erreurs, lire, moteur, table, arret, erreurs, []))
+        lecteur.start()
+        capturer(erreurs, ecrire, moteur, table, ecrivain, nbr_lots, attendus)
+        arret.set()
+        lecteur.join()
+        moteur.gestionnaire.fermer()
+    except Exception as erreur:
+        erreurs.append(str(erreur))
+    finally: #le programme principal attend un résultat par programme
+        resultats.put((attendus, erreurs[:10]))
+
+
+def programmes(dossier, nbr_programmes, nbr_lots):
+    """plusieurs programmes sur le meme dossier : les verrous flock des tables et du journal"""
+    table = 'stress_programmes'
+    moteur = MoteurSQL(dossier)
+    verifier(moteur.executer(f"CREATE TABLE {table} (lot INT, num INT, valeur INT, txt TEXT)"))
+    moteur.gestionnaire.fermer()
+
+    contexte = multiprocessing.get_context('spawn') #pas de fork d'un programme qui a deja des threads
+    resultats = contexte.Queue()
+    enfants = [contexte.Process(target=programme, args=(dossier, table, ecrivain, nbr_lots, resultats))
+               for ecrivain in range(nbr_programmes)]
+    debut = time.perf_counter()
+    for enfant in enfants:
+        enfant.start()
+    tous = {}
+    for _ in enfants:
+        attendus, erreurs = resultats.get()
+        assert not erreurs, erreurs
+        tous.update(attendus)
+    for enfant in enfants:
+        enfant.join()
+        assert enfant.exitcode == 0, enfant.exitcode
+    duree = time.perf_counter() - debut
+
+    moteur = MoteurSQL(dossier)
+    nbr = controler(moteur, table, tous)
+    moteur.gestionnaire.fermer()
+    print(f"{'row':<9} {nbr_programmes} programme(s) (un écrivain et un lecteur chacun) {duree:8.3f} s {nbr:8} lignes : ok")
+
+
+def main():
+    nbr_ecrivains = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    nbr_lecteurs = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    nbr_lots = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    nbr_programmes = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    dossier = tempfile.mkdtemp(prefix='rotterdb_stress_')
+
+    try:
+        for stockage in ('row', 'columnar'):
+            threads(dossier, stockage, nbr_ecrivains, nbr_lecteurs, nbr_lots)
+        if nbr_programmes:
+            programmes(dossier, nbr_programmes, nbr_lots)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
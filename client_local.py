@@ -2,14 +2,25 @@
 
 import sys
 import os
+import re
+import csv
+import json
+import time
+import argparse
+import itertools
 
 #On ajoute le dossier courant au path Python pour les import
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from serveur.moteur_sql import MoteurSQL
+from serveur.moteur_sql import MoteurSQL, Curseur
+from serveur.protocole import valeur_json
 
-def afficher_resultat(resultat): #méthode pour afficher les logs de requête
-    """affiche le resultat d'une requete""" 
+TAILLE_PAQUET = 1000 #lignes formatées puis écrites en un seul write (un print par ligne coute plus que la requete)
+LARGEUR_MAX = 30 #caracteres d'une valeur dans le tableau, au-dela elle est tronquée
+SEPARATEURS = re.compile(r"['\";]|--") #ce qui compte pour découper un script : guillemets, fin de requete, commentaire
+
+def afficher_resultat(resultat, page=0): #méthode pour afficher les logs de requête
+    """affiche le resultat d'une requete (page : lignes par page, 0 = tout d'un coup)"""
     print() 
     print("=" * 70)
 
@@ -25,9 +36,17 @@ def afficher_resultat(resultat): #méthode pour afficher les logs de requête
 
         data = resultat['data'] #on les récupère et affiche
 
-        if isinstance(data, list) and len(data) > 0: #si c'est une liste vide
+        if isinstance(data, Curseur): #SELECT en flux : on affiche les lignes au fur et a mesure
+            try:
+                afficher_tableau(data, page=page, pause=pause_terminal if page else None)
+            finally:
+                data.close() #affichage arreté avant la fin (ou erreur, CTRL+C) : la table n'est plus verrouillée
+            print()
+            print(f"{data.nbr_lignes} ligne(s)")
+
+        elif isinstance(data, list) and len(data) > 0: #si c'est une liste vide
             if isinstance(data[0], dict): #et si le 1er element est un dictionnaire
-                afficher_tableau(data) #on 'laffiche sous forme de tableau
+                afficher_tableau(data, page=page, pause=pause_terminal if page else None) #on 'laffiche sous forme de tableau
             else: #sinon
                 for item in data: #pour chaque item
                     print(item) #on l'imprime
@@ -39,35 +58,218 @@ def afficher_resultat(resultat): #méthode pour afficher les logs de requête
     print("-" * 70)
     print()
 
-def afficher_tableau(lignes):
-    """affcihe une liste de dictionnaires """
-    if not lignes:
-        print("(aucune donnée)")
-        return 
-    
-    colonnes = list(lignes[0].keys()) #on recupère le nom des colonnes
+def afficher_tableau(lignes, sortie=None, page=0, pause=None):
+    """
+    affiche une liste (ou un itérateur) de dictionnaires par paquets de TAILLE_PAQUET lignes (un write par paquet).
+    page : l'entete est répété toutes les page lignes, et pause() est appelée entre deux pages (elle renvoie
+    False pour arreter l'affichage). Renvoie le nombre de lignes affichées
+    """
+    sortie = sortie or sys.stdout
+    lignes = iter(lignes) #on lit les lignes une a une, sans les garder en mémoire
+    premiere = next(lignes, None)
+    if premiere is None:
+        sortie.write("(aucune donnée)\n")
+        return 0
 
+    colonnes = list(premiere.keys()) #on recupère le nom des colonnes
     entete = " | ".join(colonnes) #on crée l'entete du tableau
-    print(entete) #on imprime
-    print("-" * len(entete)) #avec une ligne de seperation
-
-    for ligne in lignes: #pour chaque ligne
-        valeurs = [] #on crée une liste vide pour les valeurs
-        for col in colonnes: #et pour chaque colonne
-            valeur = str(ligne.get(col, '')) #on renvoie la valeur convertie en string
-            if len(valeur) > 30: #mais si la valeur est trop longue
-                valeur = valeur[:27] + '...' #on la tronc
-            valeurs.append(valeur) #et on ajoute la valeur a la liste
-        print(" | ".join(valeurs)) #puis on l'affiche 
+    entete = entete + "\n" + "-" * len(entete) #avec une ligne de seperation
+
+    paquet = [entete]
+    nbr = 0
+    for ligne in itertools.chain([premiere], lignes): #pour chaque ligne
+        if page and nbr and nbr % page == 0: #fin d'une page : on l'écrit, on attend, puis on répete l'entete
+            sortie.write("\n".join(paquet) + "\n")
+            paquet = []
+            if pause is not None and not pause():
+                break
+            paquet.append(entete)
+        paquet.append(" | ".join([texte if len(texte) <= LARGEUR_MAX else texte[:LARGEUR_MAX - 3] + '...'
+                                  for texte in map(str, map(ligne.get, colonnes))])) #valeurs tronquées
+        nbr += 1
+        if len(paquet) >= TAILLE_PAQUET:
+            sortie.write("\n".join(paquet) + "\n")
+            paquet = []
+    if paquet:
+        sortie.write("\n".join(paquet) + "\n")
+    return nbr
+
+def ecrire_csv(lignes, sortie):
+    """écrit les lignes (dictionnaires) en CSV avec une ligne d'entete (NULL = champ vide : relu par COPY)"""
+    lignes = iter(lignes)
+    premiere = next(lignes, None)
+    if premiere is None:
+        return 0
+    colonnes = list(premiere.keys())
+    ecrivain = csv.writer(sortie, lineterminator='\n')
+    ecrivain.writerow(colonnes)
+    nbr = 0
+    for paquet in paquets(itertools.chain([premiere], lignes)):
+        ecrivain.writerows([list(map(ligne.get, colonnes)) for ligne in paquet]) #None = champ vide
+        nbr += len(paquet)
+    return nbr
+
+def ecrire_jsonl(lignes, sortie):
+    """écrit les lignes (dictionnaires) en JSON, une par ligne"""
+    nbr = 0
+    for paquet in paquets(lignes):
+        sortie.write("".join(json.dumps(ligne, ensure_ascii=False, default=valeur_json) + "\n" for ligne in paquet))
+        nbr += len(paquet)
+    return nbr
+
+def paquets(lignes):
+    """les lignes par listes d'au plus TAILLE_PAQUET"""
+    lignes = iter(lignes)
+    while True:
+        paquet = list(itertools.islice(lignes, TAILLE_PAQUET))
+        if not paquet:
+            return
+        yield paquet
+
+def decouper_requetes(lignes):
+    """
+    découpe un script SQL (itérateur de lignes de texte) en requetes séparées par ';', en dehors des chaines
+    entre guillemets '...' ou "..." ('' ou "" dans une chaine = un guillemet) ; les commentaires -- sont enlevés.
+    Renvoie (numéro de la ligne ou commence la requete, requete) au fil de la lecture : un gros script n'est
+    jamais lu en entier
+    """
+    morceaux = [] #la requete en cours
+    guillemet = None #celui qui a ouvert la chaine en cours
+    debut = None
+    for numero, ligne in enumerate(lignes, start=1):
+        position = 0
+        fin = len(ligne)
+        for match in SEPARATEURS.finditer(ligne):
+            if guillemet is not None: #dans une chaine, seul le guillemet fermant compte ('' : on sort et on rentre)
+                if match.group() == guillemet:
+                    guillemet = None
+                continue
+            if match.group() in ('"', "'"):
+                guillemet = match.group()
+            elif match.group() == '--': #la suite de la ligne est un commentaire
+                fin = match.start()
+                break
+            else: #; : fin de la requete
+                morceaux.append(ligne[position:match.start()])
+                requete = "".join(morceaux).strip()
+                if requete:
+                    yield debut or numero, requete
+                morceaux = []
+                debut = None
+                position = match.end()
+        reste = ligne[position:fin] + ("\n" if fin < len(ligne) else "") #le saut de ligne avant le commentaire
+        morceaux.append(reste)
+        if debut is None and (guillemet is not None or reste.strip()):
+            debut = numero
+    requete = "".join(morceaux).strip()
+    if requete: #la derniere requete, sans ; a la fin
+        yield debut or numero, requete
+
+def executer_script(moteur, lignes, format_sortie='table', page=0, arret=False, sortie=None, journal=None,
+                    pause=None):
+    """
+    exécute les requetes du script l'une apres l'autre et écrit leurs résultats dans sortie
+    (table, csv ou jsonl : en csv et jsonl, seulement les lignes des SELECT). La durée et le message de chaque
+    requete sont écrits dans journal (stderr par défaut, pour ne pas se méler aux données).
+    arret : s'arreter a la premiere erreur. pause : voir afficher_tableau. Renvoie le nombre d'erreurs
+    """
+    sortie = sortie or sys.stdout
+    journal = journal or sys.stderr
+    erreurs = 0
+    nbr_requetes = 0
+    debut_script = time.perf_counter()
+    for numero_ligne, requete in decouper_requetes(lignes):
+        nbr_requetes += 1
+        debut = time.perf_counter()
+        try:
+            resultat = moteur.executer(requete, flux=True) #SELECT lu en flux : les lignes sont écrites en les lisant
+            nbr = ecrire_donnees(resultat, format_sortie, sortie, page, pause)
+        except Exception as exception: #une erreur d'écriture ou de lecture du flux
+            resultat = {'status': 'error', 'message': str(exception), 'data': None}
+            nbr = None
+        duree = time.perf_counter() - debut
+        if format_sortie == 'table': #le tableau avant sa durée, si les deux vont au meme endroit
+            sortie.flush()
+        message = resultat['message'] if nbr is None else f"{resultat['message']}, {nbr} ligne(s) écrite(s)"
+        journal.write(f"-- requete {nbr_requetes} (ligne {numero_ligne}) : {duree:.3f} s, "
+                      f"{resultat['status'].upper()}: {message}\n")
+        if resultat['status'] != 'success':
+            erreurs += 1
+            if arret:
+                break
+    sortie.flush()
+    journal.write(f"-- {nbr_requetes} requete(s), {erreurs} erreur(s) en {time.perf_counter() - debut_script:.3f} s\n")
+    return erreurs
+
+def ecrire_donnees(resultat, format_sortie, sortie, page, pause=None):
+    """écrit le résultat d'une requete du script, renvoie le nombre de lignes écrites (None sans lignes)"""
+    data = resultat['data']
+    lignes = isinstance(data, Curseur) or (isinstance(data, list) and data and isinstance(data[0], dict))
+    try:
+        if format_sortie == 'table':
+            sortie.write(f"{resultat['status'].upper()}: {resultat['message']}\n")
+            if lignes:
+                return afficher_tableau(data, sortie, page, pause)
+            if isinstance(data, list):
+                sortie.write("".join(f"{item}\n" for item in data))
+            elif isinstance(data, dict):
+                sortie.write("".join(f"{cle}: {valeur}\n" for cle, valeur in data.items()))
+            return None
+        if not lignes:
+            return None
+        if format_sortie == 'csv':
+            return ecrire_csv(data, sortie)
+        return ecrire_jsonl(data, sortie)
+    finally:
+        if isinstance(data, Curseur):
+            data.close()
+
+def pause_terminal():
+    """attend entre deux pages : Entrée pour la suite, q pour arreter"""
+    try:
+        return input("-- Entrée pour la suite, q pour arreter -- ").strip().lower() != 'q'
+    except EOFError:
+        return False
+
+def lire_arguments():
+    parser = argparse.ArgumentParser(description="client console de Rotterdb : interactif, ou script SQL avec -f / stdin")
+    parser.add_argument('-f', '--fichier', help="script SQL a exécuter (requetes séparées par ';'), - = stdin")
+    parser.add_argument('-d', '--dossier', default='donnees', help="dossier des tables")
+    parser.add_argument('--format', choices=('table', 'csv', 'jsonl'), default='table',
+                        help="sortie des résultats d'un script (csv et jsonl : seulement les lignes des SELECT)")
+    parser.add_argument('--page', type=int, default=0,
+                        help="lignes par page d'un tableau : l'entete est répété, et un terminal attend Entrée")
+    parser.add_argument('--arret', action='store_true', help="arreter le script a la premiere erreur")
+    return parser.parse_args()
 
 def main():
     """ fontion principale client"""
+    arguments = lire_arguments()
+
+    if arguments.fichier is not None or not sys.stdin.isatty(): #script : les requetes s'enchainent sans invite
+        if arguments.fichier in (None, '-'):
+            script = sys.stdin
+        else:
+            try:
+                script = open(arguments.fichier, encoding='utf-8')
+            except OSError as exception:
+                sys.exit(f"Erreur: {exception}")
+        #pages : on attend Entrée seulement si le script ne vient pas du terminal et qu'on y écrit
+        pause = pause_terminal if script is not sys.stdin and sys.stdin.isatty() and sys.stdout.isatty() else None
+        moteur = MoteurSQL(arguments.dossier)
+        try:
+            erreurs = executer_script(moteur, script, arguments.format, arguments.page, arguments.arret, pause=pause)
+        finally:
+            moteur.gestionnaire.fermer()
+            script.close()
+        sys.exit(1 if erreurs else 0)
+
     print("=" * 70)
     print("ROTTERDB - CLIENT CONSOLE LOCAL")
     print("=" * 70)
     print()
 
-    moteur = MoteurSQL('donnees')
+    moteur = MoteurSQL(arguments.dossier)
     print("Moteur SQL initialisé")
     print()
     print("Exemples:")
@@ -77,26 +279,29 @@ def main():
     print(" DESCRIBE users")
     print()
 
-    while True: #on créer une boucle infini de saisie users
-        try:
-            requete = input("SQL> ") #et on demande des requetes "SQL"
+    try:
+        while True: #on créer une boucle infini de saisie users
+            try:
+                requete = input("SQL> ") #et on demande des requetes "SQL"
 
-            if requete.strip().lower() == 'quit': #si le user quite
-                print("Bye") #on affiche le msg d'au revoir
-                break #on sort de la boucle et ferme le prog
+                if requete.strip().lower() == 'quit': #si le user quite
+                    print("Bye") #on affiche le msg d'au revoir
+                    break #on sort de la boucle et ferme le prog
 
-            if not requete.strip(): # si la requete est vide
-                continue #on continue
+                if not requete.strip(): # si la requete est vide
+                    continue #on continue
 
-            resultat = moteur.executer(requete) #si on execute la requete
-            afficher_resultat(resultat) #on renvoie le resultat
+                resultat = moteur.executer(requete, flux=True) #si on execute la requete (SELECT lu en flux)
+                afficher_resultat(resultat, arguments.page) #on renvoie le resultat
 
-        except KeyboardInterrupt: #si le user fait CTRL+C pour sortir
-            print("\nBug ...") #affiche le msg de sortie
-            break #il sort de la boucle et du prog
+            except (KeyboardInterrupt, EOFError): #si le user fait CTRL+C (ou CTRL+D) pour sortir
+                print("\nBug ...") #affiche le msg de sortie
+                break #il sort de la boucle et du prog
 
-        except Exception as exception: # sion pour toute autre exception
-            print(f"Erreur: {exception}") #on afficher l'err
+            except Exception as exception: # sion pour toute autre exception
+                print(f"Erreur: {exception}") #on afficher l'err
+    finally:
+        moteur.gestionnaire.fermer() #comme en mode script : point de controle du journal, fichiers fermés
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+Agrégats (COUNT, SUM, AVG, MIN, MAX) et GROUP BY
+Les lignes arrivent par lots de colonnes (voir GestionnaireDeTable.lots_colonnes) et chaque groupe
+(clé = valeurs des colonnes du GROUP BY) a ses accumulateurs dans un dictionnaire : agrégation par hachage,
+en un seul parcours. Un lot est résumé par groupe d'un coup, avec numpy quand les colonnes sont des tableaux
+numériques (stockage en colonnes), sinon avec sum/min/max sur des listes
+"""
+
+from serveur import format_colonnes #en_liste : tableau lu -> valeurs python
+
+try:
+    import numpy #optionnel : agrégation vectorisée
+except ImportError:
+    numpy = None
+
+TYPES_NUMERIQUES = ('INT', 'FLOAT', 'BOOL', 'BIGSERIAL')
+
+
+class Accumulateur:
+    """l'état d'un agrégat pour un groupe : nbr de valeurs non nulles et somme / min / max"""
+
+    def __init__(self, fonction):
+        self.fonction = fonction
+        self.nbr = 0
+        self.valeur = None
+
+    def fusionner(self, nbr, valeur):
+        """ajoute le résumé d'un lot : nbr valeurs non nulles, de somme (ou min, max) valeur"""
+        if nbr == 0:
+            return
+        self.nbr += nbr
+        if self.fonction == 'COUNT':
+            return
+        if self.valeur is None:
+            self.valeur = valeur
+        elif self.fonction in ('SUM', 'AVG'):
+            self.valeur += valeur
+        elif self.fonction == 'MIN':
+            self.valeur = min(self.valeur, valeur)
+        else:
+            self.valeur = max(self.valeur, valeur)
+
+    def resultat(self):
+        if self.fonction == 'COUNT':
+            return self.nbr
+        if self.fonction == 'AVG':
+            return self.valeur / self.nbr if self.nbr else None
+        return self.valeur #SUM, MIN, MAX : NULL s'il n'y a aucune valeur
+
+
+def resumer_liste(fonction, valeurs):
+    """(nbr, somme / min / max) des valeurs non nulles d'une liste"""
+    valeurs = [valeur for valeur in valeurs if valeur is not None]
+    if not valeurs or fonction == 'COUNT':
+        return len(valeurs), None
+    if fonction in ('SUM', 'AVG'):
+        return len(valeurs), sum(valeurs)
+    try:
+        return len(valeurs), min(valeurs) if fonction == 'MIN' else max(valeurs)
+    except TypeError:
+        raise Exception(f"{fonction} impossible sur des valeurs de types différents")
+
+
+def resumer_tableau(fonction, valeurs, nulls, numeros, nbr_groupes):
+    """
+    comme resumer_liste pour chaque groupe, sur des tableaux numpy : numeros = numéro du groupe de chaque ligne.
+    Les lignes sont triées par groupe puis réduites par tranche (reduceat)
+    """
+    gardees = ~nulls
+    if valeurs.dtype.kind in 'biu': #entiers et booléens : somme exacte sur 64 bits
+        valeurs = valeurs.astype(numpy.int64)
+    valeurs = valeurs[gardees]
+    numeros = numeros[gardees]
+    resumes = [(0, None)] * nbr_groupes
+    if len(valeurs) == 0:
+        return resumes
+    if nbr_groupes == 1: #sans GROUP BY : une seule réduction
+        if fonction == 'COUNT':
+            return [(len(valeurs), None)]
+        operation = {'SUM': valeurs.sum, 'AVG': valeurs.sum, 'MIN': valeurs.min, 'MAX': valeurs.max}[fonction]
+        return [(len(valeurs), operation().item())]
+
+    ordre = numpy.argsort(numeros, kind='stable')
+    numeros = numeros[ordre]
+    valeurs = valeurs[ordre]
+    debuts = numpy.flatnonzero(numpy.r_[True, numeros[1:] != numeros[:-1]]) #début de chaque tranche
+    nbrs = numpy.diff(numpy.r_[debuts, len(numeros)])
+    if fonction == 'COUNT':
+        partiels = [None] * len(debuts)
+    else:
+        operation = {'SUM': numpy.add, 'AVG': numpy.add, 'MIN': numpy.minimum, 'MAX': numpy.maximum}[fonction]
+        partiels = operation.reduceat(valeurs, debuts).tolist()
+    for numero, nbr, partiel in zip(numeros[debuts].tolist(), nbrs.tolist(), partiels):
+        resumes[numero] = (nbr, partiel)
+    return resumes
+
+
+class Agregation:
+    """agrégation par hachage : clé du groupe -> accumulateurs, alimentée lot par lot"""
+
+    def __init__(self, groupes, agregats, types):
+        """groupes : colonnes du GROUP BY, agregats : [(fonction, colonne)] (colonne '*' pour COUNT(*))"""
+        for fonction, colonne in agregats:
+            if colonne != '*' and colonne not in types:
+                raise Exception(f"Colonne inconnue : {colonne}")
+            if fonction in ('SUM', 'AVG') and colonne != '*' and types[colonne] not in TYPES_NUMERIQUES:
+                raise Exception(f"{fonction} impossible sur la colonne {types[colonne]} {colonne}")
+        for colonne in groupes:
+            if colonne not in types:
+                raise Exception(f"Colonne inconnue : {colonne}")
+        self.groupes = groupes
+        self.agregats = agregats
+        self.types = types
+        self.etats = {} #clé du groupe -> [Accumulateur, ...]
+
+    def accumulateurs(self, cle):
+        etat = self.etats.get(cle)
+        if etat is None:
+            etat = self.etats[cle] = [Accumulateur(fonction) for fonction, _ in self.agregats]
+        return etat
+
+    def ajouter_lot(self, lot, nbr_lignes):
+        """lot : {colonne: (valeurs, nulls)} de nbr_lignes lignes"""
+        if nbr_lignes == 0:
+            return
+        if self.groupes: #numéro de groupe de chaque ligne du lot (hachage des clés)
+            colonnes = [format_colonnes.en_liste(*lot[colonne], self.types[colonne]) for colonne in self.groupes]
+            numeros_cles = {}
+            numeros = [numeros_cles.setdefault(cle, len(numeros_cles)) for cle in zip(*colonnes)]
+            cles = list(numeros_cles)
+        else:
+            numeros = None
+            cles = [()]
+        etats = [self.accumulateurs(cle) for cle in cles]
+
+        for i, (fonction, colonne) in enumerate(self.agregats):
+            if colonne == '*': #COUNT(*) : le nombre de lignes de chaque groupe
+                if numeros is None:
+                    resumes = [(nbr_lignes, None)]
+                else:
+                    nbrs = [0] * len(cles)
+                    for numero in numeros:
+                        nbrs[numero] += 1
+                    resumes = [(nbr, None) for nbr in nbrs]
+            else:
+                resumes = self.resumer(fonction, colonne, lot[colonne], numeros, len(cles))
+            for etat, (nbr, partiel) in zip(etats, resumes):
+                etat[i].fusionner(nbr, partiel)
+
+    def fusionner(self, etats):
+        """ajoute les accumulateurs d'une autre agrégation des memes agrégats (calculée sur d'autres lignes)"""
+        for cle, etat in etats.items():
+            for accumulateur, autre in zip(self.accumulateurs(cle), etat):
+                accumulateur.fusionner(autre.nbr, autre.valeur)
+
+    def resumer(self, fonction, colonne, colonne_lot, numeros, nbr_groupes):
+        """les (nbr, partiel) de chaque groupe pour un agrégat"""
+        valeurs, nulls = colonne_lot
+        if numpy is not None and isinstance(valeurs, numpy.ndarray) and self.types[colonne] in TYPES_NUMERIQUES:
+            if numeros is None:
+                numeros = numpy.zeros(len(valeurs), dtype=numpy.intp)
+            else:
+                numeros = numpy.asarray(numeros, dtype=numpy.intp)
+            resumes = resumer_tableau(fonction, valeurs, nulls, numeros, nbr_groupes)
+            if self.types[colonne] == 'BOOL' and fonction in ('MIN', 'MAX'): #réduits en entiers
+                resumes = [(nbr, None if partiel is None else bool(partiel)) for nbr, partiel in resumes]
+            return resumes
+
+        valeurs = format_colonnes.en_liste(valeurs, nulls, self.types[colonne])
+        if numeros is None:
+            return [resumer_liste(fonction, valeurs)]
+        par_groupe = [[] for _ in range(nbr_groupes)]
+        for numero, valeur in zip(numeros, valeurs):
+            par_groupe[numero].append(valeur)
+        return [resumer_liste(fonction, liste) for liste in par_groupe]
+
+    def resultats(self):
+        """(clé du groupe, [résultat de chaque agrégat]) ; sans GROUP BY, une seule ligne meme sans données"""
+        if not self.groupes and not self.etats:
+            self.accumulateurs(())
+        for cle, etat in self.etats.items():
+            yield cle, [accumulateur.resultat() for accumulateur in etat]
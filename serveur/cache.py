@@ -0,0 +1,199 @@
+"""
+Cache des lectures : un LRU borné en octets, partagé par les threads du programme
+- pages : les lignes décodées d'un morceau de table (LIGNES_PAR_PAGE lignes a partir d'une position),
+  relues sans lire ni décoder le fichier (voir GestionnaireDeTable.parcourir_pages)
+- résultats : les lignes d'un SELECT, par texte de requete et paramètres (voir MoteurSQL.cle_resultat)
+Les entrées d'une table ne servent que tant que son fichier est dans l'état connu du cache : (inode, génération
+de l'en-tête) aux formats 2 et 3. Une écriture de ce programme oublie les pages qu'elle touche, les résultats
+de la table, et fait avancer l'état connu ; une écriture d'un autre programme change la génération sur le disque
+et fait oublier toute la table au prochain accès
+"""
+
+import sys
+import bisect
+import threading
+import collections
+
+LIGNES_PAR_PAGE = 4096 #lignes (ou slots) d'une page
+ECHANTILLON = 32 #lignes mesurées pour estimer la taille d'une page ou d'un résultat
+PART_MAX_RESULTAT = 8 #un résultat ne prend pas plus d'un huitieme du cache (un gros SELECT * viderait les pages)
+
+
+def estimer_taille(lignes):
+    """taille approchée en octets d'une liste de lignes (listes de valeurs ou dictionnaires), mesurée sur un échantillon"""
+    if not lignes:
+        return sys.getsizeof(lignes)
+    echantillon = lignes[::max(1, len(lignes) // ECHANTILLON)]
+    octets = 0
+    for ligne in echantillon:
+        valeurs = ligne.values() if isinstance(ligne, dict) else ligne
+        octets += sys.getsizeof(ligne) + sum(sys.getsizeof(valeur) for valeur in valeurs)
+    return sys.getsizeof(lignes) + octets * len(lignes) // len(echantillon)
+
+
+class CacheLectures:
+    """
+    les pages et résultats gardés, du moins récemment utilisé au plus récent, dans au plus taille_max octets.
+    Clés : (nom_table, 'page', position de début) ou (nom_table, 'resultat', requete, paramètres)
+    """
+
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self.entrees = collections.OrderedDict() #clé -> (valeur, taille estimée)
+        self.taille = 0
+        self.cles_tables = {} #nom_table -> clés de ses entrées
+        self.debuts_pages = {} #nom_table -> positions de début de ses pages, triées (pour oublier_positions)
+        self.etats = {} #nom_table -> état du fichier auquel correspondent ses entrées
+        self.verrou = threading.Lock()
+        self.succes = 0 #hits
+        self.echecs = 0 #misses
+        self.evictions = 0 #entrées enlevées pour rester sous taille_max
+        self.invalidations = 0 #entrées oubliées par une écriture (ou un changement vu sur le disque)
+
+    def lire_page(self, nom_table, debut, nbr):
+        """la page (fin, nbr, positions, lignes) qui commence a debut, None si absente ou si elle n'a pas nbr lignes"""
+        with self.verrou:
+            entree = self.entrees.get((nom_table, 'page', debut))
+            if entree is None or entree[0][1] != nbr: #la derniere page d'une table qui a grandi : a relire
+                self.echecs += 1
+                return None
+            self.entrees.move_to_end((nom_table, 'page', debut))
+            self.succes += 1
+            return entree[0]
+
+    def ajouter_page(self, nom_table, etat, debut, page):
+        """garde une page décodée (fin, nbr, positions, lignes) lue dans l'état etat du fichier"""
+        _, _, positions, lignes = page
+        taille = estimer_taille(lignes) + sys.getsizeof(positions) + sys.getsizeof(debut) * len(positions)
+        self.ajouter((nom_table, 'page', debut), etat, page, taille)
+
+    def pages_gardees(self, nom_table, etat):
+        """le nbr de pages de la table gardées pour l'état etat du fichier (EXPLAIN), sans compter de hit ni de miss"""
+        with self.verrou:
+            if self.etats.get(nom_table) != etat:
+                return 0
+            return len(self.debuts_pages.get(nom_table, ()))
+
+    def contient(self, cle, etat):
+        """vrai si le résultat est gardé pour l'état etat de la table (EXPLAIN), sans compter de hit ni de miss"""
+        with self.verrou:
+            return self.etats.get(cle[0]) == etat and cle in self.entrees
+
+    def lire_resultat(self, cle, etat):
+        """les lignes gardées pour le SELECT, None si absentes ou si la table n'est plus dans l'état etat"""
+        self.verifier_etat(cle[0], etat)
+        with self.verrou:
+            entree = self.entrees.get(cle)
+            if entree is None:
+                self.echecs += 1
+                return None
+            self.entrees.move_to_end(cle)
+            self.succes += 1
+            return entree[0]
+
+    def taille_max_resultat(self):
+        return self.taille_max // PART_MAX_RESULTAT
+
+    def ajouter_resultat(self, cle, etat, lignes):
+        """garde les lignes d'un SELECT lu dans l'état etat de la table (rien si elles sont trop grosses)"""
+        taille = estimer_taille(lignes)
+        if taille <= self.taille_max_resultat():
+            self.ajouter(cle, etat, lignes, taille)
+
+    def ajouter(self, cle, etat, valeur, taille):
+        """ajoute l'entrée si la table est toujours dans l'état etat, puis enleve les moins récemment utilisées"""
+        nom_table = cle[0]
+        with self.verrou:
+            if self.etats.get(nom_table) != etat or taille > self.taille_max: #une écriture est passée entre temps
+                return
+            if cle in self.entrees:
+                self.retirer(cle)
+            self.entrees[cle] = (valeur, taille)
+            self.taille += taille
+            self.cles_tables.setdefault(nom_table, set()).add(cle)
+            if cle[1] == 'page':
+                bisect.insort(self.debuts_pages.setdefault(nom_table, []), cle[2])
+            while self.taille > self.taille_max:
+                self.retirer(next(iter(self.entrees)))
+                self.evictions += 1
+
+    def retirer(self, cle):
+        """enleve une entrée (sous le verrou)"""
+        _, taille = self.entrees.pop(cle)
+        self.taille -= taille
+        nom_table = cle[0]
+        cles = self.cles_tables[nom_table]
+        cles.discard(cle)
+        if not cles:
+            del self.cles_tables[nom_table]
+        if cle[1] == 'page':
+            debuts = self.debuts_pages[nom_table]
+            del debuts[bisect.bisect_left(debuts, cle[2])]
+            if not debuts:
+                del self.debuts_pages[nom_table]
+
+    def verifier_etat(self, nom_table, etat):
+        """début d'une lecture : si le fichier n'est plus dans l'état connu, ses entrées sont oubliées"""
+        with self.verrou:
+            if self.etats.get(nom_table) != etat:
+                self.vider_table(nom_table)
+                self.etats[nom_table] = etat
+
+    def avancer(self, nom_table, avant, apres, positions=None):
+        """
+        une écriture de ce programme fait passer le fichier de l'état avant a apres : les résultats de la table
+        et les pages qui contiennent les positions écrites sont oubliés (positions None = toutes les pages).
+        Si le cache ne connaissait pas l'état avant, toute la table est oubliée
+        """
+        with self.verrou:
+            if self.etats.get(nom_table) != avant or positions is None:
+                self.vider_table(nom_table)
+            else:
+                for cle in [cle for cle in self.cles_tables.get(nom_table, ()) if cle[1] == 'resultat']:
+                    self.retirer(cle)
+                    self.invalidations += 1
+                self.oublier_positions(nom_table, positions)
+            self.etats[nom_table] = apres
+
+    def oublier_positions(self, nom_table, positions):
+        """
+        enleve les pages qui contiennent une des positions (sous le verrou). Une ligne ajoutée juste après
+        la derniere page, si elle n'est pas pleine, l'oublie aussi (fin None : la derniere page, fin inconnue)
+        """
+        for position in positions:
+            debuts = self.debuts_pages.get(nom_table)
+            if not debuts:
+                return
+            rang = bisect.bisect_right(debuts, position) - 1
+            if rang < 0:
+                continue
+            cle = (nom_table, 'page', debuts[rang])
+            fin, nbr, _, _ = self.entrees[cle][0]
+            if fin is None or position < fin or (position == fin and nbr < LIGNES_PAR_PAGE):
+                self.retirer(cle)
+                self.invalidations += 1
+
+    def oublier_table(self, nom_table):
+        """oublie toutes les entrées et l'état de la table (DROP, CREATE, MIGRATE, VACUUM, écriture interrompue)"""
+        with self.verrou:
+            self.vider_table(nom_table)
+            self.etats.pop(nom_table, None)
+
+    def vider_table(self, nom_table):
+        """enleve les entrées de la table (sous le verrou)"""
+        for cle in list(self.cles_tables.get(nom_table, ())):
+            self.retirer(cle)
+            self.invalidations += 1
+
+    def statistiques(self):
+        """compteurs du cache : succes (hits), echecs (misses), evictions, invalidations, entrees, octets, taille_max"""
+        with self.verrou:
+            return {
+                'succes': self.succes,
+                'echecs': self.echecs,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entrees': len(self.entrees),
+                'octets': self.taille,
+                'taille_max': self.taille_max,
+            }
@@ -0,0 +1,200 @@
+"""
+Client du serveur réseau (serveur/reseau.py) : connexions bloquantes et pool de connexions
+
+    pool = Pool('127.0.0.1', 5433, taille=4)
+    with pool.connexion() as connexion:
+        connexion.executer("INSERT INTO users VALUES ('Rotter', 32)")
+        for ligne in connexion.curseur("SELECT * FROM users"): #lignes reçues par lots
+            print(ligne)
+    pool.fermer()
+"""
+
+import socket
+import threading
+import itertools
+import contextlib
+import collections
+
+from serveur import protocole
+
+
+class Connexion:
+    """une connexion au serveur, qui est aussi une session (BEGIN ... COMMIT)"""
+
+    def __init__(self, hote='127.0.0.1', port=5433, delai=None):
+        self.socket = socket.create_connection((hote, port), timeout=delai)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) #petites trames : pas d'attente de Nagle
+        self.fichier = self.socket.makefile('rb')
+        self.curseur_ouvert = None #le curseur dont les lots sont en train d'arriver
+
+    def envoyer(self, requetes):
+        """envoie des requetes d'un coup (une seule écriture), sans attendre les réponses"""
+        self.socket.sendall(b''.join(protocole.encoder(protocole.REQUETE, {'requete': requete}) for requete in requetes))
+
+    def lire_trame(self):
+        """(sorte, corps) de la trame suivante"""
+        entete = self.fichier.read(protocole.FORMAT_TRAME.size)
+        if len(entete) < protocole.FORMAT_TRAME.size:
+            raise ConnectionError("Connexion fermée par le serveur")
+        longueur, sorte = protocole.lire_entete(entete)
+        corps = self.fichier.read(longueur)
+        if len(corps) < longueur:
+            raise ConnectionError("Connexion fermée par le serveur")
+        return sorte, protocole.decoder(corps)
+
+    def lire_reponse(self):
+        """la réponse a la prochaine requete, comme MoteurSQL.executer (les lignes d'un SELECT dans une liste)"""
+        self.terminer_curseur()
+        sorte, corps = self.lire_trame()
+        if sorte == protocole.RESULTAT:
+            return corps
+        curseur = CurseurReseau(self, corps)
+        curseur.close() #tous les lots, gardés
+        fin = curseur.fin
+        return {'status': fin['status'], 'message': fin['message'],
+                'data': list(curseur.lignes) if fin['status'] == 'success' else None}
+
+    def executer(self, requete):
+        """envoie la requete et attend sa réponse"""
+        self.envoyer([requete])
+        return self.lire_reponse()
+
+    def executer_plusieurs(self, requetes):
+        """pipelining : toutes les requetes partent avant la premiere réponse, renvoie les réponses dans l'ordre"""
+        requetes = list(requetes)
+        self.envoyer(requetes)
+        return [self.lire_reponse() for _ in requetes]
+
+    def curseur(self, requete):
+        """
+        un SELECT dont les lignes sont lues par lots a mesure qu'on les parcourt.
+        La connexion ne sert a rien d'autre tant qu'il n'est pas fini (la suite est lue et jetée sinon)
+        """
+        self.terminer_curseur()
+        self.envoyer([requete])
+        sorte, corps = self.lire_trame()
+        if sorte == protocole.RESULTAT:
+            if corps['status'] != 'success':
+                raise Exception(corps['message'])
+            return iter(corps['data'] or [])
+        curseur = self.curseur_ouvert = CurseurReseau(self, corps)
+        return curseur
+
+    def terminer_curseur(self):
+        if self.curseur_ouvert is not None:
+            self.curseur_ouvert.close()
+
+    def fermer(self):
+        try:
+            self.fichier.close()
+        finally:
+            self.socket.close()
+
+
+class CurseurReseau:
+    """les lignes d'un SELECT reçues par lots (trames LOT), jusqu'a la trame FIN"""
+
+    def __init__(self, connexion, debut):
+        self.connexion = connexion
+        self.message = debut['message']
+        self.lignes = collections.deque()
+        self.fin = None #le corps de la trame FIN, une fois reçue
+        self.nbr_lignes = 0
+        self.erreur_levee = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.lignes:
+            if self.fin is not None:
+                if self.fin['status'] != 'success' and not self.erreur_levee: #lecture échouée sur le serveur
+                    self.erreur_levee = True
+                    raise Exception(self.fin['message'])
+                raise StopIteration
+            self.lire_lot()
+        self.nbr_lignes += 1
+        return self.lignes.popleft()
+
+    def lire_lot(self):
+        sorte, corps = self.connexion.lire_trame()
+        if sorte == protocole.LOT:
+            self.lignes.extend(protocole.lignes_du_lot(corps))
+        elif sorte == protocole.FIN:
+            self.fin = corps
+            if self.connexion.curseur_ouvert is self: #la connexion est libre
+                self.connexion.curseur_ouvert = None
+        else:
+            raise Exception(f"Trame inattendue : {sorte}")
+
+    def fetchone(self):
+        return next(self, None)
+
+    def fetchmany(self, taille=100):
+        return list(itertools.islice(self, taille))
+
+    def fetchall(self):
+        return list(self)
+
+    def close(self):
+        """lit les lots restants : la connexion est libre pour la requete suivante"""
+        while self.fin is None:
+            self.lire_lot()
+
+
+class Pool:
+    """un pool de connexions au meme serveur, partagé entre threads"""
+
+    def __init__(self, hote='127.0.0.1', port=5433, taille=4, delai=None):
+        self.hote = hote
+        self.port = port
+        self.delai = delai
+        self.libres = [] #connexions ouvertes et disponibles
+        self.condition = threading.Condition()
+        self.places = threading.Semaphore(taille) #au plus 'taille' connexions ouvertes
+        self.ferme = False
+
+    @contextlib.contextmanager
+    def connexion(self):
+        """
+        prete une connexion (en ouvre une si aucune n'est libre), la rend a la fin du bloc.
+        Une transaction commencée dans le bloc doit y etre finie (COMMIT / ROLLBACK) : la session suit la connexion
+        """
+        self.places.acquire()
+        try:
+            connexion = self.prendre()
+        except BaseException:
+            self.places.release()
+            raise
+        rendue = False
+        try:
+            yield connexion
+            connexion.terminer_curseur()
+            with self.condition:
+                if not self.ferme:
+                    self.libres.append(connexion)
+                    rendue = True
+        finally:
+            if not rendue: #erreur dans le bloc : la connexion est peut-etre au milieu d'une réponse
+                connexion.fermer()
+            self.places.release()
+
+    def prendre(self):
+        with self.condition:
+            if self.ferme:
+                raise Exception("Pool fermé")
+            if self.libres:
+                return self.libres.pop()
+        return Connexion(self.hote, self.port, self.delai)
+
+    def executer(self, requete):
+        """une requete sur une connexion du pool"""
+        with self.connexion() as connexion:
+            return connexion.executer(requete)
+
+    def fermer(self):
+        with self.condition:
+            self.ferme = True
+            libres, self.libres = self.libres, []
+        for connexion in libres:
+            connexion.fermer()
@@ -0,0 +1,798 @@
+"""
+Parser et évaluation des conditions WHERE / HAVING, de la liste du SELECT, des VALUES d'un INSERT
+et des colonnes d'un CREATE TABLE
+Le texte est découpé en tokens en une seule passe, puis transformé en arbre (des tuples),
+puis compilé une seule fois en fonction python appelée sur chaque ligne
+"""
+
+import re #pour transformer les motifs LIKE en regex
+import operator #les comparaisons, choisies une fois a la compilation
+
+
+MOTS_CLES = {'AND', 'OR', 'NOT', 'IS', 'NULL', 'IN', 'LIKE', 'BETWEEN', 'TRUE', 'FALSE', 'AS',
+             'WHERE', 'GROUP', 'BY', 'HAVING', 'ORDER', 'ASC', 'DESC', 'LIMIT', 'OFFSET', 'SET'}
+FONCTIONS_AGREGAT = {'COUNT', 'SUM', 'AVG', 'MIN', 'MAX'}
+
+#une regex par sorte de token, essayées dans l'ordre, les espaces avant le token sont sautés dans le meme match
+TOKENS = re.compile(r"""
+    \s*(?:
+    (?P<symbole>[(),*])
+  | (?P<nombre>-?\d+(?:\.\d*)?|-?\.\d+)
+  | (?P<chaine>'[^']*(?:''[^']*)*'|"[^"]*(?:""[^"]*)*")
+  | (?P<nom>\w+)
+  | (?P<parametre>:\w+)
+  | (?P<operateur><=|>=|<>|!=|=|<|>)
+    )""", re.VERBOSE)
+
+
+def decouper(texte):
+    """découpe le texte en liste de tokens (sorte, valeur), en une seule passe"""
+    tokens = []
+    position = 0
+    for match in TOKENS.finditer(texte):
+        if match.start() != position: #finditer a sauté un caractère que rien ne reconnait
+            break
+        position = match.end()
+        sorte = match.lastgroup
+        valeur = match.group(sorte)
+
+        if sorte == 'nombre':
+            valeur = float(valeur) if '.' in valeur else int(valeur)
+        elif sorte == 'chaine': #on enleve les guillemets et on dé-double les guillemets échappés
+            guillemet = valeur[0]
+            valeur = valeur[1:-1].replace(guillemet * 2, guillemet)
+        elif sorte == 'nom' and valeur.upper() in MOTS_CLES:
+            sorte = 'mot'
+            valeur = valeur.upper()
+        elif sorte == 'parametre': #:nom, ou :1, :2, ... pour les ? (voir numeroter_parametres)
+            valeur = Parametre(valeur[1:])
+        tokens.append((sorte, valeur))
+
+    reste = texte[position:].lstrip()
+    if reste:
+        raise Exception(f"Caractère inattendu : {reste[0]!r}")
+    return tokens
+
+
+class Parametre:
+    """un ? ou :nom d'une requete préparée, remplacé par sa valeur a l'exécution (voir lier)"""
+
+    def __init__(self, nom):
+        self.nom = nom
+
+    def __repr__(self):
+        return f":{self.nom}"
+
+
+def numeroter_parametres(texte):
+    """remplace les ? hors des chaines par :1, :2, ... (les paramètres nommés :nom restent)"""
+    if '?' not in texte:
+        return texte
+    morceaux = []
+    debut = 0
+    numero = 0
+    guillemet = None
+    for i, caractere in enumerate(texte):
+        if guillemet is not None: #dans une chaine, seul le guillemet fermant compte
+            if caractere == guillemet:
+                guillemet = None
+        elif caractere in ('"', "'"):
+            guillemet = caractere
+        elif caractere == '?':
+            numero += 1
+            morceaux.append(texte[debut:i])
+            morceaux.append(f":{numero}")
+            debut = i + 1
+    morceaux.append(texte[debut:])
+    return ''.join(morceaux)
+
+
+def lier(objet, parametres):
+    """
+    une copie de l'objet (tuples, listes, dictionnaires) ou chaque Parametre est remplacé par sa valeur.
+    parametres : une séquence pour les ?, un dictionnaire pour les :nom
+    """
+    if isinstance(objet, Parametre):
+        try:
+            if parametres is None:
+                raise KeyError(objet.nom)
+            if isinstance(parametres, dict):
+                return parametres[objet.nom]
+            if not objet.nom.isdigit():
+                raise Exception(f"Paramètre nommé :{objet.nom} : passez un dictionnaire")
+            return parametres[int(objet.nom) - 1]
+        except (KeyError, IndexError):
+            raise Exception(f"Paramètre manquant : {'?' if objet.nom.isdigit() else ':'}{objet.nom}")
+    if isinstance(objet, tuple):
+        return tuple(lier(element, parametres) for element in objet)
+    if isinstance(objet, list):
+        return [lier(element, parametres) for element in objet]
+    if isinstance(objet, dict):
+        return {cle: lier(valeur, parametres) for cle, valeur in objet.items()}
+    return objet
+
+
+def parametres_de(objet):
+    """les noms des paramètres (Parametre) contenus dans l'objet : tuples, listes, dictionnaires"""
+    if isinstance(objet, Parametre):
+        return {objet.nom}
+    if isinstance(objet, dict):
+        objet = objet.values()
+    elif not isinstance(objet, (tuple, list)):
+        return set()
+    noms = set()
+    for element in objet:
+        noms |= parametres_de(element)
+    return noms
+
+
+class ParserCondition:
+    """parser récursif : ou -> et -> non -> comparaison -> terme"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def suivant(self):
+        """le token courant sans avancer, (None, None) a la fin"""
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def avancer(self):
+        token = self.suivant()
+        self.position += 1
+        return token
+
+    def accepter(self, sorte, valeur=None):
+        """avance si le token courant correspond, et renvoie True"""
+        token_sorte, token_valeur = self.suivant()
+        if token_sorte == sorte and (valeur is None or token_valeur == valeur):
+            self.position += 1
+            return True
+        return False
+
+    def attendre(self, sorte, valeur=None):
+        if not self.accepter(sorte, valeur):
+            attendu = valeur or sorte
+            raise Exception(f"Condition invalide : '{attendu}' attendu")
+
+    def selection(self):
+        """la liste du SELECT : [(arbre, alias)], arbre = ('tout',), ('col', nom) ou ('agg', fonction, colonne)"""
+        elements = []
+        while True:
+            if self.accepter('symbole', '*'):
+                elements.append((('tout',), None))
+            else:
+                arbre = self.terme()
+                if arbre[0] not in ('col', 'agg'):
+                    raise Exception("Colonne ou agrégat attendu dans le SELECT")
+                alias = None
+                if self.accepter('mot', 'AS'):
+                    sorte, alias = self.avancer()
+                    if sorte != 'nom':
+                        raise Exception("Nom attendu apres AS")
+                elements.append((arbre, alias))
+            if not self.accepter('symbole', ','):
+                break
+        if self.position != len(self.tokens):
+            raise Exception(f"SELECT invalide pres de '{self.suivant()[1]}'")
+        return elements
+
+    def tri(self):
+        """la liste du ORDER BY : [(arbre, descendant)], arbre = ('col', nom) ou ('agg', fonction, colonne)"""
+        elements = []
+        while True:
+            arbre = self.terme()
+            if arbre[0] not in ('col', 'agg'):
+                raise Exception("Colonne ou agrégat attendu dans ORDER BY")
+            descendant = self.accepter('mot', 'DESC')
+            if not descendant:
+                self.accepter('mot', 'ASC')
+            elements.append((arbre, descendant))
+            if not self.accepter('symbole', ','):
+                break
+        if self.position != len(self.tokens):
+            raise Exception(f"ORDER BY invalide pres de '{self.suivant()[1]}'")
+        return elements
+
+    def affectations(self):
+        """la liste du SET d'un UPDATE : {colonne: valeur}, les valeurs sont des constantes"""
+        valeurs = {}
+        while True:
+            sorte, colonne = self.avancer()
+            if sorte != 'nom':
+                raise Exception("Colonne attendue dans SET")
+            self.attendre('operateur', '=')
+            arbre = self.terme()
+            if arbre[0] != 'val':
+                raise Exception(f"SET {colonne} : valeur constante attendue")
+            valeurs[colonne] = arbre[1]
+            if not self.accepter('symbole', ','):
+                break
+        if self.position != len(self.tokens):
+            raise Exception(f"SET invalide pres de '{self.suivant()[1]}'")
+        return valeurs
+
+    def tuples(self):
+        """les tuples du VALUES d'un INSERT : [[valeur, ...], ...], les valeurs sont des constantes"""
+        lignes = []
+        while True:
+            self.attendre('symbole', '(')
+            valeurs = []
+            while True:
+                arbre = self.terme()
+                if arbre[0] != 'val':
+                    raise Exception(f"VALUES : valeur constante attendue, pas {arbre[1]}")
+                valeurs.append(arbre[1])
+                if not self.accepter('symbole', ','):
+                    break
+            self.attendre('symbole', ')')
+            lignes.append(valeurs)
+            if not self.accepter('symbole', ','):
+                break
+        if self.position != len(self.tokens):
+            raise Exception(f"VALUES invalide pres de '{self.suivant()[1]}'")
+        return lignes
+
+    def creation(self):
+        """
+        la suite d'un CREATE TABLE nom : (colonne type, ...) [WITH (option = valeur, ...)]
+        renvoie ([(colonne, type)], {option: valeur}). Un type peut avoir des arguments : DECIMAL(10, 2)
+        """
+        self.attendre('symbole', '(')
+        colonnes = []
+        while True:
+            sorte, colonne = self.avancer()
+            if sorte != 'nom':
+                raise Exception(f"Nom de colonne attendu, pas '{colonne}'")
+            sorte, type_col = self.avancer()
+            if sorte != 'nom':
+                raise Exception(f"Type attendu pour la colonne {colonne}")
+            type_col = type_col.upper()
+            if self.accepter('symbole', '('): #arguments du type
+                arguments = []
+                while True:
+                    sorte, argument = self.avancer()
+                    if sorte != 'nombre':
+                        raise Exception(f"{type_col} : nombre attendu")
+                    arguments.append(str(argument))
+                    if not self.accepter('symbole', ','):
+                        break
+                self.attendre('symbole', ')')
+                type_col = f"{type_col}({','.join(arguments)})"
+            colonnes.append((colonne, type_col))
+            if not self.accepter('symbole', ','):
+                break
+        if not self.accepter('symbole', ')'): #ex: NOT NULL, PRIMARY KEY
+            raise Exception(f"Colonne {colonnes[-1][0]} : '{self.suivant()[1]}' non supporté")
+
+        options = {}
+        sorte, mot = self.suivant()
+        if sorte == 'nom' and mot.upper() == 'WITH':
+            self.avancer()
+            self.attendre('symbole', '(')
+            while True:
+                sorte, option = self.avancer()
+                if sorte != 'nom':
+                    raise Exception("Option de table attendue dans WITH")
+                self.attendre('operateur', '=')
+                sorte, valeur = self.avancer()
+                if sorte not in ('chaine', 'nombre', 'nom'):
+                    raise Exception(f"Valeur attendue pour l'option {option}")
+                options[option.lower()] = valeur
+                if not self.accepter('symbole', ','):
+                    break
+            self.attendre('symbole', ')')
+        if self.position != len(self.tokens):
+            raise Exception(f"CREATE TABLE invalide pres de '{self.suivant()[1]}'")
+        return colonnes, options
+
+    def parser(self):
+        """parse toute la condition"""
+        arbre = self.ou()
+        if self.position != len(self.tokens): #il reste des tokens non compris
+            raise Exception(f"Condition invalide pres de '{self.suivant()[1]}'")
+        return arbre
+
+    def ou(self):
+        gauche = self.et()
+        while self.accepter('mot', 'OR'):
+            gauche = ('ou', gauche, self.et())
+        return gauche
+
+    def et(self):
+        gauche = self.non()
+        while self.accepter('mot', 'AND'):
+            gauche = ('et', gauche, self.non())
+        return gauche
+
+    def non(self):
+        if self.accepter('mot', 'NOT'):
+            return ('non', self.non())
+        return self.comparaison()
+
+    def comparaison(self):
+        gauche = self.terme()
+        sorte, valeur = self.suivant()
+
+        if sorte == 'operateur': # a = b, a < b, ...
+            self.avancer()
+            operateur = '<>' if valeur == '!=' else valeur
+            return ('cmp', operateur, gauche, self.terme())
+
+        if self.accepter('mot', 'IS'): # IS [NOT] NULL
+            negation = self.accepter('mot', 'NOT')
+            self.attendre('mot', 'NULL')
+            arbre = ('est_null', gauche)
+            return ('non', arbre) if negation else arbre
+
+        negation = self.accepter('mot', 'NOT') # [NOT] IN / LIKE / BETWEEN
+        if self.accepter('mot', 'IN'):
+            self.attendre('symbole', '(')
+            liste = [self.terme()]
+            while self.accepter('symbole', ','):
+                liste.append(self.terme())
+            self.attendre('symbole', ')')
+            arbre = ('dans', gauche, liste)
+        elif self.accepter('mot', 'LIKE'):
+            arbre = ('like', gauche, self.terme())
+        elif self.accepter('mot', 'BETWEEN'):
+            bas = self.terme()
+            self.attendre('mot', 'AND')
+            arbre = ('entre', gauche, bas, self.terme())
+        elif negation:
+            raise Exception("Condition invalide : IN, LIKE ou BETWEEN attendu apres NOT")
+        else:
+            return gauche #un terme seul (ex: WHERE actif)
+        return ('non', arbre) if negation else arbre
+
+    def terme(self):
+        sorte, valeur = self.avancer()
+        if sorte in ('nombre', 'chaine', 'parametre'):
+            return ('val', valeur)
+        if sorte == 'mot' and valeur in ('NULL', 'TRUE', 'FALSE'):
+            return ('val', {'NULL': None, 'TRUE': True, 'FALSE': False}[valeur])
+        if sorte == 'nom' and valeur.upper() in FONCTIONS_AGREGAT and self.accepter('symbole', '('):
+            fonction = valeur.upper() # COUNT(*), SUM(col), ...
+            if self.accepter('symbole', '*'):
+                if fonction != 'COUNT':
+                    raise Exception(f"{fonction}(*) impossible, seulement COUNT(*)")
+                colonne = '*'
+            else:
+                sorte, colonne = self.avancer()
+                if sorte != 'nom':
+                    raise Exception(f"Colonne attendue dans {fonction}()")
+            self.attendre('symbole', ')')
+            return ('agg', fonction, colonne)
+        if sorte == 'nom':
+            return ('col', valeur)
+        if sorte == 'symbole' and valeur == '(':
+            arbre = self.ou()
+            self.attendre('symbole', ')')
+            return arbre
+        if sorte is None:
+            raise Exception("Condition incomplète")
+        raise Exception(f"Condition invalide pres de '{valeur}'")
+
+
+def parser_condition(texte):
+    """texte de la clause WHERE -> arbre de la condition"""
+    return ParserCondition(decouper(texte)).parser()
+
+
+def parser_selection(texte):
+    """texte de la liste du SELECT -> [(arbre, alias)]"""
+    return ParserCondition(decouper(texte)).selection()
+
+
+def separer_clauses(texte, clauses):
+    """
+    découpe la fin d'une requete en clauses, ex: clauses = [('WHERE',), ('GROUP', 'BY'), ('HAVING',)].
+    Renvoie {premier mot de la clause: ses tokens}. Les clauses doivent etre dans l'ordre donné,
+    et un mot clé entre parentheses ou dans une chaine n'est pas un début de clause
+    """
+    tokens = decouper(texte)
+    resultat = {}
+    courante = None
+    suivantes = list(clauses)
+    profondeur = 0
+    i = 0
+    while i < len(tokens):
+        sorte, valeur = tokens[i]
+        if sorte == 'symbole' and valeur in '()':
+            profondeur += 1 if valeur == '(' else -1
+        elif sorte == 'mot' and profondeur == 0:
+            rang = next((r for r, clause in enumerate(suivantes)
+                         if tokens[i:i + len(clause)] == [('mot', mot) for mot in clause]), None)
+            if rang is not None: #début d'une clause
+                courante = suivantes[rang][0]
+                resultat[courante] = []
+                i += len(suivantes[rang])
+                suivantes = suivantes[rang + 1:] #les clauses suivantes seulement
+                continue
+        if courante is None:
+            raise Exception(f"Requete invalide pres de '{valeur}'")
+        resultat[courante].append(tokens[i])
+        i += 1
+
+    for clause in clauses:
+        if clause[0] in resultat and not resultat[clause[0]]:
+            raise Exception(f"Clause {' '.join(clause)} vide")
+    return resultat
+
+
+def parser_tri(tokens):
+    """tokens du ORDER BY -> [(arbre, descendant)]"""
+    return ParserCondition(tokens).tri()
+
+
+def parser_tuples(texte):
+    """texte du VALUES d'un INSERT -> [[valeur, ...], ...]"""
+    return ParserCondition(decouper(texte)).tuples()
+
+
+def parser_creation(texte):
+    """texte d'un CREATE TABLE apres le nom de la table -> ([(colonne, type)], {option: valeur})"""
+    return ParserCondition(decouper(texte)).creation()
+
+
+def parser_affectations(tokens):
+    """tokens du SET -> {colonne: valeur}"""
+    return ParserCondition(tokens).affectations()
+
+
+def parser_tokens(tokens):
+    """tokens d'une condition (voir separer_clauses) -> arbre de la condition"""
+    return ParserCondition(tokens).parser()
+
+
+def nom_agregat(arbre):
+    """le nom d'un agrégat dans le résultat : COUNT(*), SUM(age), ..."""
+    return f"{arbre[1]}({arbre[2]})"
+
+
+def texte_valeur(valeur):
+    """une constante en SQL : NULL, TRUE, 'texte' (guillemets doublés), 42, :nom"""
+    if valeur is None:
+        return 'NULL'
+    if isinstance(valeur, bool):
+        return 'TRUE' if valeur else 'FALSE'
+    if isinstance(valeur, str):
+        return "'" + valeur.replace("'", "''") + "'"
+    return repr(valeur)
+
+
+def texte(arbre):
+    """l'arbre remis en SQL (EXPLAIN), avec les parentheses nécessaires : a > 3 AND (b IS NULL OR c IN (1, 2))"""
+    sorte = arbre[0]
+    if sorte == 'val':
+        return texte_valeur(arbre[1])
+    if sorte == 'col':
+        return arbre[1]
+    if sorte == 'agg':
+        return nom_agregat(arbre)
+    if sorte == 'tout':
+        return '*'
+    if sorte == 'cmp':
+        return f"{texte(arbre[2])} {arbre[1]} {texte(arbre[3])}"
+    if sorte in ('et', 'ou'):
+        morceaux = []
+        for enfant in arbre[1:]: #OR est moins prioritaire que AND : entre parentheses dans un AND
+            morceau = texte(enfant)
+            morceaux.append(f"({morceau})" if sorte == 'et' and enfant[0] == 'ou' else morceau)
+        return (' AND ' if sorte == 'et' else ' OR ').join(morceaux)
+    if sorte == 'non':
+        if arbre[1][0] == 'est_null':
+            return f"{texte(arbre[1][1])} IS NOT NULL"
+        return f"NOT ({texte(arbre[1])})"
+    if sorte == 'est_null':
+        return f"{texte(arbre[1])} IS NULL"
+    if sorte == 'dans':
+        return f"{texte(arbre[1])} IN ({', '.join(texte(element) for element in arbre[2])})"
+    if sorte == 'like':
+        return f"{texte(arbre[1])} LIKE {texte(arbre[2])}"
+    if sorte == 'entre':
+        return f"{texte(arbre[1])} BETWEEN {texte(arbre[2])} AND {texte(arbre[3])}"
+    raise Exception(f"Condition inconnue : {sorte}")
+
+
+def agregats_de(arbre):
+    """les agrégats ('agg', fonction, colonne) utilisés dans l'arbre, sans doublons"""
+    if arbre[0] == 'agg':
+        return [arbre]
+    agregats = []
+    for enfant in arbre[1:]:
+        enfants = enfant if isinstance(enfant, list) else [enfant]
+        for element in enfants:
+            if isinstance(element, tuple):
+                agregats.extend(a for a in agregats_de(element) if a not in agregats)
+    return agregats
+
+
+def colonnes_de(arbre):
+    """l'ensemble des colonnes utilisées par la condition"""
+    if arbre[0] == 'col':
+        return {arbre[1]}
+    if arbre[0] == 'val':
+        return set()
+    colonnes = set()
+    for enfant in arbre[1:]:
+        if isinstance(enfant, tuple):
+            colonnes |= colonnes_de(enfant)
+        elif isinstance(enfant, list): #la liste du IN
+            for element in enfant:
+                colonnes |= colonnes_de(element)
+    return colonnes
+
+
+def motif_like(motif):
+    """transforme un motif LIKE ('Rot%', 'a_c') en regex compilée"""
+    morceaux = []
+    for caractere in motif:
+        if caractere == '%':
+            morceaux.append('.*')
+        elif caractere == '_':
+            morceaux.append('.')
+        else:
+            morceaux.append(re.escape(caractere))
+    return re.compile(''.join(morceaux), re.DOTALL)
+
+
+OPERATEURS = {'=': operator.eq, '<>': operator.ne, '<': operator.lt, '<=': operator.le,
+              '>': operator.gt, '>=': operator.ge}
+
+
+def comparer(operateur, gauche, droite):
+    """compare deux valeurs, None si l'une est NULL (logique SQL a 3 valeurs)"""
+    if gauche is None or droite is None:
+        return None
+    try:
+        return OPERATEURS[operateur](gauche, droite)
+    except TypeError:
+        raise Exception(f"Comparaison impossible entre {gauche!r} et {droite!r}")
+
+
+def compiler_comparaison(operateur, colonne, constante, positions):
+    """colonne op constante, le cas le plus courant : la colonne est lue directement dans la ligne"""
+    if colonne not in positions:
+        raise Exception(f"Colonne inconnue : {colonne}")
+    indice = positions[colonne]
+    fonction = OPERATEURS[operateur]
+    if constante is None: #col = NULL n'est jamais vrai
+        return lambda valeurs: None
+
+    def comparaison(valeurs):
+        valeur = valeurs[indice]
+        if valeur is None:
+            return None
+        try:
+            return fonction(valeur, constante)
+        except TypeError:
+            raise Exception(f"Comparaison impossible entre {valeur!r} et {constante!r}")
+    return comparaison
+
+
+def compiler(arbre, positions):
+    """
+    compile l'arbre en fonction f(valeurs) -> True / False / None,
+    valeurs étant la liste des valeurs de la ligne dans l'ordre des colonnes de la table.
+    positions : dictionnaire nom de colonne -> indice dans la ligne
+    """
+    sorte = arbre[0]
+
+    if sorte == 'val':
+        valeur = arbre[1]
+        return lambda valeurs: valeur
+
+    if sorte == 'col':
+        if arbre[1] not in positions:
+            raise Exception(f"Colonne inconnue : {arbre[1]}")
+        indice = positions[arbre[1]]
+        return lambda valeurs: valeurs[indice]
+
+    if sorte == 'agg': #seulement dans HAVING : la valeur de l'agrégat pour le groupe
+        if nom_agregat(arbre) not in positions:
+            raise Exception(f"Agrégat impossible ici : {nom_agregat(arbre)}")
+        indice = positions[nom_agregat(arbre)]
+        return lambda valeurs: valeurs[indice]
+
+    if sorte == 'cmp':
+        operateur = arbre[1]
+        if arbre[2][0] == 'col' and arbre[3][0] == 'val':
+            return compiler_comparaison(operateur, arbre[2][1], arbre[3][1], positions)
+        if arbre[2][0] == 'val' and arbre[3][0] == 'col': #a < col <=> col > a
+            return compiler_comparaison(INVERSE.get(operateur, operateur), arbre[3][1], arbre[2][1], positions) #<> : <>
+        gauche = compiler(arbre[2], positions)
+        droite = compiler(arbre[3], positions)
+        return lambda valeurs: comparer(operateur, gauche(valeurs), droite(valeurs))
+
+    if sorte == 'et':
+        gauche = compiler(arbre[1], positions)
+        droite = compiler(arbre[2], positions)
+
+        def et(valeurs):
+            a = gauche(valeurs)
+            if a is False:
+                return False #inutile d'évaluer la droite
+            b = droite(valeurs)
+            if b is False:
+                return False
+            if a is None or b is None:
+                return None
+            return True
+        return et
+
+    if sorte == 'ou':
+        gauche = compiler(arbre[1], positions)
+        droite = compiler(arbre[2], positions)
+
+        def ou(valeurs):
+            a = gauche(valeurs)
+            if a is True:
+                return True #inutile d'évaluer la droite
+            b = droite(valeurs)
+            if b is True:
+                return True
+            if a is None or b is None:
+                return None
+            return False
+        return ou
+
+    if sorte == 'non':
+        enfant = compiler(arbre[1], positions)
+
+        def non(valeurs):
+            resultat = enfant(valeurs)
+            return None if resultat is None else not resultat
+        return non
+
+    if sorte == 'est_null':
+        enfant = compiler(arbre[1], positions)
+        return lambda valeurs: enfant(valeurs) is None
+
+    if sorte == 'dans':
+        enfant = compiler(arbre[1], positions)
+        liste = [compiler(element, positions) for element in arbre[2]]
+        if all(element[0] == 'val' for element in arbre[2]): #liste constante : un set, calculé une fois
+            constantes = {element[1] for element in arbre[2] if element[1] is not None}
+            avec_null = any(element[1] is None for element in arbre[2]) #x IN (1, NULL) : inconnu si x <> 1
+            absent = None if avec_null else False
+
+            def dans_constantes(valeurs):
+                valeur = enfant(valeurs)
+                if valeur is None:
+                    return None
+                return True if valeur in constantes else absent
+            return dans_constantes
+
+        def dans(valeurs):
+            valeur = enfant(valeurs)
+            if valeur is None:
+                return None
+            resultat = False
+            for element in liste:
+                autre = element(valeurs)
+                if autre is None: #un NULL de la liste : au mieux inconnu
+                    resultat = None
+                elif valeur == autre:
+                    return True
+            return resultat
+        return dans
+
+    if sorte == 'like':
+        enfant = compiler(arbre[1], positions)
+        if arbre[2][0] != 'val' or not isinstance(arbre[2][1], str):
+            raise Exception("LIKE attend un motif texte")
+        regex = motif_like(arbre[2][1]) #compilé une seule fois
+
+        def like(valeurs):
+            valeur = enfant(valeurs)
+            if valeur is None:
+                return None
+            return regex.fullmatch(str(valeur)) is not None
+        return like
+
+    if sorte == 'entre':
+        enfant = compiler(arbre[1], positions)
+        bas = compiler(arbre[2], positions)
+        haut = compiler(arbre[3], positions)
+
+        def entre(valeurs):
+            valeur = enfant(valeurs)
+            a = comparer('>=', valeur, bas(valeurs))
+            b = comparer('<=', valeur, haut(valeurs))
+            if a is False or b is False:
+                return False
+            if a is None or b is None:
+                return None
+            return True
+        return entre
+
+    raise Exception(f"Condition inconnue : {sorte}")
+
+
+def typer(arbre, convertir):
+    """
+    l'arbre ou chaque constante comparée a une colonne est convertie au type de la colonne,
+    avec convertir(colonne, valeur) -> valeur. ex: age = '32' -> age = 32
+    """
+    sorte = arbre[0]
+    if sorte == 'cmp':
+        operateur, gauche, droite = arbre[1:]
+        if gauche[0] == 'col' and droite[0] == 'val':
+            return ('cmp', operateur, gauche, ('val', convertir(gauche[1], droite[1])))
+        if gauche[0] == 'val' and droite[0] == 'col':
+            return ('cmp', operateur, ('val', convertir(droite[1], gauche[1])), droite)
+    elif sorte in ('dans', 'entre') and arbre[1][0] == 'col':
+        colonne = arbre[1][1]
+        termes = arbre[2] if sorte == 'dans' else arbre[2:]
+        termes = [('val', convertir(colonne, terme[1])) if terme[0] == 'val' else terme for terme in termes]
+        return ('dans', arbre[1], termes) if sorte == 'dans' else ('entre', arbre[1], *termes)
+    elif sorte in ('et', 'ou'):
+        return (sorte, typer(arbre[1], convertir), typer(arbre[2], convertir))
+    elif sorte == 'non':
+        return ('non', typer(arbre[1], convertir))
+    return arbre
+
+
+INVERSE = {'=': '=', '<': '>', '<=': '>=', '>': '<', '>=': '<='} #a < col <=> col > a
+
+
+def conjonctions(arbre):
+    """les conditions reliées par AND au premier niveau : a AND (b AND c) -> [a, b, c]"""
+    if arbre[0] == 'et':
+        return conjonctions(arbre[1]) + conjonctions(arbre[2])
+    return [arbre]
+
+
+def contraintes_index(arbre):
+    """
+    les conditions de la clause WHERE utilisables par un index, chacune étant :
+    ('egal', colonne, [valeurs])                                  pour col = v et col IN (...)
+    ('intervalle', colonne, bas, bas_inclus, haut, haut_inclus)   pour <, <=, >, >= et BETWEEN
+    Elles sont toutes reliées par AND, donc chacune suffit a réduire les lignes a lire
+    """
+    contraintes = []
+    for condition in conjonctions(arbre):
+        sorte = condition[0]
+
+        if sorte == 'cmp' and condition[1] in INVERSE:
+            operateur, gauche, droite = condition[1], condition[2], condition[3]
+            if gauche[0] == 'val' and droite[0] == 'col': #constante a gauche : on retourne la comparaison
+                operateur, gauche, droite = INVERSE[operateur], droite, gauche
+            if gauche[0] != 'col' or droite[0] != 'val' or droite[1] is None:
+                continue
+            colonne, valeur = gauche[1], droite[1]
+            if operateur == '=':
+                contraintes.append(('egal', colonne, [valeur]))
+            elif operateur in ('<', '<='):
+                contraintes.append(('intervalle', colonne, None, False, valeur, operateur == '<='))
+            else:
+                contraintes.append(('intervalle', colonne, valeur, operateur == '>=', None, False))
+
+        elif sorte == 'dans' and condition[1][0] == 'col' and all(e[0] == 'val' for e in condition[2]):
+            contraintes.append(('egal', condition[1][1], [e[1] for e in condition[2] if e[1] is not None]))
+
+        elif sorte == 'entre' and condition[1][0] == 'col' and condition[2][0] == 'val' and condition[3][0] == 'val':
+            if condition[2][1] is not None and condition[3][1] is not None:
+                contraintes.append(('intervalle', condition[1][1], condition[2][1], True, condition[3][1], True))
+
+    return contraintes
+
+
+def texte_contrainte(contrainte):
+    """une contrainte de contraintes_index remise en SQL (EXPLAIN)"""
+    colonne = contrainte[1]
+    if contrainte[0] == 'egal':
+        valeurs = contrainte[2]
+        if len(valeurs) == 1:
+            return f"{colonne} = {texte_valeur(valeurs[0])}"
+        return f"{colonne} IN ({', '.join(texte_valeur(valeur) for valeur in valeurs)})"
+    _, _, bas, bas_inclus, haut, haut_inclus = contrainte
+    morceaux = []
+    if bas is not None:
+        morceaux.append(f"{colonne} {'>=' if bas_inclus else '>'} {texte_valeur(bas)}")
+    if haut is not None:
+        morceaux.append(f"{colonne} {'<=' if haut_inclus else '<'} {texte_valeur(haut)}")
+    return ' AND '.join(morceaux)
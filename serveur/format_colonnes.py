@@ -0,0 +1,172 @@
+"""
+Stockage en colonnes : CREATE TABLE ... WITH (storage = 'columnar')
+
+L'en-tête est celui du format 2 (voir format_fixe) avec l'octet stockage = format_fixe.STOCKAGE_COLONNES,
+son compteur NBR_LIGNES donne le nombre de lignes valides. Chaque colonne a ses propres fichiers :
+    table_<nom>.<colonne>.col : les valeurs bout a bout, INT = 4o, FLOAT = 8o, BOOL = 1o, BIGSERIAL = 8o (little endian)
+                                TEXT et SERIAL : position de fin (8o) du texte dans le .txt
+    table_<nom>.<colonne>.txt : les textes bout a bout (TEXT et SERIAL seulement)
+    table_<nom>.<colonne>.nul : bitmap des nulls, le bit k est la ligne k
+    table_<nom>.del           : bitmap des lignes supprimées (DELETE), vidé par VACUUM
+Lire une colonne ne lit donc que ses octets, et numpy (s'il est installé) la décode sans boucle Python
+"""
+
+import array #repli quand numpy n'est pas installé
+import struct
+import sys
+
+try:
+    import numpy #optionnel : colonnes décodées en tableaux numpy
+except ImportError:
+    numpy = None
+
+EXTENSIONS = ('.col', '.txt', '.nul') #les fichiers d'une colonne
+EXTENSION_SUPPRIMEES = '.del' #le bitmap des lignes supprimées de la table
+
+#taille d'une valeur dans le .col, type numpy et code du module array correspondants
+LARGEURS = {'INT': 4, 'FLOAT': 8, 'BOOL': 1, 'TEXT': 8, 'SERIAL': 8, 'BIGSERIAL': 8}
+TYPES_NUMPY = {'INT': '<i4', 'FLOAT': '<f8', 'BOOL': '?', 'TEXT': '<u8', 'SERIAL': '<u8', 'BIGSERIAL': '<i8'}
+CODES_ARRAY = {'INT': 'i', 'FLOAT': 'd', 'BOOL': 'B', 'TEXT': 'Q', 'SERIAL': 'Q', 'BIGSERIAL': 'q'}
+FORMATS_STRUCT = {'INT': '<i', 'FLOAT': '<d', 'BOOL': '<?', 'TEXT': '<Q', 'SERIAL': '<Q', 'BIGSERIAL': '<q'}
+TYPES_TEXTE = ('TEXT', 'SERIAL')
+
+FORMAT_FIN_TEXTE = struct.Struct('<Q')
+
+
+def encoder_colonne(type_col, valeurs, fin_textes=0):
+    """
+    encode les valeurs d'une colonne (None = null). Renvoie (octets du .col, octets du .txt, nulls)
+    fin_textes : taille actuelle du .txt, les nouvelles positions de fin en partent
+    """
+    nulls = [valeur is None for valeur in valeurs]
+    if type_col in TYPES_TEXTE:
+        textes = [b'' if valeur is None else str(valeur).encode('utf-8') for valeur in valeurs]
+        fins = []
+        for texte in textes:
+            fin_textes += len(texte)
+            fins.append(fin_textes)
+        return struct.pack(f'<{len(fins)}Q', *fins), b''.join(textes), nulls
+
+    if type_col in ('INT', 'BIGSERIAL'):
+        propres = [0 if valeur is None else int(valeur) for valeur in valeurs]
+    elif type_col == 'FLOAT':
+        propres = [0.0 if valeur is None else float(valeur) for valeur in valeurs]
+    elif type_col == 'BOOL':
+        propres = [False if valeur is None else bool(valeur) for valeur in valeurs]
+    else:
+        raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+    format_valeur = FORMATS_STRUCT[type_col][1:]
+    return struct.pack(f'<{len(propres)}{format_valeur}', *propres), b'', nulls
+
+
+def ecrire_nulls(fichier, debut, nulls):
+    """écrit les bits des lignes debut, debut+1, ... dans le bitmap ouvert en 'r+b' (le dernier octet est complété)"""
+    decalage = debut % 8
+    fichier.seek(debut // 8)
+    premier = fichier.read(1) if decalage else b''
+    bits = int.from_bytes(premier, 'little') & ((1 << decalage) - 1) #les bits deja écrits de cet octet
+    for i, est_null in enumerate(nulls):
+        if est_null:
+            bits |= 1 << (decalage + i)
+    fichier.seek(debut // 8)
+    fichier.write(bits.to_bytes((decalage + len(nulls) + 7) // 8, 'little'))
+
+
+def changer_bits(fichier, numeros, valeur):
+    """met a valeur (True = 1) les bits des lignes numeros dans un bitmap ouvert en 'r+b', sans toucher aux autres"""
+    octets = {} #rang de l'octet -> bits a changer
+    for numero in numeros:
+        octets[numero // 8] = octets.get(numero // 8, 0) | 1 << numero % 8
+    for rang in sorted(octets):
+        fichier.seek(rang)
+        ancien = fichier.read(1)
+        ancien = ancien[0] if ancien else 0 #au-dela de la fin du fichier : bits a 0
+        fichier.seek(rang)
+        fichier.write(bytes([ancien | octets[rang] if valeur else ancien & ~octets[rang] & 0xFF]))
+
+
+def lire_valeurs(fichier, type_col, debut, nbr):
+    """les valeurs brutes des lignes debut a debut+nbr : tableau numpy, ou array.array sans numpy"""
+    largeur = LARGEURS[type_col]
+    fichier.seek(debut * largeur)
+    donnees = fichier.read(nbr * largeur)
+    if len(donnees) < nbr * largeur:
+        raise Exception("Colonne incomplète")
+    if numpy is not None:
+        return numpy.frombuffer(donnees, dtype=TYPES_NUMPY[type_col])
+    valeurs = array.array(CODES_ARRAY[type_col])
+    valeurs.frombytes(donnees)
+    if sys.byteorder == 'big': #les fichiers sont en little endian
+        valeurs.byteswap()
+    return valeurs
+
+
+def lire_nulls(fichier, debut, nbr):
+    """le masque des nulls des lignes debut a debut+nbr : tableau numpy de booléens, ou liste"""
+    fichier.seek(debut // 8)
+    taille = (debut % 8 + nbr + 7) // 8
+    donnees = fichier.read(taille)
+    donnees += bytes(taille - len(donnees)) #au-dela de la fin du fichier : bits a 0
+    decalage = debut % 8
+    if numpy is not None:
+        bits = numpy.unpackbits(numpy.frombuffer(donnees, dtype=numpy.uint8), bitorder='little')
+        return bits[decalage:decalage + nbr].astype(bool)
+    bits = int.from_bytes(donnees, 'little') >> decalage
+    return [bool(bits >> i & 1) for i in range(nbr)]
+
+
+def lire_textes(fichier_col, fichier_txt, debut, nbr):
+    """les textes des lignes debut a debut+nbr (une seule lecture du .txt)"""
+    if nbr == 0:
+        return []
+    if debut > 0: #la fin du texte précédent est le début du premier
+        fins = lire_valeurs(fichier_col, 'TEXT', debut - 1, nbr + 1).tolist()
+        depart = fins.pop(0)
+    else:
+        fins = lire_valeurs(fichier_col, 'TEXT', 0, nbr).tolist()
+        depart = 0
+    fichier_txt.seek(depart)
+    bloc = fichier_txt.read(fins[-1] - depart)
+
+    textes = []
+    position = 0
+    for fin in fins:
+        suivante = fin - depart
+        textes.append(bloc[position:suivante].decode('utf-8'))
+        position = suivante
+    return textes
+
+
+def fin_textes(fichier_col, nbr_lignes):
+    """taille utile du .txt : la position de fin du texte de la derniere ligne"""
+    if nbr_lignes == 0:
+        return 0
+    fichier_col.seek((nbr_lignes - 1) * FORMAT_FIN_TEXTE.size)
+    return FORMAT_FIN_TEXTE.unpack(fichier_col.read(FORMAT_FIN_TEXTE.size))[0]
+
+
+def enlever(valeurs, supprimees):
+    """les valeurs (tableau numpy, array.array ou liste) sans celles des lignes supprimées (masque)"""
+    if numpy is not None and isinstance(valeurs, numpy.ndarray):
+        return valeurs[~numpy.asarray(supprimees, dtype=bool)]
+    if numpy is not None and isinstance(supprimees, numpy.ndarray):
+        supprimees = supprimees.tolist()
+    gardees = [valeur for valeur, supprimee in zip(valeurs, supprimees) if not supprimee]
+    if isinstance(valeurs, array.array): #reste un tableau (en_liste convertit ses BOOL)
+        return array.array(valeurs.typecode, gardees)
+    return gardees
+
+
+def en_liste(valeurs, nulls, type_col):
+    """valeurs Python d'une colonne lue (ou d'une liste deja Python), None pour les nulls"""
+    if not isinstance(valeurs, list):
+        valeurs = valeurs.tolist()
+        if type_col == 'BOOL' and numpy is None: #array.array de 'B' : des entiers
+            valeurs = [bool(valeur) for valeur in valeurs]
+    if numpy is not None and isinstance(nulls, numpy.ndarray):
+        if not nulls.any():
+            return valeurs
+        nulls = nulls.tolist()
+    elif not any(nulls):
+        return valeurs
+    return [None if est_null else valeur for valeur, est_null in zip(valeurs, nulls)]
@@ -0,0 +1,242 @@
+"""
+Format 3 des tables : des lignes compactes de taille variable, ajoutées les unes a la suite des autres
+
+Fichier table_<nom>.db :
+    en-tête : celui du format 2 (voir format_fixe) avec la version 3. Le compteur TAILLE_LIGNES donne
+              la place des lignes comptées : la fin de la derniere ligne est connue sans parcours
+    lignes  : longueur du reste de la ligne (varint) | bitmap | valeurs des colonnes non nulles
+              bitmap : 1 bit par colonne (null), puis 1 bit par colonne BOOL (sa valeur), arrondi a l'octet
+              INT et BIGSERIAL = varint zigzag (1 octet de -64 a 63), FLOAT = 8o, BOOL = rien (dans le bitmap),
+              TEXT et SERIAL = longueur (varint) + texte. Pas de marqueur par valeur, ni de padding pour un null
+La longueur en tete de ligne permet de passer a la ligne suivante sans lire les colonnes qui ne sont pas demandées.
+Varint : 7 bits par octet, poids faibles d'abord, le bit 0x80 dit qu'un octet suit
+"""
+
+import struct
+import functools #les décodeurs compilés, gardés par structure
+
+VERSION_COMPACTE = 3
+
+FORMAT_FLOAT = struct.Struct('<d')
+TYPES_TEXTE = ('TEXT', 'SERIAL')
+TYPES_ENTIERS = ('INT', 'BIGSERIAL')
+LIMITES_ENTIERS = {'INT': 1 << 31, 'BIGSERIAL': 1 << 63} #memes bornes que les formats 1 et 2 (4 et 8 octets)
+
+#sorte de chaque type, pour écrire le code du décodeur de chaque colonne (voir compiler_lecture)
+ENTIER, TEXTE, REEL, BOOLEEN = 0, 1, 2, 3
+SORTES = {'INT': ENTIER, 'BIGSERIAL': ENTIER, 'TEXT': TEXTE, 'SERIAL': TEXTE, 'FLOAT': REEL, 'BOOL': BOOLEEN}
+
+PETITS_VARINTS = [bytes((octet,)) for octet in range(0x80)] #les varints d'un octet, déjà encodés
+
+
+def encoder_varint(nombre):
+    """les octets du varint d'un entier positif"""
+    if nombre < 0x80:
+        return PETITS_VARINTS[nombre]
+    octets = bytearray()
+    while nombre >= 0x80:
+        octets.append(nombre & 0x7F | 0x80)
+        nombre >>= 7
+    octets.append(nombre)
+    return bytes(octets)
+
+
+def lire_varint(tampon, position):
+    """décode le varint a position, renvoie (valeur, position qui suit). Lève IndexError s'il dépasse du tampon"""
+    valeur = 0
+    decalage = 0
+    while True:
+        octet = tampon[position]
+        position += 1
+        valeur |= (octet & 0x7F) << decalage
+        if octet < 0x80:
+            return valeur, position
+        decalage += 7
+
+
+def encoder_entier(valeur, type_col):
+    """un INT ou BIGSERIAL en varint zigzag : les petits négatifs restent courts (-1 -> 1, 1 -> 2)"""
+    limite = LIMITES_ENTIERS[type_col]
+    if not -limite <= valeur < limite:
+        raise Exception(f"Entier hors limites pour {type_col} : {valeur}")
+    return encoder_varint(valeur << 1 if valeur >= 0 else (-valeur << 1) - 1)
+
+
+def octets_bitmap(types):
+    """taille du bitmap d'une ligne : les nulls, puis les valeurs des BOOL"""
+    return (len(types) + types.count('BOOL') + 7) // 8
+
+
+def bits_booleens(types):
+    """le bit de la valeur de chaque colonne BOOL dans le bitmap (0 pour les autres colonnes)"""
+    bits = []
+    bit = 1 << len(types)
+    for type_col in types:
+        if type_col == 'BOOL':
+            bits.append(bit)
+            bit <<= 1
+        else:
+            bits.append(0)
+    return bits
+
+
+def encoder_lignes(types, lignes):
+    """
+    encode des lignes (listes de valeurs dans l'ordre des colonnes).
+    Renvoie (octets des lignes, taille de chaque ligne encodée)
+    """
+    taille_bitmap = octets_bitmap(types)
+    booleens = bits_booleens(types)
+    morceaux = []
+    tailles = []
+
+    for valeurs in lignes:
+        bits = 0
+        corps = []
+        for indice, (valeur, type_col) in enumerate(zip(valeurs, types)):
+            if valeur is None:
+                bits |= 1 << indice
+            elif type_col in TYPES_ENTIERS:
+                corps.append(encoder_entier(int(valeur), type_col))
+            elif type_col in TYPES_TEXTE:
+                texte = str(valeur).encode('utf-8')
+                corps.append(encoder_varint(len(texte)))
+                corps.append(texte)
+            elif type_col == 'FLOAT':
+                corps.append(FORMAT_FLOAT.pack(float(valeur)))
+            elif type_col == 'BOOL':
+                if valeur:
+                    bits |= booleens[indice]
+            else:
+                raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+        ligne = bits.to_bytes(taille_bitmap, 'little') + b''.join(corps)
+        longueur = encoder_varint(len(ligne))
+        morceaux.append(longueur)
+        morceaux.append(ligne)
+        tailles.append(len(longueur) + len(ligne))
+
+    return b''.join(morceaux), tailles
+
+
+def decoder_retenues(tampon, valeurs, retenues, lecture):
+    """la ligne est gardée : décode les textes retenus, puis les colonnes projetées après la derniere filtrée"""
+    textes, position, bits = retenues
+    for indice, depart in textes:
+        longueur, depart = lire_varint(tampon, depart)
+        valeurs[indice] = tampon[depart:depart + longueur].decode('utf-8')
+    if lecture[1] is not None:
+        lecture[1](tampon, position, bits, valeurs)
+
+
+def preparer_lecture(types, roles):
+    """
+    les décodeurs d'un parcours : (decoder, suite), compilés une fois par structure et roles des colonnes
+    (0 = sauter la valeur, 1 = la décoder, 2 = la décoder seulement si la ligne est gardée par le filtre).
+    decoder(tampon, position) décode une ligne comme GestionnaireDeTable.decoder_ligne et renvoie
+    (valeurs, retenues, position de fin de ligne) ; seules les colonnes jusqu'a la derniere de role 1 sont lues,
+    la longueur de la ligne donne sa fin. Lève IndexError si la ligne dépasse du tampon.
+    suite(tampon, position, bits, valeurs) décode les colonnes qui suivent la derniere filtrée, pour les lignes
+    gardées (voir decoder_retenues), None s'il n'y en a pas
+    """
+    for type_col in types:
+        if type_col not in SORTES:
+            raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+    return compiler_lecture(tuple(types), tuple(roles))
+
+
+@functools.lru_cache(maxsize=256)
+def compiler_lecture(types, roles):
+    """
+    preparer_lecture pour une structure : le code Python des décodeurs est écrit pour ces colonnes-la
+    (ni boucle sur les colonnes, ni test du type de chaque valeur) puis compilé
+    """
+    demandees = [indice for indice, role in enumerate(roles) if role]
+    filtrees = [indice for indice, role in enumerate(roles) if role == 1]
+    nbr_lues = demandees[-1] + 1 if demandees else 0
+    nbr_filtrees = filtrees[-1] + 1 if filtrees else 0
+    booleens = bits_booleens(list(types))
+    colonnes = [(indice, 1 << indice, SORTES[types[indice]], roles[indice], booleens[indice])
+                for indice in range(nbr_lues)]
+    suite = [(indice, bit_null, sorte, 1 if role else 0, bit_bool) #lignes gardées : role 2 = décoder
+             for indice, bit_null, sorte, role, bit_bool in colonnes[nbr_filtrees:]]
+    taille_bitmap = octets_bitmap(list(types))
+    variables = [f"v{indice}" for indice in range(len(types))]
+
+    code = [
+        "def decoder(tampon, position):",
+        "    longueur = tampon[position]",
+        "    if longueur < 0x80:",
+        "        position += 1",
+        "    else:",
+        "        longueur, position = lire_varint(tampon, position)",
+        "    fin = position + longueur",
+        "    if fin > len(tampon):", #toute la ligne doit etre dans le tampon
+        "        raise IndexError",
+        #jusqu'a 8 colonnes et BOOL : pas besoin de int.from_bytes
+        "    bits = tampon[position]" if taille_bitmap == 1 else
+        f"    bits = int.from_bytes(tampon[position:position + {taille_bitmap}], 'little')",
+        f"    position += {taille_bitmap}",
+        "    textes = []",
+    ]
+    if variables: #colonne sautée ou null = None
+        code.append("    " + " = ".join(variables) + " = None")
+    code += ["    " + ligne for ligne in code_colonnes(colonnes[:nbr_filtrees], lambda indice: f"v{indice}")]
+    code.append(f"    return [{', '.join(variables)}], (textes, position, bits), fin")
+    if suite:
+        code.append("def suite(tampon, position, bits, valeurs):")
+        code += ["    " + ligne for ligne in code_colonnes(suite, lambda indice: f"valeurs[{indice}]")]
+
+    decodeurs = {'lire_varint': lire_varint, 'lire_float': FORMAT_FLOAT.unpack_from}
+    exec(compile("\n".join(code), f"<format 3 : {', '.join(types)}>", 'exec'), decodeurs)
+    return decodeurs['decoder'], decodeurs.get('suite')
+
+
+def code_colonnes(colonnes, cible):
+    """
+    les lignes de code qui décodent les colonnes [(indice, bit du null, sorte, role, bit du BOOL)] a partir de
+    position et mettent chaque valeur dans cible(indice). Un texte de role 2 est seulement retenu dans textes
+    """
+    code = []
+    for indice, bit_null, sorte, role, bit_bool in colonnes:
+        valeur = cible(indice)
+        if sorte == ENTIER:
+            if role: #les varints de 1 a 3 octets (jusqu'a +-1 million) sont décodés sur place
+                corps = [
+                    "octet = tampon[position]",
+                    "if octet < 0x80:",
+                    "    valeur = octet",
+                    "    position += 1",
+                    "elif tampon[position + 1] < 0x80:",
+                    "    valeur = octet & 0x7F | tampon[position + 1] << 7",
+                    "    position += 2",
+                    "elif tampon[position + 2] < 0x80:",
+                    "    valeur = octet & 0x7F | (tampon[position + 1] & 0x7F) << 7 | tampon[position + 2] << 14",
+                    "    position += 3",
+                    "else:",
+                    "    valeur, position = lire_varint(tampon, position)",
+                    f"{valeur} = (valeur >> 1) ^ -(valeur & 1)",
+                ]
+            else:
+                corps = ["while tampon[position] >= 0x80:", "    position += 1", "position += 1"]
+        elif sorte == TEXTE:
+            corps = [f"textes.append(({indice}, position))"] if role == 2 else []
+            corps += [
+                "longueur = tampon[position]",
+                "if longueur < 0x80:",
+                "    position += 1",
+                "else:",
+                "    longueur, position = lire_varint(tampon, position)",
+            ]
+            if role == 1:
+                corps.append(f"{valeur} = tampon[position:position + longueur].decode('utf-8')")
+            corps.append("position += longueur")
+        elif sorte == REEL:
+            corps = [f"{valeur} = lire_float(tampon, position)[0]"] if role else []
+            corps.append("position += 8")
+        elif role: #BOOL : sa valeur est dans le bitmap
+            corps = [f"{valeur} = bits & {bit_bool} != 0"]
+        else:
+            continue
+        code.append(f"if not bits & {bit_null}:") #null : rien dans la ligne
+        code += ["    " + ligne for ligne in corps]
+    return code
@@ -0,0 +1,194 @@
+"""
+Format 2 des tables : des lignes de taille fixe ("slots") + un tas pour les textes
+
+Fichier table_<nom>.db :
+    en-tête : b'RTDB' (4o) | version (1o) | stockage (1o) | réservé (2o)
+              nbr_colonnes (4o) | pour chaque colonne : longueur du nom (4o), nom, code type (1o)
+              compteurs : 8 entiers de 8o (voir NBR_LIGNES, ...)
+    slots   : un par ligne, tous de la meme taille, la ligne k est donc a taille_entete + k * taille_slot
+              drapeaux (1o) | bitmap des nulls (1 bit par colonne) | valeurs de taille fixe
+              INT = 4o, FLOAT = 8o, BOOL = 1o, BIGSERIAL = 8o, TEXT et SERIAL = position (8o) + longueur (4o) dans le tas
+              un slot supprimé garde sa place : drapeaux (DRAPEAU_SUPPRIMEE) | numéro + 1 du slot libre suivant (8o),
+              les slots libres forment une liste chaînée depuis le compteur LIBRE, réutilisée par les INSERT
+Fichier table_<nom>.tas : les textes, les uns a la suite des autres
+"""
+
+import mmap
+import random
+import struct
+
+MAGIC = b'RTDB' #les 4 premiers octets d'une table versionnée (une table v1 commence par son nbr de colonnes)
+VERSION_FIXE = 2
+
+FORMAT_DEBUT = struct.Struct('<4sBBH') #magic, version, stockage, réservé
+FORMAT_COMPTEURS = struct.Struct('<8Q')
+
+#indices des compteurs dans l'en-tête
+NBR_LIGNES = 0 #nombre de slots écrits
+NBR_VIVANTES = 1 #nombre de lignes non supprimées
+TAILLE_TAS = 2 #taille des données valides du tas
+DERNIER_ID = 3 #le plus grand _id BIGSERIAL donné (ou réservé par une transaction), jamais redonné
+LIBRE = 4 #numéro + 1 du premier slot libre (0 = aucun)
+TAS_LIBRE = 5 #octets du tas qui ne sont plus utilisés (textes supprimés ou remplacés), récupérés par VACUUM
+TAILLE_LIGNES = 6 #format 3 (voir format_compact) : octets des lignes comptées, la fin de la derniere ligne
+GENERATION = 7 #avance a chaque écriture des compteurs : le cache des lectures voit les écritures des autres programmes
+
+#octet stockage de l'en-tête
+STOCKAGE_LIGNES = 0 #slots dans la table (ce module)
+STOCKAGE_COLONNES = 1 #un fichier par colonne (voir format_colonnes)
+
+DRAPEAU_SUPPRIMEE = 1 #bit des drapeaux d'un slot : ligne supprimée
+FORMAT_LIBRE = struct.Struct('<BQ') #début d'un slot supprimé : drapeaux, numéro + 1 du slot libre suivant
+
+#format struct de chaque type dans un slot
+FORMATS_CHAMPS = {'INT': 'i', 'FLOAT': 'd', 'BOOL': '?', 'TEXT': 'QI', 'SERIAL': 'QI', 'BIGSERIAL': 'q'}
+TYPES_TEXTE = ('TEXT', 'SERIAL') #SERIAL : les _id en texte des tables créées avant BIGSERIAL
+TYPES_ENTIERS = ('INT', 'BIGSERIAL')
+
+
+def format_slot(types):
+    """le struct.Struct d'un slot pour ces types de colonnes (compilé une seule fois par table)"""
+    octets_nulls = (len(types) + 7) // 8
+    champs = ''.join(FORMATS_CHAMPS[type_col] for type_col in types)
+    return struct.Struct(f'<B{octets_nulls}s{champs}')
+
+
+def places_champs(types):
+    """indice de la valeur de chaque colonne dans le tuple d'un slot décodé (0 = drapeaux, 1 = bitmap)"""
+    places = []
+    place = 2
+    for type_col in types:
+        places.append(place)
+        place += 2 if type_col in TYPES_TEXTE else 1
+    return places
+
+
+def generation_initiale():
+    """
+    la génération d'une nouvelle table : un nombre aléatoire, pour qu'une table recréée (parfois sur le meme inode)
+    ne reprenne pas la génération de l'ancienne
+    """
+    return random.getrandbits(32)
+
+
+def entete_fixe(colonnes, stockage=0, compteurs=None, version=VERSION_FIXE):
+    """les octets de l'en-tête d'une table au format 2 (ou 3, qui a le meme en-tête)"""
+    if compteurs is None:
+        compteurs = [0] * 8
+        compteurs[GENERATION] = generation_initiale()
+    morceaux = [FORMAT_DEBUT.pack(MAGIC, version, stockage, 0), struct.pack('<I', len(colonnes))]
+    for nom, code_type in colonnes:
+        nom_binaire = nom.encode('utf-8')
+        morceaux.append(struct.pack('<I', len(nom_binaire)) + nom_binaire + struct.pack('<B', code_type))
+    morceaux.append(FORMAT_COMPTEURS.pack(*compteurs))
+    return b''.join(morceaux)
+
+
+def encoder_slots(types, lignes, format_ligne, debut_tas):
+    """
+    encode des lignes (listes de valeurs dans l'ordre des colonnes) en slots.
+    Renvoie (octets des slots, octets a ajouter au tas). Les textes sont placés dans le tas a partir de debut_tas
+    """
+    slots = []
+    tas = []
+    position_tas = debut_tas
+    octets_nulls = (len(types) + 7) // 8
+
+    for valeurs in lignes:
+        nulls = 0
+        champs = []
+        for indice, (valeur, type_col) in enumerate(zip(valeurs, types)):
+            if valeur is None:
+                nulls |= 1 << indice
+                champs.extend((0, 0) if type_col in TYPES_TEXTE else (0,))
+            elif type_col in TYPES_ENTIERS:
+                champs.append(int(valeur))
+            elif type_col == 'FLOAT':
+                champs.append(float(valeur))
+            elif type_col == 'BOOL':
+                champs.append(bool(valeur))
+            elif type_col in TYPES_TEXTE:
+                texte = str(valeur).encode('utf-8')
+                champs.extend((position_tas, len(texte)))
+                tas.append(texte)
+                position_tas += len(texte)
+            else:
+                raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+        slots.append(format_ligne.pack(0, nulls.to_bytes(octets_nulls, 'little'), *champs))
+
+    return b''.join(slots), b''.join(tas)
+
+
+def modifier_champs(champs, modifications, types, places, debut_tas):
+    """
+    applique les modifications {indice de colonne: valeur} aux champs d'un slot décodé.
+    Les nouveaux textes sont placés dans le tas a partir de debut_tas, les anciens ne sont plus utilisés.
+    Renvoie (champs modifiés, octets a ajouter au tas, octets du tas libérés)
+    """
+    champs = list(champs)
+    nulls = int.from_bytes(champs[1], 'little')
+    tas = []
+    liberes = 0
+    for indice, valeur in modifications.items():
+        type_col = types[indice]
+        place = places[indice]
+        if type_col in TYPES_TEXTE and not nulls >> indice & 1: #l'ancien texte
+            liberes += champs[place + 1]
+        if valeur is None:
+            nulls |= 1 << indice
+            champs[place] = 0
+            if type_col in TYPES_TEXTE:
+                champs[place + 1] = 0
+            continue
+        nulls &= ~(1 << indice)
+        if type_col in TYPES_ENTIERS:
+            champs[place] = int(valeur)
+        elif type_col == 'FLOAT':
+            champs[place] = float(valeur)
+        elif type_col == 'BOOL':
+            champs[place] = bool(valeur)
+        elif type_col in TYPES_TEXTE:
+            texte = str(valeur).encode('utf-8')
+            champs[place] = debut_tas
+            champs[place + 1] = len(texte)
+            tas.append(texte)
+            debut_tas += len(texte)
+        else:
+            raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+    champs[1] = nulls.to_bytes(len(champs[1]), 'little')
+    return champs, b''.join(tas), liberes
+
+
+def octets_textes(champs, types, places):
+    """la place occupée dans le tas par les textes d'un slot décodé"""
+    nulls = int.from_bytes(champs[1], 'little')
+    return sum(
+        champs[place + 1] for indice, (type_col, place) in enumerate(zip(types, places))
+        if type_col in TYPES_TEXTE and not nulls >> indice & 1
+    )
+
+
+def lire_tas(tas, references):
+    """
+    lit les textes [(position, longueur), ...] dans le fichier du tas ouvert (ou projeté en mémoire),
+    renvoie la liste des textes.
+    Une seule lecture quand ils sont proches (lignes insérées ensemble), sinon une par texte
+    """
+    if not references:
+        return []
+    if isinstance(tas, mmap.mmap): #tas projeté en mémoire : chaque texte est décodé sur place, sans lecture
+        return [tas[position:position + longueur].decode('utf-8') for position, longueur in references]
+    debut = min(position for position, _ in references)
+    fin = max(position + longueur for position, longueur in references)
+    total = sum(longueur for _, longueur in references)
+
+    if fin - debut <= max(2 * total, 1 << 16):
+        tas.seek(debut)
+        bloc = tas.read(fin - debut)
+        return [bloc[position - debut:position - debut + longueur].decode('utf-8') for position, longueur in references]
+
+    textes = []
+    for position, longueur in references:
+        tas.seek(position)
+        textes.append(tas.read(longueur).decode('utf-8'))
+    return textes
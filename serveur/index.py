@@ -0,0 +1,225 @@
+"""
+Index secondaires : pour une colonne, les valeurs triées -> position (en octets) de la ligne dans la table
+Chaque index est stocké dans un fichier a coté de la table : table_<nom>.<index>.idx
+Le fichier commence par les entrées triées, suivies des entrées ajoutées depuis (non triées)
+"""
+
+import struct #pour encoder les entrées en binaire
+import os
+import bisect #recherche dichotomique dans les listes triées : O(log n)
+
+MAGIC = b'RIDX' #les 4 premiers octets d'un fichier d'index
+FORMAT_POSITION = struct.Struct('Q') #position de la ligne, 8 octets
+FORMAT_CLE = {'INT': struct.Struct('i'), 'FLOAT': struct.Struct('d'), 'BOOL': struct.Struct('?'),
+              'BIGSERIAL': struct.Struct('q')}
+
+
+def encoder_entree(valeur, type_col, position):
+    """une entrée = marqueur null (1o) + valeur + position (8o)"""
+    if valeur is None:
+        return b'\x00' + FORMAT_POSITION.pack(position)
+    if type_col in FORMAT_CLE:
+        return b'\x01' + FORMAT_CLE[type_col].pack(valeur) + FORMAT_POSITION.pack(position)
+    texte = str(valeur).encode('utf-8') #TEXT et SERIAL : longueur + texte
+    return b'\x01' + struct.pack('I', len(texte)) + texte + FORMAT_POSITION.pack(position)
+
+
+def decoder_entree(donnees, position, type_col):
+    """renvoie (valeur, position de la ligne, position de l'entrée suivante), IndexError si incomplète"""
+    marqueur = donnees[position]
+    position += 1
+    if marqueur == 0:
+        valeur = None
+    elif type_col in FORMAT_CLE:
+        format_cle = FORMAT_CLE[type_col]
+        valeur = format_cle.unpack_from(donnees, position)[0]
+        position += format_cle.size
+    else:
+        longueur = struct.unpack_from('I', donnees, position)[0]
+        position += 4
+        if position + longueur > len(donnees):
+            raise IndexError
+        valeur = donnees[position:position + longueur].decode('utf-8')
+        position += longueur
+    ligne = FORMAT_POSITION.unpack_from(donnees, position)[0]
+    return valeur, ligne, position + FORMAT_POSITION.size
+
+
+class Index:
+    """un index chargé en mémoire : deux listes paralleles, les clés triées et les positions des lignes"""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.colonne = None
+        self.type_col = None
+        self.cles = [] #valeurs non nulles, triées
+        self.positions = [] #position de la ligne de chaque clé
+        self.nbr_entrees = 0 #toutes les lignes indexées, nulles comprises
+        self.derniere_position = None #position de la derniere ligne indexée
+        self.taille_lue = 0 #taille du fichier deja chargée (entrées complètes)
+        self.taille_fichier = 0 #taille du fichier a la derniere vérification
+        self.debut_entrees = 0 #position de la premiere entrée dans le fichier
+        self.nbr_triees = 0 #nbr d'entrées dans la partie triée du fichier
+
+    @classmethod
+    def creer(cls, chemin, colonne, type_col, entrees):
+        """écrit un nouvel index a partir d'une liste de (valeur, position de ligne)"""
+        index = cls(chemin)
+        index.colonne = colonne
+        index.type_col = type_col
+        index.reecrire(entrees)
+        return index
+
+    def reecrire(self, entrees):
+        """réécrit tout le fichier, entrées triées (les nulles a la fin)"""
+        non_nulles = sorted((e for e in entrees if e[0] is not None), key=lambda e: (e[0], e[1]))
+        nulles = [e for e in entrees if e[0] is None]
+
+        nom = self.colonne.encode('utf-8')
+        entete = MAGIC + struct.pack('I', len(nom)) + nom + struct.pack('B', len(self.type_col))
+        entete += self.type_col.encode('ascii') + struct.pack('Q', len(non_nulles) + len(nulles))
+        corps = b''.join(encoder_entree(v, self.type_col, p) for v, p in non_nulles + nulles)
+
+        temporaire = self.chemin + '.tmp' #on écrit a coté puis on remplace, pour ne jamais avoir d'index a moitié écrit
+        with open(temporaire, 'wb') as fichier:
+            fichier.write(entete + corps)
+        os.replace(temporaire, self.chemin)
+
+        self.cles = [v for v, _ in non_nulles]
+        self.positions = [p for _, p in non_nulles]
+        self.nbr_entrees = len(entrees)
+        self.derniere_position = max((p for _, p in entrees), default=None)
+        self.debut_entrees = len(entete)
+        self.nbr_triees = len(entrees)
+        self.taille_lue = len(entete) + len(corps)
+        self.taille_fichier = self.taille_lue
+
+    def charger(self):
+        """lit tout le fichier d'index"""
+        with open(self.chemin, 'rb') as fichier:
+            donnees = fichier.read()
+        self.taille_fichier = len(donnees)
+        if donnees[:4] != MAGIC:
+            raise Exception(f"Fichier d'index invalide : {self.chemin}")
+
+        position = 4
+        nom_len = struct.unpack_from('I', donnees, position)[0]
+        position += 4
+        self.colonne = donnees[position:position + nom_len].decode('utf-8')
+        position += nom_len
+        type_len = donnees[position]
+        position += 1
+        self.type_col = donnees[position:position + type_len].decode('ascii')
+        position += type_len
+        self.nbr_triees = struct.unpack_from('Q', donnees, position)[0]
+        position += 8
+
+        self.cles, self.positions = [], []
+        self.nbr_entrees = 0
+        self.derniere_position = None
+        self.debut_entrees = position
+        self.taille_lue = position
+        self.lire_entrees(donnees, position, triees=self.nbr_triees)
+
+    def lire_entrees(self, donnees, position, triees=0):
+        """ajoute en mémoire les entrées de donnees a partir de position (les 'triees' premieres sont deja dans l'ordre)"""
+        debut = position
+        lues = 0
+        while position < len(donnees):
+            try:
+                valeur, ligne, suivante = decoder_entree(donnees, position, self.type_col)
+            except (IndexError, struct.error): #entrée incomplète (écriture interrompue) : ignorée
+                break
+            if valeur is not None:
+                if lues < triees: #partie triée : il suffit d'ajouter a la fin
+                    self.cles.append(valeur)
+                    self.positions.append(ligne)
+                else: #ajout ultérieur : on l'insère a sa place
+                    i = bisect.bisect_right(self.cles, valeur)
+                    self.cles.insert(i, valeur)
+                    self.positions.insert(i, ligne)
+            if self.derniere_position is None or ligne > self.derniere_position:
+                self.derniere_position = ligne
+            self.nbr_entrees += 1
+            lues += 1
+            position = suivante
+        self.taille_lue += position - debut
+
+    def synchroniser(self):
+        """relit la fin du fichier si un autre programme y a ajouté des entrées (ou tout, s'il a été réécrit)"""
+        try:
+            taille = os.path.getsize(self.chemin)
+        except FileNotFoundError:
+            raise Exception(f"Index supprimé : {self.chemin}")
+        self.taille_fichier = taille
+        if taille == self.taille_lue:
+            return
+        if taille < self.taille_lue: #réécrit : on recharge tout
+            self.charger()
+            return
+        with open(self.chemin, 'rb') as fichier: #seulement la partie ajoutée
+            fichier.seek(self.taille_lue)
+            self.lire_entrees(fichier.read(), 0)
+
+    def ajouter(self, entrees):
+        """ajoute des (valeur, position de ligne) a la fin du fichier et en mémoire"""
+        if not entrees:
+            return
+        donnees = b''.join(encoder_entree(v, self.type_col, p) for v, p in entrees)
+        with open(self.chemin, 'ab') as fichier:
+            if self.taille_fichier > self.taille_lue: #on enleve une éventuelle entrée incomplète
+                fichier.truncate(self.taille_lue)
+            fichier.write(donnees)
+        self.lire_entrees(donnees, 0)
+        self.taille_fichier = self.taille_lue
+
+        #trop d'entrées non triées dans le fichier : on le réécrit trié pour accélérer le prochain chargement
+        if self.nbr_entrees - self.nbr_triees > max(1000, self.nbr_triees // 4):
+            self.compacter()
+
+    def compacter(self):
+        """réécrit le fichier avec toutes les entrées triées"""
+        with open(self.chemin, 'rb') as fichier:
+            donnees = fichier.read()
+        entrees = []
+        position = self.debut_entrees
+        while position < len(donnees):
+            try:
+                valeur, ligne, position = decoder_entree(donnees, position, self.type_col)
+            except (IndexError, struct.error):
+                break
+            entrees.append((valeur, ligne))
+        self.reecrire(entrees)
+
+    def egal(self, valeurs):
+        """positions des lignes dont la clé est dans valeurs"""
+        resultat = []
+        for valeur in valeurs:
+            if valeur is None: #= NULL n'est jamais vrai
+                continue
+            try:
+                debut = bisect.bisect_left(self.cles, valeur)
+                fin = bisect.bisect_right(self.cles, valeur, debut)
+            except TypeError:
+                raise Exception(f"Comparaison impossible entre {self.colonne} et {valeur!r}")
+            resultat.extend(self.positions[debut:fin])
+        return resultat
+
+    def intervalle(self, bas, bas_inclus, haut, haut_inclus):
+        """positions des lignes dont la clé est entre bas et haut (None = pas de borne)"""
+        try:
+            if bas is None:
+                debut = 0
+            elif bas_inclus:
+                debut = bisect.bisect_left(self.cles, bas)
+            else:
+                debut = bisect.bisect_right(self.cles, bas)
+            if haut is None:
+                fin = len(self.cles)
+            elif haut_inclus:
+                fin = bisect.bisect_right(self.cles, haut)
+            else:
+                fin = bisect.bisect_left(self.cles, haut)
+        except TypeError:
+            raise Exception(f"Comparaison impossible sur la colonne {self.colonne}")
+        return self.positions[debut:fin] if debut < fin else []
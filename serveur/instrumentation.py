@@ -0,0 +1,202 @@
+"""
+Instrumentation des requetes
+- Mesure : ce que lit une requete sous EXPLAIN ANALYZE (lignes parcourues, octets lus, durée des read(), pages du cache)
+- FichierMesure : un fichier de table ouvert en lecture dont les read() sont comptés dans une Mesure
+- Metriques : compteurs et histogrammes des requetes (voir MoteurSQL.instrumenter), exportés au format texte
+  de Prometheus (https://prometheus.io/docs/instrumenting/exposition_formats/)
+"""
+
+import bisect #la tranche d'un histogramme
+import threading
+import time
+
+#bornes des tranches de l'histogramme des durées, en secondes (+Inf est ajoutée a l'export)
+BORNES_DUREES = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Mesure:
+    """les compteurs de lecture d'une requete, remplis par le gestionnaire pendant EXPLAIN ANALYZE (un seul thread)"""
+
+    def __init__(self):
+        self.lignes_parcourues = 0 #lignes décodées et passées au filtre (ou renvoyées sans filtre)
+        self.octets_lus = 0 #par read()
+        self.nbr_lectures = 0 #appels a read()
+        self.duree_lecture = 0.0 #secondes passées dans read()
+        self.octets_projetes = 0 #fichiers projetés en mémoire (mmap) : lus au décodage, sans read()
+        self.pages_cache = 0 #pages trouvées dans le cache des lectures
+        self.pages_decodees = 0 #pages absentes, décodées puis gardées
+        self.plages_paralleles = 0 #plages lues par les processus d'un parcours parallèle
+
+    def compter(self, filtre):
+        """le filtre, qui compte au passage les lignes sur lesquelles il est appelé"""
+        def filtre_compte(valeurs):
+            self.lignes_parcourues += 1
+            return filtre(valeurs)
+        return filtre_compte
+
+    def compter_lignes(self, lignes):
+        """les lignes d'un parcours sans filtre, comptées au passage (le parcours est fermé avec le générateur)"""
+        try:
+            for ligne in lignes:
+                self.lignes_parcourues += 1
+                yield ligne
+        finally:
+            if hasattr(lignes, 'close'):
+                lignes.close()
+
+
+class FichierMesure:
+    """enveloppe un fichier ouvert en lecture : ses read() sont chronométrés et comptés dans la mesure"""
+
+    def __init__(self, fichier, mesure):
+        self.fichier = fichier
+        self.mesure = mesure
+
+    def read(self, taille=-1):
+        debut = time.perf_counter()
+        octets = self.fichier.read(taille)
+        self.mesure.duree_lecture += time.perf_counter() - debut
+        self.mesure.octets_lus += len(octets)
+        self.mesure.nbr_lectures += 1
+        return octets
+
+    def __getattr__(self, nom): #seek, tell, fileno, close, ... : ceux du fichier
+        return getattr(self.fichier, nom)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.fichier.close()
+
+
+class Metriques:
+    """
+    registre des métriques d'un moteur, partagé par ses threads : compteurs et histogrammes par étiquettes
+    (ex: requetes_total{sorte="SELECT",statut="success"}), plus des collecteurs appelés a l'export
+    pour les valeurs tenues ailleurs (cache des lectures, cache des plans)
+    """
+
+    def __init__(self, prefixe='rotterdb_'):
+        self.prefixe = prefixe
+        self.descriptions = {} #nom -> (sorte Prometheus : 'counter' / 'histogram', aide, bornes)
+        self.valeurs = {} #nom -> {étiquettes (tuple trié): valeur, ou [comptes par tranche, somme, nbr]}
+        self.collecteurs = [] #fonctions () -> [(nom, sorte, aide, valeur)]
+        self.verrou = threading.Lock()
+
+    def compteur(self, nom, aide):
+        """déclare un compteur (ne fait que monter)"""
+        self.declarer(nom, 'counter', aide, None)
+
+    def histogramme(self, nom, aide, bornes=BORNES_DUREES):
+        """déclare un histogramme : nbr de valeurs observées sous chaque borne, leur somme et leur nombre"""
+        self.declarer(nom, 'histogram', aide, tuple(sorted(bornes)))
+
+    def declarer(self, nom, sorte, aide, bornes):
+        with self.verrou:
+            if nom in self.descriptions and self.descriptions[nom][0] != sorte:
+                raise Exception(f"Métrique '{nom}' déja déclarée comme {self.descriptions[nom][0]}")
+            self.descriptions[nom] = (sorte, aide, bornes)
+            self.valeurs.setdefault(nom, {})
+
+    def incrementer(self, nom, valeur=1, **etiquettes):
+        """ajoute valeur au compteur pour ces étiquettes"""
+        cle = tuple(sorted(etiquettes.items()))
+        with self.verrou:
+            valeurs = self.valeurs[nom]
+            valeurs[cle] = valeurs.get(cle, 0) + valeur
+
+    def observer(self, nom, valeur, **etiquettes):
+        """ajoute une valeur (une durée en secondes) a l'histogramme pour ces étiquettes"""
+        cle = tuple(sorted(etiquettes.items()))
+        bornes = self.descriptions[nom][2]
+        with self.verrou:
+            serie = self.valeurs[nom].get(cle)
+            if serie is None:
+                serie = self.valeurs[nom][cle] = [[0] * len(bornes), 0.0, 0]
+            tranche = bisect.bisect_left(bornes, valeur)
+            if tranche < len(bornes): #au-dela de la derniere borne : seulement dans +Inf (le nbr total)
+                serie[0][tranche] += 1
+            serie[1] += valeur
+            serie[2] += 1
+
+    def valeur(self, nom, **etiquettes):
+        """la valeur d'un compteur (0 s'il n'a jamais été incrémenté), ou (somme, nbr) d'un histogramme"""
+        with self.verrou:
+            valeur = self.valeurs[nom].get(tuple(sorted(etiquettes.items())))
+        if self.descriptions[nom][0] == 'histogram':
+            return (0.0, 0) if valeur is None else (valeur[1], valeur[2])
+        return valeur or 0
+
+    def ajouter_collecteur(self, collecteur):
+        """collecteur() -> [(nom, sorte, aide, valeur)], appelé a chaque export"""
+        self.collecteurs.append(collecteur)
+
+    def exporter(self):
+        """toutes les métriques au format texte de Prometheus (version 0.0.4)"""
+        lignes = []
+        with self.verrou: #une copie : les requetes continuent pendant la mise en texte
+            series = []
+            for nom in sorted(self.descriptions):
+                valeurs = {cle: (list(v[0]), v[1], v[2]) if isinstance(v, list) else v
+                           for cle, v in self.valeurs[nom].items()}
+                series.append((nom, self.descriptions[nom], valeurs))
+        for nom, (sorte, aide, bornes), valeurs in series:
+            nom = self.prefixe + nom
+            lignes.append(f"# HELP {nom} {echapper_aide(aide)}")
+            lignes.append(f"# TYPE {nom} {sorte}")
+            for cle in sorted(valeurs):
+                if sorte != 'histogram':
+                    lignes.append(f"{nom}{texte_etiquettes(cle)} {texte_nombre(valeurs[cle])}")
+                    continue
+                comptes, somme, nbr = valeurs[cle]
+                cumul = 0
+                for borne, compte in zip(bornes, comptes):
+                    cumul += compte
+                    lignes.append(f"{nom}_bucket{texte_etiquettes(cle + (('le', texte_nombre(borne)),))} {cumul}")
+                lignes.append(f"{nom}_bucket{texte_etiquettes(cle + (('le', '+Inf'),))} {nbr}")
+                lignes.append(f"{nom}_sum{texte_etiquettes(cle)} {texte_nombre(somme)}")
+                lignes.append(f"{nom}_count{texte_etiquettes(cle)} {nbr}")
+        for collecteur in list(self.collecteurs):
+            for nom, sorte, aide, valeur in collecteur():
+                nom = self.prefixe + nom
+                lignes.append(f"# HELP {nom} {echapper_aide(aide)}")
+                lignes.append(f"# TYPE {nom} {sorte}")
+                lignes.append(f"{nom} {texte_nombre(valeur)}")
+        return '\n'.join(lignes) + '\n'
+
+
+def echapper_aide(aide):
+    return aide.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def texte_etiquettes(cle):
+    """((nom, valeur), ...) -> {nom="valeur",...}, rien sans étiquette"""
+    if not cle:
+        return ''
+    morceaux = []
+    for nom, valeur in cle:
+        valeur = str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        morceaux.append(f'{nom}="{valeur}"')
+    return '{' + ','.join(morceaux) + '}'
+
+
+def texte_nombre(valeur):
+    """un nombre pour Prometheus : les entiers sans .0, les réels en repr (précision complete)"""
+    if isinstance(valeur, float) and not valeur.is_integer():
+        return repr(valeur)
+    return str(int(valeur))
+
+
+def texte_duree(secondes):
+    """une durée pour EXPLAIN ANALYZE, en millisecondes"""
+    return f"{secondes * 1000:.3f} ms"
+
+
+def texte_octets(octets):
+    """une taille pour EXPLAIN ANALYZE : o, Ko, Mo ou Go"""
+    for unite in ('o', 'Ko', 'Mo'):
+        if octets < 1024:
+            return f"{octets:.0f} {unite}" if unite == 'o' else f"{octets:.1f} {unite}"
+        octets /= 1024
+    return f"{octets:.1f} Go"
@@ -0,0 +1,314 @@
+"""
+Journal des écritures (write-ahead log) : le fichier journal.wal du dossier des données
+
+Un INSERT / UPDATE / DELETE est d'abord préparé : ses écritures dans les fichiers des tables sont notées
+en mémoire (voir Ecritures), puis ajoutées au journal en un seul enregistrement, le journal est synchronisé
+sur le disque (fsync), et seulement ensuite elles sont faites dans les fichiers, sans fsync.
+Les fichiers des tables ne sont synchronisés qu'au point de contrôle (journal trop gros, changement de structure),
+après quoi le journal est vidé. Au démarrage, les enregistrements du journal sont rejoués : ce sont des octets
+a réécrire aux memes endroits, rejouer un enregistrement deja appliqué ne change donc rien.
+
+Enregistrement : taille (4o) | crc32 (4o) | écritures, chacune :
+    sorte (1o, ECRITURE ou TRONCATURE) | longueur du nom (2o) | nom du fichier | position (8o)
+    ECRITURE seulement : longueur (4o) | octets
+Un enregistrement incomplet ou abîmé en fin de journal (crash pendant l'ajout) n'a jamais été validé : il est ignoré
+
+Commit groupé : les threads qui valident en meme temps partagent un seul fsync (le premier arrivé le fait
+pour tous les enregistrements deja ajoutés, les autres attendent son résultat)
+"""
+
+import os
+import struct
+import threading
+import zlib #crc32 : reconnaitre un enregistrement abîmé
+
+from serveur import verrous #flock : plusieurs programmes sur le meme dossier
+
+NOM_JOURNAL = 'journal.wal'
+TAILLE_POINT_DE_CONTROLE = 16 << 20 #au-dela de 16 Mo de journal, les tables sont synchronisées et le journal vidé
+
+ECRITURE = 1
+TRONCATURE = 2
+
+FORMAT_ENTETE = struct.Struct('<II') #taille, crc32
+FORMAT_OPERATION = struct.Struct('<BH') #sorte, longueur du nom
+FORMAT_POSITION = struct.Struct('<Q')
+FORMAT_LONGUEUR = struct.Struct('<I')
+
+
+class Ecritures:
+    """les écritures d'une opération : [(sorte, nom du fichier, position, octets)], gardées jusqu'a la validation"""
+
+    def __init__(self):
+        self.operations = []
+
+    def ouvrir(self, chemin):
+        """ouvre un fichier de table pour l'opération, a la place de open(chemin, 'r+b')"""
+        return FichierDiffere(self, chemin)
+
+    def chemins(self):
+        return {chemin for _, chemin, _, _ in self.operations}
+
+    def encoder(self):
+        """les octets de l'enregistrement (sans l'en-tête)"""
+        morceaux = []
+        for sorte, chemin, position, octets in self.operations:
+            nom = os.path.basename(chemin).encode('utf-8') #tous les fichiers sont dans le dossier des données
+            morceaux.append(FORMAT_OPERATION.pack(sorte, len(nom)) + nom + FORMAT_POSITION.pack(position))
+            if sorte == ECRITURE:
+                morceaux.append(FORMAT_LONGUEUR.pack(len(octets)))
+                morceaux.append(octets)
+        return b''.join(morceaux)
+
+    def appliquer(self):
+        """fait les écritures dans les fichiers"""
+        appliquer(self.operations)
+
+
+def decoder(donnees, dossier):
+    """les opérations d'un enregistrement, avec le chemin complet de chaque fichier"""
+    operations = []
+    position = 0
+    while position < len(donnees):
+        sorte, longueur_nom = FORMAT_OPERATION.unpack_from(donnees, position)
+        position += FORMAT_OPERATION.size
+        nom = donnees[position:position + longueur_nom].decode('utf-8')
+        position += longueur_nom
+        decalage = FORMAT_POSITION.unpack_from(donnees, position)[0]
+        position += FORMAT_POSITION.size
+        octets = b''
+        if sorte == ECRITURE:
+            longueur = FORMAT_LONGUEUR.unpack_from(donnees, position)[0]
+            position += FORMAT_LONGUEUR.size
+            octets = donnees[position:position + longueur]
+            position += longueur
+        operations.append((sorte, os.path.join(dossier, nom), decalage, octets))
+    return operations
+
+
+def appliquer(operations):
+    """fait les écritures et troncatures dans l'ordre (chaque fichier ouvert une seule fois)"""
+    fichiers = {}
+    try:
+        for sorte, chemin, position, octets in operations:
+            fichier = fichiers.get(chemin)
+            if fichier is None:
+                if not os.path.exists(chemin): #créé pendant l'opération, perdu dans un crash avant synchronisation
+                    open(chemin, 'wb').close()
+                fichier = fichiers[chemin] = open(chemin, 'r+b')
+            if sorte == ECRITURE:
+                fichier.seek(position)
+                fichier.write(octets)
+            else:
+                fichier.truncate(position)
+    finally:
+        for fichier in fichiers.values():
+            fichier.close()
+
+
+def synchroniser(chemin):
+    """fsync d'un fichier (ignoré s'il n'existe plus)"""
+    try:
+        descripteur = os.open(chemin, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(descripteur)
+    finally:
+        os.close(descripteur)
+
+
+class FichierDiffere:
+    """
+    remplace un fichier ouvert en 'r+b' pendant une opération : les écritures sont notées dans Ecritures
+    et ne sont faites qu'après la validation du journal. Les lectures vont au fichier, corrigées par les
+    écritures deja notées (une opération relit ce qu'elle vient d'écrire, ex : dernier octet d'un bitmap)
+    """
+
+    def __init__(self, ecritures, chemin):
+        self.fichier = open(chemin, 'rb') #FileNotFoundError comme 'r+b'
+        self.ecritures = ecritures
+        self.chemin = chemin
+        self.position = 0
+
+    def notees(self):
+        """les écritures et troncatures deja notées sur ce fichier, dans l'ordre"""
+        return [(sorte, position, octets) for sorte, chemin, position, octets in self.ecritures.operations
+                if chemin == self.chemin]
+
+    def taille(self):
+        """la taille du fichier une fois les écritures notées faites"""
+        taille = os.fstat(self.fichier.fileno()).st_size
+        for sorte, position, octets in self.notees():
+            taille = max(taille, position + len(octets)) if sorte == ECRITURE else position
+        return taille
+
+    def seek(self, position, origine=os.SEEK_SET):
+        if origine == os.SEEK_CUR:
+            position += self.position
+        elif origine == os.SEEK_END:
+            position += self.taille()
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+    def read(self, taille=-1):
+        self.fichier.seek(self.position)
+        donnees = self.fichier.read(taille)
+        notees = self.notees()
+        if notees:
+            limite = self.taille() - self.position
+            if taille is not None and taille >= 0:
+                limite = min(limite, taille)
+            donnees = bytearray(donnees)
+            for sorte, position, octets in notees:
+                debut = position - self.position
+                if sorte == TRONCATURE:
+                    del donnees[max(debut, 0):]
+                    continue
+                fin = min(debut + len(octets), limite)
+                if fin <= max(debut, 0):
+                    continue
+                if len(donnees) < debut:
+                    donnees += bytes(debut - len(donnees))
+                donnees[max(debut, 0):fin] = octets[max(-debut, 0):fin - debut]
+            limite = max(limite, 0)
+            donnees += bytes(limite - len(donnees)) #un trou avant une écriture au-dela de la fin : des zéros
+            donnees = bytes(donnees[:limite])
+        self.position += len(donnees)
+        return donnees
+
+    def write(self, octets):
+        if octets: #écrire 0 octet au-dela de la fin n'agrandit pas le fichier
+            self.ecritures.operations.append((ECRITURE, self.chemin, self.position, bytes(octets)))
+        self.position += len(octets)
+        return len(octets)
+
+    def truncate(self, taille=None):
+        taille = self.position if taille is None else taille
+        self.ecritures.operations.append((TRONCATURE, self.chemin, taille, b''))
+        return taille
+
+    def flush(self):
+        pass #rien n'est écrit avant la validation
+
+    def fileno(self):
+        return self.fichier.fileno()
+
+    def close(self):
+        self.fichier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class Journal:
+    """le fichier journal : ajout d'enregistrements, fsync (groupé ou non), point de contrôle et rejeu"""
+
+    def __init__(self, chemin, commit_groupe=True):
+        self.chemin = chemin
+        self.commit_groupe = commit_groupe
+        self.verrou = threading.Lock()
+        self.condition = threading.Condition(self.verrou)
+        self.ajoutes = 0 #nbr d'enregistrements ajoutés au fichier
+        self.durables = 0 #nbr d'enregistrements synchronisés sur le disque
+        self.fsync_en_cours = False
+        self.nbr_fsync = 0
+        self.fichiers_sales = set() #les fichiers écrits depuis le dernier point de contrôle
+        #partagé par les opérations en cours (de tous les programmes), exclusif pour le point de contrôle et le rejeu
+        self.verrou_fichier = verrous.VerrouFichier(chemin)
+        self.descripteur = os.open(chemin, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.taille = os.fstat(self.descripteur).st_size
+
+    def valider(self, ecritures):
+        """ajoute l'enregistrement des écritures et attend qu'il soit sur le disque"""
+        donnees = ecritures.encoder()
+        enregistrement = FORMAT_ENTETE.pack(len(donnees), zlib.crc32(donnees)) + donnees
+        with self.verrou:
+            vue = memoryview(enregistrement)
+            while vue: #os.write peut écrire moins que demandé
+                vue = vue[os.write(self.descripteur, vue):]
+            self.taille += len(enregistrement)
+            self.ajoutes += 1
+            numero = self.ajoutes
+            self.fichiers_sales.update(ecritures.chemins())
+            if not self.commit_groupe: #un fsync par enregistrement
+                os.fsync(self.descripteur)
+                self.nbr_fsync += 1
+                self.durables = numero
+                return
+        self.attendre(numero)
+
+    def attendre(self, numero):
+        """commit groupé : attend que l'enregistrement numero soit synchronisé, en faisant le fsync si personne ne le fait"""
+        with self.condition:
+            while self.durables < numero:
+                if self.fsync_en_cours: #un autre thread synchronise : son fsync couvrira peut-etre le notre
+                    self.condition.wait()
+                    continue
+                self.fsync_en_cours = True
+                cible = self.ajoutes #tous les enregistrements deja ajoutés
+                self.verrou.release() #les autres peuvent ajouter pendant le fsync
+                try:
+                    os.fsync(self.descripteur)
+                finally:
+                    self.verrou.acquire()
+                    self.fsync_en_cours = False
+                    self.condition.notify_all()
+                self.nbr_fsync += 1
+                self.durables = max(self.durables, cible)
+
+    def point_de_controle(self):
+        """
+        synchronise les fichiers écrits depuis le dernier point de contrôle, puis vide le journal.
+        Un autre programme a pu ajouter au journal des écritures dans d'autres fichiers : tout le dossier est synchronisé
+        """
+        self.verrou_fichier.prendre_exclusif()
+        try:
+            with self.verrou:
+                dossier = os.path.dirname(self.chemin)
+                self.fichiers_sales.update(
+                    os.path.join(dossier, nom) for nom in os.listdir(dossier) if nom != os.path.basename(self.chemin)
+                )
+                for chemin in self.fichiers_sales:
+                    synchroniser(chemin)
+                self.fichiers_sales.clear()
+                os.ftruncate(self.descripteur, 0)
+                os.fsync(self.descripteur)
+                self.taille = 0
+        finally:
+            self.verrou_fichier.rendre_exclusif()
+
+    def rejouer(self, dossier):
+        """
+        au démarrage : refait les écritures des enregistrements validés, puis point de contrôle. Renvoie leur nombre.
+        Les autres programmes n'ont pas d'opération en cours pendant le rejeu (verrou exclusif)
+        """
+        self.verrou_fichier.prendre_exclusif()
+        try:
+            with open(self.chemin, 'rb') as fichier:
+                donnees = fichier.read()
+            position = 0
+            nbr = 0
+            while position + FORMAT_ENTETE.size <= len(donnees):
+                taille, crc = FORMAT_ENTETE.unpack_from(donnees, position)
+                corps = donnees[position + FORMAT_ENTETE.size:position + FORMAT_ENTETE.size + taille]
+                if len(corps) < taille or zlib.crc32(corps) != crc: #fin du journal (ajout interrompu)
+                    break
+                operations = decoder(corps, dossier)
+                appliquer(operations)
+                self.fichiers_sales.update(chemin for _, chemin, _, _ in operations)
+                position += FORMAT_ENTETE.size + taille
+                nbr += 1
+        finally:
+            self.verrou_fichier.rendre_exclusif()
+        self.point_de_controle()
+        return nbr
+
+    def fermer(self):
+        os.close(self.descripteur)
@@ -1,13 +1,310 @@
 import re #module pour les expressions regex, qui vont etre utile pour parser le texte
-from serveur.stockage import GestionnaireDeTable
+import csv #module pour lire les fichiers CSV de COPY FROM
+import itertools #pour découper un itérateur (fetchmany) sans tout lire
+import threading #une transaction par thread : un MoteurSQL peut etre partagé par un pool de threads
+import collections #OrderedDict : le cache LRU des plans
+import time #durée des requetes (métriques, EXPLAIN ANALYZE)
+from serveur.stockage import GestionnaireDeTable, TAILLE_LOT_COLONNES
+from serveur.cache import LIGNES_PAR_PAGE, estimer_taille #cache des résultats des SELECT (voir serveur/cache.py)
+from serveur import expressions #parser et compilation des conditions WHERE
+from serveur import format_fixe
+from serveur import format_compact
+from serveur import format_colonnes
+from serveur import agregats #COUNT, SUM, ... et GROUP BY
+from serveur import tri #ORDER BY : tas borné et tri externe
+from serveur.transactions import Transaction #BEGIN / COMMIT / ROLLBACK
+from serveur.instrumentation import Metriques, texte_duree, texte_octets #métriques (Prometheus), EXPLAIN ANALYZE
+
+#CREATE TABLE ... WITH (storage = '...') -> (format, octet stockage de l'en-tête)
+STOCKAGES = {
+    'row': (format_fixe.VERSION_FIXE, format_fixe.STOCKAGE_LIGNES),
+    'columnar': (format_fixe.VERSION_FIXE, format_fixe.STOCKAGE_COLONNES),
+    'compact': (format_compact.VERSION_COMPACTE, format_fixe.STOCKAGE_LIGNES), #lignes compactes, sans UPDATE / DELETE
+}
+
+#les requetes qui changent la structure des fichiers : pas dans une transaction
+REQUETES_STRUCTURE = ('CREATE', 'DROP', 'MIGRATE', 'VACUUM')
+
+#les requetes dont le plan (la requete parsée) est gardé en cache et qui acceptent des paramètres ? / :nom
+REQUETES_PLANIFIEES = ('INSERT', 'DELETE', 'UPDATE', 'SELECT')
+#'true' / 'false' entre guillemets dans une colonne BOOL
+VALEURS_BOOL = {'true': True, 't': True, '1': True, 'vrai': True, 'false': False, 'f': False, '0': False, 'faux': False}
+TAILLE_MAX_PLAN = 4096 #au-dela (un gros INSERT ponctuel), la requete est parsée sans etre gardée dans le cache
+#l'étiquette 'sorte' des métriques : le premier mot de la requete, AUTRE sinon (nbr de séries borné)
+SORTES_REQUETES = REQUETES_PLANIFIEES + REQUETES_STRUCTURE + ('BEGIN', 'COMMIT', 'ROLLBACK', 'COPY', 'DESCRIBE', 'EXPLAIN')
+
+
+def entier_exact(valeur):
+    """l'entier égal a la valeur (7.0 ou '7' -> 7), ValueError si elle n'est pas entiere (7.9, '7.9', 'abc')"""
+    if isinstance(valeur, str):
+        texte = valeur.strip()
+        try:
+            return int(texte)
+        except ValueError:
+            valeur = float(texte) #'7.0' -> 7.0, 'abc' : ValueError
+    if isinstance(valeur, float):
+        if not valeur.is_integer(): #aussi nan et inf
+            raise ValueError(valeur)
+        return int(valeur)
+    return int(valeur)
+
+
+class LignesDesLots:
+    """
+    les lignes d'un résultat lu par lots de colonnes (voir MoteurSQL.lots_selectionnes) : chaque ligne n'est construite
+    que si on la lit. Curseur.iter_colonnes renvoie les lots eux-memes, sans construire aucune ligne
+    """
+
+    def __init__(self, lots, types):
+        self.lots = lots #(nbr de lignes, {colonne du résultat: (valeurs, nulls)})
+        self.types = types #colonne du résultat -> type de la colonne lue
+        self.lignes = self.construire()
+
+    def construire(self):
+        for _, lot in self.lots:
+            noms = list(lot)
+            listes = [format_colonnes.en_liste(valeurs, nulls, self.types[nom]) for nom, (valeurs, nulls) in lot.items()]
+            for valeurs in zip(*listes):
+                yield dict(zip(noms, valeurs))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.lignes)
+
+    def close(self):
+        self.lignes.close()
+        self.lots.close() #rend le verrou de lecture de la table
+
+
+class Curseur:
+    """curseur sur le resultat d'une requete : les lignes sont lues a la demande (fetchone, fetchmany, for)"""
+
+    def __init__(self, lignes):
+        self.lignes = iter(lignes) #itérateur sur les lignes (générateur de lecture de la table)
+        self.nbr_lignes = 0 #nombre de lignes deja renvoyées
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        ligne = next(self.lignes) #lève StopIteration a la fin
+        self.nbr_lignes += 1
+        return ligne
+
+    def fetchone(self):
+        """renvoie la ligne suivante, ou None s'il n'y en a plus"""
+        return next(self, None)
+
+    def fetchmany(self, taille=100):
+        """renvoie une liste d'au plus 'taille' lignes suivantes"""
+        return list(itertools.islice(self, taille))
+
+    def fetchall(self):
+        """renvoie toutes les lignes restantes"""
+        return list(self)
+
+    def iter_colonnes(self):
+        """
+        le reste du résultat par lots de colonnes : (nbr de lignes, {colonne: (valeurs, nulls)}), comme
+        GestionnaireDeTable.lots_colonnes. Un SELECT de colonnes sans WHERE, ORDER BY ni LIMIT sur une table
+        stockée en colonnes donne les tableaux lus dans ses fichiers (numpy si installé) sans construire de ligne,
+        sinon les lignes restantes sont regroupées en listes
+        """
+        if isinstance(self.lignes, LignesDesLots) and self.nbr_lignes == 0:
+            for nbr, lot in self.lignes.lots:
+                self.nbr_lignes += nbr
+                yield nbr, lot
+            return
+        while True:
+            paquet = self.fetchmany(TAILLE_LOT_COLONNES)
+            if not paquet:
+                break
+            lot = {}
+            for col in paquet[0]:
+                valeurs = [ligne[col] for ligne in paquet]
+                lot[col] = (valeurs, [valeur is None for valeur in valeurs])
+            yield len(paquet), lot
+
+    def close(self):
+        """arrete la lecture et ferme le fichier de la table"""
+        if hasattr(self.lignes, 'close'): #un générateur ferme son fichier quand on le ferme
+            self.lignes.close()
+
+
+class RequetePreparee:
+    """
+    une requete parsée une seule fois (MoteurSQL.prepare), exécutée autant de fois qu'on veut avec des paramètres.
+    ex: requete = moteur.prepare("SELECT * FROM users WHERE age > ?"); requete.executer((30,))
+    """
+
+    def __init__(self, moteur, requete, plan):
+        self.moteur = moteur
+        self.requete = requete #le texte, pour l'affichage
+        self.plan = plan #partagé avec le cache du moteur : jamais modifié
+
+    def executer(self, parametres=None, flux=False):
+        """parametres : séquence pour les ?, dictionnaire pour les :nom. Renvoie le résultat comme MoteurSQL.executer"""
+        return self.moteur.instrumenter(self.requete, parametres,
+                                        lambda: self.moteur.executer_plan(self.plan, parametres, flux, self.requete))
+
+    def executemany(self, suite_parametres):
+        """
+        la requete pour chaque jeu de paramètres. Un INSERT insère toutes les lignes en une seule écriture,
+        les autres requetes sont exécutées l'une apres l'autre (arret a la premiere erreur)
+        """
+        return self.moteur.instrumenter(self.requete, None, lambda: self.executer_suite(suite_parametres))
+
+    def executer_suite(self, suite_parametres):
+        """executemany sans l'instrumentation"""
+        try:
+            if self.plan['sorte'] == 'INSERT':
+                return self.moteur.executer_insertions(self.plan, suite_parametres)
+            nbr_requetes = 0
+            for parametres in suite_parametres:
+                resultat = self.moteur.executer_plan(self.plan, parametres, requete=self.requete)
+                if resultat['status'] != 'success':
+                    return resultat
+                nbr_requetes += 1
+            return {
+                'status': 'success',
+                'message': f"{nbr_requetes} requete(s) exécutée(s)",
+                'data': None
+            }
+        except Exception as exceptions:
+            return {
+                'status': 'error',
+                'message': str(exceptions),
+                'data': None
+            }
+
+    def __repr__(self):
+        return f"RequetePreparee({self.requete!r})"
+
 
 class MoteurSQL:
     """le moteur pour executer les requete sql"""
 
-    def __init__(self, nom_dossier='nom'):
-        self.gestionnaire = GestionnaireDeTable(nom_dossier) #On crée le gestionnaire de table
+    def __init__(self, nom_dossier='nom', lignes_tri=100000, taille_cache_plans=256, parallel_workers=0,
+                 taille_cache=0):
+        #On crée le gestionnaire de table (parallel_workers : processus pour parcourir les grandes tables,
+        #taille_cache : octets du cache des pages décodées et des résultats des SELECT, 0 = pas de cache)
+        self.gestionnaire = GestionnaireDeTable(nom_dossier, parallel_workers=parallel_workers,
+                                                taille_cache=taille_cache)
+        self.lignes_tri = lignes_tri #budget d'un ORDER BY : au-dela, tri externe sur disque
+        self.sessions = threading.local() #la transaction en cours de chaque thread
+        #requete nettoyée -> plan, du moins récemment utilisé au plus récent (LRU)
+        self.cache_plans = collections.OrderedDict()
+        self.taille_cache_plans = taille_cache_plans
+        self.verrou_plans = threading.Lock()
+        self.crochets = [] #(avant, apres) appelés autour de chaque requete (voir ajouter_crochet)
+        self.verrou_crochets = threading.Lock()
+        self.metriques = Metriques() #voir instrumenter, exportées par self.metriques.exporter()
+        self.metriques.compteur('requetes_total', "Requetes exécutées, par sorte (premier mot) et statut")
+        self.metriques.histogramme('duree_requete_secondes',
+                                   "Durée des requetes, par sorte (jusqu'au Curseur renvoyé pour un SELECT en flux)")
+        self.metriques.compteur('lignes_renvoyees_total', "Lignes renvoyées dans 'data', par sorte de requete")
+        self.metriques.compteur('erreurs_crochets_total', "Exceptions levées par les crochets apres (ignorées)")
+        self.metriques.ajouter_collecteur(self.metriques_caches)
+
+    @property
+    def transaction(self):
+        """la transaction en cours du thread (BEGIN), None = chaque requete est validée seule"""
+        return getattr(self.sessions, 'transaction', None)
+
+    @transaction.setter
+    def transaction(self, transaction):
+        self.sessions.transaction = transaction
+
+    def donnees(self):
+        """ce que lisent et écrivent les requetes : la transaction en cours (lignes non validées comprises) ou les tables"""
+        return self.gestionnaire if self.transaction is None else self.transaction
+
+
+    def ajouter_crochet(self, avant=None, apres=None):
+        """
+        instrumente chaque requete (executer, executemany, requetes préparées) :
+        avant(requete, parametres) est appelée avant l'exécution, une exception l'empeche (son message est l'erreur
+        renvoyée) ; apres(requete, parametres, resultat, duree) est appelée apres, duree en secondes (ses exceptions
+        sont ignorées, comptées dans erreurs_crochets_total). executemany passe parametres=None.
+        Renvoie le crochet, a donner a retirer_crochet
+        """
+        crochet = (avant, apres)
+        with self.verrou_crochets: #une nouvelle liste : les requetes en cours gardent la leur
+            self.crochets = self.crochets + [crochet]
+        return crochet
+
+    def retirer_crochet(self, crochet):
+        with self.verrou_crochets:
+            self.crochets = [autre for autre in self.crochets if autre is not crochet]
+
+    def instrumenter(self, requete, parametres, executer):
+        """
+        exécute la requete (executer() renvoie son résultat) entre les crochets avant et apres,
+        puis la compte dans les métriques : nbr par sorte et statut, durée, lignes renvoyées
+        """
+        crochets = self.crochets
+        sorte = self.sorte_requete(requete)
+        try:
+            for avant, _ in crochets:
+                if avant is not None:
+                    avant(requete, parametres)
+        except Exception as exceptions: #refusée par un crochet : pas exécutée, pas de durée
+            self.metriques.incrementer('requetes_total', sorte=sorte, statut='refused')
+            return {
+                'status': 'error',
+                'message': str(exceptions),
+                'data': None
+            }
+
+        debut = time.perf_counter()
+        try:
+            resultat = executer()
+        except Exception as exceptions: #executer et les requetes préparées renvoient déja leurs erreurs
+            resultat = {
+                'status': 'error',
+                'message': str(exceptions),
+                'data': None
+            }
+        duree = time.perf_counter() - debut
+
+        self.metriques.incrementer('requetes_total', sorte=sorte, statut=resultat['status'])
+        self.metriques.observer('duree_requete_secondes', duree, sorte=sorte)
+        if isinstance(resultat['data'], list):
+            self.metriques.incrementer('lignes_renvoyees_total', len(resultat['data']), sorte=sorte)
+        for _, apres in crochets:
+            if apres is not None:
+                try:
+                    apres(requete, parametres, resultat, duree)
+                except Exception:
+                    self.metriques.incrementer('erreurs_crochets_total')
+        return resultat
+
+    def sorte_requete(self, requete):
+        """l'étiquette 'sorte' d'une requete dans les métriques : son premier mot, ou AUTRE"""
+        mots = requete.split(None, 1) if isinstance(requete, str) else None
+        sorte = mots[0].upper() if mots else 'AUTRE'
+        return sorte if sorte in SORTES_REQUETES else 'AUTRE'
+
+    def metriques_caches(self):
+        """le collecteur des métriques : taille du cache des plans, compteurs du cache des lectures"""
+        with self.verrou_plans:
+            valeurs = [('plans_en_cache', 'gauge', "Plans gardés dans le cache des plans", len(self.cache_plans))]
+        if self.gestionnaire.cache is not None:
+            statistiques = self.gestionnaire.cache.statistiques()
+            valeurs += [
+                ('cache_succes_total', 'counter', "Pages et résultats trouvés dans le cache", statistiques['succes']),
+                ('cache_echecs_total', 'counter', "Pages et résultats absents du cache", statistiques['echecs']),
+                ('cache_evictions_total', 'counter', "Entrées enlevées pour rester sous la taille max",
+                 statistiques['evictions']),
+                ('cache_invalidations_total', 'counter', "Entrées oubliées apres une écriture",
+                 statistiques['invalidations']),
+                ('cache_entrees', 'gauge', "Entrées gardées dans le cache", statistiques['entrees']),
+                ('cache_octets', 'gauge', "Taille estimée des entrées du cache", statistiques['octets']),
+            ]
+        return valeurs
 
-    
     def nettoyer_requete(self, requete):
         """reformatte la requete proprement"""
         requete = requete.strip() #on enlève les espace au début et fin
@@ -15,8 +312,17 @@ class MoteurSQL:
             requete = requete[:-1] #on enelve le :dernier caractère
         return requete #et on renvoi la requete nettoyée
     
-    def executer(self, requete):
-        """on execute la commande sql et try/catch les erreurs"""
+    def executer(self, requete, flux=False, parametres=None):
+        """
+        on execute la commande sql et try/catch les erreurs.
+        flux=True : pour un SELECT, 'data' est un Curseur qui lit les lignes a la demande au lieu d'une liste
+        parametres : les valeurs des ? (séquence) ou des :nom (dictionnaire) de la requete
+        La requete passe par les crochets et les métriques (voir instrumenter)
+        """
+        return self.instrumenter(requete, parametres, lambda: self.executer_requete(requete, flux, parametres))
+
+    def executer_requete(self, requete, flux=False, parametres=None):
+        """executer sans l'instrumentation"""
         try: #pour capturer les erreurs lorsqu'on execute
             requete = self.nettoyer_requete(requete) #on nettoye
 
@@ -26,14 +332,46 @@ class MoteurSQL:
                     'message': 'vide',
                     'data' : None
                 }
+
+            plan = self.plan(requete) #INSERT / DELETE / UPDATE / SELECT : parsés une seule fois
+            if plan is not None:
+                return self.executer_plan(plan, parametres, flux, requete)
             
             #Parsons maintenant les requetes
             mots = requete.split() #on découpe la requete en tockens
             type_requete = mots[0].upper() #on formatte le premier arg de la commande en MAJ comme SQL
 
-            if type_requete == 'CREATE': #pour créer une table
-                nom_table, colonnes = self.parser_create(requete) #on parse la requete
-                self.gestionnaire.creer_table(nom_table, colonnes) #on crée la table
+            if type_requete in ('BEGIN', 'COMMIT', 'ROLLBACK'): #les transactions
+                return self.executer_transaction(type_requete, mots)
+
+            if type_requete == 'EXPLAIN': #le plan d'une requete, ANALYZE : exécutée et mesurée
+                return self.expliquer(requete, parametres)
+
+            if type_requete in REQUETES_STRUCTURE and self.transaction is not None:
+                raise Exception(f"{type_requete} impossible dans une transaction : COMMIT ou ROLLBACK d'abord")
+
+            if type_requete == 'CREATE' and len(mots) > 1 and mots[1].upper() == 'INDEX': #pour créer un index
+                nom_index, nom_table, colonne = self.parser_create_index(requete)
+                self.gestionnaire.creer_index(nom_table, nom_index, colonne)
+                return {
+                    'status': 'success',
+                    'message': f"Index '{nom_index}' créé sur '{nom_table}' ({colonne})",
+                    'data': None
+                }
+
+            elif type_requete == 'DROP' and len(mots) > 1 and mots[1].upper() == 'INDEX': #pour supprimer un index
+                nom_index, nom_table = self.parser_drop_index(requete)
+                nom_table = self.gestionnaire.supprimer_index(nom_index, nom_table)
+                return {
+                    'status': 'success',
+                    'message': f"Index '{nom_index}' supprimé de '{nom_table}'",
+                    'data': None
+                }
+
+            elif type_requete == 'CREATE': #pour créer une table
+                nom_table, colonnes, version, stockage = self.parser_create(requete) #on parse la requete
+                self.oublier_plans(nom_table)
+                self.gestionnaire.creer_table(nom_table, colonnes, version=version, stockage=stockage) #on crée la table
                 return { #renvoi logs de creations
                     'status': 'success',
                     'message': f"Table '{nom_table}' créée",
@@ -42,6 +380,7 @@ class MoteurSQL:
             
             elif type_requete == 'DROP': #pour supprimer une table
                 nom_table = self.parser_drop(requete) #on parse
+                self.oublier_plans(nom_table)
                 self.gestionnaire.supprimer_table(nom_table) #on supprime
                 return { #on renvoie les logs de suppressions
                     'status': 'success',
@@ -49,35 +388,33 @@ class MoteurSQL:
                     'data': None
                 }
             
-            elif type_requete == 'INSERT': #pour insérer des valeurs
-                nom_table, valeurs = self.parser_insert(requete) #on parse la requete
-                id_insert = self.gestionnaire.inserer_ligne(nom_table, valeurs) #on insère la ligne dans la table
-                return { #on renvoie les logs d'insertions
+            elif type_requete == 'MIGRATE': #pour convertir une table au format 2 (ou 3 : storage = 'compact')
+                nom_table, version = self.parser_migrate(requete)
+                nbr_lignes = self.gestionnaire.migrer_table(nom_table, version)
+                return {
                     'status': 'success',
-                    'message': f"Ligne insérée, _id = {id_insert}",
-                    'data': {'_id':id_insert}
+                    'message': f"Table '{nom_table}' migrée ({nbr_lignes} ligne(s))",
+                    'data': None
                 }
-            
-            elif type_requete == 'SELECT': #pour selectionner des valeurs
-                colonnes, nom_table = self.parser_select(requete) #on parse la requete
-                lignes = self.gestionnaire.lire_table(nom_table) #on selectionne toutes les lignes a lire
-
-                if colonnes != ['*']: #pour select des colonnes si pas * : all
-                    lignes_filtrees = [] #on declare une liste vide pour les lignes demandées
-                    for ligne in lignes: #pour chaque ligne de la table
-                        nouvelle_ligne = {} #on declare un dictionnaire vide
-                        for col in colonnes: #pour chaque colonne demandée
-                            nouvelle_ligne[col] = ligne.get(col) #on copie la valeur de la ligne dans le dictionnaire
-                        lignes_filtrees.append(nouvelle_ligne) #on l'ajoute a la liste 
-                    lignes = lignes_filtrees #et on remplace seulement par les lignes demandées
 
+            elif type_requete == 'COPY': #pour charger un fichier CSV
+                nom_table, lignes = self.parser_copy(requete) #on lit et convertit le fichier
+                ids = self.donnees().inserer_lignes(nom_table, lignes) #une seule écriture pour tout le fichier
                 return {
                     'status': 'success',
-                    'message': f"{len(lignes)} ligne(s)",
-                    'data': lignes
+                    'message': f"{len(ids)} ligne(s) copiée(s) dans '{nom_table}'",
+                    'data': None
                 }
-                    
             
+            elif type_requete == 'VACUUM': #pour récupérer la place des lignes supprimées
+                nom_table = self.parser_vacuum(requete)
+                nbr_lignes = self.gestionnaire.compacter_table(nom_table)
+                return {
+                    'status': 'success',
+                    'message': f"Table '{nom_table}' compactée ({nbr_lignes} ligne(s) supprimée(s) récupérée(s))",
+                    'data': None
+                }
+
             elif type_requete == 'DESCRIBE': #pour retourner la structure de la table
                 nom_table = mots[1] #on prends le deuxieme mot = qui est le nom de la table
                 structure = self.gestionnaire.lire_struct(nom_table) #on lit la structure de la table
@@ -101,31 +438,529 @@ class MoteurSQL:
                 'data': None
             }
     
-    def parser_create(self, requete):
-        """pour parser lorsqu'on créer"""
-        pattern = r'CREATE\s+TABLE\s+(\w+)\s*\((.*)\)' #regex DROP TABLE groupe(1) groupe(2)
-        match = re.search(pattern, requete, re.IGNORECASE | re.DOTALL) #fonction regex pour match avec requette sans casse
+    def executer_transaction(self, type_requete, mots):
+        """BEGIN [TRANSACTION], COMMIT, ROLLBACK"""
+        if len(mots) > 2 or (len(mots) == 2 and mots[1].upper() != 'TRANSACTION'):
+            raise Exception(f"Mauvaise {type_requete} syntaxe")
+        if type_requete == 'BEGIN':
+            if self.transaction is not None:
+                raise Exception("Une transaction est deja en cours")
+            self.transaction = Transaction(self.gestionnaire)
+            message = "Transaction commencée"
+        elif self.transaction is None:
+            raise Exception("Pas de transaction en cours")
+        else:
+            transaction, self.transaction = self.transaction, None #finie, meme si le COMMIT échoue (rien d'écrit)
+            if type_requete == 'COMMIT':
+                nbr_lignes = transaction.valider()
+                message = f"Transaction validée ({nbr_lignes} ligne(s) ajoutée(s) ou supprimée(s))"
+            else:
+                transaction.annuler()
+                message = "Transaction annulée"
+        return {
+            'status': 'success',
+            'message': message,
+            'data': None
+        }
+
+    def expliquer(self, requete, parametres):
+        """
+        EXPLAIN [ANALYZE] requete : le plan d'un INSERT, DELETE, UPDATE ou SELECT, une étape par ligne de 'data'
+        ({'plan': texte}). ANALYZE exécute aussi la requete (écritures comprises) et ajoute ce qui a été mesuré
+        """
+        match = re.match(r'EXPLAIN\s+(ANALYZE\s+)?(\S.*)$', requete, re.IGNORECASE | re.DOTALL)
+        if not match:
+            raise Exception("Mauvaise EXPLAIN syntaxe : EXPLAIN [ANALYZE] requete")
+        analyse, requete = match.group(1) is not None, match.group(2)
+
+        debut = time.perf_counter()
+        with self.verrou_plans:
+            en_cache = requete in self.cache_plans
+        plan = self.plan(requete)
+        if plan is None:
+            raise Exception("EXPLAIN n'accepte que INSERT, DELETE, UPDATE et SELECT")
+        duree_analyse = time.perf_counter() - debut
 
+        debut = time.perf_counter()
+        etapes = self.decrire_plan(plan, parametres, requete)
+        duree_planification = time.perf_counter() - debut
+        if analyse:
+            etapes += self.analyser_plan(plan, parametres, requete, en_cache, duree_analyse, duree_planification)
+        return {
+            'status': 'success',
+            'message': f"Plan de la requete sur '{plan['table']}'",
+            'data': [{'plan': etape} for etape in etapes]
+        }
+
+    def decrire_plan(self, plan, parametres, requete):
+        """les étapes du plan en texte : table, accès (index ou parcours), filtre, colonnes, agrégats, tri, limite"""
+        plan = self.lier_plan(plan, parametres)
+        nom_table = plan['table']
+        table = self.gestionnaire.decrire_table(nom_table)
+        etapes = [f"{plan['sorte']} sur '{nom_table}' : {self.texte_stockage(table)}, {table['vivantes']} ligne(s)"]
+        if table['slots'] > table['vivantes']:
+            etapes[0] += f" et {table['slots'] - table['vivantes']} supprimée(s), sautées a la lecture (VACUUM)"
+        if self.transaction is not None:
+            etapes.append("Transaction en cours : les lignes non validées de ce thread sont lues en plus")
+
+        if plan['sorte'] == 'INSERT':
+            etapes.append(f"Insertion de {len(plan['tuples'])} ligne(s) en une seule écriture"
+                          + (" au COMMIT" if self.transaction is not None else ""))
+            return etapes
+        plan = self.typer_plan(plan)
+
+        if plan['sorte'] in ('DELETE', 'UPDATE'):
+            etapes += self.decrire_acces(nom_table, table, plan['condition'], [], "Parcours séquentiel de toute la table")
+            if plan['sorte'] == 'UPDATE':
+                etapes.append("Valeurs : " + ", ".join(
+                    f"{nom_col} = {expressions.texte_valeur(valeur)}" for nom_col, valeur in plan['valeurs'].items()))
+            return etapes
+
+        self.verifier_colonnes(plan, [nom_col for nom_col, _ in self.gestionnaire.lire_struct(nom_table)])
+        cle, etat = self.cle_resultat(requete, nom_table, parametres)
+        if cle is not None and self.gestionnaire.cache.contient(cle, etat):
+            etapes.append("Résultat en cache : renvoyé sans lecture ni décodage tant que la table ne change pas")
+        if plan['groupes'] or any(arbre[0] == 'agg' for arbre, _ in plan['selection']):
+            return etapes + self.decrire_agregats(nom_table, table, plan)
+        return etapes + self.decrire_selection(nom_table, table, plan)
+
+    def texte_stockage(self, table):
+        """le format d'une table décrite par GestionnaireDeTable.decrire_table"""
+        if table['version'] == 1:
+            return "format 1 (lignes de taille variable)"
+        if table['version'] == format_compact.VERSION_COMPACTE:
+            return "format 3 compact (bitmap des nulls, varints)"
+        if table['colonnes']:
+            return "format 2 en colonnes (un fichier par colonne)"
+        return "format 2 en lignes (slots de taille fixe, textes dans le tas)"
+
+    def texte_parcours(self, table, projection):
+        """le parcours de toute la table : par les pages du cache des lectures s'il y en a un, sinon dans le fichier"""
+        if self.gestionnaire.cache is not None:
+            texte = (f"Parcours séquentiel par les pages du cache des lectures "
+                     f"({table['pages_gardees']}/{table['pages']} page(s) gardée(s))")
+            if projection: #voir GestionnaireDeTable.parcourir_pages
+                texte += ", la suite lue directement a la premiere page absente (une projection ne remplit pas le cache)"
+            return texte
+        if table['colonnes']:
+            return "Parcours séquentiel des fichiers des colonnes lues, par lots"
+        return "Parcours séquentiel de toute la table" + (", projetée en mémoire (mmap)" if table['mmap'] else "")
+
+    def decrire_acces(self, nom_table, table, condition, colonnes, parcours):
+        """
+        les étapes de l'accès aux lignes : l'index choisi pour le WHERE, sinon le texte parcours,
+        puis le filtre et les colonnes décodées avant lui (colonnes : projetées, None = toutes)
+        """
+        choix = None
+        if condition is not None:
+            choix = self.gestionnaire.choisir_index(nom_table, expressions.contraintes_index(condition))
+        if choix is not None:
+            nom_index, contrainte = choix
+            etapes = [f"Accès par l'index '{nom_index}' : {expressions.texte_contrainte(contrainte)}, "
+                      f"lignes candidates lues dans l'ordre du fichier"]
+        else:
+            etapes = [parcours]
+        if condition is None:
+            return etapes
+
+        filtrees = sorted(expressions.colonnes_de(condition))
+        etapes.append(f"Filtre {'vérifié sur les lignes candidates' if choix else 'appliqué pendant la lecture'} : "
+                      f"{expressions.texte(condition)}")
+        structure = [nom_col for nom_col, _ in self.gestionnaire.lire_struct(nom_table)]
+        projetees = structure if colonnes is None else colonnes
+        apres = [nom_col for nom_col in projetees if nom_col not in filtrees]
+        etapes.append("Colonnes décodées avant le filtre : " + ", ".join(filtrees)
+                      + ("" if not apres else " ; seulement pour les lignes gardées : " + ", ".join(apres)))
+        return etapes
+
+    def decrire_selection(self, nom_table, table, select):
+        """les étapes d'un SELECT sans agrégat (voir lignes_selectionnees)"""
+        condition, decalage, limite = select['condition'], select['decalage'], select['limite']
+        if select['selection'] == [(('tout',), None)]:
+            colonnes = None
+        else:
+            colonnes = [arbre[1] for arbre, _ in select['selection'] if arbre[0] == 'col']
+            sorties = colonnes + [alias for _, alias in select['selection'] if alias]
+            colonnes += [nom for nom, _ in self.cles_tri(select) if nom not in sorties] #lues pour le tri
+
+        limitee = not select['ordre'] and (decalage or limite is not None) #la lecture s'arrete d'elle-meme
+        if condition is None and table['colonnes'] and not select['ordre'] and not limitee:
+            parcours = ("Lots lus directement dans les fichiers des colonnes (tableaux numpy si installé), "
+                        "lignes construites seulement si elles sont lues")
+        elif (self.parcours_parallele(None) and table['plages']
+                and (select['ordre'] or (not decalage and limite is None))):
+            parcours = (f"Parcours parallèle : {table['plages']} plages décodées et filtrées par "
+                        f"{self.gestionnaire.parallel_workers} processus, rendues dans l'ordre de la table")
+        elif condition is None and table['direct'] and (self.gestionnaire.cache is None or limitee):
+            parcours = "Parcours séquentiel de toute la table"
+            if limitee and decalage: #voir GestionnaireDeTable.ouvrir_lignes
+                parcours = f"Lecture directe a partir de la ligne {decalage} ({'lignes' if table['colonnes'] else 'slots'} de taille fixe, aucune supprimée)"
+            elif table['mmap']:
+                parcours += ", projetée en mémoire (mmap)"
+        else:
+            parcours = self.texte_parcours(table, colonnes is not None)
+        etapes = self.decrire_acces(nom_table, table, condition, colonnes, parcours)
+        etapes.append("Colonnes lues : " + ("toutes" if colonnes is None else ", ".join(colonnes))
+                      + (", seuls leurs fichiers sont ouverts" if table['colonnes'] and colonnes is not None else ""))
+
+        if select['ordre']:
+            cles = ", ".join(nom + (" DESC" if descendant else "") for nom, descendant in self.cles_tri(select))
+            if limite is not None:
+                etapes.append(f"Tri : {cles}, tas borné aux {decalage + limite} premieres lignes")
+            else:
+                etapes.append(f"Tri : {cles}, en mémoire jusqu'a {self.lignes_tri} lignes, puis tri externe sur disque")
+        elif limitee:
+            clauses = ([f"LIMIT {limite}"] if limite is not None else []) + ([f"OFFSET {decalage}"] if decalage else [])
+            etapes.append(f"{' '.join(clauses)} : la lecture s'arrete apres la derniere ligne demandée")
+        return etapes
+
+    def decrire_agregats(self, nom_table, table, select):
+        """les étapes d'un SELECT avec agrégats et/ou GROUP BY (voir lignes_agregees)"""
+        condition, groupes = select['condition'], select['groupes']
+        fonctions = []
+        for arbre in [arbre for arbre, _ in select['selection']] + [arbre for arbre, _ in select['ordre']]:
+            if arbre[0] == 'agg' and arbre not in fonctions:
+                fonctions.append(arbre)
+        if select['having'] is not None:
+            fonctions.extend(a for a in expressions.agregats_de(select['having']) if a not in fonctions)
+
+        if not groupes and condition is None and all(arbre[2] == '*' for arbre in fonctions):
+            return ["COUNT(*) lu dans l'en-tête de la table, sans parcours"]
+        colonnes = list(groupes)
+        colonnes += [arbre[2] for arbre in fonctions if arbre[2] != '*' and arbre[2] not in colonnes]
+        if self.parcours_parallele(None) and table['plages'] and not (condition is None and table['colonnes']):
+            parcours = (f"Parcours parallèle : agrégats partiels de {table['plages']} plages calculés par "
+                        f"{self.gestionnaire.parallel_workers} processus, puis fusionnés")
+        elif condition is None and table['colonnes']:
+            parcours = "Lots lus directement dans les fichiers des colonnes (tableaux numpy si installé)"
+        else:
+            parcours = self.texte_parcours(table, True)
+        etapes = self.decrire_acces(nom_table, table, condition, colonnes, parcours)
+        etapes.append("Colonnes lues : " + (", ".join(colonnes) if colonnes else "aucune"))
+        etapes.append("Agrégation : " + ", ".join(expressions.nom_agregat(arbre) for arbre in fonctions)
+                      + (f" par groupe de {', '.join(groupes)}" if groupes else ""))
+        if select['having'] is not None:
+            etapes.append(f"HAVING : {expressions.texte(select['having'])}")
+        if select['ordre']:
+            etapes.append("Tri des groupes : " + ", ".join(
+                nom + (" DESC" if descendant else "") for nom, descendant in self.cles_tri(select)))
+        return etapes
+
+    def analyser_plan(self, plan, parametres, requete, en_cache, duree_analyse, duree_planification):
+        """
+        EXPLAIN ANALYZE : exécute le plan en mesurant ses lectures (voir GestionnaireDeTable.mesurer),
+        renvoie les étapes des mesures : durées, lignes parcourues et renvoyées, octets lus, pages du cache
+        """
+        cle, etat = self.cle_resultat(requete, plan['table'], parametres)
+        servi = plan['sorte'] == 'SELECT' and cle is not None and self.gestionnaire.cache.contient(cle, etat)
+        with self.gestionnaire.mesurer() as mesure:
+            debut = time.perf_counter()
+            resultat = self.executer_plan(plan, parametres, flux=True, requete=requete)
+            lignes = resultat['data'].fetchall() if isinstance(resultat['data'], Curseur) else None
+            duree = time.perf_counter() - debut
+
+        etapes = [
+            f"Analyse : {texte_duree(duree_analyse)}{' (plan en cache)' if en_cache else ''}, "
+            f"planification : {texte_duree(duree_planification)}, exécution : {texte_duree(duree)}",
+            f"Exécution : lecture {texte_duree(mesure.duree_lecture)} ({mesure.nbr_lectures} read()), "
+            f"décodage, filtre et résultat {texte_duree(max(0.0, duree - mesure.duree_lecture))}",
+        ]
+        if lignes is not None:
+            renvoyees = f"{len(lignes)} renvoyée(s)" + (" depuis le cache des résultats" if servi else "")
+        else:
+            renvoyees = resultat['message']
+        etapes.append(f"Lignes : {mesure.lignes_parcourues} parcourue(s), {renvoyees}")
+        octets = f"Octets : {texte_octets(mesure.octets_lus)} lus par read()"
+        if mesure.octets_projetes:
+            octets += f", {texte_octets(mesure.octets_projetes)} projetés en mémoire (lus pendant le décodage)"
+        etapes.append(octets)
+        if mesure.pages_cache or mesure.pages_decodees:
+            etapes.append(f"Pages du cache : {mesure.pages_cache} trouvée(s), {mesure.pages_decodees} décodée(s) et gardée(s)")
+        if mesure.plages_paralleles:
+            etapes.append(f"Parcours parallèle : {mesure.plages_paralleles} plage(s) lue(s) par les processus "
+                          f"(leurs octets ne sont pas comptés)")
+        return etapes
+
+    def prepare(self, requete):
+        """
+        parse une requete INSERT, DELETE, UPDATE ou SELECT avec des paramètres ? ou :nom,
+        renvoie une RequetePreparee (lève une exception si la requete est invalide)
+        """
+        requete = self.nettoyer_requete(requete)
+        plan = self.plan(requete) if requete else None
+        if plan is None:
+            raise Exception("prepare n'accepte que INSERT, DELETE, UPDATE et SELECT")
+        return RequetePreparee(self, requete, plan)
+
+    def plan(self, requete):
+        """
+        le plan de la requete (nettoyée) depuis le cache, parsé et gardé s'il n'y est pas encore.
+        None si la requete n'est pas un INSERT, DELETE, UPDATE ou SELECT
+        """
+        with self.verrou_plans:
+            plan = self.cache_plans.get(requete)
+            if plan is not None:
+                self.cache_plans.move_to_end(requete) #le plus récemment utilisé
+                return plan
+
+        type_requete = requete.split(None, 1)[0].upper()
+        if type_requete not in REQUETES_PLANIFIEES:
+            return None
+        plan = self.planifier(requete, type_requete) #hors du verrou : les autres threads n'attendent pas le parser
+
+        if len(requete) <= TAILLE_MAX_PLAN:
+            with self.verrou_plans:
+                self.cache_plans[requete] = plan
+                self.cache_plans.move_to_end(requete)
+                while len(self.cache_plans) > self.taille_cache_plans: #on oublie le moins récemment utilisé
+                    self.cache_plans.popitem(last=False)
+        return plan
+
+    def planifier(self, requete, type_requete):
+        """
+        parse la requete en plan : un dictionnaire avec la sorte de requete, la table, ce que renvoie son parser
+        et les noms des paramètres. Les valeurs d'un INSERT sont associées aux colonnes a l'exécution
+        """
+        requete = expressions.numeroter_parametres(requete) #les ? deviennent :1, :2, ...
+        if type_requete == 'INSERT':
+            nom_table, tuples = self.parser_insert(requete)
+            plan = {'table': nom_table, 'tuples': tuples}
+        elif type_requete == 'DELETE':
+            nom_table, condition = self.parser_delete(requete)
+            plan = {'table': nom_table, 'condition': condition}
+        elif type_requete == 'UPDATE':
+            nom_table, valeurs, condition = self.parser_update(requete)
+            plan = {'table': nom_table, 'valeurs': valeurs, 'condition': condition}
+        else:
+            plan = self.parser_select(requete) #selection, table, condition, groupes, ...
+        plan['sorte'] = type_requete
+        plan['parametres'] = expressions.parametres_de(plan)
+        return plan
+
+    def oublier_plans(self, nom_table):
+        """enleve du cache les plans qui lisent ou écrivent la table (CREATE / DROP)"""
+        with self.verrou_plans:
+            for requete in [requete for requete, plan in self.cache_plans.items() if plan['table'] == nom_table]:
+                del self.cache_plans[requete]
+
+    def lier_plan(self, plan, parametres):
+        """le plan avec les valeurs des paramètres (une copie), ou le plan lui-meme s'il n'en a pas"""
+        if not plan['parametres']:
+            if parametres:
+                raise Exception("La requete n'a pas de paramètres")
+            return plan
+        if parametres is not None and not isinstance(parametres, dict):
+            nbr_attendus = sum(nom.isdigit() for nom in plan['parametres'])
+            if nbr_attendus and len(parametres) != nbr_attendus: #sinon lier demande un dictionnaire pour les :nom
+                raise Exception(f"{nbr_attendus} paramètre(s) attendu(s), {len(parametres)} donné(s)")
+        return expressions.lier(plan, parametres)
+
+    def executer_plan(self, plan, parametres=None, flux=False, requete=None):
+        """
+        exécute un plan (voir planifier) avec ses paramètres, renvoie le résultat comme executer.
+        requete : le texte nettoyé du plan, la clé de son résultat dans le cache des résultats
+        """
+        plan = self.lier_plan(plan, parametres)
+        nom_table = plan['table']
+        if plan['sorte'] != 'INSERT': #INSERT : valeurs converties par lignes_insert
+            plan = self.typer_plan(plan)
+
+        if plan['sorte'] == 'INSERT': #pour ajouter des données dans les colonnes, une ou plusieurs lignes
+            #une seule écriture pour toutes les lignes (ou gardées jusqu'au COMMIT dans une transaction)
+            ids = self.donnees().inserer_lignes(nom_table, self.lignes_insert(nom_table, plan['tuples']))
+            return self.resultat_insertion(ids)
+
+        if plan['sorte'] in ('DELETE', 'UPDATE'): #pour supprimer ou modifier des lignes
+            filtre, colonnes_filtre = self.preparer_filtre(nom_table, plan['condition']) #le WHERE compilé
+            positions = self.positions_par_index(nom_table, plan['condition']) #None = toute la table
+            if plan['sorte'] == 'DELETE':
+                nbr_lignes = self.donnees().supprimer_lignes(nom_table, filtre, colonnes_filtre, positions)
+                message = f"{nbr_lignes} ligne(s) supprimée(s)"
+            else:
+                nbr_lignes = self.donnees().modifier_lignes(nom_table, plan['valeurs'], filtre, colonnes_filtre, positions)
+                message = f"{nbr_lignes} ligne(s) modifiée(s)"
+            return {
+                'status': 'success',
+                'message': message,
+                'data': None
+            }
+
+        #pour selectionner : les lignes sont lues a la demande par le Curseur
+        cle, etat = self.cle_resultat(requete, nom_table, parametres)
+        gardees = None if cle is None else self.gestionnaire.cache.lire_resultat(cle, etat)
+        if gardees is not None: #meme requete sur la table inchangée : ni lecture ni décodage
+            curseur = Curseur([dict(ligne) for ligne in gardees])
+        else:
+            if plan['groupes'] or any(arbre[0] == 'agg' for arbre, _ in plan['selection']):
+                lignes = self.lignes_agregees(plan) #GROUP BY / agrégats
+            else:
+                lignes = self.lignes_selectionnees(plan)
+            curseur = Curseur(lignes if cle is None else self.garder_resultat(lignes, cle, etat))
+        if flux: #le Curseur lui-meme, les lignes ne sont pas encore lues
+            return {
+                'status': 'success',
+                'message': f"Lecture de '{nom_table}'",
+                'data': curseur
+            }
+        lignes = curseur.fetchall() #on lit tout
+        return { #on renvoie le msg
+            'status': 'success',
+            'message': f"{len(lignes)} ligne(s)",
+            'data': lignes
+        }
+
+    def cle_resultat(self, requete, nom_table, parametres):
+        """
+        la clé d'un SELECT dans le cache des résultats et l'état de sa table, (None, None) s'il n'y est pas gardé :
+        pas de cache, requete sans texte, paramètres non hachables ou transaction en cours (ses lignes non validées
+        ne sont que dans ce thread). Le type des paramètres compte : 1 et True ne donnent pas le meme résultat
+        """
+        if self.gestionnaire.cache is None or requete is None or self.transaction is not None:
+            return None, None
+        if isinstance(parametres, dict):
+            valeurs = tuple(sorted((nom, type(valeur).__name__, valeur) for nom, valeur in parametres.items()))
+        else:
+            valeurs = tuple((type(valeur).__name__, valeur) for valeur in parametres or ())
+        try:
+            hash(valeurs)
+        except TypeError:
+            return None, None
+        etat = self.gestionnaire.etat_table(nom_table) #lu avant la requete : une écriture pendant la lecture l'invalide
+        if etat is None:
+            return None, None
+        return (nom_table, 'resultat', requete, valeurs), etat
+
+    def garder_resultat(self, lignes, cle, etat):
+        """
+        les lignes du SELECT, copiées au passage dans le cache des résultats une fois toutes lues
+        (pas un curseur fermé avant la fin, ni un résultat plus gros que la part permise du cache)
+        """
+        cache = self.gestionnaire.cache
+        gardees = []
+        try:
+            for ligne in lignes:
+                if gardees is not None:
+                    gardees.append(dict(ligne))
+                    if len(gardees) % LIGNES_PAR_PAGE == 0 and estimer_taille(gardees) > cache.taille_max_resultat():
+                        gardees = None #trop gros : on arrete de copier
+                yield ligne
+        finally:
+            if hasattr(lignes, 'close'):
+                lignes.close()
+        if gardees is not None:
+            cache.ajouter_resultat(cle, etat, gardees)
+
+    def executer_insertions(self, plan, suite_parametres):
+        """un INSERT préparé pour chaque jeu de paramètres : toutes les lignes en une seule écriture"""
+        tuples = []
+        for parametres in suite_parametres:
+            tuples.extend(self.lier_plan(plan, parametres)['tuples'])
+        ids = self.donnees().inserer_lignes(plan['table'], self.lignes_insert(plan['table'], tuples))
+        return self.resultat_insertion(ids)
+
+    def curseur(self, requete):
+        """execute la requete et renvoie un Curseur sur son resultat (lève une exception en cas d'erreur)"""
+        resultat = self.executer(requete, flux=True)
+        if resultat['status'] != 'success':
+            raise Exception(resultat['message'])
+
+        data = resultat['data']
+        if isinstance(data, Curseur): #SELECT
+            return data
+        if isinstance(data, dict): #INSERT : une seule "ligne" avec l'_id
+            return Curseur([data])
+        return Curseur(data or []) #DESCRIBE, ou pas de données
+
+    def resultat_insertion(self, ids):
+        """formatte le resultat d'une insertion d'une ou plusieurs lignes"""
+        if len(ids) == 1: #une seule ligne : meme reponse qu'avant
+            return {
+                'status': 'success',
+                'message': f"Ligne insérée, _id = {ids[0]}",
+                'data': {'_id': ids[0]}
+            }
+        return {
+            'status': 'success',
+            'message': f"{len(ids)} lignes insérées",
+            'data': {'_id': ids}
+        }
+
+    def executemany(self, requete, lignes):
+        """
+        insère plusieurs lignes avec une seule requete INSERT et une seule écriture.
+        ex: executemany("INSERT INTO users VALUES (?, ?)", [('Rotter', 32), ('Dam', 20)])
+        chaque ligne est un tuple dans l'ordre des colonnes (sans _id) ou un dictionnaire
+        """
+        return self.instrumenter(requete, None, lambda: self.inserer_lot(requete, lignes))
+
+    def inserer_lot(self, requete, lignes):
+        """executemany sans l'instrumentation"""
+        try:
+            requete = self.nettoyer_requete(requete) #on nettoye
+            match = re.match(r'INSERT\s+INTO\s+(\w+)', requete, re.IGNORECASE) #seul le nom de table compte
+            if not match:
+                raise Exception("executemany n'accepte que INSERT INTO")
+            nom_table = match.group(1)
+
+            structure = self.gestionnaire.lire_struct(nom_table) #une seule lecture de la structure pour tout le lot
+            colonnes_sans_id = [nom for nom, _ in structure if nom != '_id']
+
+            lot = [] #les lignes converties en dictionnaires
+            for ligne in lignes:
+                if isinstance(ligne, dict): #deja un dictionnaire colonne : valeur
+                    lot.append(dict(ligne))
+                    continue
+                if len(ligne) != len(colonnes_sans_id): #meme controle que pour INSERT
+                    raise Exception(f"Mauvais nombre de valeurs")
+                lot.append(dict(zip(colonnes_sans_id, ligne)))
+
+            ids = self.donnees().inserer_lignes(nom_table, lot) #une seule écriture (au COMMIT dans une transaction)
+            return self.resultat_insertion(ids)
+        except Exception as exceptions:
+            return {
+                'status': 'error',
+                'message': str(exceptions),
+                'data': None
+            }
+
+    def parser_create(self, requete):
+        """
+        pour parser lorsqu'on créer, avec en option WITH (storage = 'row' | 'columnar' | 'compact').
+        Les colonnes sont lues par le parser de expressions : un type peut avoir des arguments, ex: DECIMAL(10, 2)
+        """
+        match = re.match(r'CREATE\s+TABLE\s+(\w+)', requete, re.IGNORECASE) #regex pour le nom de la table seulement
         if not match: #si pas de match a été trouvé
             raise Exception("Mauvaise CREATE TABLE syntaxe") #on imprime le msg d'err exception
-        
+
         nom_table = match.group(1) #premier match trouvé = nom_table
-        colonnes_texte = match.group(2)#deuxieme match trouvé = colonnes_texte
+        colonnes, options = expressions.parser_creation(requete[match.end():]) #[(nom, type)], {option: valeur}
+
+        version, stockage = STOCKAGES['row']
+        for option, valeur in options.items(): #les options de WITH (...)
+            if option != 'storage':
+                raise Exception(f"Option de table inconnue : {option}")
+            if str(valeur).lower() not in STOCKAGES:
+                raise Exception(f"Stockage inconnu : {valeur} (row, columnar ou compact)")
+            version, stockage = STOCKAGES[valeur.lower()]
 
-        colonnes=[] #on déclare une liste vide pour y stocker les colonnes
-        parties = colonnes_texte.split(',') #on séparer en tockens les différents colonnes dans le texte 
+        return nom_table, colonnes, version, stockage #et on renvoie nom, colonnes, format et stockage
 
-        for partie in parties: #pour chaque colonne
-            partie = partie.strip() #on enleve les espaces
-            elements = partie.split() #on les séparer en tocken
-            if len(elements) <2: #si moins de 2 tockens
-                raise Exception(f"Colonne syntaxe erreur {partie}") #msg d'err d'exception
-            nom_col = elements[0] #sinon 1er tocken et le nom de la colonne
-            type_col = elements[1].upper() #2eme tocken est le type
-            colonnes.append((nom_col, type_col)) #on ajoute le tuple nom, type a la liste vide
 
-        return nom_table, colonnes #et on renvoie nom et colonnes
+    def parser_create_index(self, requete):
+        """pour parser CREATE INDEX nom ON table (colonne)"""
+        pattern = r'CREATE\s+INDEX\s+(\w+)\s+ON\s+(\w+)\s*\(\s*(\w+)\s*\)$'
+        match = re.match(pattern, requete, re.IGNORECASE)
+        if not match:
+            raise Exception("Mauvaise CREATE INDEX syntaxe")
+        return match.group(1), match.group(2), match.group(3) #nom de l'index, table, colonne
 
+    def parser_drop_index(self, requete):
+        """pour parser DROP INDEX nom [ON table]"""
+        pattern = r'DROP\s+INDEX\s+(\w+)(?:\s+ON\s+(\w+))?$'
+        match = re.match(pattern, requete, re.IGNORECASE)
+        if not match:
+            raise Exception("Mauvaise DROP INDEX syntaxe")
+        return match.group(1), match.group(2) #nom de l'index, table (ou None)
 
     def parser_drop(self, requete): #parser pour supprimer
         """pour parser lorsqu'on supprime"""
@@ -137,100 +972,422 @@ class MoteurSQL:
         
         return match.group(1) ##sinon renvoi le groupe(1) trouvé
     
+    def parser_migrate(self, requete):
+        """pour parser MIGRATE TABLE nom [WITH (storage = 'row' | 'compact')], renvoie (nom, format visé)"""
+        match = re.match(r"MIGRATE\s+TABLE\s+(\w+)(?:\s+WITH\s*\(\s*storage\s*=\s*'?(\w+)'?\s*\))?\s*;?\s*$",
+                         requete.strip(), re.IGNORECASE)
+        if not match:
+            raise Exception("Mauvaise MIGRATE TABLE syntaxe")
+        stockage = (match.group(2) or 'row').lower()
+        if stockage not in ('row', 'compact'): #le stockage en colonnes se choisit au CREATE TABLE
+            raise Exception(f"Stockage inconnu pour MIGRATE : {stockage} (row ou compact)")
+        return match.group(1), STOCKAGES[stockage][0]
+
+    def parser_delete(self, requete):
+        """pour parser DELETE FROM table [WHERE ...], renvoie (table, condition ou None)"""
+        match = re.match(r'DELETE\s+FROM\s+(\w+)(.*)$', requete, re.IGNORECASE | re.DOTALL)
+        if not match:
+            raise Exception("Mauvaise DELETE syntaxe")
+        clauses = expressions.separer_clauses(match.group(2), [('WHERE',)])
+        return match.group(1), expressions.parser_tokens(clauses['WHERE']) if 'WHERE' in clauses else None
+
+    def parser_update(self, requete):
+        """pour parser UPDATE table SET col = valeur, ... [WHERE ...], renvoie (table, {colonne: valeur}, condition)"""
+        match = re.match(r'UPDATE\s+(\w+)(.*)$', requete, re.IGNORECASE | re.DOTALL)
+        if not match:
+            raise Exception("Mauvaise UPDATE syntaxe")
+        clauses = expressions.separer_clauses(match.group(2), [('SET',), ('WHERE',)])
+        if 'SET' not in clauses:
+            raise Exception("UPDATE sans SET")
+        condition = expressions.parser_tokens(clauses['WHERE']) if 'WHERE' in clauses else None
+        return match.group(1), expressions.parser_affectations(clauses['SET']), condition
+
+    def parser_vacuum(self, requete):
+        """pour parser VACUUM table"""
+        match = re.match(r'VACUUM\s+(?:TABLE\s+)?(\w+)$', requete, re.IGNORECASE)
+        if not match:
+            raise Exception("Mauvaise VACUUM syntaxe")
+        return match.group(1)
+
     def parser_insert(self, requete): #parser pour inserer des données dans les colonnes
-        """pour parser les insertion d'écriture"""
-        pattern = r'INSERT\s+INTO\s+(\w+)\s+VALUES\s*\((.*)\)' #regex INSERT INTO groupe(1) groupe(2)
-        match = re.search(pattern, requete, re.IGNORECASE) #fonction regex de match avec requette sans casse
+        """
+        pour parser les insertion d'écriture, avec une ou plusieurs lignes : VALUES (...), (...).
+        Renvoie (table, [valeurs de chaque tuple]), associées aux colonnes a l'exécution (voir lignes_insert)
+        """
+        match = re.match(r'INSERT\s+INTO\s+(\w+)\s+VALUES\b', requete, re.IGNORECASE) #regex INSERT INTO groupe(1)
 
         if not match: #si aucun match
             raise Exception("Mauvase syntaxe INSERT") #renvoie le msg d'err d'exception
-        
-        nom_table = match.group(1) #1er match groupe(1) est le nom de la table
-        valeurs_texte = match.group(2) #2eme match est la valeur en texte a mettre dans les colonnes
 
-        valeurs = self.parser_valeurs(valeurs_texte) #parse les valeur second notre fonction pratique
+        #les tuples sont lus en une seule passe par le tokenizer (chaines échappées, paramètres ? et :nom)
+        return match.group(1), expressions.parser_tuples(requete[match.end():])
 
-        structure = self.gestionnaire.lire_struct(nom_table) #lit la structure de la table
-        colonnes_sans_id = [col for col in structure if col[0] != '_id'] #on enleve _id du tableau pour flag
+    def lignes_insert(self, nom_table, tuples):
+        """les valeurs de chaque tuple d'un INSERT associées aux colonnes de la table : une liste de dictionnaires"""
+        structure = self.gestionnaire.lire_struct(nom_table) #lit la structure de la table (une fois pour tout le lot)
+        colonnes_sans_id = [(nom_col, type_col) for nom_col, type_col in structure if nom_col != '_id'] #sans _id
 
-        if len(valeurs) != len(colonnes_sans_id): #on vérfie que le nombre de valeur correspond sans _id
-            raise Exception(f"Mauvais nombre de valeurs") #sinon on renvoie msg erreur d'excpetion
-        
-        dict_valeurs = {} #on déclare un dictionnaire vide a remplir
-        for i, (nom_col, _) in enumerate(colonnes_sans_id): #pour chaque colonne avec nom, dans le nbr de colonne dans id
-            dict_valeurs[nom_col] = valeurs[i] #on associe la valeur du nom de la colonne a indice ou il se trouve da
+        lignes = [] #une liste de dictionnaires, un par tuple
+        for valeurs in tuples:
+            if len(valeurs) != len(colonnes_sans_id): #on vérfie que le nombre de valeur correspond sans _id
+                raise Exception(f"Mauvais nombre de valeurs") #sinon on renvoie msg erreur d'excpetion
+            lignes.append({ #un nouveau dictionnaire a chaque exécution, valeurs converties selon le type
+                nom_col: self.convertir_selon_type(valeur, type_col, nom_col)
+                for (nom_col, type_col), valeur in zip(colonnes_sans_id, valeurs)
+            })
+        return lignes
 
-        return nom_table, dict_valeurs #renvoi nom et dictionnaire
-    
+    def convertir_selon_type(self, valeur, type_col, nom_col):
+        """
+        une valeur de la requete convertie selon le type de sa colonne (ex: '32' -> 32 pour un INT).
+        Un INT refuse une valeur qui n'est pas un nombre entier (1.5 n'est pas tronqué en 1)
+        """
+        if valeur is None:
+            return None
+        try:
+            if type_col in ('INT', 'BIGSERIAL'):
+                return valeur if type(valeur) is int else entier_exact(valeur)
+            if type_col == 'FLOAT':
+                return valeur if type(valeur) is float else float(valeur)
+            if type_col == 'BOOL':
+                if isinstance(valeur, str): #'true' / 'false' entre guillemets
+                    if valeur.strip().lower() not in VALEURS_BOOL:
+                        raise ValueError(valeur)
+                    return VALEURS_BOOL[valeur.strip().lower()]
+                return bool(valeur)
+            return valeur if isinstance(valeur, str) else str(valeur) #TEXT et SERIAL
+        except (TypeError, ValueError):
+            raise Exception(f"Valeur {valeur!r} invalide pour la colonne {nom_col} ({type_col})")
 
-    def parser_valeurs(self, texte): #parser pour capturer les valeurs
-        """pour parser les valeurs types texte, int, foat, booleen """
-        valeurs = [] #on déclare une liste vide pour stockage
-        partie_actuelle = "" #un buffer pour construire une valeur
-        dans_guillemets = False #flag pou savoir si on est dans une streing ou pas
-        guillemet_type = None #type de guillement '' ou ""
-        
-        for caractere in texte: #pour chaque carctère
-            if caractere in ('"', "'") and not dans_guillemets: #début d'un string
-                dans_guillemets = True #active le flag
-                guillemet_type = caractere #et mémorise le type
-            elif caractere == guillemet_type and dans_guillemets: #prchain guillement
-                dans_guillemets = False #fin de string
-                guillemet_type = None
-            elif caractere == ',' and not dans_guillemets: #si virgule hors guillemets,
-                valeur = self.convertir_valeur(partie_actuelle.strip()) #on nettoye les avant apres
-                valeurs.append(valeur) #on ajoute a la liste
-                partie_actuelle = "" #on réinitialise le bugger
-            else:
-                partie_actuelle += caractere #et on réinitialise le buffer
-            
-        if partie_actuelle.strip(): #si le dernir buffer non vide 
-            valeur = self.convertir_valeur(partie_actuelle.strip())
-            valeurs.append(valeur) #on ajoute la valeur a la liste
+    def convertir_constante(self, valeur, type_col, nom_col):
+        """
+        une constante du WHERE comparée a une colonne, convertie selon son type seulement si rien n'est perdu :
+        une colonne INT comparée a 1.5 (ou '1.5') garde le réel, comparé numériquement (x < 1.5 garde x = 1)
+        """
+        if type_col in ('INT', 'BIGSERIAL') and valeur is not None and type(valeur) is not int and not isinstance(valeur, bool):
+            try:
+                return entier_exact(valeur)
+            except (TypeError, ValueError, OverflowError):
+                try:
+                    return float(valeur) #pas entier : comparé tel quel ('abc' reste une erreur)
+                except (TypeError, ValueError):
+                    raise Exception(f"Valeur {valeur!r} invalide pour la colonne {nom_col} ({type_col})")
+        return self.convertir_selon_type(valeur, type_col, nom_col)
+
+    def typer_plan(self, plan):
+        """
+        une copie du plan ou les valeurs du SET et les constantes comparées aux colonnes dans le WHERE
+        sont converties selon les types des colonnes de la table
+        """
+        types = dict(self.gestionnaire.lire_struct(plan['table'])) #depuis le cache
+
+        def convertir(nom_col, valeur):
+            if nom_col not in types: #colonne inconnue : l'erreur vient de la compilation du filtre
+                return valeur
+            return self.convertir_selon_type(valeur, types[nom_col], nom_col)
+
+        def convertir_condition(nom_col, valeur):
+            if nom_col not in types:
+                return valeur
+            return self.convertir_constante(valeur, types[nom_col], nom_col)
+
+        plan = dict(plan)
+        if plan.get('condition') is not None:
+            plan['condition'] = expressions.typer(plan['condition'], convertir_condition)
+        if 'valeurs' in plan: #UPDATE
+            plan['valeurs'] = {nom_col: convertir(nom_col, valeur) for nom_col, valeur in plan['valeurs'].items()}
+        return plan
+
+    def parser_copy(self, requete):
+        """pour parser COPY table FROM 'fichier.csv' [WITH HEADER] et lire le fichier"""
+        pattern = r"COPY\s+(\w+)\s+FROM\s+'([^']+)'(\s+WITH\s+HEADER)?\s*;?\s*$" #regex COPY groupe(1) FROM groupe(2)
+        match = re.match(pattern, requete, re.IGNORECASE)
+
+        if not match:
+            raise Exception("Mauvaise syntaxe COPY")
+
+        nom_table = match.group(1) #la table a remplir
+        chemin_csv = match.group(2) #le fichier a lire
+        avec_entete = match.group(3) is not None #la 1ere ligne du CSV contient les noms de colonnes
+
+        structure = self.gestionnaire.lire_struct(nom_table)
+        colonnes_sans_id = [col for col in structure if col[0] != '_id']
+
+        lignes = []
+        with open(chemin_csv, newline='', encoding='utf-8') as fichier:
+            lecteur = csv.reader(fichier)
+            if avec_entete:
+                next(lecteur, None) #on saute l'entete
+            for champs in lecteur:
+                numero = lecteur.line_num #la ligne du fichier (un champ entre guillemets peut en prendre plusieurs)
+                if not champs: #ligne vide
+                    continue
+                if len(champs) != len(colonnes_sans_id):
+                    raise Exception(f"Mauvais nombre de valeurs (ligne {numero} du CSV)")
+                ligne = {}
+                for (nom_col, type_col), champ in zip(colonnes_sans_id, champs):
+                    try:
+                        ligne[nom_col] = self.convertir_champ(champ, type_col, nom_col)
+                    except Exception as erreur:
+                        raise Exception(f"{erreur} (ligne {numero} du CSV)")
+                lignes.append(ligne)
+
+        return nom_table, lignes
+
+    def convertir_champ(self, texte, type_col, nom_col):
+        """
+        convertit un champ de CSV selon le type de la colonne (champ vide = NULL), comme les valeurs
+        d'un INSERT : une valeur invalide (BOOL inconnu, INT non entier) est refusée
+        """
+        if texte == '' or texte.upper() == 'NULL':
+            return None
+        return self.convertir_selon_type(texte, type_col, nom_col) #TEXT et SERIAL restent des chaines
 
-        return valeurs #et on renvoie la liste de valeurs
-    
-    def convertir_valeur(self, texte):
-        """Convertire dans les guillemets"""
-        texte = texte.strip() #on enttoye et enleve les espaces
 
-        if texte.upper() == 'NULL':  #si la valeur est NULL
-            return None #on retourne rien
-        
-        if texte.lower() == 'true': #si true
-            return True #renvoie true
-        
-        if texte.lower() == 'false': #si fausse
-            return False #renvoie faux
-        
-        if (texte.startswith("'") and texte.endswith("'")) or (texte.startswith('"') and texte.endswith('"')):
-            return texte[1:-1] #si guillemets, on renvoie le texte sans
-        
-        try: # on essaie de convertir en nombre
-            if '.' not in texte: #si pas de decimal
-                return int(texte) #on converti en int
-            else: #sinon
-                return float(texte) #on convertie en float
-        except ValueError: #mais si la conversion échoue
-            return texte #on renvoi le text sans modif
-        
     def parser_select(self, requete):
-        """parser pour selectionner la data"""
-        pattern = r'SELECT\s+(.*?)\s+FROM\s+(\w+)' #regex SELECT groupe(1) FROM group(2)
-        match = re.search(pattern, requete, re.IGNORECASE) #fonction regex pour ignorer la casse
+        """
+        parser pour selectionner la data :
+        SELECT ... FROM t [WHERE ...] [GROUP BY ...] [HAVING ...] [ORDER BY ...] [LIMIT n] [OFFSET m]
+        Renvoie un dictionnaire : selection (voir expressions.parser_selection), table, condition, groupes, having,
+        ordre (voir expressions.parser_tri), limite, decalage
+        """
+        pattern = r'SELECT\s+(.*?)\s+FROM\s+(\w+)(.*)$' #regex SELECT groupe(1) FROM group(2) suite groupe(3)
+        match = re.search(pattern, requete, re.IGNORECASE | re.DOTALL) #fonction regex pour ignorer la casse
 
         if not match:  #mais si aucun match
             raise Exception("Mauvaise SELEXT syntax") #msg d'err
-        
-        colonnes_texte = match.group(1).strip() #on recupere les colonnes du match du grp 1
-        nom_table = match.group(2) #et ceux du grp 2
 
-        if colonnes_texte =='*': #si on veut toutes les colonnes
-            colonnes = ['*'] #on renvoie la lsite avec etoile
-        else: #sinon
-            colonnes = [c.strip() for c in colonnes_texte.split(',')] #on separer les colonnes par une virgule
+        clauses = expressions.separer_clauses(
+            match.group(3), [('WHERE',), ('GROUP', 'BY'), ('HAVING',), ('ORDER', 'BY'), ('LIMIT',), ('OFFSET',)]
+        )
+
+        groupes = [] #les colonnes du GROUP BY, séparées par des virgules
+        for i, (sorte, valeur) in enumerate(clauses.get('GROUP', [])):
+            if (i % 2 == 0 and sorte != 'nom') or (i % 2 == 1 and (sorte, valeur) != ('symbole', ',')):
+                raise Exception(f"GROUP BY invalide pres de '{valeur}'")
+            if i % 2 == 0:
+                groupes.append(valeur)
+        if 'GROUP' in clauses and len(clauses['GROUP']) % 2 == 0: #termine par une virgule
+            raise Exception("GROUP BY incomplet")
+
+        return {
+            'selection': expressions.parser_selection(match.group(1)), #[(arbre, alias)]
+            'table': match.group(2),
+            'condition': expressions.parser_tokens(clauses['WHERE']) if 'WHERE' in clauses else None,
+            'groupes': groupes,
+            'having': expressions.parser_tokens(clauses['HAVING']) if 'HAVING' in clauses else None,
+            'ordre': expressions.parser_tri(clauses['ORDER']) if 'ORDER' in clauses else [],
+            'limite': self.parser_entier(clauses['LIMIT'], 'LIMIT') if 'LIMIT' in clauses else None,
+            'decalage': self.parser_entier(clauses['OFFSET'], 'OFFSET') if 'OFFSET' in clauses else 0,
+        }
+
+    def parser_entier(self, tokens, clause):
+        """la valeur de LIMIT / OFFSET : un entier positif"""
+        if len(tokens) != 1 or tokens[0][0] != 'nombre' or not isinstance(tokens[0][1], int) or tokens[0][1] < 0:
+            raise Exception(f"{clause} attend un entier positif")
+        return tokens[0][1]
+
+    def ordonner(self, lignes, select, cachees):
+        """applique ORDER BY, OFFSET et LIMIT, puis enleve les colonnes lues seulement pour le tri"""
+        if select['ordre']:
+            cle = tri.fonction_cle([(nom, descendant) for nom, descendant in self.cles_tri(select)])
+            lignes = tri.trier(lignes, cle, select['limite'], select['decalage'], self.lignes_tri)
+        elif select['decalage'] or select['limite'] is not None:
+            limite = select['limite']
+            decalage = select['decalage']
+            lignes = itertools.islice(lignes, decalage, None if limite is None else decalage + limite)
+        if cachees:
+            lignes = ({nom: valeur for nom, valeur in ligne.items() if nom not in cachees} for ligne in lignes)
+        return lignes
+
+    def cles_tri(self, select):
+        """les (nom dans la ligne, descendant) du ORDER BY"""
+        return [
+            (arbre[1] if arbre[0] == 'col' else expressions.nom_agregat(arbre), descendant)
+            for arbre, descendant in select['ordre']
+        ]
+
+    def lignes_selectionnees(self, select):
+        """les lignes d'un SELECT sans agrégat, lues une par une (générateur)"""
+        nom_table, condition = select['table'], select['condition']
+        if select['having'] is not None:
+            raise Exception("HAVING sans GROUP BY ni agrégat")
+        selection = select['selection']
+        if selection == [(('tout',), None)]: #SELECT * : toutes les colonnes
+            colonnes = None
+        elif any(arbre[0] == 'tout' for arbre, _ in selection):
+            raise Exception("* doit etre seul dans le SELECT")
+        else:
+            colonnes = [arbre[1] for arbre, _ in selection]
+
+        structure = [nom_col for nom_col, _ in self.gestionnaire.lire_struct(nom_table)]
+        self.verifier_colonnes(select, structure)
+        if colonnes is None:
+            noms = [(nom_col, nom_col) for nom_col in structure] #(nom dans le résultat, colonne lue)
+        else:
+            noms = [(alias or arbre[1], arbre[1]) for arbre, alias in selection]
+
+        cachees = set() #colonnes du ORDER BY absentes du résultat : lues pour le tri puis enlevées
+        for nom, _ in self.cles_tri(select):
+            if any(nom == sortie for sortie, _ in noms):
+                continue
+            if nom not in structure or '(' in nom:
+                raise Exception(f"ORDER BY : colonne inconnue {nom}")
+            cachees.add(nom)
+            noms.append((nom, nom))
+            colonnes.append(nom)
+
+        if (condition is None and not select['ordre'] and not select['decalage'] and select['limite'] is None
+                and self.gestionnaire.en_colonnes(nom_table)):
+            return self.lots_selectionnes(nom_table, noms)
+
+        filtre, colonnes_filtre = self.preparer_filtre(nom_table, condition) #le WHERE compilé
+        positions = self.positions_par_index(nom_table, condition) #None = toute la table
+        if self.parcours_parallele(positions) and (select['ordre'] or (not select['decalage'] and select['limite'] is None)):
+            #toute la table (sans LIMIT qui arreterait la lecture tot) : décodée et filtrée par plusieurs processus
+            lignes = self.gestionnaire.lignes_paralleles(nom_table, colonnes, condition)
+            if lignes is not None:
+                return self.ordonner(self.renommer(lignes, selection, noms), select, cachees)
+        #les lignes sont lues une par une, seulement avec les colonnes demandées,
+        #et le filtre est appliqué pendant la lecture
+        if not select['ordre']: #LIMIT / OFFSET sans tri : la lecture s'arrete d'elle-meme
+            return self.renommer(self.donnees().iter_lignes(
+                nom_table, colonnes, filtre, colonnes_filtre, positions=positions,
+                decalage=select['decalage'], limite=select['limite']
+            ), selection, noms)
+        lignes = self.donnees().iter_lignes(nom_table, colonnes, filtre, colonnes_filtre, positions=positions)
+        return self.ordonner(self.renommer(lignes, selection, noms), select, cachees)
+
+    def verifier_colonnes(self, select, structure):
+        """lève une exception si le SELECT, son GROUP BY ou ses agrégats nomment une colonne absente de la table"""
+        noms = list(select['groupes'])
+        for arbre, _ in select['selection']:
+            if arbre[0] == 'col':
+                noms.append(arbre[1])
+            elif arbre[0] == 'agg' and arbre[2] != '*':
+                noms.append(arbre[2])
+        for nom in noms:
+            if nom not in structure:
+                raise Exception(f"Colonne inconnue : {nom}")
 
-        return colonnes, nom_table #et on renvoie les colonnes avec le nom de la table
+    def lots_selectionnes(self, nom_table, noms):
+        """
+        toute une table stockée en colonnes, lue par lots de colonnes (tableaux numpy si installé) :
+        les lignes ne sont construites que si on les lit (voir LignesDesLots et Curseur.iter_colonnes)
+        """
+        types = dict(self.gestionnaire.lire_struct(nom_table))
+        colonnes = list(dict.fromkeys(col for _, col in noms)) #chaque colonne lue une fois
+        lots = self.renommer_lots(self.donnees().lots_colonnes(nom_table, colonnes), noms)
+        return LignesDesLots(lots, {nom: types[col] for nom, col in noms})
+
+    def renommer_lots(self, lots, noms):
+        """les lots avec les noms du résultat (SELECT col AS nom), dans l'ordre du SELECT"""
+        try:
+            for nbr, lot in lots:
+                yield nbr, {nom: lot[col] for nom, col in noms}
+        finally:
+            lots.close()
+
+    def renommer(self, lignes, selection, noms):
+        """SELECT col AS nom : les lignes avec les noms du résultat"""
+        if any(alias for _, alias in selection):
+            return ({nom: ligne[col] for nom, col in noms} for ligne in lignes)
+        return lignes
+
+    def lignes_agregees(self, select):
+        """
+        les lignes d'un SELECT avec agrégats et/ou GROUP BY : une par groupe (calculées d'un coup).
+        COUNT(*) sans WHERE ni GROUP BY est lu dans l'en-tête de la table, sans parcours
+        """
+        nom_table, condition, groupes = select['table'], select['condition'], select['groupes']
+        types = dict(self.gestionnaire.lire_struct(nom_table))
+        self.verifier_colonnes(select, types)
+
+        fonctions = [] #les agrégats a calculer ('agg', fonction, colonne), du SELECT et du HAVING
+        sorties = [] #(nom dans le résultat, nom de la valeur calculée)
+        for arbre, alias in select['selection']:
+            if arbre[0] == 'tout':
+                raise Exception("SELECT * impossible avec GROUP BY ou des agrégats")
+            if arbre[0] == 'col':
+                if arbre[1] not in groupes:
+                    raise Exception(f"La colonne '{arbre[1]}' doit etre dans GROUP BY ou dans un agrégat")
+                sorties.append((alias or arbre[1], arbre[1]))
+            else:
+                if arbre not in fonctions:
+                    fonctions.append(arbre)
+                sorties.append((alias or expressions.nom_agregat(arbre), expressions.nom_agregat(arbre)))
+        if select['having'] is not None:
+            fonctions.extend(a for a in expressions.agregats_de(select['having']) if a not in fonctions)
+
+        cachees = set() #valeurs du ORDER BY absentes du résultat : calculées pour le tri puis enlevées
+        for (arbre, _), (nom, _) in zip(select['ordre'], self.cles_tri(select)):
+            if any(nom == sortie for sortie, _ in sorties):
+                continue
+            if arbre[0] == 'col' and arbre[1] not in groupes:
+                raise Exception(f"ORDER BY : '{nom}' doit etre dans GROUP BY ou dans un agrégat")
+            if arbre[0] == 'agg' and arbre not in fonctions:
+                fonctions.append(arbre)
+            cachees.add(nom)
+            sorties.append((nom, nom))
+
+        #une ligne de résultat = valeurs des colonnes du GROUP BY puis des agrégats
+        places = {colonne: i for i, colonne in enumerate(groupes)}
+        places.update({expressions.nom_agregat(arbre): len(groupes) + i for i, arbre in enumerate(fonctions)})
+        having = None
+        if select['having'] is not None:
+            having = expressions.compiler(select['having'], places)
+
+        if not groupes and condition is None and all(arbre[2] == '*' for arbre in fonctions):
+            resultats = [((), [self.donnees().compter_lignes(nom_table)] * len(fonctions))]
+        else:
+            agregation = agregats.Agregation(groupes, [(arbre[1], arbre[2]) for arbre in fonctions], types)
+            colonnes = list(groupes)
+            for arbre in fonctions: #les colonnes a lire : GROUP BY puis agrégats
+                if arbre[2] != '*' and arbre[2] not in colonnes:
+                    colonnes.append(arbre[2])
+            filtre, colonnes_filtre = self.preparer_filtre(nom_table, condition)
+            positions = self.positions_par_index(nom_table, condition)
+            if not (self.parcours_parallele(positions)
+                    and self.gestionnaire.agreger_parallele(nom_table, agregation, colonnes, condition)):
+                for nbr_lignes, lot in self.donnees().lots_colonnes(nom_table, colonnes, filtre, colonnes_filtre, positions):
+                    agregation.ajouter_lot(lot, nbr_lignes)
+            resultats = agregation.resultats()
+
+        lignes = []
+        for cle, valeurs in resultats:
+            ligne = list(cle) + valeurs
+            if having is not None and having(ligne) is not True:
+                continue
+            lignes.append({nom: ligne[places[valeur]] for nom, valeur in sorties})
+        return list(self.ordonner(lignes, select, cachees))
+
+    def preparer_filtre(self, nom_table, condition):
+        """compile la condition WHERE pour la table : renvoie (fonction, colonnes utilisées) ou (None, ())"""
+        if condition is None:
+            return None, ()
+        structure = self.gestionnaire.lire_struct(nom_table) #depuis le cache
+        positions = {nom_col: indice for indice, (nom_col, _) in enumerate(structure)} #nom -> indice dans la ligne
+        filtre = expressions.compiler(condition, positions)
+        mesure = self.gestionnaire.mesure_courante()
+        if mesure is not None: #EXPLAIN ANALYZE : les lignes passées au filtre sont comptées
+            filtre = mesure.compter(filtre)
+        return filtre, expressions.colonnes_de(condition)
     
-        
 
+    def parcours_parallele(self, positions):
+        """
+        vrai si la lecture peut etre confiée aux processus du gestionnaire : toute la table (pas d'index)
+        et pas de transaction (ses lignes non validées ne sont que dans ce programme)
+        """
+        return self.gestionnaire.parallel_workers > 1 and positions is None and self.transaction is None
+
+    def positions_par_index(self, nom_table, condition):
+        """si un index peut servir pour le WHERE, renvoie les positions des lignes candidates, sinon None"""
+        if condition is None:
+            return None
+        choix = self.gestionnaire.choisir_index(nom_table, expressions.contraintes_index(condition))
+        if choix is None: #aucun index utilisable : parcours de toute la table
+            return None
+        nom_index, contrainte = choix
+        #le filtre complet est quand meme appliqué sur les lignes trouvées
+        return self.gestionnaire.positions_index(nom_table, nom_index, contrainte)
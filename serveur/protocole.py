@@ -0,0 +1,63 @@
+"""
+Protocole réseau du serveur (voir serveur/reseau.py et serveur/client.py)
+
+Chaque message est une trame : longueur du corps (4o) | sorte (1o) | corps (JSON en utf-8)
+    client -> serveur : REQUETE, corps = {"requete": "SELECT ..."}
+    serveur -> client, pour chaque requete et dans l'ordre des requetes :
+        RESULTAT : {"status", "message", "data"}, comme MoteurSQL.executer (requete sans lignes, ou erreur)
+        ou, pour un SELECT, les lignes par lots au lieu d'une seule grosse réponse :
+        DEBUT {"status", "message"}, puis des LOT {"colonnes": [...], "lignes": [[...], ...]},
+        puis FIN {"status", "message", "nbr_lignes"} (status 'error' si la lecture a échoué en cours de route)
+Le client peut envoyer plusieurs requetes sans attendre les réponses (pipelining)
+"""
+
+import json
+import struct
+
+FORMAT_TRAME = struct.Struct('<IB') #longueur du corps, sorte
+TAILLE_MAX_TRAME = 64 << 20 #au-dela, ce n'est pas une trame de ce protocole
+
+REQUETE = 1
+RESULTAT = 2
+DEBUT = 3
+LOT = 4
+FIN = 5
+
+LIGNES_PAR_LOT = 500 #lignes d'un SELECT envoyées par trame LOT
+
+
+def valeur_json(valeur):
+    """les valeurs que json ne connait pas : scalaires numpy (agrégats), sinon leur texte"""
+    if hasattr(valeur, 'item'):
+        return valeur.item()
+    return str(valeur)
+
+
+def encoder(sorte, corps):
+    """les octets d'une trame"""
+    octets = json.dumps(corps, ensure_ascii=False, separators=(',', ':'), default=valeur_json).encode('utf-8')
+    return FORMAT_TRAME.pack(len(octets), sorte) + octets
+
+
+def lire_entete(entete):
+    """(longueur du corps, sorte) d'une en-tête de trame"""
+    longueur, sorte = FORMAT_TRAME.unpack(entete)
+    if longueur > TAILLE_MAX_TRAME:
+        raise Exception(f"Trame trop grande : {longueur} octets")
+    return longueur, sorte
+
+
+def decoder(corps):
+    return json.loads(corps.decode('utf-8'))
+
+
+def lot(lignes):
+    """le corps d'une trame LOT : les noms de colonnes une fois, puis les valeurs de chaque ligne"""
+    colonnes = list(lignes[0]) if lignes else []
+    return {'colonnes': colonnes, 'lignes': [[ligne.get(col) for col in colonnes] for ligne in lignes]}
+
+
+def lignes_du_lot(corps):
+    """les lignes (dictionnaires) d'une trame LOT"""
+    colonnes = corps['colonnes']
+    return [dict(zip(colonnes, valeurs)) for valeurs in corps['lignes']]
@@ -0,0 +1,177 @@
+"""
+Serveur réseau : un MoteurSQL partagé par toutes les connexions TCP (asyncio), protocole de serveur/protocole.py
+
+- chaque connexion lit ses requetes a l'avance (pipelining) et y répond dans l'ordre, une a la fois
+- les requetes s'exécutent dans un pool borné de threads : un long parcours de table ne bloque pas
+  les autres connexions, et au plus 'travailleurs' requetes touchent les fichiers en meme temps
+- un SELECT est envoyé par lots de LIGNES_PAR_LOT lignes, lus a la demande : le thread attend que le client
+  ait reçu le lot précédent (la table reste verrouillée en lecture, par ce thread, jusqu'au dernier lot)
+- chaque connexion est une session : BEGIN ... COMMIT y vivent, une connexion fermée annule sa transaction
+
+usage : python -m serveur.reseau [dossier] [port]
+"""
+
+import sys
+import asyncio
+import concurrent.futures
+
+from serveur.moteur_sql import MoteurSQL, Curseur
+from serveur import protocole
+
+PORT_DEFAUT = 5433
+REQUETES_EN_ATTENTE = 64 #requetes lues a l'avance par connexion, au-dela le client attend (TCP)
+
+
+class Session:
+    """l'état d'une connexion : sa transaction en cours"""
+
+    def __init__(self):
+        self.transaction = None
+
+
+class Serveur:
+    """le serveur TCP autour d'un MoteurSQL"""
+
+    def __init__(self, nom_dossier='donnees', hote='127.0.0.1', port=PORT_DEFAUT, travailleurs=8, parallel_workers=0,
+                 taille_cache=0):
+        self.moteur = MoteurSQL(nom_dossier, parallel_workers=parallel_workers, taille_cache=taille_cache)
+        self.hote = hote
+        self.port = port
+        self.executeur = concurrent.futures.ThreadPoolExecutor(max_workers=travailleurs,
+                                                               thread_name_prefix='rotterdb')
+        self.serveur = None
+        self.boucle = None
+
+    async def demarrer(self):
+        """ouvre le port (port 0 : choisi par le systeme), renvoie le port"""
+        self.boucle = asyncio.get_running_loop()
+        self.serveur = await asyncio.start_server(self.servir_connexion, self.hote, self.port)
+        self.port = self.serveur.sockets[0].getsockname()[1]
+        return self.port
+
+    async def servir(self):
+        """démarre si besoin, puis sert jusqu'a l'annulation"""
+        if self.serveur is None:
+            await self.demarrer()
+        async with self.serveur:
+            await self.serveur.serve_forever()
+
+    def fermer(self):
+        """arrete le pool de threads et ferme le moteur (point de contrôle du journal)"""
+        if self.serveur is not None:
+            self.serveur.close()
+        self.executeur.shutdown(wait=True)
+        self.moteur.gestionnaire.fermer()
+
+    async def servir_connexion(self, lecteur, ecrivain):
+        """une connexion : les requetes sont lues par une tache a part, traitées ici dans l'ordre"""
+        file = asyncio.Queue(maxsize=REQUETES_EN_ATTENTE)
+        session = Session()
+        lecture = asyncio.ensure_future(self.lire_requetes(lecteur, file))
+        try:
+            while True:
+                requete = await file.get()
+                if requete is None: #connexion fermée par le client
+                    break
+                await self.repondre(requete, session, ecrivain)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass #client parti au milieu d'une réponse
+        finally:
+            lecture.cancel()
+            session.transaction = None #ROLLBACK : rien n'a été écrit
+            ecrivain.close()
+
+    async def lire_requetes(self, lecteur, file):
+        """lit les trames REQUETE du client et les met dans la file, None a la fin"""
+        try:
+            while True:
+                longueur, sorte = protocole.lire_entete(await lecteur.readexactly(protocole.FORMAT_TRAME.size))
+                corps = protocole.decoder(await lecteur.readexactly(longueur))
+                if sorte != protocole.REQUETE:
+                    raise Exception(f"Trame inattendue : {sorte}")
+                await file.put(corps['requete'])
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as exception: #trame invalide : on répond par une erreur, puis on ferme
+            await file.put(exception)
+        await file.put(None)
+
+    async def repondre(self, requete, session, ecrivain):
+        """exécute une requete dans le pool de threads et envoie sa réponse"""
+        if isinstance(requete, Exception):
+            ecrivain.write(protocole.encoder(protocole.RESULTAT, erreur(requete)))
+            await ecrivain.drain()
+            return
+        trames = await self.boucle.run_in_executor(self.executeur, self.executer, requete, session, ecrivain)
+        ecrivain.write(trames)
+        await ecrivain.drain()
+
+    def executer(self, requete, session, ecrivain):
+        """
+        dans un thread du pool : exécute la requete dans la transaction de la session.
+        Renvoie les octets de la réponse (ou de sa fin, si les lignes ont été envoyées par lots)
+        """
+        self.moteur.transaction = session.transaction #les transactions du moteur sont rangées par thread
+        try:
+            resultat = self.moteur.executer(requete, flux=True)
+            if not isinstance(resultat['data'], Curseur):
+                return protocole.encoder(protocole.RESULTAT, resultat)
+            return self.envoyer_lignes(resultat, ecrivain)
+        finally:
+            session.transaction = self.moteur.transaction
+            self.moteur.transaction = None
+
+    def envoyer_lignes(self, resultat, ecrivain):
+        """envoie les lignes d'un SELECT par lots, chaque lot une fois le précédent parti, renvoie la trame FIN"""
+        curseur = resultat['data']
+        try:
+            self.envoyer(ecrivain, protocole.encoder(protocole.DEBUT, {
+                'status': resultat['status'], 'message': resultat['message']
+            }))
+            while True:
+                lignes = curseur.fetchmany(protocole.LIGNES_PAR_LOT)
+                if not lignes:
+                    break
+                self.envoyer(ecrivain, protocole.encoder(protocole.LOT, protocole.lot(lignes)))
+            fin = {'status': 'success', 'message': resultat['message'], 'nbr_lignes': curseur.nbr_lignes}
+        except (ConnectionError, concurrent.futures.CancelledError):
+            raise
+        except Exception as exception: #les lots deja envoyés restent : le client reçoit l'erreur a la fin
+            fin = {'status': 'error', 'message': str(exception), 'nbr_lignes': curseur.nbr_lignes}
+        finally:
+            curseur.close() #rend le verrou de lecture de la table
+        return protocole.encoder(protocole.FIN, fin)
+
+    def envoyer(self, ecrivain, octets):
+        """depuis un thread du pool : écrit une trame et attend qu'elle soit partie (le client lit a son rythme)"""
+        asyncio.run_coroutine_threadsafe(self.ecrire(ecrivain, octets), self.boucle).result()
+
+    async def ecrire(self, ecrivain, octets):
+        ecrivain.write(octets)
+        await ecrivain.drain()
+
+
+def erreur(exception):
+    return {'status': 'error', 'message': str(exception), 'data': None}
+
+
+def main():
+    nom_dossier = sys.argv[1] if len(sys.argv) > 1 else 'donnees'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT_DEFAUT
+    serveur = Serveur(nom_dossier, port=port)
+
+    async def lancer():
+        await serveur.demarrer()
+        print(f"Rotterdb écoute sur {serveur.hote}:{serveur.port} (dossier '{nom_dossier}')")
+        await serveur.servir()
+
+    try:
+        asyncio.run(lancer())
+    except KeyboardInterrupt:
+        print("\nArret du serveur")
+    finally:
+        serveur.fermer()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,45 @@ Chaque table est stockée dans un fichier au format .db
 """
 
 import struct #module pour convertir les données python en binaire, un traducteur
+import mmap #parcours des grandes tables : le fichier projeté en mémoire, sans read() ni copie par bloc
 import os #module pour gérer les fichiers et dossiers, s'ils existents et les créer
 import random #module pour générer des nombres aleatoires
 import string #module pour des constantes de caractères a-z et 0-9 pour les ID types SERIAL demandées
+import itertools #pour lire les lignes par lots (islice)
+import operator #itemgetter : extraire les colonnes demandées d'une ligne
+import threading #verrou d'écriture de chaque table (commit groupé entre threads)
+import contextlib #operation() : un bloc d'écritures journalisées
+import collections #les plages en cours de lecture parallele (deque)
+import multiprocessing #processus 'spawn' pour les parcours parallèles
+import concurrent.futures #pool de processus : une plage de lignes par tache
+
+from serveur.index import Index #les index secondaires, stockés a coté des tables
+from serveur import format_fixe #le format 2 : lignes de taille fixe + tas pour les textes
+from serveur import format_colonnes #le stockage en colonnes : un fichier par colonne
+from serveur import format_compact #le format 3 : lignes compactes de taille variable
+from serveur import journal #write-ahead log : écritures journalisées avant d'etre faites dans les tables
+from serveur import verrous #verrous lecture / écriture des tables, entre threads et entre programmes
+from serveur import expressions #le WHERE recompilé dans chaque processus d'un parcours parallèle
+from serveur import agregats #les agrégats partiels calculés par chaque processus
+from serveur.cache import CacheLectures, LIGNES_PAR_PAGE #pages décodées et résultats gardés en mémoire
+from serveur.instrumentation import Mesure, FichierMesure #les lectures comptées par EXPLAIN ANALYZE
+
+TAILLE_TAMPON = 1 << 16 #taille du buffer de lecture des tables (64 Ko), pour lire en flux
+TAILLE_MIN_MMAP = 1 << 18 #en dessous (256 Ko), projeter le fichier coute plus cher que quelques read()
+
+#formats struct précompilés pour décoder directement dans un tampon d'octets (unpack_from)
+FORMAT_INT = struct.Struct('i')
+FORMAT_FLOAT = struct.Struct('d')
+FORMAT_LONGUEUR = struct.Struct('I')
+
+VERSION_DEFAUT = format_fixe.VERSION_FIXE #format des nouvelles tables (les tables v1 restent lisibles)
+TAILLE_LOT_MIGRATION = 10000 #lignes converties a la fois lors d'une migration
+TAILLE_LOT_COLONNES = 1 << 16 #lignes lues a la fois dans chaque colonne (stockage en colonnes)
+TAILLE_LOT_VACUUM = 10000 #slots déplacés par étape de VACUUM (la table n'est tenue que le temps d'une étape)
+LIGNES_MIN_PARALLELE = 100000 #en dessous, lancer les processus et renvoyer les lignes coute plus que le décodage
+LIGNES_MIN_PLAGE = 20000 #taille minimale d'une plage de lignes confiée a un processus
+PLAGES_PAR_PROCESSUS = 4 #plusieurs plages par processus : les plus rapides prennent la suite
+TAILLE_RESERVE_IDS = 1000 #_id BIGSERIAL réservés d'un coup pour les INSERT des transactions (une écriture de l'en-tête)
 
 #Fonction pratique 1: pour générer un ID unique de type SERIAL
 def generer_id():
@@ -24,10 +60,24 @@ def type_vers_code(nom_type): #parmètre d'entrée (nom_type)
         'FLOAT': 2, #les quotients
         'TEXT': 3, #du texte
         'BOOL':4, #les vrais ou faux
-        'SERIAL':5 #serie unique d'entiers
+        'SERIAL':5, #serie unique d'identifiants en texte (le _id des anciennes tables)
+        'BIGSERIAL': 6 #compteur de 8 octets, le _id des tables au format 2
     } #et .get : la méthode dictionnaire : .get(clé, valeur_par_defaut)
     return types_disponibles.get(nom_type.upper(), 0) #convertit en MAJ, et vérifie si la clé existe sinon 0
 
+#Fonction pratique 4 : la valeur telle qu'elle sera relue depuis le fichier (pour les index)
+def normaliser_valeur(valeur, type_col):
+    """convertit la valeur comme encoder_valeur le fait (ex: '5' dans une colonne INT -> 5)"""
+    if valeur is None:
+        return None
+    if type_col == 'INT' or type_col == 'BIGSERIAL':
+        return int(valeur)
+    if type_col == 'FLOAT':
+        return float(valeur)
+    if type_col == 'BOOL':
+        return bool(valeur)
+    return str(valeur)
+
 #Fonction pratique 3 : code vers type (quand on lit depuis le fichier binaire)
 def code_vers_type(code):
     """On convertit un code numerique en nom de type SQL"""
@@ -36,7 +86,8 @@ def code_vers_type(code):
         2: 'FLOAT',
         3: 'TEXT',
         4: 'BOOL',
-        5: 'SERIAL'
+        5: 'SERIAL',
+        6: 'BIGSERIAL'
     } #de nouveau la méthode dictionnaire 
     return codes_vers_types.get(code, 'UNKNOWN') #récupère la clé, ou UNKNOWN si non définie
 
@@ -45,8 +96,16 @@ class GestionnaireDeTable: #classe = plan de construction de la db, style Pascal
     """La classe pour gérer le stockage et la lecture des tables""" 
 
     #on défini le constructeur ALWAYS avec __init__ , TOUJOURS appelé à la création 
-    def __init__(self, nom_dossier='nom'): #on assigne à nom_dossier, une valeur par défaut
-        """Initialise le gestionnaire avec l'attribut dossier"""
+    def __init__(self, nom_dossier='nom', avec_journal=True, commit_groupe=True, lecture_mmap=True,
+                 parallel_workers=0, taille_cache=0): #on assigne à nom_dossier, une valeur par défaut
+        """
+        Initialise le gestionnaire avec l'attribut dossier.
+        avec_journal : INSERT / UPDATE / DELETE passent par le journal (voir serveur/journal.py), rejoué ici
+        commit_groupe : les threads qui écrivent en meme temps partagent un fsync du journal
+        lecture_mmap : les parcours complets des grandes tables lisent le fichier projeté en mémoire (mmap)
+        parallel_workers : nbr de processus pour parcourir les grandes tables au format 2 (0 ou 1 = un seul coeur)
+        taille_cache : octets du cache des lectures (pages décodées, résultats des SELECT), 0 = pas de cache
+        """
         self.dossier = nom_dossier #self ALWAYS le 1er param : self.attribut = param 
         #self est par défaut une "instance de la classe" = le nom d'objet qu'on choisira
         #.dossier est un attribut (une variable) de l'objet self
@@ -57,36 +116,311 @@ class GestionnaireDeTable: #classe = plan de construction de la db, style Pascal
         if not os.path.exists(self.dossier):  #si le dossier n'existe pas
             os.makedirs(self.dossier) #on puisse le créer avec la methode os.makedirs()
 
+        #cache des en-têtes : nom_table -> métadonnées (colonnes, taille de l'en-tête, nbr de lignes, ...)
+        #pour ne pas relire et re-parser l'en-tête a chaque requete
+        self.cache_meta = {}
+
+        #index chargés en mémoire : nom_table -> {nom_index: Index}
+        self.index_tables = {}
+
+        #journal : les écritures validées avant un crash sont refaites avant tout accès aux tables
+        self.journal = None
+        if avec_journal:
+            self.journal = journal.Journal(os.path.join(self.dossier, journal.NOM_JOURNAL), commit_groupe)
+            self.journal.rejouer(self.dossier)
+        self.courante = threading.local() #l'opération (Ecritures) en cours dans chaque thread
+        self.verrous_tables = {} #nom_table -> VerrouTable : plusieurs lectures ou une écriture
+        self.tenues = {} #thread -> {nom_table: 'ecriture' ou nbr de lectures}, pour les verrous déjà pris
+        self.verrou_index = threading.RLock() #index en mémoire : rattrapés et consultés par plusieurs lecteurs
+        self.verrou_operations = threading.Condition() #protege operations_en_cours, verrous_tables et tenues
+        self.operations_en_cours = 0 #validées mais pas encore faites dans les fichiers : pas de point de contrôle
+        self.lecture_mmap = lecture_mmap
+        self.parallel_workers = parallel_workers
+        self.processus = None #le pool de processus des parcours parallèles, créé au premier besoin
+        self.ids_reserves = {} #nom_table -> (inode, prochain _id, fin) : le bloc de _id réservé (voir reserver_ids)
+        self.verrou_ids = threading.Lock()
+        self.cache = CacheLectures(taille_cache) if taille_cache > 0 else None #voir serveur/cache.py
+        self.mesures = threading.local() #la Mesure en cours de chaque thread (EXPLAIN ANALYZE)
+
+    def verrou_table(self, nom_table):
+        with self.verrou_operations:
+            verrou = self.verrous_tables.get(nom_table)
+            if verrou is None:
+                chemin_verrou = os.path.join(self.dossier, f'table_{nom_table}.verrou')
+                verrou = self.verrous_tables[nom_table] = verrous.VerrouTable(chemin_verrou)
+            return verrou
+
+    def prendre_lecture(self, nom_table):
+        """prend le verrou de lecture de la table, renvoie la fonction qui le rend (rien a rendre si déja tenu)"""
+        thread = threading.get_ident()
+        with self.verrou_operations:
+            tenues = self.tenues.get(thread, {})
+            if nom_table in tenues: #ce thread lit ou écrit deja la table : une écriture en attente ne doit pas le bloquer
+                if tenues[nom_table] != 'ecriture':
+                    tenues[nom_table] += 1
+                    return lambda: self.oublier_lecture(thread, nom_table)
+                return lambda: None
+        verrou = self.verrou_table(nom_table)
+        verrou.prendre_lecture()
+        with self.verrou_operations:
+            self.tenues.setdefault(thread, {})[nom_table] = 1
+
+        def rendre():
+            if self.oublier_lecture(thread, nom_table):
+                verrou.rendre_lecture()
+        return rendre
+
+    def oublier_lecture(self, thread, nom_table):
+        """une lecture de moins pour ce thread, renvoie True si c'était la derniere"""
+        with self.verrou_operations:
+            tenues = self.tenues[thread]
+            tenues[nom_table] -= 1
+            if tenues[nom_table] == 0:
+                del tenues[nom_table]
+                if not tenues:
+                    del self.tenues[thread]
+                return True
+            return False
+
+    @contextlib.contextmanager
+    def lecture(self, nom_table):
+        """bloc de lecture d'une table : les écritures attendent la fin"""
+        rendre = self.prendre_lecture(nom_table)
+        try:
+            yield
+        finally:
+            rendre()
+
+    @contextlib.contextmanager
+    def ecriture(self, *noms_tables):
+        """
+        bloc d'écriture sur des tables, seul (lectures et écritures des autres threads et programmes attendent).
+        Les verrous sont pris dans l'ordre des noms : deux écritures sur les memes tables ne s'attendent pas l'une l'autre
+        """
+        thread = threading.get_ident()
+        prises = []
+        try:
+            for nom_table in sorted(set(noms_tables)):
+                with self.verrou_operations:
+                    deja = self.tenues.get(thread, {}).get(nom_table)
+                if deja == 'ecriture':
+                    continue
+                if deja is not None: #attendrait sa propre lecture
+                    raise Exception(f"Lecture en cours sur '{nom_table}' : fermez le curseur avant d'écrire dans la table")
+                verrou = self.verrou_table(nom_table)
+                verrou.prendre_ecriture()
+                with self.verrou_operations:
+                    self.tenues.setdefault(thread, {})[nom_table] = 'ecriture'
+                prises.append((nom_table, verrou))
+            yield
+        except BaseException: #écriture interrompue : les fichiers ont pu changer sans que le cache le sache
+            for nom_table, _ in prises:
+                self.oublier_cache(nom_table)
+            raise
+        finally:
+            for nom_table, verrou in reversed(prises):
+                self.adopter_etat(nom_table)
+                with self.verrou_operations:
+                    tenues = self.tenues[thread]
+                    del tenues[nom_table]
+                    if not tenues:
+                        del self.tenues[thread]
+                verrou.rendre_ecriture()
+
+    def adopter_etat(self, nom_table):
+        """
+        fin d'une écriture : le cache de l'en-tête adopte la date de modification du fichier tant qu'on le tient seul
+        (plus tard, celle d'une écriture d'un autre programme serait prise pour la notre)
+        """
+        meta = self.cache_meta.get(nom_table)
+        if meta is None or meta['mtime'] is not None:
+            return
+        try:
+            infos = os.stat(self.chemin_table(nom_table))
+        except FileNotFoundError:
+            self.cache_meta.pop(nom_table, None)
+            return
+        if infos.st_size == meta['taille'] and infos.st_ino == meta['inode']:
+            meta['mtime'] = infos.st_mtime_ns
+        else:
+            self.cache_meta.pop(nom_table, None)
+
+    @contextlib.contextmanager
+    def operation(self, *noms_tables):
+        """
+        un bloc d'écritures sur une ou plusieurs tables, sous leur verrou d'écriture : les fichiers ouverts avec
+        ouvrir_ecriture ne sont modifiés qu'a la fin, après la validation du journal (tout ou rien).
+        Une opération dans une autre s'y rattache
+        """
+        if getattr(self.courante, 'ecritures', None) is not None:
+            yield
+            return
+        with self.ecriture(*noms_tables):
+            if self.journal is None:
+                yield
+                return
+            with self.verrou_operations: #compté seulement une fois les tables tenues (voir point_de_controle)
+                self.journal.verrou_fichier.prendre_partage() #pas de point de contrôle d'un autre programme
+                self.operations_en_cours += 1
+            try:
+                ecritures = self.courante.ecritures = journal.Ecritures()
+                try:
+                    yield
+                except BaseException:
+                    for nom_table in noms_tables: #le cache a pu etre modifié : on relira l'en-tête
+                        self.cache_meta.pop(nom_table, None)
+                    raise
+                finally:
+                    self.courante.ecritures = None
+                if ecritures.operations:
+                    self.journal.valider(ecritures) #durable avant d'écrire dans les tables
+                    ecritures.appliquer()
+            finally:
+                with self.verrou_operations:
+                    self.operations_en_cours -= 1
+                    self.journal.verrou_fichier.rendre_partage()
+                    self.verrou_operations.notify_all()
+        if self.journal.taille > journal.TAILLE_POINT_DE_CONTROLE:
+            self.point_de_controle()
+
+    def ouvrir_ecriture(self, chemin):
+        """ouvre un fichier de table en écriture ('r+b'), journalisé si une opération est en cours"""
+        ecritures = getattr(self.courante, 'ecritures', None)
+        if ecritures is None:
+            return open(chemin, 'r+b')
+        return ecritures.ouvrir(chemin)
+
+    def point_de_controle(self):
+        """synchronise les tables sur le disque et vide le journal (avant un changement de structure)"""
+        if self.journal is None:
+            return
+        with self.verrou_operations:
+            while self.operations_en_cours: #une opération validée doit d'abord etre faite dans les fichiers
+                self.verrou_operations.wait()
+            self.journal.point_de_controle()
+
+    def synchroniser_fichiers(self, chemins):
+        """fsync de fichiers créés ou remplacés hors du journal, puis du dossier (le journal ne les connait pas)"""
+        if self.journal is None:
+            return
+        for chemin in chemins:
+            journal.synchroniser(chemin)
+        journal.synchroniser(self.dossier)
+
+    def fermer(self):
+        """point de contrôle et fermeture du journal, arret des processus des parcours parallèles"""
+        if self.processus is not None:
+            self.processus.shutdown(wait=True)
+            self.processus = None
+        if self.journal is not None:
+            self.point_de_controle()
+            self.journal.fermer()
+            self.journal = None
+
     def chemin_table(self, nom_table): #nouvelle methode, donc 1er param = self, 2e param, ...
         """Renvoie le chemin du fichier de la table"""
         return os.path.join(self.dossier, f'table_{nom_table}.db') #retourne self.dossier/nom_table.db
         #f-string : f' devant {} active et formate la chaine, mais c'est du python récent
         #ex: f'table_{nom_table}.db, est 'table_users.db'
     
+    def chemin_tas(self, nom_table):
+        """Renvoie le chemin du tas (les textes) d'une table au format 2"""
+        return os.path.join(self.dossier, f'table_{nom_table}.tas')
+
+    def chemin_colonne(self, nom_table, colonne, extension):
+        """Renvoie le chemin d'un fichier d'une colonne (stockage en colonnes, voir format_colonnes)"""
+        return os.path.join(self.dossier, f'table_{nom_table}.{colonne}{extension}')
+
+    def chemin_supprimees(self, nom_table):
+        """Renvoie le chemin du bitmap des lignes supprimées (stockage en colonnes)"""
+        return os.path.join(self.dossier, f'table_{nom_table}{format_colonnes.EXTENSION_SUPPRIMEES}')
+
     def table_existe(self, nom_table): 
         """Rerifie si la table existe ou non"""
         chemin = self.chemin_table(nom_table) #appelle la méthode précédente (DRY : don't repeat yourself)
         return os.path.exists(chemin) #retourne le resultat du booleen .exists() : true or false
     
 
-    def creer_table(self, nom_table, colonnes):
+    def creer_table(self, nom_table, colonnes, version=VERSION_DEFAUT, stockage=format_fixe.STOCKAGE_LIGNES):
         """
         pour créer les nouvelles tbales on va utiliser des tuples, 
         c'est à dire des associations du style ('nom', 'type')
         ou ('id', 'SERIAL'), ou encore ('age', 'INT')
+        version : 1 = lignes de taille variable, 2 = lignes de taille fixe + tas (voir format_fixe),
+        3 = lignes compactes de taille variable (voir format_compact)
+        stockage : format_fixe.STOCKAGE_LIGNES, ou STOCKAGE_COLONNES pour un fichier par colonne (format 2)
         """
-        #il faut d'abord verifier la présence de la table et éviter de créer des doublons (=exceptions), donc
-        if self.table_existe(nom_table): #si elle existe
-            raise Exception(f"Erreur : la table '{nom_table}' existe déjà") #alors, on renvoie un message d'erreur
+        with self.ecriture(nom_table):
+            #il faut d'abord verifier la présence de la table et éviter de créer des doublons (=exceptions), donc
+            if self.table_existe(nom_table): #si elle existe
+                raise Exception(f"Erreur : la table '{nom_table}' existe déjà") #alors, on renvoie un message d'erreur
+        
+            #on crée aussi la colonne _id par défaut
+            noms_colonnes = [col[0] for col in colonnes] #1ere colonne = indice [0]: [expression for element in lsite]
+            if '_id' not in noms_colonnes: #si le noms_colonnes n'est pas _id
+                #alors, on l'insert avant la 1ere colonne : un compteur de l'en-tête aux formats 2 et 3, un texte au format 1
+                colonnes.insert(0, ('_id', 'SERIAL' if version == 1 else 'BIGSERIAL'))
+            for nom, type_col in colonnes: #BIGSERIAL : le compteur de l'en-tête ne sert qu'a _id
+                if type_col.upper() == 'BIGSERIAL' and (nom != '_id' or version == 1):
+                    raise Exception(f"Le type BIGSERIAL est réservé a la colonne _id d'une table au format 2 ou 3 : {nom}")
         
-        #on crée aussi la colonne _id par défaut
-        noms_colonnes = [col[0] for col in colonnes] #1ere colonne = indice [0]: [expression for element in lsite]
-        if '_id' not in noms_colonnes: #si le noms_colonnes n'est pas _id
-            colonnes.insert(0, ('_id', 'SERIAL')) #alors, on l'insert avant la 1ere colonne, en type SERIAL
+            #il faut aussi 'préparer' l'en-tête pour chaque table, donc on défini d'abord son chemin
+            chemin = self.chemin_table(nom_table)
+            self.cache_meta.pop(nom_table, None) #nouvelle table : on oublie l'ancien en-tête
+            self.ids_reserves.pop(nom_table, None)
+            self.oublier_cache(nom_table)
+            self.point_de_controle() #le journal ne doit plus rien avoir a rejouer sur une ancienne table du meme nom
+
+            for nom, type_col in colonnes: #un type inconnu serait stocké avec le code 0
+                if type_vers_code(type_col) == 0:
+                    raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+
+            if stockage == format_fixe.STOCKAGE_COLONNES and version != format_fixe.VERSION_FIXE:
+                raise Exception(f"Le stockage en colonnes demande le format {format_fixe.VERSION_FIXE}")
+            if stockage not in (format_fixe.STOCKAGE_LIGNES, format_fixe.STOCKAGE_COLONNES):
+                raise Exception(f"Stockage inconnu : {stockage}")
+
+            for chemin_colonne in self.fichiers_colonnes(nom_table): #restes d'une ancienne table du meme nom
+                os.remove(chemin_colonne)
+
+            if version == format_fixe.VERSION_FIXE:
+                #format 2 : en-tête versionné, puis un tas vide pour les textes (ou des fichiers de colonnes vides)
+                if stockage == format_fixe.STOCKAGE_COLONNES:
+                    for nom, type_col in colonnes:
+                        extensions = ('.col', '.nul', '.txt') if type_col in format_colonnes.TYPES_TEXTE else ('.col', '.nul')
+                        for extension in extensions:
+                            with open(self.chemin_colonne(nom_table, nom, extension), 'wb'):
+                                pass
+                    with open(self.chemin_supprimees(nom_table), 'wb'):
+                        pass
+                else:
+                    with open(self.chemin_tas(nom_table), 'wb'):
+                        pass
+                with open(chemin, 'wb') as table:
+                    table.write(format_fixe.entete_fixe([(nom, type_vers_code(typ)) for nom, typ in colonnes], stockage))
+            elif version == format_compact.VERSION_COMPACTE: #format 3 : l'en-tête du format 2, les lignes a la suite
+                with open(chemin, 'wb') as table:
+                    table.write(format_fixe.entete_fixe([(nom, type_vers_code(typ)) for nom, typ in colonnes],
+                                                        version=version))
+            elif version != 1:
+                raise Exception(f"Version de table inconnue : {version}")
+            else:
+                self.ecrire_entete_v1(chemin, colonnes)
+            #sur le disque avant que le journal n'y fasse référence
+            self.synchroniser_fichiers([chemin, self.chemin_tas(nom_table)] + self.fichiers_colonnes(nom_table))
+
+            #index implicite sur _id, pour retrouver une ligne par son _id en O(log n)
+            for chemin_index in self.fichiers_index(nom_table): #restes d'une ancienne table du meme nom
+                os.remove(chemin_index)
+            type_id = dict(colonnes)['_id']
+            self.index_tables[nom_table] = {
+                '_id': Index.creer(self.chemin_index(nom_table, '_id'), '_id', type_id, [])
+            }
         
-        #il faut aussi 'préparer' l'en-tête pour chaque table, donc on défini d'abord son chemin
-        chemin = self.chemin_table(nom_table)
+            return True #et on renvoi True si tout s'est bien passé
 
+    def ecrire_entete_v1(self, chemin, colonnes):
+        """écrit l'en-tête d'une table au format 1 (sans lignes)"""
         #with open ouvre la table depuis son (chemin, en mode "write binary") et lui assigne une variable : table
         with open(chemin, 'wb') as table:
             #1. Nbr de colonnes
@@ -108,42 +442,162 @@ class GestionnaireDeTable: #classe = plan de construction de la db, style Pascal
             
             #3. Nbr de ligne
             table.write(struct.pack('I', 0)) #et alloue 4 octets pour le nbr de lignes
-        
-        return True #et on renvoi True si tout s'est bien passé
     
     #Recap : nbr_colonnes = 4o,
     #Pour chaque col : nom_len = 4o,  nom_binaire = variable, code_type = 1o, et nbr_lignes = 4o
     
     def lire_struct(self, nom_table):
         """ça renvoie la structure de la table (nom, type)"""
-        if not self.table_existe(nom_table): #si la table n'existe pas 
-            raise Exception(f"Il n'y a pas de table '{nom_table}'") #alors, exception et msg d'erreur
-        
-        chemin = self.chemin_table(nom_table) #on assigne une variable au chemin de la table
+        return self.meta_table(nom_table)['colonnes'] #renvoi la liste de tuples par colonne (depuis le cache)
+
+    def meta_table(self, nom_table, table=None):
+        """
+        renvoie les métadonnées de la table depuis le cache.
+        L'en-tête n'est relu que si le fichier a changé (inode, date de modification ou taille),
+        pour que les modifications faites par un autre programme soient quand meme vues.
+        Si la table est deja ouverte, on la passe pour utiliser fstat au lieu de stat
+        """
+        try:
+            if table is not None:
+                infos = os.fstat(table.fileno()) #fichier deja ouvert : pas besoin de chercher le chemin
+            else:
+                infos = os.stat(self.chemin_table(nom_table)) #un seul stat : vérifie l'existence ET le cache
+        except FileNotFoundError: #si la table n'existe pas
+            raise Exception(f"Pas de table '{nom_table}'") #alors, exception et msg d'erreur
+
+        meta = self.cache_meta.get(nom_table)
+        if meta is not None and meta['inode'] == infos.st_ino and meta['taille'] == infos.st_size:
+            if meta['mtime'] is None: #on est le dernier a avoir écrit dedans : on adopte sa date de modif
+                meta['mtime'] = infos.st_mtime_ns
+            if meta['mtime'] == infos.st_mtime_ns: #rien n'a changé depuis
+                return meta
+
+        #premier accès, ou fichier modifié ailleurs : on relit l'en-tête
+        if table is not None:
+            meta = self.lire_entete(table)
+        else:
+            with open(self.chemin_table(nom_table), 'rb') as fichier:
+                meta = self.lire_entete(fichier)
+
+        meta['nom'] = nom_table
+        meta['inode'] = infos.st_ino #on retient l'état du fichier pour les prochaines vérifications
+        meta['mtime'] = infos.st_mtime_ns
+        meta['taille'] = infos.st_size
+        self.cache_meta[nom_table] = meta
+        return meta
+
+    def etat_fichier(self, table, meta):
+        """
+        l'état de la table ouverte pour le cache des lectures : (inode, génération) aux formats 2 et 3, la génération
+        étant relue sur le disque (8 octets) pour voir les écritures des autres programmes, meme dans la meme
+        milliseconde ; (inode, taille, date de modification) au format 1. None si l'en-tête du cache est périmé
+        """
+        if meta['version'] == 1:
+            return meta['inode'], meta['taille'], meta['mtime']
+        position = meta['position_compteurs'] + format_fixe.GENERATION * 8
+        if hasattr(os, 'pread'):
+            octets = os.pread(table.fileno(), 8, position)
+        else:
+            with open(self.chemin_table(meta['nom']), 'rb') as fichier:
+                fichier.seek(position)
+                octets = fichier.read(8)
+        generation = struct.unpack('<Q', octets)[0]
+        if generation != meta['compteurs'][format_fixe.GENERATION]:
+            return None
+        return meta['inode'], generation
+
+    def etat_table(self, nom_table):
+        """l'état de la table pour le cache des lectures (voir etat_fichier), None si elle n'existe pas"""
+        try:
+            with open(self.chemin_table(nom_table), 'rb', buffering=0) as table:
+                return self.etat_fichier(table, self.meta_table(nom_table, table))
+        except FileNotFoundError:
+            return None
+
+    def oublier_cache(self, nom_table):
+        """oublie les pages et résultats gardés de la table"""
+        if self.cache is not None:
+            self.cache.oublier_table(nom_table)
+
+    def lire_entete(self, table):
+        """parse l'en-tête d'une table ouverte et renvoie ses métadonnées"""
         colonnes = [] #on défini une liste vide pour les colonnes
 
-        with open(chemin, "rb") as table: #on ouvre la table en "read bytes" en buffer avec var : table
-            #1 Nbr de colonnes (lire)
-            data = table.read(4) #on défini data, la variable qui lit 4 octet car, nbr_colonnes (voir recap)
-            nbr_colonnes = struct.unpack('I', data)[0] #unpack décode et renvoie un tuple [x,y]
-            #on veut seulement x, donc rajouter l'indice [Ø] pour avoir le nombre de colonne
+        table.seek(0) #on se place au début du fichier
+        #1 Nbr de colonnes (lire)
+        data = table.read(4) #on défini data, la variable qui lit 4 octet car, nbr_colonnes (voir recap)
+        if data == format_fixe.MAGIC: #table versionnée (format 2 ou 3)
+            return self.lire_entete_fixe(table)
+        nbr_colonnes = struct.unpack('I', data)[0] #unpack décode et renvoie un tuple [x,y]
+        #on veut seulement x, donc rajouter l'indice [Ø] pour avoir le nombre de colonne
 
-            for _ in range(nbr_colonnes): #une boucle for avec variable jetable car nbr fini de colonne
-                #2. Pour chaque colonne
-                data = table.read(4) #on lit 4 octets
-                nom_len = struct.unpack('I', data)[0] #et on décode la longueur du nom en binaire
+        for _ in range(nbr_colonnes): #une boucle for avec variable jetable car nbr fini de colonne
+            #2. Pour chaque colonne
+            data = table.read(4) #on lit 4 octets
+            nom_len = struct.unpack('I', data)[0] #et on décode la longueur du nom en binaire
+
+            nom_binaire = table.read(nom_len) #on lit le nbr d'octet de la longueur du nom (variable)
+            nom_col = nom_binaire.decode('utf-8') #et on convertit le nom du binaire en texte
 
-                nom_binaire = table.read(nom_len) #on lit le nbr d'octet de la longueur du nom (variable)
-                nom_col = nom_binaire.decode('utf-8') #et on convertit le nom du binaire en texte
+            data = table.read(1) #on lit un octet pour le code du type 
+            code_type = struct.unpack('B', data)[0] #on décode type unsigned char 'B', retrouve le code du type
+            type_col = code_vers_type(code_type) #convertie le code en nom type SQL avec notre fonction
 
-                data = table.read(1) #on lit un octet pour le code du type 
-                code_type = struct.unpack('B', data)[0] #on décode type unsigned char 'B', retrouve le code du type
-                type_col = code_vers_type(code_type) #convertie le code en nom type SQL avec notre fonction
+            colonnes.append((nom_col, type_col))
 
-                colonnes.append((nom_col, type_col))
+        #3. Nbr de lignes, juste après les colonnes
+        nbr_lignes = struct.unpack('I', table.read(4))[0]
 
-        return colonnes #renvoi la liste de tuples par colonne
+        return {
+            'version': 1,
+            'colonnes': colonnes, #liste de tuples (nom, type)
+            'codes': [type_vers_code(type_col) for _, type_col in colonnes], #les codes types
+            'taille_entete': table.tell(), #les lignes commencent juste après l'en-tête
+            'nbr_lignes': nbr_lignes,
+            'fin': None, #fin de la derniere ligne valide, calculée au premier INSERT
+        }
     
+    def lire_entete_fixe(self, table):
+        """parse l'en-tête d'une table au format 2 (voir format_fixe) ou 3 (voir format_compact)"""
+        table.seek(0)
+        _, version, stockage, _ = format_fixe.FORMAT_DEBUT.unpack(table.read(format_fixe.FORMAT_DEBUT.size))
+        if version not in (format_fixe.VERSION_FIXE, format_compact.VERSION_COMPACTE):
+            raise Exception(f"Version de table inconnue : {version}")
+
+        colonnes = []
+        nbr_colonnes = struct.unpack('<I', table.read(4))[0]
+        for _ in range(nbr_colonnes):
+            nom_len = struct.unpack('<I', table.read(4))[0]
+            nom_col = table.read(nom_len).decode('utf-8')
+            code_type = table.read(1)[0]
+            colonnes.append((nom_col, code_vers_type(code_type)))
+
+        position_compteurs = table.tell()
+        compteurs = list(format_fixe.FORMAT_COMPTEURS.unpack(table.read(format_fixe.FORMAT_COMPTEURS.size)))
+        types = [type_col for _, type_col in colonnes]
+        taille_entete = table.tell()
+
+        meta = {
+            'version': version,
+            'stockage': stockage,
+            'colonnes': colonnes,
+            'codes': [type_vers_code(type_col) for type_col in types],
+            'taille_entete': taille_entete, #le premier slot
+            'position_compteurs': position_compteurs,
+            'compteurs': compteurs,
+            'nbr_lignes': compteurs[format_fixe.NBR_LIGNES], #nbr de slots
+            'fin': None, #fin du dernier slot (stockage en lignes)
+        }
+        if version == format_compact.VERSION_COMPACTE: #lignes de taille variable : leur fin est un compteur
+            meta['fin'] = taille_entete + compteurs[format_fixe.TAILLE_LIGNES]
+        elif stockage == format_fixe.STOCKAGE_LIGNES:
+            format_slot = format_fixe.format_slot(types) #compilé une seule fois, gardé dans le cache
+            meta['format_slot'] = format_slot
+            meta['taille_slot'] = format_slot.size
+            meta['places'] = format_fixe.places_champs(types)
+            meta['fin'] = taille_entete + compteurs[format_fixe.NBR_LIGNES] * format_slot.size #pas besoin de parcourir
+        return meta
+
     def encoder_valeur(self, valeur, type_col):
         """code en binaire chaque valeur en fonction du type"""
 
@@ -205,101 +659,1743 @@ class GestionnaireDeTable: #classe = plan de construction de la db, style Pascal
             raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
         
 
+    def sauter_valeur(self, table, type_col):
+        """avance dans le fichier sans décoder la valeur (plus rapide que decoder_valeur)"""
+
+        marqueur = table.read(1) #on lit le marqueur null / non null
+        if len(marqueur) == 0: #fin de fichier : ligne incomplète
+            raise Exception("Ligne incomplète en fin de table")
+
+        if marqueur == b'\x00': #valeur null : 4 octets de padding
+            table.seek(4, os.SEEK_CUR)
+        elif type_col == 'INT':
+            table.seek(4, os.SEEK_CUR) #4 octets pour un int
+        elif type_col == 'FLOAT':
+            table.seek(8, os.SEEK_CUR) #8 octets pour un float
+        elif type_col == 'TEXT' or type_col == 'SERIAL':
+            data = table.read(4) #la longueur du texte
+            if len(data) < 4:
+                raise Exception("Ligne incomplète en fin de table")
+            table.seek(struct.unpack('I', data)[0], os.SEEK_CUR) #on saute le texte sans le décoder
+        elif type_col == 'BOOL':
+            table.seek(1, os.SEEK_CUR) #1 octet pour un booleen
+        else:
+            raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+
+    def fin_des_donnees(self, table, meta):
+        """
+        renvoie la position de la fin de la derniere ligne comptée dans l'en-tête.
+        Ce qui se trouve après (une ligne à moitié écrite lors d'un crash) n'est pas compté
+        """
+        if meta['fin'] is None: #premier ajout depuis la lecture de l'en-tête
+            #on parcourt les lignes sans les décoder
+            table.seek(meta['taille_entete'])
+            for _ in range(meta['nbr_lignes']):
+                for _, type_col in meta['colonnes']:
+                    self.sauter_valeur(table, type_col)
+            meta['fin'] = table.tell() #on est pile à la fin de la derniere ligne valide
+        return meta['fin']
+
     def inserer_ligne(self, nom_table, valeurs):
         """ inserer de la data dans les tables"""
+        return self.inserer_lignes(nom_table, [valeurs])[0] #une seule ligne = un lot de taille 1
 
-        if not self.table_existe(nom_table): #on vérifie que la table existe
-            raise Exception(f"Pas de table '{nom_table}'") #sinon msg d'erreur car exception
-        
-        table = self.lire_struct(nom_table)#on lit la structure de la table avec notre méthode dans le meme ordre 
+    def inserer_lignes(self, nom_table, lignes):
+        """
+        inserer un lot de lignes (liste de dictionnaires) en une seule écriture
+        et une seule mise à jour du compteur. Renvoie la liste des _id insérés
+        """
+        with self.ecriture(nom_table):
+            chemin = self.chemin_table(nom_table) #récupre le chemin de la table
 
-        if '_id' not in valeurs: #si l'_id manque
-            valeurs['_id'] = generer_id() #on la génère
+            with self.operation(nom_table): #journalisée : tout le lot ou rien
+                #on ouvre en lecture/écriture ('r+b' ne tronque pas le fichier, contrairement à 'wb')
+                try:
+                    table = self.ouvrir_ecriture(chemin)
+                except FileNotFoundError: #on vérifie que la table existe
+                    raise Exception(f"Pas de table '{nom_table}'") #sinon msg d'erreur car exception
 
-        for nom_col, type_col in table: #pour chaque colonne du tableau
-            if nom_col not in valeurs and type_col != 'SERIAL': #s'il manque une colonne
-                valeurs[nom_col] = None  #ajouter la valeur null dans cette colonne
-        
-        donnees_binaires = b'' #Crée un panier vide pour stocker les bytes
-        for nom_col, type_col in table: #pour chaque colonne dans la table
-            valeur = valeurs.get(nom_col) #récupérer la valeur de la ligne dans la colonne
-            donnees_binaires += self.encoder_valeur(valeur, type_col) #et la convertit en binaire puis l'ajoute au panier
+                with table:
+                    meta = self.meta_table(nom_table, table) #structure et compteur depuis le cache
 
-        chemin = self.chemin_table(nom_table) #récupre le chemin de la table
+                    index = self.index_de_table(nom_table)
+                    for idx in index.values(): #les index doivent couvrir toutes les lignes deja présentes
+                        self.rattraper_index(nom_table, idx, meta)
 
-        with open(chemin, 'rb') as table: # ouvre en mode lecture
-            contenu = table.read() #charge toute la table en memoire
+                    if dict(meta['colonnes']).get('_id') == 'BIGSERIAL':
+                        ids = self.numeroter_lignes(meta, lignes) #le compteur est écrit avec les lignes
+                    else:
+                        ids = [] #les _id des lignes du lot
+                        for valeurs in lignes: #pour chaque ligne du lot
+                            if '_id' not in valeurs: #si l'_id manque
+                                valeurs['_id'] = generer_id() #on la génère
+                            ids.append(valeurs['_id'])
 
-        #Trouver ou inserer les lignes
-        position = 4 #on se positionne apres le nombre de colonne, donc apres 4octets
-        nbr_colonnes = struct.unpack('I', contenu[:4])[0] #lit de nbr de colonnes, 4o
+                    if meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+                        positions = self.ecrire_colonnes(table, meta, lignes)
+                    elif meta['version'] == format_fixe.VERSION_FIXE:
+                        positions = self.ecrire_slots(table, meta, lignes)
+                    elif meta['version'] == format_compact.VERSION_COMPACTE:
+                        positions = self.ecrire_lignes_compactes(table, meta, lignes)
+                    else:
+                        positions = self.ecrire_lignes_v1(table, meta, lignes)
 
-        #On saute l'en-tête des colonnes
-        for _ in range(nbr_colonnes): #pour chaque colonne
-            nom_len = struct.unpack('I', contenu[position:position+4])[0] #lit la longueur du nom
-            position += 4 + nom_len + 1 #on se positionne apres le saute en octets : 4 + variable + 1
+            #3. les index, une fois les lignes comptées (un index ne pointe jamais vers une ligne non comptée)
+            types = dict(meta['colonnes'])
+            for idx in index.values():
+                idx.ajouter([
+                    (normaliser_valeur(valeurs.get(idx.colonne), types[idx.colonne]), position)
+                    for valeurs, position in zip(lignes, positions)
+                ])
         
-        #lire et incrémenter le compteur
-        nbr_lignes = struct.unpack('I', contenu[position:position+4])[0] #un décode le nombre de ligne actuel
-        nouveau_nbr = nbr_lignes + 1 #on rajoute la ligne supplémentaire
-
-        #Reconstruire le fichier
-        nouveau_contenu = (
-            contenu[:position] +  #on garde tout l'en-tete jusqu'au nbr de lignes
-            struct.pack('I', nouveau_nbr) +  #on convertit en binarie et ajoute le nouveau nombre de ligne
-            contenu[position+4:] + #on garde le contenu de la table chargé en mémoire
-            donnees_binaires #on ajoute la nouvelle ligne convertie en binaire après
+            return ids #et on renvoie bien les _id des lignes insérées
+
+    def numeroter_lignes(self, meta, lignes):
+        """
+        donne aux lignes sans _id les numéros du bloc réservé (voir reserver_ids), puis ceux qui suivent le compteur
+        DERNIER_ID de l'en-tête (_id BIGSERIAL). Le compteur est mis a jour dans le cache et écrit par ecrire_slots /
+        ecrire_colonnes avec les autres. Un _id deja donné (ligne recopiée) le fait au besoin avancer. Renvoie les _id
+        """
+        compteurs = list(meta['compteurs'])
+        dernier = compteurs[format_fixe.DERNIER_ID]
+        reserves = iter(self.ids_du_bloc(meta, sum(1 for valeurs in lignes if valeurs.get('_id') is None)))
+        ids = []
+        for valeurs in lignes:
+            if valeurs.get('_id') is None:
+                valeurs['_id'] = next(reserves, None)
+                if valeurs['_id'] is None: #bloc épuisé
+                    dernier += 1
+                    valeurs['_id'] = dernier
+            else:
+                dernier = max(dernier, int(valeurs['_id']))
+            ids.append(valeurs['_id'])
+        compteurs[format_fixe.DERNIER_ID] = dernier
+        meta['compteurs'] = compteurs #une erreur avant l'écriture fait oublier le cache (voir operation)
+        return ids
+
+    def reserver_ids(self, nom_table, nbr):
+        """
+        nbr _id BIGSERIAL pour des lignes pas encore écrites (INSERT dans une transaction). Ils sont pris dans un bloc
+        de TAILLE_RESERVE_IDS numéros réservé d'un coup dans l'en-tête : une écriture journalisée par bloc.
+        Les numéros d'un bloc non utilisés a la fin du programme (ou d'un ROLLBACK) ne sont jamais redonnés
+        """
+        ids = self.ids_du_bloc(self.meta_table(nom_table), nbr)
+        if len(ids) < nbr: #bloc épuisé : un nouveau, sous le verrou d'écriture de la table
+            with self.operation(nom_table):
+                meta = self.meta_table(nom_table)
+                ids += self.ids_du_bloc(meta, nbr - len(ids)) #un autre thread a pu le réserver entre temps
+                manquants = nbr - len(ids)
+                if manquants:
+                    taille = max(manquants, TAILLE_RESERVE_IDS)
+                    with self.ouvrir_ecriture(self.chemin_table(nom_table)) as table:
+                        compteurs = list(meta['compteurs'])
+                        premier = compteurs[format_fixe.DERNIER_ID] + 1
+                        compteurs[format_fixe.DERNIER_ID] += taille
+                        self.ecrire_compteurs(table, meta, compteurs, ()) #aucune ligne écrite
+                    ids += range(premier, premier + manquants)
+                    with self.verrou_ids:
+                        self.ids_reserves[nom_table] = (meta['inode'], premier + manquants, premier + taille)
+        return ids
+
+    def ids_du_bloc(self, meta, nbr):
+        """au plus nbr _id pris dans le bloc réservé pour la table (un bloc d'une table recréée depuis est oublié)"""
+        with self.verrou_ids:
+            inode, prochain, fin = self.ids_reserves.get(meta['nom'], (None, 0, 0))
+            if inode != meta['inode'] or nbr <= 0:
+                return []
+            pris = min(nbr, fin - prochain)
+            self.ids_reserves[meta['nom']] = (inode, prochain + pris, fin)
+            return list(range(prochain, prochain + pris))
+
+    def ecrire_lignes_v1(self, table, meta, lignes):
+        """ajoute les lignes a une table au format 1, renvoie la position de chacune dans le fichier"""
+        structure = meta['colonnes']
+        morceaux = [] #les lignes encodées, jointes une seule fois à la fin
+        longueurs = [] #taille de chaque ligne encodée, pour connaitre sa position dans le fichier
+        for valeurs in lignes: #pour chaque ligne du lot
+            taille_ligne = 0
+            for nom_col, type_col in structure: #pour chaque colonne du tableau
+                morceau = self.encoder_valeur(valeurs.get(nom_col), type_col) #colonne absente = null
+                morceaux.append(morceau)
+                taille_ligne += len(morceau)
+            longueurs.append(taille_ligne)
+
+        donnees_binaires = b''.join(morceaux) #tout le lot en un seul bloc d'octets
+        fin = self.fin_des_donnees(table, meta) #où écrire les nouvelles lignes
+
+        #1. on ajoute les lignes à la fin des données (en écrasant un éventuel reste de ligne incomplète)
+        table.seek(fin)
+        table.write(donnees_binaires)
+        if meta['taille'] > fin: #si un crash avait laissé des octets en trop après la derniere ligne
+            table.truncate()
+        table.flush() #les lignes sont entièrement écrites AVANT de mettre à jour le compteur
+
+        #2. seulement ensuite, on met à jour le compteur sur place (4 octets juste avant les lignes)
+        table.seek(meta['taille_entete'] - 4)
+        table.write(struct.pack('I', meta['nbr_lignes'] + len(lignes)))
+
+        #on met le cache à jour nous-memes, sans relire l'en-tête
+        meta['nbr_lignes'] += len(lignes)
+        meta['fin'] = fin + len(donnees_binaires)
+        meta['taille'] = meta['fin']
+        meta['mtime'] = None #sera adoptée à la prochaine vérification
+        self.oublier_cache(meta['nom']) #format 1 : pas de génération dans l'en-tête
+
+        positions = []
+        position = fin
+        for taille_ligne in longueurs:
+            positions.append(position)
+            position += taille_ligne
+        return positions
+
+    def ecrire_lignes_compactes(self, table, meta, lignes):
+        """
+        ajoute les lignes a une table au format 3 : les lignes a la fin des lignes comptées, puis les compteurs.
+        Un crash avant les compteurs laisse seulement des octets non comptés, écrasés au prochain ajout.
+        Renvoie la position de chaque ligne dans le fichier
+        """
+        structure = meta['colonnes']
+        valeurs = [[ligne.get(nom_col) for nom_col, _ in structure] for ligne in lignes] #colonne absente = null
+        donnees_binaires, tailles = format_compact.encoder_lignes([type_col for _, type_col in structure], valeurs)
+
+        fin = meta['fin']
+        table.seek(fin)
+        table.write(donnees_binaires)
+        if meta['taille'] > fin + len(donnees_binaires): #des octets d'un ajout interrompu
+            table.truncate()
+        table.flush()
+
+        compteurs = list(meta['compteurs']) #DERNIER_ID déjà avancé par numeroter_lignes
+        compteurs[format_fixe.NBR_LIGNES] += len(lignes)
+        compteurs[format_fixe.NBR_VIVANTES] += len(lignes)
+        compteurs[format_fixe.TAILLE_LIGNES] += len(donnees_binaires)
+        self.ecrire_compteurs(table, meta, compteurs, [fin]) #ajoutées a la fin : seule la derniere page change
+        meta['fin'] = fin + len(donnees_binaires)
+        meta['taille'] = meta['fin']
+
+        positions = []
+        position = fin
+        for taille_ligne in tailles:
+            positions.append(position)
+            position += taille_ligne
+        return positions
+
+    def ecrire_slots(self, table, meta, lignes):
+        """
+        ajoute les lignes a une table au format 2 : les textes dans le tas, puis les slots, puis les compteurs.
+        Les slots libres (lignes supprimées) sont réutilisés d'abord, les autres lignes vont a la fin.
+        Un crash avant les compteurs laisse seulement des octets non comptés, écrasés au prochain ajout
+        """
+        structure = meta['colonnes']
+        compteurs = list(meta['compteurs'])
+        taille_slot = meta['taille_slot']
+        valeurs = [[ligne.get(nom_col) for nom_col, _ in structure] for ligne in lignes]
+        slots, textes = format_fixe.encoder_slots(
+            [type_col for _, type_col in structure], valeurs, meta['format_slot'], compteurs[format_fixe.TAILLE_TAS]
         )
 
-        with open(chemin, 'wb') as table: #on ouvre la table en write binary
-            table.write(nouveau_contenu) #on écrit le nouveau contenu
-        
-        return valeurs['_id'] #et on renvoie bien l'_id de la ligne inséré
+        #1. les textes, a la fin des données valides du tas
+        if textes:
+            with self.ouvrir_ecriture(self.chemin_tas(meta['nom'])) as tas:
+                tas.seek(compteurs[format_fixe.TAILLE_TAS])
+                tas.write(textes)
+
+        #2. les slots : dans les slots libres, puis juste après le dernier slot compté
+        libres, libre_suivant = self.slots_libres(table, meta, len(lignes))
+        positions = []
+        for i, numero in enumerate(libres):
+            position = meta['taille_entete'] + numero * taille_slot
+            table.seek(position)
+            table.write(slots[i * taille_slot:(i + 1) * taille_slot])
+            positions.append(position)
+        slots = slots[len(libres) * taille_slot:]
+
+        fin = meta['fin']
+        table.seek(fin)
+        table.write(slots)
+        if meta['taille'] > fin + len(slots): #des octets d'un ajout interrompu
+            table.truncate()
+        table.flush()
+
+        #3. les compteurs, en une seule écriture
+        ajoutees = len(lignes) - len(libres)
+        compteurs[format_fixe.NBR_LIGNES] += ajoutees
+        compteurs[format_fixe.NBR_VIVANTES] += len(lignes)
+        compteurs[format_fixe.TAILLE_TAS] += len(textes)
+        compteurs[format_fixe.LIBRE] = libre_suivant
+        positions += [fin + i * taille_slot for i in range(ajoutees)]
+        self.ecrire_compteurs(table, meta, compteurs, positions[:len(libres) + 1]) #slots réutilisés, puis la fin
+        meta['fin'] = fin + len(slots)
+        meta['taille'] = meta['fin'] #le fichier s'arrete au dernier slot écrit
+        return positions
+
+    def slots_libres(self, table, meta, nbr):
+        """
+        les numéros d'au plus nbr slots libres, pris dans la liste chaînée du compteur LIBRE,
+        et le début de la liste une fois ces slots pris
+        """
+        libres = []
+        suivant = meta['compteurs'][format_fixe.LIBRE]
+        while suivant and len(libres) < nbr:
+            numero = suivant - 1
+            if numero >= meta['nbr_lignes']: #chaîne abîmée (crash) : abandonnée, VACUUM bouche les trous
+                return libres, 0
+            table.seek(meta['taille_entete'] + numero * meta['taille_slot'])
+            drapeaux, suivant = format_fixe.FORMAT_LIBRE.unpack(table.read(format_fixe.FORMAT_LIBRE.size))
+            if not drapeaux & format_fixe.DRAPEAU_SUPPRIMEE: #idem : ce slot a été réutilisé sans mise a jour
+                return libres, 0
+            libres.append(numero)
+        return libres, suivant
+
+    def ecrire_compteurs(self, table, meta, compteurs, modifiees=None):
+        """
+        écrit les compteurs de l'en-tête (format 2 et 3) en une seule écriture, avec la génération suivante,
+        et met le cache a jour. modifiees : les positions des lignes écrites depuis les derniers compteurs,
+        dont les pages sont oubliées du cache des lectures (None = toutes les pages de la table)
+        """
+        generation = meta['compteurs'][format_fixe.GENERATION]
+        compteurs = list(compteurs)
+        compteurs[format_fixe.GENERATION] = generation + 1
+        table.seek(meta['position_compteurs'])
+        table.write(format_fixe.FORMAT_COMPTEURS.pack(*compteurs))
+        meta['compteurs'] = compteurs
+        meta['nbr_lignes'] = compteurs[format_fixe.NBR_LIGNES]
+        meta['mtime'] = None #sera adoptée à la prochaine vérification
+        if self.cache is not None:
+            self.cache.avancer(meta['nom'], (meta['inode'], generation), (meta['inode'], generation + 1), modifiees)
     
+    def ecrire_colonnes(self, table, meta, lignes):
+        """
+        ajoute les lignes a une table stockée en colonnes : chaque colonne a la fin de ses fichiers, puis le compteur.
+        Les positions renvoyées sont les numéros des lignes
+        """
+        debut = meta['nbr_lignes']
+        for nom_col, type_col in meta['colonnes']:
+            valeurs = [ligne.get(nom_col) for ligne in lignes]
+            largeur = format_colonnes.LARGEURS[type_col]
+            with self.ouvrir_ecriture(self.chemin_colonne(meta['nom'], nom_col, '.col')) as fichier_col:
+                if type_col in format_colonnes.TYPES_TEXTE: #les textes d'abord, a la fin des textes comptés
+                    fin_textes = format_colonnes.fin_textes(fichier_col, debut)
+                    octets, textes, nulls = format_colonnes.encoder_colonne(type_col, valeurs, fin_textes)
+                    with self.ouvrir_ecriture(self.chemin_colonne(meta['nom'], nom_col, '.txt')) as fichier_txt:
+                        fichier_txt.seek(fin_textes)
+                        fichier_txt.write(textes)
+                        fichier_txt.truncate() #un éventuel reste d'ajout interrompu
+                else:
+                    octets, _, nulls = format_colonnes.encoder_colonne(type_col, valeurs)
+                fichier_col.seek(debut * largeur)
+                fichier_col.write(octets)
+                fichier_col.truncate()
+            with self.ouvrir_ecriture(self.chemin_colonne(meta['nom'], nom_col, '.nul')) as fichier_nul:
+                format_colonnes.ecrire_nulls(fichier_nul, debut, nulls)
+                fichier_nul.truncate()
+
+        #toutes les colonnes sont écrites : on peut compter les lignes
+        compteurs = list(meta['compteurs'])
+        compteurs[format_fixe.NBR_LIGNES] += len(lignes)
+        compteurs[format_fixe.NBR_VIVANTES] += len(lignes)
+        self.ecrire_compteurs(table, meta, compteurs, [debut]) #ajoutées a la fin : seule la derniere page change
+        return list(range(debut, debut + len(lignes)))
+
     def lire_table(self, nom_table):
         """lit toutes les lignes de la table"""
+        return list(self.iter_lignes(nom_table)) #on renvoie toutes les lignes
 
-        if not self.table_existe(nom_table):  #verifie que la table existe
-            raise Exception(f"Pas de table {nom_table}") #sinon, msg erreur d'exception
-        
-        structure = self.lire_struct(nom_table) #on recupere la structure des entetes de la table
+    def iter_lignes(self, nom_table, colonnes=None, filtre=None, colonnes_filtre=(),
+                    positions=None, avec_positions=False, decalage=0, limite=None):
+        """
+        renvoie un itérateur qui lit les lignes une par une (sans tout charger en mémoire).
+        colonnes : liste des colonnes a renvoyer (None = toutes). Les autres ne sont pas décodées
+        filtre : fonction appelée sur la liste des valeurs de la ligne (dans l'ordre des colonnes),
+        la ligne n'est gardée que si elle renvoie True. Seules les colonnes_filtre sont décodées avant
+        positions : les positions des lignes a lire (trouvées par un index), None = toute la table
+        decalage, limite : OFFSET et LIMIT, la lecture s'arrete apres la derniere ligne demandée
+        La table reste verrouillée en lecture jusqu'a la fin de l'itérateur (ou son close())
+        """
+        if not self.table_existe(nom_table): #pas de fichier verrou pour une table qui n'existe pas
+            raise Exception(f"Pas de table '{nom_table}'")
+        rendre = self.prendre_lecture(nom_table)
+        try:
+            lignes = self.ouvrir_lignes(nom_table, colonnes, filtre, colonnes_filtre,
+                                        positions, avec_positions, decalage, limite)
+            mesure = self.mesure_courante()
+            if mesure is not None and filtre is None: #sans filtre, les lignes parcourues sont celles renvoyées
+                lignes = mesure.compter_lignes(lignes)
+        except BaseException:
+            rendre()
+            raise
+        return verrous.LectureVerrouillee(lignes, rendre)
 
+    def ouvrir_lignes(self, nom_table, colonnes, filtre, colonnes_filtre, positions, avec_positions, decalage, limite):
+        """le générateur des lignes pour iter_lignes, appelé sous le verrou de lecture"""
         chemin = self.chemin_table(nom_table) #le chemin de la table
-        lignes = [] #on prepare un liste vide a remplir lors de la lecture
 
-        with open(chemin, 'rb') as table: #on ouvre en lecture bianire
-            nbr_colonnes = struct.unpack('I', table.read(4))[0] #on lit le nbr de colonnes
+        try:
+            table = self.ouvrir_lecture(chemin, TAILLE_TAMPON) #on ouvre en lecture bianire, avec un buffer
+        except FileNotFoundError: #verifie que la table existe
+            raise Exception(f"Pas de table '{nom_table}'") #sinon, msg erreur d'exception
+
+        try:
+            meta = self.meta_table(nom_table, table) #structure et nbr de lignes depuis le cache
+        except Exception:
+            table.close()
+            raise
+
+        direct = filtre is None and positions is None and self.acces_direct(meta)
+        if direct and (self.cache is None or decalage or limite is not None):
+            #lignes de taille fixe et aucune supprimée : la ligne 'decalage' est a une position connue
+            if meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+                debut = decalage #numéro de ligne
+            else:
+                debut = meta['taille_entete'] + decalage * meta['taille_slot']
+            nbr = max(0, meta['nbr_lignes'] - decalage)
+            if limite is not None:
+                nbr = min(nbr, limite)
+            return self.parcourir_lignes(table, meta, colonnes, debut=debut, nbr=nbr, avec_positions=avec_positions)
+
+        etat = None
+        if self.cache is not None and positions is None: #toute la table : par les pages du cache des lectures
+            etat = self.etat_fichier(table, meta)
+        #les erreurs (table absente) sont levées ici, pas a la premiere ligne lue
+        if etat is not None:
+            lignes = self.parcourir_pages(table, meta, etat, colonnes, filtre, colonnes_filtre, avec_positions)
+        else:
+            lignes = self.parcourir_lignes(table, meta, colonnes, filtre, colonnes_filtre,
+                                           positions=positions, avec_positions=avec_positions)
+        if decalage or limite is not None: #on saute / s'arrete ligne par ligne
+            return itertools.islice(lignes, decalage, None if limite is None else decalage + limite)
+        return lignes
+
+    def acces_direct(self, meta):
+        """vrai si la ligne k peut etre lue sans lire les précédentes (format 2, aucune ligne supprimée)"""
+        return (meta['version'] == format_fixe.VERSION_FIXE
+                and meta['compteurs'][format_fixe.NBR_VIVANTES] == meta['nbr_lignes'])
+
+    @contextlib.contextmanager
+    def mesurer(self):
+        """bloc dont les lectures de ce thread sont comptées dans la Mesure renvoyée (EXPLAIN ANALYZE)"""
+        mesure = self.mesures.courante = Mesure()
+        try:
+            yield mesure
+        finally:
+            self.mesures.courante = None
+
+    def mesure_courante(self):
+        """la Mesure en cours dans ce thread, None hors d'EXPLAIN ANALYZE"""
+        return getattr(self.mesures, 'courante', None)
+
+    def ouvrir_lecture(self, chemin, buffering=-1):
+        """ouvre un fichier de table en lecture, ses read() comptés par la Mesure en cours du thread s'il y en a une"""
+        fichier = open(chemin, 'rb', buffering=buffering)
+        mesure = self.mesure_courante()
+        return fichier if mesure is None else FichierMesure(fichier, mesure)
+
+    def projeter(self, fichier, taille):
+        """
+        le fichier ouvert projeté en mémoire en lecture seule, ou None (petit fichier, lecture_mmap désactivée,
+        systeme sans mmap). Le fichier ne change pas pendant la lecture : la table est verrouillée en lecture
+        """
+        if not self.lecture_mmap or taille < TAILLE_MIN_MMAP:
+            return None
+        try:
+            carte = mmap.mmap(fichier.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        mesure = self.mesure_courante()
+        if mesure is not None: #lue au décodage, sans read() : seulement sa taille est comptée
+            mesure.octets_projetes += len(carte)
+        return carte
+
+    def parcourir_lignes(self, table, meta, colonnes, filtre=None, colonnes_filtre=(),
+                         positions=None, debut=None, nbr=None, avec_positions=False):
+        """
+        générateur des lignes d'une table ouverte, la ferme a la fin.
+        Le fichier est lu par blocs de TAILLE_TAMPON et les lignes sont décodées directement dans le bloc.
+        positions : liste triée des positions (en octets) des lignes a lire, au lieu de tout parcourir
+        debut, nbr : parcourir nbr lignes a partir de la position debut (par défaut toute la table)
+        avec_positions : renvoie des tuples (position de la ligne, ligne)
+        """
+        if meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+            yield from self.parcourir_colonnes(table, meta, colonnes, filtre, colonnes_filtre,
+                                               positions, debut, nbr, avec_positions)
+            return
+        if meta['version'] == format_fixe.VERSION_FIXE:
+            yield from self.parcourir_slots(table, meta, colonnes, filtre, colonnes_filtre,
+                                            positions, debut, nbr, avec_positions)
+            return
+
+        carte = self.projeter(table, meta['taille']) if positions is None else None #parcours de tout le fichier
+        with table, carte if carte is not None else contextlib.nullcontext():
+            structure = meta['colonnes']
+            noms = [nom_col for nom_col, _ in structure]
+            types = [type_col for _, type_col in structure]
+
+            roles = self.roles_colonnes(noms, colonnes, filtre, colonnes_filtre)
+            construire = self.constructeur_ligne(noms, colonnes)
+            compacte = meta['version'] == format_compact.VERSION_COMPACTE
+            if compacte: #format 3 : le décodeur compilé pour ces colonnes
+                lecture = format_compact.preparer_lecture(types, roles)
+                decoder_compacte = lecture[0]
+
+            if positions is None: #parcours séquentiel
+                restantes = meta['nbr_lignes'] if nbr is None else nbr #on ne lit que les lignes présentes a l'ouverture
+                position = meta['taille_entete'] if debut is None else debut
+            else: #seulement les lignes trouvées par un index
+                restantes = len(positions)
+                suivantes = iter(positions)
+
+            tampon = b'' if carte is None else carte #le bloc d'octets en cours (tout le fichier si projeté)
+            debut_tampon = 0 #position dans le fichier du premier octet du bloc
+
+            while restantes: #pour chaque ligne
+                if positions is not None:
+                    position = next(suivantes)
+
+                relative = position - debut_tampon #position de la ligne dans le bloc
+                if relative < 0 or relative >= len(tampon): #la ligne n'est pas dans le bloc : on lit a partir d'elle
+                    table.seek(position)
+                    tampon = table.read(TAILLE_TAMPON)
+                    debut_tampon, relative = position, 0
+
+                while True:
+                    try:
+                        if compacte:
+                            valeurs, retenues, fin = decoder_compacte(tampon, relative)
+                        else:
+                            valeurs, retenues, fin = self.decoder_ligne(tampon, relative, types, roles)
+                        break
+                    except (IndexError, struct.error): #la ligne dépasse du bloc : on lit la suite et on recommence
+                        table.seek(debut_tampon + len(tampon))
+                        suite = table.read(max(TAILLE_TAMPON, len(tampon) - relative)) #au moins autant que le reste
+                        if not suite:
+                            raise Exception("Ligne incomplète en fin de table")
+                        tampon = tampon[relative:] + suite
+                        debut_tampon, relative = position, 0
+
+                restantes -= 1
+                position_ligne = position
+                position = debut_tampon + fin #la ligne suivante commence juste après
+
+                if filtre is not None:
+                    if filtre(valeurs) is not True: #False ou NULL : la ligne est écartée, sans construire de dictionnaire
+                        continue
+                    if compacte: #la ligne est gardée : on décode les colonnes projetées
+                        format_compact.decoder_retenues(tampon, valeurs, retenues, lecture)
+                    else:
+                        for indice, depart in retenues:
+                            valeurs[indice] = self.decoder_dans(tampon, depart, types[indice])
+
+                ligne = construire(valeurs) #on construit le dictionnaire de la ligne
+
+                if avec_positions:
+                    yield position_ligne, ligne
+                else:
+                    yield ligne #on renvoie la ligne, la suivante n'est lue qu'a la demande
+
+    def parcourir_pages(self, table, meta, etat, colonnes, filtre, colonnes_filtre, avec_positions):
+        """
+        comme parcourir_lignes pour toute la table, page par page (LIGNES_PAR_PAGE lignes ou slots) par le cache
+        des lectures : une page gardée donne ses lignes sans lire ni décoder le fichier. Une page absente est décodée
+        avec toutes ses colonnes et gardée si toutes les colonnes sont demandées ; sinon le reste de la table est lu
+        directement, sans les colonnes inutiles (une projection ne remplit pas le cache)
+        """
+        table.close() #chaque page absente rouvre la table (voir lire_page)
+        nom_table = meta['nom']
+        self.cache.verifier_etat(nom_table, etat)
+        noms = [nom_col for nom_col, _ in meta['colonnes']]
+        construire = self.constructeur_ligne(noms, colonnes)
+        total = meta['nbr_lignes']
+        if meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+            debut = 0 #les positions sont des numéros de ligne
+        else:
+            debut = meta['taille_entete']
+
+        for numero in range(0, total, LIGNES_PAR_PAGE):
+            nbr = min(LIGNES_PAR_PAGE, total - numero)
+            page = self.cache.lire_page(nom_table, debut, nbr)
+            mesure = self.mesure_courante()
+            if page is None:
+                if colonnes is not None:
+                    yield from self.parcourir_lignes(self.ouvrir_lecture(self.chemin_table(nom_table), TAILLE_TAMPON),
+                                                     meta, colonnes, filtre, colonnes_filtre, debut=debut,
+                                                     nbr=total - numero, avec_positions=avec_positions)
+                    return
+                page = self.lire_page(meta, debut, nbr, numero + nbr < total)
+                self.cache.ajouter_page(nom_table, etat, debut, page)
+                if mesure is not None:
+                    mesure.pages_decodees += 1
+            elif mesure is not None:
+                mesure.pages_cache += 1
+            debut, _, positions, lignes = page
+            for position, valeurs in zip(positions, lignes):
+                if filtre is not None and filtre(valeurs) is not True:
+                    continue
+                if avec_positions:
+                    yield position, construire(valeurs)
+                else:
+                    yield construire(valeurs)
+
+    def decrire_table(self, nom_table):
+        """
+        ce qu'EXPLAIN montre de la table : format et stockage, slots et lignes vivantes, lecture directe possible,
+        plages d'un parcours parallèle, projection en mémoire (mmap) et pages gardées par le cache des lectures
+        """
+        if not self.table_existe(nom_table):
+            raise Exception(f"Pas de table '{nom_table}'")
+        with self.lecture(nom_table), open(self.chemin_table(nom_table), 'rb', buffering=0) as table:
+            meta = self.meta_table(nom_table, table)
+            etat = self.etat_fichier(table, meta) if self.cache is not None else None
+        colonnes = meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES
+        plages = self.plages_paralleles(meta)
+        taille = meta['fin'] if meta['version'] == format_fixe.VERSION_FIXE else meta['taille']
+        return {
+            'version': meta['version'],
+            'colonnes': colonnes, #stockage en colonnes
+            'slots': meta['nbr_lignes'],
+            'vivantes': meta['compteurs'][format_fixe.NBR_VIVANTES] if meta['version'] != 1 else meta['nbr_lignes'],
+            'direct': self.acces_direct(meta),
+            'plages': 0 if plages is None else len(plages),
+            'mmap': not colonnes and self.lecture_mmap and taille is not None and taille >= TAILLE_MIN_MMAP,
+            'pages': -(-meta['nbr_lignes'] // LIGNES_PAR_PAGE),
+            'pages_gardees': 0 if etat is None else self.cache.pages_gardees(nom_table, etat),
+        }
+
+    def lire_page(self, meta, debut, nbr, suite):
+        """
+        décode les nbr lignes (ou slots) de la page qui commence a debut : (fin, nbr, positions, lignes), les lignes
+        en listes de valeurs. suite : d'autres lignes suivent, aux formats 1 et 3 la premiere donne la fin de la page
+        """
+        variable = meta['version'] != format_fixe.VERSION_FIXE
+        table = self.ouvrir_lecture(self.chemin_table(meta['nom']), TAILLE_TAMPON)
+        positions = []
+        lignes = []
+        lues = nbr + 1 if variable and suite else nbr
+        for position, ligne in self.parcourir_lignes(table, meta, None, debut=debut, nbr=lues, avec_positions=True):
+            positions.append(position)
+            lignes.append(list(ligne.values()))
+        if meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+            fin = debut + nbr
+        elif not variable:
+            fin = debut + nbr * meta['taille_slot']
+        elif suite:
+            fin = positions.pop()
+            lignes.pop()
+        else:
+            fin = meta['fin'] #None au format 1 tant qu'aucun INSERT ne l'a calculée
+        return fin, nbr, positions, lignes
+
+    def constructeur_ligne(self, noms, colonnes):
+        """
+        la fonction valeurs décodées -> dictionnaire de la ligne, avec les colonnes demandées
+        dans l'ordre demandé (colonne inconnue = null). Préparée une fois par lecture
+        """
+        if colonnes is None:
+            return lambda valeurs: dict(zip(noms, valeurs))
+        indices = {nom_col: i for i, nom_col in enumerate(noms)}
+        if colonnes and all(col in indices for col in colonnes):
+            prendre = operator.itemgetter(*[indices[col] for col in colonnes])
+            if len(colonnes) == 1: #itemgetter d'un seul indice renvoie la valeur, pas un tuple
+                colonne = colonnes[0]
+                return lambda valeurs: {colonne: prendre(valeurs)}
+            return lambda valeurs: dict(zip(colonnes, prendre(valeurs)))
+        return lambda valeurs: {col: valeurs[indices[col]] if col in indices else None for col in colonnes}
+
+    def roles_colonnes(self, noms, colonnes, filtre, colonnes_filtre):
+        """
+        role de chaque colonne pendant la lecture : 0 = sauter, 1 = décoder, 2 = projetée seulement,
+        décodée après le filtre si la ligne est gardée
+        """
+        roles = []
+        for nom_col in noms:
+            projetee = colonnes is None or nom_col in colonnes
+            if filtre is None:
+                roles.append(1 if projetee else 0)
+            elif nom_col in colonnes_filtre:
+                roles.append(1)
+            else:
+                roles.append(2 if projetee else 0)
+        return roles
+
+    def blocs_slots(self, table, meta, positions=None, debut=None, nbr=None, carte=None):
+        """
+        générateur de blocs de slots décodés par struct (format 2) : listes de (position, tuple des champs).
+        Les slots étant de taille fixe, un bloc entier est décodé d'un coup avec iter_unpack.
+        carte : la table projetée en mémoire (voir projeter), les blocs y sont décodés sur place, sans read()
+        """
+        format_slot = meta['format_slot']
+        taille_slot = meta['taille_slot']
+        par_bloc = max(1, TAILLE_TAMPON // taille_slot) #slots par lecture
+
+        if positions is None: #parcours séquentiel
+            position = meta['taille_entete'] if debut is None else debut
+            disponibles = (meta['fin'] - position) // taille_slot #slots présents a l'ouverture
+            restantes = disponibles if nbr is None else min(nbr, disponibles)
+            vue = memoryview(carte) if carte is not None else None
+            try:
+                table.seek(position)
+                while restantes > 0:
+                    nbr_bloc = min(par_bloc, restantes)
+                    if vue is not None:
+                        donnees = vue[position:position + nbr_bloc * taille_slot] #sans copie
+                    else:
+                        donnees = table.read(nbr_bloc * taille_slot)
+                    if len(donnees) < nbr_bloc * taille_slot:
+                        raise Exception("Ligne incomplète en fin de table")
+                    bloc = [
+                        (position + i * taille_slot, champs)
+                        for i, champs in enumerate(format_slot.iter_unpack(donnees))
+                    ]
+                    del donnees #plus aucune vue sur la carte pendant le yield : elle peut etre fermée
+                    yield bloc
+                    position += nbr_bloc * taille_slot
+                    restantes -= nbr_bloc
+            finally:
+                if vue is not None:
+                    vue.release()
+        else: #accès direct aux slots trouvés par un index
+            for i in range(0, len(positions), par_bloc):
+                bloc = []
+                for position in positions[i:i + par_bloc]:
+                    if position + taille_slot > meta['fin']: #entrée d'index périmée (table compactée par VACUUM)
+                        continue
+                    table.seek(position)
+                    bloc.append((position, format_slot.unpack(table.read(taille_slot))))
+                yield bloc
+
+    def parcourir_slots(self, table, meta, colonnes, filtre=None, colonnes_filtre=(),
+                        positions=None, debut=None, nbr=None, avec_positions=False):
+        """
+        comme parcourir_lignes, pour une table au format 2 : un bloc de slots a la fois, décodé colonne par colonne
+        (voir colonne_slots). Un parcours de toute une grande table lit la table et le tas projetés en mémoire
+        """
+        tas = self.ouvrir_lecture(self.chemin_tas(meta['nom']))
+        with table, tas, contextlib.ExitStack() as pile: #la pile est fermée en premier, dans l'ordre inverse
+            carte = carte_tas = None
+            if positions is None:
+                carte = self.projeter(table, meta['fin'])
+                carte_tas = self.projeter(tas, meta['compteurs'][format_fixe.TAILLE_TAS])
+                for projection in (carte, carte_tas):
+                    if projection is not None:
+                        pile.enter_context(projection)
+
+            structure = meta['colonnes']
+            noms = [nom_col for nom_col, _ in structure]
+            textes = [type_col in format_fixe.TYPES_TEXTE for _, type_col in structure]
+            places = meta['places']
+            roles = self.roles_colonnes(noms, colonnes, filtre, colonnes_filtre)
+            avant = [i for i, role in enumerate(roles) if role == 1] #décodées avant le filtre
+            apres = [i for i, role in enumerate(roles) if role == 2] #décodées pour les lignes gardées
+            construire = self.constructeur_ligne(noms, colonnes)
+            source_textes = tas if carte_tas is None else carte_tas
+            sans_null = bytes((len(noms) + 7) // 8) #bitmap d'un slot sans aucun null
+
+            blocs = pile.enter_context(contextlib.closing(self.blocs_slots(table, meta, positions, debut, nbr, carte)))
+            for bloc in blocs:
+                vivants = [(position, champs) for position, champs in bloc
+                           if not champs[0] & format_fixe.DRAPEAU_SUPPRIMEE] #sans les lignes supprimées
+                if not vivants:
+                    continue
+                champs_bloc = [champs for _, champs in vivants]
+                avec_nulls = [k for k, champs in enumerate(champs_bloc) if champs[1] != sans_null]
+                vides = [None] * len(vivants) #les colonnes non lues
+                valeurs_colonnes = [vides] * len(noms)
+                for indice in avant:
+                    valeurs_colonnes[indice] = self.colonne_slots(champs_bloc, avec_nulls, indice, places[indice],
+                                                                  textes[indice], source_textes)
+
+                if filtre is not None:
+                    garder = [filtre(valeurs) is True for valeurs in zip(*valeurs_colonnes)]
+                    vivants = list(itertools.compress(vivants, garder))
+                    if not vivants:
+                        continue
+                    champs_bloc = [champs for _, champs in vivants]
+                    avec_nulls = [k for k, champs in enumerate(champs_bloc) if champs[1] != sans_null]
+                    vides = [None] * len(vivants)
+                    valeurs_colonnes = [
+                        vides if indice not in avant else list(itertools.compress(valeurs_colonnes[indice], garder))
+                        for indice in range(len(noms))
+                    ]
+                    for indice in apres:
+                        valeurs_colonnes[indice] = self.colonne_slots(champs_bloc, avec_nulls, indice, places[indice],
+                                                                      textes[indice], source_textes)
+
+                for (position, _), valeurs in zip(vivants, zip(*valeurs_colonnes)):
+                    ligne = construire(valeurs) #on construit le dictionnaire de la ligne
+                    if avec_positions:
+                        yield position, ligne
+                    else:
+                        yield ligne
+
+    def colonne_slots(self, champs_bloc, avec_nulls, indice, place, texte, tas):
+        """
+        les valeurs d'une colonne pour tout un bloc de slots décodés (None = null) : une liste en compréhension
+        sur les champs de struct, les textes lus dans le tas en une seule fois.
+        avec_nulls : les rangs des slots du bloc qui ont au moins un null
+        """
+        octet, bit = indice >> 3, indice & 7
+        nulls = [k for k in avec_nulls if champs_bloc[k][1][octet] >> bit & 1]
+        if not texte:
+            valeurs = [champs[place] for champs in champs_bloc]
+            for k in nulls:
+                valeurs[k] = None
+            return valeurs
+        if not nulls:
+            return format_fixe.lire_tas(tas, [(champs[place], champs[place + 1]) for champs in champs_bloc])
+        exclus = set(nulls)
+        lus = iter(format_fixe.lire_tas(tas, [
+            (champs[place], champs[place + 1]) for k, champs in enumerate(champs_bloc) if k not in exclus
+        ]))
+        return [None if k in exclus else next(lus) for k in range(len(champs_bloc))]
+
+    def remplir_slots(self, lignes, indices, places, textes, tas):
+        """décode les colonnes 'indices' des slots, les textes étant lus dans le tas en une seule fois"""
+        if not indices or not lignes:
+            return
+        cibles = [] #(valeurs, indice) de chaque texte a lire
+        references = [] #(position, longueur) de chaque texte dans le tas
+        for _, champs, nulls, valeurs in lignes:
+            for indice in indices:
+                if nulls >> indice & 1: #null
+                    continue
+                place = places[indice]
+                if textes[indice]:
+                    cibles.append((valeurs, indice))
+                    references.append((champs[place], champs[place + 1]))
+                else:
+                    valeurs[indice] = champs[place]
+        for (valeurs, indice), texte in zip(cibles, format_fixe.lire_tas(tas, references)):
+            valeurs[indice] = texte
+
+    def lire_morceau(self, fichiers, type_col, debut, nbr):
+        """les valeurs Python (None = null) des lignes debut a debut+nbr d'une colonne"""
+        if type_col in format_colonnes.TYPES_TEXTE:
+            valeurs = format_colonnes.lire_textes(fichiers['.col'], fichiers['.txt'], debut, nbr)
+        else:
+            valeurs = format_colonnes.lire_valeurs(fichiers['.col'], type_col, debut, nbr)
+        nulls = format_colonnes.lire_nulls(fichiers['.nul'], debut, nbr)
+        return format_colonnes.en_liste(valeurs, nulls, type_col)
+
+    def parcourir_colonnes(self, table, meta, colonnes, filtre=None, colonnes_filtre=(),
+                           positions=None, debut=None, nbr=None, avec_positions=False):
+        """
+        comme parcourir_lignes, pour une table stockée en colonnes : seuls les fichiers des colonnes utiles
+        sont lus, par lots de TAILLE_LOT_COLONNES lignes. debut et les positions sont des numéros de ligne
+        """
+        table.close() #tout est dans les fichiers des colonnes
+        structure = meta['colonnes']
+        noms = [nom_col for nom_col, _ in structure]
+        roles = self.roles_colonnes(noms, colonnes, filtre, colonnes_filtre)
+        avant = [i for i, role in enumerate(roles) if role == 1]
+        apres = [i for i, role in enumerate(roles) if role == 2]
+        total = meta['nbr_lignes'] #les lignes comptées a l'ouverture
+
+        fichiers = {} #indice de colonne -> {extension: fichier ouvert}
+        supprimees = None #le bitmap des lignes supprimées, s'il y en a
+        try:
+            if meta['compteurs'][format_fixe.NBR_VIVANTES] != total:
+                supprimees = self.ouvrir_lecture(self.chemin_supprimees(meta['nom']))
+            for i in avant + apres:
+                nom_col, type_col = structure[i]
+                extensions = format_colonnes.EXTENSIONS if type_col in format_colonnes.TYPES_TEXTE else ('.col', '.nul')
+                fichiers[i] = {ext: self.ouvrir_lecture(self.chemin_colonne(meta['nom'], nom_col, ext))
+                               for ext in extensions}
+
+            if positions is None: #lots consécutifs
+                premiere = 0 if debut is None else debut
+                derniere = total if nbr is None else min(total, premiere + nbr)
+                lots = [
+                    (lot, min(lot + TAILLE_LOT_COLONNES, derniere), None)
+                    for lot in range(premiere, derniere, TAILLE_LOT_COLONNES)
+                ]
+            else: #lignes trouvées par un index : on ne lit que l'étendue de chaque groupe
+                lots = []
+                for position in positions: #triées : un groupe couvre au plus TAILLE_LOT_COLONNES lignes
+                    if position >= total:
+                        break
+                    if lots and position - lots[-1][0] < TAILLE_LOT_COLONNES:
+                        lots[-1][2].append(position)
+                    else:
+                        lots.append((position, None, [position]))
+                lots = [(premiere, choisies[-1] + 1, choisies) for premiere, _, choisies in lots]
+
+            for premiere, derniere, choisies in lots:
+                if premiere >= derniere:
+                    continue
+                numeros = range(premiere, derniere) if choisies is None else choisies
+                if supprimees is not None: #on saute les lignes supprimées
+                    masque = format_colonnes.lire_nulls(supprimees, premiere, derniere - premiere)
+                    if not isinstance(masque, list): #tableau numpy
+                        masque = masque.tolist()
+                    numeros = [numero for numero in numeros if not masque[numero - premiere]]
+                    if not numeros:
+                        continue
+                valeurs = [None] * len(noms) #les colonnes du lot, en listes
+                for i in avant:
+                    valeurs[i] = self.lire_morceau(fichiers[i], structure[i][1], premiere, derniere - premiere)
+
+                if filtre is not None: #le filtre travaille sur une ligne a la fois
+                    gardees = []
+                    for numero in numeros:
+                        ligne = [None if v is None else v[numero - premiere] for v in valeurs]
+                        if filtre(ligne) is True:
+                            gardees.append(numero)
+                    numeros = gardees
+                    if not numeros:
+                        continue
+                    for i in apres: #les colonnes seulement projetées, pour les lignes gardées
+                        valeurs[i] = self.lire_morceau(fichiers[i], structure[i][1], premiere, derniere - premiere)
+
+                if colonnes is None:
+                    sorties = [(nom_col, valeurs[i]) for i, nom_col in enumerate(noms)]
+                else: #dans l'ordre demandé, colonne inconnue = null
+                    indices = {nom_col: i for i, nom_col in enumerate(noms)}
+                    sorties = [(col, valeurs[indices[col]] if col in indices else None) for col in colonnes]
+                for numero in numeros:
+                    decalage = numero - premiere
+                    ligne = {col: (None if v is None else v[decalage]) for col, v in sorties}
+                    if avec_positions:
+                        yield numero, ligne
+                    else:
+                        yield ligne
+        finally:
+            for fichiers_col in fichiers.values():
+                for fichier in fichiers_col.values():
+                    fichier.close()
+            if supprimees is not None:
+                supprimees.close()
+
+    def en_colonnes(self, nom_table):
+        """vrai si la table est stockée en colonnes : lots_colonnes sans filtre lit alors directement ses fichiers"""
+        meta = self.meta_table(nom_table)
+        return meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES
+
+    def lots_colonnes(self, nom_table, colonnes, filtre=None, colonnes_filtre=(), positions=None):
+        """
+        les lignes par lots de colonnes : (nbr de lignes, {colonne: (valeurs, nulls)}).
+        Une table stockée en colonnes, lue sans filtre, donne directement les tableaux de ses fichiers
+        (numpy si installé), sinon les lignes lues sont regroupées en listes de TAILLE_LOT_COLONNES lignes
+        """
+        if not self.table_existe(nom_table):
+            raise Exception(f"Pas de table '{nom_table}'")
+        rendre = self.prendre_lecture(nom_table) #jusqu'au dernier lot
+        try:
+            yield from self.parcourir_lots(nom_table, colonnes, filtre, colonnes_filtre, positions)
+        finally:
+            rendre()
+
+    def parcourir_lots(self, nom_table, colonnes, filtre, colonnes_filtre, positions):
+        """les lots de lots_colonnes, sous le verrou de lecture"""
+        meta = self.meta_table(nom_table)
+        types = dict(meta['colonnes'])
+        for col in colonnes:
+            if col not in types:
+                raise Exception(f"Pas de colonne '{col}' dans '{nom_table}'")
+
+        if (meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES
+                and filtre is None and positions is None):
+            total = meta['nbr_lignes']
+            fichiers = {}
+            supprimees = None
+            try:
+                if meta['compteurs'][format_fixe.NBR_VIVANTES] != total: #des lignes supprimées a enlever des lots
+                    supprimees = self.ouvrir_lecture(self.chemin_supprimees(nom_table))
+                for col in colonnes:
+                    extensions = ('.col', '.nul', '.txt') if types[col] in format_colonnes.TYPES_TEXTE else ('.col', '.nul')
+                    fichiers[col] = {ext: self.ouvrir_lecture(self.chemin_colonne(nom_table, col, ext))
+                                     for ext in extensions}
+                for debut in range(0, total, TAILLE_LOT_COLONNES):
+                    nbr = min(TAILLE_LOT_COLONNES, total - debut)
+                    lot = {}
+                    for col in colonnes:
+                        if types[col] in format_colonnes.TYPES_TEXTE:
+                            valeurs = format_colonnes.lire_textes(fichiers[col]['.col'], fichiers[col]['.txt'], debut, nbr)
+                        else:
+                            valeurs = format_colonnes.lire_valeurs(fichiers[col]['.col'], types[col], debut, nbr)
+                        lot[col] = (valeurs, format_colonnes.lire_nulls(fichiers[col]['.nul'], debut, nbr))
+                    if supprimees is not None:
+                        masque = format_colonnes.lire_nulls(supprimees, debut, nbr)
+                        nbr -= int(sum(masque))
+                        lot = {
+                            col: (format_colonnes.enlever(valeurs, masque), format_colonnes.enlever(nulls, masque))
+                            for col, (valeurs, nulls) in lot.items()
+                        }
+                    mesure = self.mesure_courante()
+                    if mesure is not None:
+                        mesure.lignes_parcourues += nbr
+                    yield nbr, lot
+            finally:
+                for fichiers_col in fichiers.values():
+                    for fichier in fichiers_col.values():
+                        fichier.close()
+                if supprimees is not None:
+                    supprimees.close()
+            return
+
+        yield from self.lots_de_lignes(self.iter_lignes(nom_table, list(colonnes), filtre, colonnes_filtre,
+                                                        positions=positions), colonnes)
 
-            for _ in range(nbr_colonnes): #pour chaque colonne
-                nom_len = struct.unpack('I', table.read(4))[0] #on lit la longueur du nom
-                table.read(nom_len) #on saute en octet sa longueur
-                table.read(1) #idem pour le code type
+    def lots_de_lignes(self, lignes, colonnes):
+        """les lignes lues regroupées en lots de colonnes de TAILLE_LOT_COLONNES lignes (voir lots_colonnes)"""
+        while True:
+            paquet = list(itertools.islice(lignes, TAILLE_LOT_COLONNES))
+            if not paquet:
+                break
+            lot = {}
+            for col in colonnes:
+                valeurs = [ligne[col] for ligne in paquet]
+                lot[col] = (valeurs, [valeur is None for valeur in valeurs])
+            yield len(paquet), lot
 
-            nbr_lignes = struct.unpack('I', table.read(4))[0] #on lit le nbr de lignes
+    def plages_paralleles(self, meta):
+        """
+        les plages (premiere ligne, nbr de lignes) d'un parcours parallèle, ou None si la table est lue
+        par un seul processus. Au format 2 les slots sont de taille fixe : le début de chaque plage se calcule,
+        sans index des positions. Aux formats 1 et 3 il faudrait lire toutes les lignes précédentes (MIGRATE d'abord)
+        """
+        if self.parallel_workers < 2 or meta['version'] != format_fixe.VERSION_FIXE:
+            return None
+        total = meta['nbr_lignes'] #les slots, supprimés compris : sautés par chaque processus
+        if total < LIGNES_MIN_PARALLELE:
+            return None
+        nbr_plages = max(2, min(self.parallel_workers * PLAGES_PAR_PROCESSUS, total // LIGNES_MIN_PLAGE))
+        taille = -(-total // nbr_plages)
+        return [(debut, min(taille, total - debut)) for debut in range(0, total, taille)]
 
-            for _ in range(nbr_lignes): #pour chaque ligne
-                ligne = {} #on assigne un dictionnaire vide
+    def pool_processus(self):
+        """le pool de processus des parcours parallèles ('spawn' : rien n'est hérité des threads du programme)"""
+        with self.verrou_operations:
+            if self.processus is None:
+                self.processus = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.parallel_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.processus
 
-                for nom_col, type_col in structure: #pour chaque colonne
-                    valeur = self.decoder_valeur(table, type_col) #on décode la valeur binaire(octet et type)
-                    ligne[nom_col] = valeur #on stock le contenu décodé dans le dictionnaire
+    def lignes_paralleles(self, nom_table, colonnes, condition):
+        """
+        comme iter_lignes pour un parcours de toute la table filtré par l'arbre condition (voir expressions),
+        les plages de lignes étant décodées et filtrées par le pool de processus. Les lignes arrivent dans l'ordre
+        de la table. Renvoie None si la table est lue par un seul processus (voir plages_paralleles)
+        """
+        if self.parallel_workers < 2 or not self.table_existe(nom_table):
+            return None
+        rendre = self.prendre_lecture(nom_table) #les processus lisent les fichiers sous le verrou de ce thread
+        try:
+            meta = self.meta_table(nom_table)
+            plages = self.plages_paralleles(meta)
+            if plages is None:
+                rendre()
+                return None
+            if colonnes is None:
+                colonnes = [nom_col for nom_col, _ in meta['colonnes']]
+            self.compter_plages(plages)
+            lignes = self.lignes_des_plages(self.repartir(lire_plage, plages, nom_table, colonnes, condition), colonnes)
+        except BaseException:
+            rendre()
+            raise
+        return verrous.LectureVerrouillee(lignes, rendre)
 
-                lignes.append(ligne) #on ajoute la ligne à la liste vide
+    def lignes_des_plages(self, resultats, colonnes):
+        """les dictionnaires des lignes renvoyées par chaque plage, la répartition fermée avec l'itérateur"""
+        with contextlib.closing(resultats):
+            for resultat in resultats:
+                for valeurs in resultat:
+                    yield dict(zip(colonnes, valeurs))
 
-        return lignes #on renvoie toutes les lignes
+    def agreger_parallele(self, nom_table, agregation, colonnes, condition):
+        """
+        alimente l'Agregation avec les agrégats partiels de chaque plage, calculés par le pool de processus
+        (seuls les accumulateurs de chaque groupe reviennent). Renvoie False si la table est lue par un seul processus.
+        Une table en colonnes sans WHERE garde sa lecture directe des fichiers (déjà vectorisée avec numpy)
+        """
+        if self.parallel_workers < 2 or not self.table_existe(nom_table):
+            return False
+        with self.lecture(nom_table):
+            meta = self.meta_table(nom_table)
+            plages = self.plages_paralleles(meta)
+            if plages is None or (condition is None and meta['stockage'] == format_fixe.STOCKAGE_COLONNES):
+                return False
+            self.compter_plages(plages)
+            for etats in self.repartir(agreger_plage, plages, nom_table, colonnes, condition,
+                                       agregation.groupes, agregation.agregats, agregation.types):
+                agregation.fusionner(etats)
+        return True
+
+    def compter_plages(self, plages):
+        """EXPLAIN ANALYZE : le filtre tourne dans les processus, tous les slots des plages comptent comme parcourus"""
+        mesure = self.mesure_courante()
+        if mesure is not None:
+            mesure.plages_paralleles += len(plages)
+            mesure.lignes_parcourues += sum(nbr for _, nbr in plages)
+
+    def repartir(self, tache, plages, nom_table, *arguments):
+        """
+        générateur des résultats de tache(dossier, nom_table, debut, nbr, *arguments) pour chaque plage, dans l'ordre.
+        Au plus 2 plages d'avance par processus (la mémoire des résultats pas encore lus reste bornée).
+        A la fin, les plages lancées sont attendues : aucune lecture ne continue apres le verrou rendu
+        """
+        pool = self.pool_processus()
+        suivantes = iter(plages)
+        en_cours = collections.deque()
+
+        def lancer():
+            for debut, nbr in itertools.islice(suivantes, 2 * self.parallel_workers - len(en_cours)):
+                en_cours.append(pool.submit(tache, self.dossier, nom_table, debut, nbr, *arguments))
+
+        try:
+            lancer()
+            while en_cours:
+                resultat = en_cours.popleft().result()
+                lancer()
+                yield resultat
+        except concurrent.futures.process.BrokenProcessPool: #un processus est mort : nouveau pool a la prochaine lecture
+            with self.verrou_operations:
+                if self.processus is pool:
+                    self.processus = None
+            raise Exception("Parcours parallèle interrompu : un processus s'est arreté")
+        finally:
+            for futur in en_cours:
+                futur.cancel()
+            concurrent.futures.wait(en_cours)
+
+    def lire_plage(self, nom_table, debut, nbr, colonnes, condition):
+        """
+        dans un processus du pool : les lignes debut a debut+nbr de la table (format 2), filtrées par la condition.
+        Pas de verrou ici : le programme qui a lancé la lecture tient la table en lecture
+        """
+        table = open(self.chemin_table(nom_table), 'rb', buffering=TAILLE_TAMPON)
+        try:
+            meta = self.meta_table(nom_table, table)
+            filtre, colonnes_filtre = None, ()
+            if condition is not None: #compilé ici : une fonction python ne passe pas d'un processus a l'autre
+                positions = {nom_col: indice for indice, (nom_col, _) in enumerate(meta['colonnes'])}
+                filtre, colonnes_filtre = expressions.compiler(condition, positions), expressions.colonnes_de(condition)
+        except BaseException:
+            table.close()
+            raise
+        if meta['stockage'] != format_fixe.STOCKAGE_COLONNES:
+            debut = meta['taille_entete'] + debut * meta['taille_slot'] #position du premier slot de la plage
+        return self.parcourir_lignes(table, meta, colonnes, filtre, colonnes_filtre, debut=debut, nbr=nbr)
+
+    def compter_lignes(self, nom_table):
+        """le nombre de lignes de la table, lu dans l'en-tête (sans parcours)"""
+        if not self.table_existe(nom_table):
+            raise Exception(f"Pas de table '{nom_table}'")
+        with self.lecture(nom_table):
+            meta = self.meta_table(nom_table)
+        if meta['version'] == format_fixe.VERSION_FIXE:
+            return meta['compteurs'][format_fixe.NBR_VIVANTES] #les lignes non supprimées
+        return meta['nbr_lignes']
+
+    def lire_colonnes(self, nom_table, colonnes):
+        """
+        lit des colonnes entieres sans construire de ligne : {colonne: (valeurs, nulls)}.
+        Avec numpy, valeurs et nulls sont des tableaux numpy (calculs vectorisés), sinon des array.array / listes.
+        Les textes sont des listes. Pour une table stockée en lignes, les colonnes sont extraites d'un parcours
+        """
+        with self.lecture(nom_table):
+            meta = self.meta_table(nom_table)
+            types = dict(meta['colonnes'])
+            for col in colonnes:
+                if col not in types:
+                    raise Exception(f"Pas de colonne '{col}' dans '{nom_table}'")
+
+            if meta['version'] != format_fixe.VERSION_FIXE or meta['stockage'] != format_fixe.STOCKAGE_COLONNES:
+                listes = {col: [] for col in colonnes}
+                for ligne in self.iter_lignes(nom_table, list(colonnes)):
+                    for col in colonnes:
+                        listes[col].append(ligne[col])
+                return {col: (valeurs, [v is None for v in valeurs]) for col, valeurs in listes.items()}
+
+            resultat = {}
+            total = meta['nbr_lignes']
+            masque = None #les lignes supprimées, enlevées des colonnes lues
+            if meta['compteurs'][format_fixe.NBR_VIVANTES] != total:
+                with open(self.chemin_supprimees(nom_table), 'rb') as supprimees:
+                    masque = format_colonnes.lire_nulls(supprimees, 0, total)
+            for col in colonnes:
+                type_col = types[col]
+                with open(self.chemin_colonne(nom_table, col, '.col'), 'rb') as fichier_col, \
+                        open(self.chemin_colonne(nom_table, col, '.nul'), 'rb') as fichier_nul:
+                    if type_col in format_colonnes.TYPES_TEXTE:
+                        with open(self.chemin_colonne(nom_table, col, '.txt'), 'rb') as fichier_txt:
+                            valeurs = format_colonnes.lire_textes(fichier_col, fichier_txt, 0, total)
+                    else:
+                        valeurs = format_colonnes.lire_valeurs(fichier_col, type_col, 0, total)
+                    nulls = format_colonnes.lire_nulls(fichier_nul, 0, total)
+                if masque is not None:
+                    valeurs, nulls = format_colonnes.enlever(valeurs, masque), format_colonnes.enlever(nulls, masque)
+                resultat[col] = (valeurs, nulls)
+            return resultat
+
+    def decoder_ligne(self, tampon, position, types, roles):
+        """
+        décode une ligne dans un tampon d'octets a partir de position.
+        roles : 0 = sauter la valeur, 1 = la décoder, 2 = retenir sa position sans la décoder
+        renvoie (valeurs, [(indice, position retenue)], position de fin de ligne).
+        Lève IndexError ou struct.error si la ligne dépasse du tampon
+        """
+        valeurs = [None] * len(types) #colonne sautée = None
+        retenues = []
+
+        for indice, type_col in enumerate(types):
+            role = roles[indice]
+            if role == 2:
+                retenues.append((indice, position))
+
+            if tampon[position] == 0: #marqueur null, suivi de 4 octets de padding
+                position += 5
+                continue
+            position += 1 #on passe le marqueur
+
+            if type_col == 'INT':
+                if role == 1:
+                    valeurs[indice] = FORMAT_INT.unpack_from(tampon, position)[0]
+                position += 4
+            elif type_col == 'FLOAT':
+                if role == 1:
+                    valeurs[indice] = FORMAT_FLOAT.unpack_from(tampon, position)[0]
+                position += 8
+            elif type_col == 'TEXT' or type_col == 'SERIAL':
+                longueur = FORMAT_LONGUEUR.unpack_from(tampon, position)[0]
+                position += 4
+                if role == 1:
+                    if position + longueur > len(tampon): #texte coupé par la fin du tampon
+                        raise IndexError
+                    valeurs[indice] = tampon[position:position + longueur].decode('utf-8')
+                position += longueur #sauter un texte = juste avancer de sa longueur
+            elif type_col == 'BOOL':
+                if role == 1:
+                    valeurs[indice] = tampon[position] == 1
+                position += 1
+            else:
+                raise Exception(f"Pas du type INT, FLOAT, TEXT, or BOOL : {type_col}")
+
+        if position > len(tampon): #la derniere valeur sautée dépasse du tampon
+            raise IndexError
+        return valeurs, retenues, position
+
+    def decoder_dans(self, tampon, position, type_col):
+        """décode une seule valeur dans un tampon d'octets (marqueur compris)"""
+        valeurs, _, _ = self.decoder_ligne(tampon, position, [type_col], [1])
+        return valeurs[0]
     
     def supprimer_table(self, nom_table):
         """supprimer une table"""
-
-        if not self.table_existe(nom_table): #on vérifie que la table existe
-            raise Exception(f"Pas de table {nom_table}") #sinon msg d'err d'exception
+        with self.ecriture(nom_table):
+            if not self.table_existe(nom_table): #on vérifie que la table existe
+                raise Exception(f"Pas de table {nom_table}") #sinon msg d'err d'exception
         
-        chemin = self.chemin_table(nom_table) #on récupère le chemin
-        os.remove(chemin) #et on le supprime 
+            chemin = self.chemin_table(nom_table) #on récupère le chemin
+            self.point_de_controle() #plus rien a rejouer dans ses fichiers
+            os.remove(chemin) #et on le supprime 
+            self.cache_meta.pop(nom_table, None) #on oublie son en-tête
+            self.ids_reserves.pop(nom_table, None)
+            self.oublier_cache(nom_table)
+            if os.path.exists(self.chemin_tas(nom_table)): #le tas des textes (format 2)
+                os.remove(self.chemin_tas(nom_table))
+            for chemin_colonne in self.fichiers_colonnes(nom_table): #les colonnes (stockage en colonnes)
+                os.remove(chemin_colonne)
+
+            for chemin_index in self.fichiers_index(nom_table): #et ses index
+                os.remove(chemin_index)
+            self.index_tables.pop(nom_table, None)
+
+            return True #renvoi que tout est ok
 
-        return True #renvoi que tout est ok
+    def migrer_table(self, nom_table, version=format_fixe.VERSION_FIXE):
+        """
+        convertit une table vers le format 2 (lignes de taille fixe + tas), depuis le format 1 ou 3,
+        ou vers le format 3 (lignes compactes, voir format_compact), depuis le format 1 ou 2.
+        Les nouveaux fichiers sont écrits a coté puis remplacent les anciens, et les index sont reconstruits
+        (les positions des lignes changent). Renvoie le nombre de lignes converties
+        """
+        with self.ecriture(nom_table):
+            meta = self.meta_table(nom_table)
+            if version not in (format_fixe.VERSION_FIXE, format_compact.VERSION_COMPACTE):
+                raise Exception(f"Version de table inconnue : {version}")
+            if meta['version'] == version:
+                raise Exception(f"La table '{nom_table}' est déjà au format {version}")
+
+            chemin = self.chemin_table(nom_table)
+            chemin_tas = self.chemin_tas(nom_table)
+            fixe = version == format_fixe.VERSION_FIXE
+            types = [type_col for _, type_col in meta['colonnes']]
+            entete = format_fixe.entete_fixe(list(zip([nom for nom, _ in meta['colonnes']], meta['codes'])),
+                                             version=version)
+            format_ligne = format_fixe.format_slot(types) if fixe else None
+
+            compteurs = [0] * 8
+            compteurs[format_fixe.GENERATION] = format_fixe.generation_initiale()
+            if meta['version'] != 1: #le compteur des _id BIGSERIAL continue (blocs réservés compris)
+                compteurs[format_fixe.DERNIER_ID] = meta['compteurs'][format_fixe.DERNIER_ID]
+            lignes = self.iter_lignes(nom_table)
+            with open(chemin + '.migration', 'wb') as table, \
+                    open(chemin_tas + '.migration', 'wb') if fixe else contextlib.nullcontext() as tas:
+                table.write(entete)
+                while True: #par lots, pour ne jamais avoir toute la table en mémoire
+                    lot = [list(ligne.values()) for ligne in itertools.islice(lignes, TAILLE_LOT_MIGRATION)]
+                    if not lot:
+                        break
+                    if fixe:
+                        slots, textes = format_fixe.encoder_slots(types, lot, format_ligne,
+                                                                  compteurs[format_fixe.TAILLE_TAS])
+                        table.write(slots)
+                        tas.write(textes)
+                        compteurs[format_fixe.TAILLE_TAS] += len(textes)
+                    else: #format 3 : pas de tas, les textes sont dans les lignes
+                        donnees_binaires, _ = format_compact.encoder_lignes(types, lot)
+                        table.write(donnees_binaires)
+                        compteurs[format_fixe.TAILLE_LIGNES] += len(donnees_binaires)
+                    compteurs[format_fixe.NBR_LIGNES] += len(lot)
+
+                compteurs[format_fixe.NBR_VIVANTES] = compteurs[format_fixe.NBR_LIGNES]
+                table.seek(len(entete) - format_fixe.FORMAT_COMPTEURS.size)
+                table.write(format_fixe.FORMAT_COMPTEURS.pack(*compteurs))
+
+            #le tas d'abord : tant que la table n'est pas remplacée, l'ancienne reste lisible
+            self.point_de_controle()
+            if fixe:
+                self.synchroniser_fichiers([chemin_tas + '.migration', chemin + '.migration'])
+                os.replace(chemin_tas + '.migration', chemin_tas)
+                os.replace(chemin + '.migration', chemin)
+            else:
+                self.synchroniser_fichiers([chemin + '.migration'])
+                os.replace(chemin + '.migration', chemin)
+                if os.path.exists(chemin_tas): #le tas et les colonnes de l'ancien format 2 ne servent plus
+                    os.remove(chemin_tas)
+                for chemin_colonne in self.fichiers_colonnes(nom_table):
+                    os.remove(chemin_colonne)
+            self.synchroniser_fichiers([])
+            self.cache_meta.pop(nom_table, None)
+            self.ids_reserves.pop(nom_table, None)
+            self.oublier_cache(nom_table)
+
+            self.reconstruire_index(nom_table) #les index pointent vers les anciennes positions
+            return compteurs[format_fixe.NBR_LIGNES]
+
+    def reconstruire_index(self, nom_table):
+        """reconstruit tous les index de la table a partir de ses lignes (positions changées, entrées périmées)"""
+        with self.ecriture(nom_table):
+            index = self.index_de_table(nom_table)
+            colonnes_index = [(nom_index, idx.colonne) for nom_index, idx in index.items()]
+            for chemin_index in self.fichiers_index(nom_table):
+                os.remove(chemin_index)
+            self.index_tables[nom_table] = {}
+            for nom_index, colonne in colonnes_index:
+                self.creer_index(nom_table, nom_index, colonne)
+
+    def ouvrir_modification(self, nom_table):
+        """ouvre une table pour UPDATE / DELETE / VACUUM ('r+b'), renvoie (fichier, métadonnées)"""
+        try:
+            table = self.ouvrir_ecriture(self.chemin_table(nom_table))
+        except FileNotFoundError:
+            raise Exception(f"Pas de table '{nom_table}'")
+        try:
+            meta = self.meta_table(nom_table, table)
+            if meta['version'] != format_fixe.VERSION_FIXE: #lignes de taille variable : pas de modification sur place
+                raise Exception(f"La table '{nom_table}' est au format {meta['version']} : MIGRATE TABLE {nom_table} d'abord")
+        except Exception:
+            table.close()
+            raise
+        return table, meta
+
+    def slots_choisis(self, meta, filtre=None, colonnes_filtre=(), positions=None):
+        """les (position, champs décodés) des slots non supprimés qui vérifient le filtre (format 2 en lignes)"""
+        structure = meta['colonnes']
+        noms = [nom_col for nom_col, _ in structure]
+        textes = [type_col in format_fixe.TYPES_TEXTE for _, type_col in structure]
+        roles = self.roles_colonnes(noms, [], filtre, colonnes_filtre)
+        avant = [i for i, role in enumerate(roles) if role == 1] #les colonnes du filtre
+        choisis = []
+        with self.ouvrir_lecture(self.chemin_table(meta['nom']), TAILLE_TAMPON) as table, \
+                self.ouvrir_lecture(self.chemin_tas(meta['nom'])) as tas:
+            for bloc in self.blocs_slots(table, meta, positions):
+                lignes = [
+                    (position, champs, int.from_bytes(champs[1], 'little'), [None] * len(noms))
+                    for position, champs in bloc if not champs[0] & format_fixe.DRAPEAU_SUPPRIMEE
+                ]
+                if filtre is not None:
+                    self.remplir_slots(lignes, avant, meta['places'], textes, tas)
+                    lignes = [ligne for ligne in lignes if filtre(ligne[3]) is True]
+                choisis.extend((position, champs) for position, champs, _, _ in lignes)
+        mesure = self.mesure_courante()
+        if mesure is not None and filtre is None: #sans filtre : toutes les lignes lues sont choisies
+            mesure.lignes_parcourues += len(choisis)
+        return choisis
+
+    def numeros_choisis(self, meta, filtre=None, colonnes_filtre=(), positions=None):
+        """les numéros des lignes non supprimées qui vérifient le filtre (stockage en colonnes)"""
+        table = self.ouvrir_lecture(self.chemin_table(meta['nom']))
+        numeros = [numero for numero, _ in self.parcourir_colonnes(table, meta, [], filtre, colonnes_filtre,
+                                                                    positions, avec_positions=True)]
+        mesure = self.mesure_courante()
+        if mesure is not None and filtre is None:
+            mesure.lignes_parcourues += len(numeros)
+        return numeros
+
+    def supprimer_lignes(self, nom_table, filtre=None, colonnes_filtre=(), positions=None):
+        """
+        DELETE : marque supprimées les lignes qui vérifient le filtre, sans déplacer les autres (tombstone).
+        En lignes, le slot est ajouté a la liste des slots libres, réutilisés par les prochains INSERT.
+        En colonnes, le bit de la ligne est mis a 1 dans table_<nom>.del. Renvoie le nombre de lignes supprimées.
+        Les entrées d'index des lignes supprimées restent : le WHERE est toujours vérifié sur les lignes lues
+        """
+        with self.operation(nom_table):
+            table, meta = self.ouvrir_modification(nom_table)
+            with table:
+                compteurs = list(meta['compteurs'])
+                if meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+                    numeros = self.numeros_choisis(meta, filtre, colonnes_filtre, positions)
+                    if not os.path.exists(self.chemin_supprimees(nom_table)): #table créée avant DELETE
+                        open(self.chemin_supprimees(nom_table), 'wb').close()
+                    with self.ouvrir_ecriture(self.chemin_supprimees(nom_table)) as supprimees:
+                        format_colonnes.changer_bits(supprimees, numeros, True)
+                    compteurs[format_fixe.NBR_VIVANTES] -= len(numeros)
+                    self.ecrire_compteurs(table, meta, compteurs, numeros)
+                    return len(numeros)
+
+                choisis = self.slots_choisis(meta, filtre, colonnes_filtre, positions)
+                types = [type_col for _, type_col in meta['colonnes']]
+                chainer = meta['taille_slot'] >= format_fixe.FORMAT_LIBRE.size #assez de place pour le lien
+                libre = compteurs[format_fixe.LIBRE]
+                for position, champs in choisis:
+                    compteurs[format_fixe.TAS_LIBRE] += format_fixe.octets_textes(champs, types, meta['places'])
+                    table.seek(position)
+                    if chainer: #le slot devient la tete de la liste des slots libres
+                        table.write(format_fixe.FORMAT_LIBRE.pack(format_fixe.DRAPEAU_SUPPRIMEE, libre))
+                        libre = (position - meta['taille_entete']) // meta['taille_slot'] + 1
+                    else:
+                        table.write(bytes([format_fixe.DRAPEAU_SUPPRIMEE]))
+                table.flush() #les slots marqués AVANT les compteurs
+
+                compteurs[format_fixe.NBR_VIVANTES] -= len(choisis)
+                compteurs[format_fixe.LIBRE] = libre
+                self.ecrire_compteurs(table, meta, compteurs, [position for position, _ in choisis])
+                return len(choisis)
+
+    def modifier_lignes(self, nom_table, valeurs, filtre=None, colonnes_filtre=(), positions=None):
+        """
+        UPDATE : donne les valeurs {colonne: valeur} aux lignes qui vérifient le filtre. Renvoie le nombre de lignes.
+        En lignes, le slot (de taille fixe) est réécrit sur place, les nouveaux textes vont a la fin du tas.
+        En colonnes, les valeurs de taille fixe sont réécrites sur place ; si un texte change,
+        la ligne est supprimée puis ajoutée a la fin
+        """
+        with self.ecriture(nom_table):
+            with self.operation(nom_table): #la suppression et la réinsertion d'un texte modifié : une seule opération
+                table, meta = self.ouvrir_modification(nom_table)
+                with table:
+                    structure = meta['colonnes']
+                    noms = [nom_col for nom_col, _ in structure]
+                    types = [type_col for _, type_col in structure]
+                    modifications = self.preparer_modifications(nom_table, structure, valeurs)
+
+                    index = self.index_de_table(nom_table)
+                    for idx in index.values(): #les index couvrent toutes les lignes avant d'y ajouter les nouvelles valeurs
+                        self.rattraper_index(nom_table, idx, meta)
+
+                    if meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+                        if any(types[indice] in format_colonnes.TYPES_TEXTE for indice in modifications):
+                            lignes = list(self.parcourir_colonnes(open(self.chemin_table(nom_table), 'rb'), meta, None,
+                                                                  filtre, colonnes_filtre, positions, avec_positions=True))
+                        else:
+                            lignes = None
+                            choisies = self.numeros_choisis(meta, filtre, colonnes_filtre, positions)
+                            self.modifier_colonnes(meta, modifications, choisies)
+                            #les compteurs ne changent pas, mais la génération si (cache des autres programmes)
+                            self.ecrire_compteurs(table, meta, meta['compteurs'], choisies)
+                    else:
+                        lignes = None
+                        choisies = self.modifier_slots(table, meta, modifications, filtre, colonnes_filtre, positions)
+
+                if lignes is not None: #un texte change : les lignes sont supprimées puis réinsérées (avec leur _id)
+                    self.supprimer_lignes(nom_table, positions=[numero for numero, _ in lignes])
+                    lignes = [ligne for _, ligne in lignes]
+                    for ligne in lignes:
+                        ligne.update((noms[indice], valeur) for indice, valeur in modifications.items())
+                    self.inserer_lignes(nom_table, lignes)
+                    return len(lignes)
+
+            #les nouvelles valeurs dans les index (l'ancienne entrée reste, le WHERE est revérifié a la lecture)
+            for idx in index.values():
+                if idx.colonne in valeurs:
+                    valeur = modifications[noms.index(idx.colonne)]
+                    idx.ajouter([(valeur, position) for position in choisies])
+            return len(choisies)
+
+    def preparer_modifications(self, nom_table, structure, valeurs):
+        """les valeurs d'un UPDATE {colonne: valeur} vérifiées et converties : {indice de colonne: valeur}"""
+        noms = [nom_col for nom_col, _ in structure]
+        modifications = {}
+        for nom_col, valeur in valeurs.items():
+            if nom_col not in noms:
+                raise Exception(f"Pas de colonne '{nom_col}' dans '{nom_table}'")
+            if nom_col == '_id':
+                raise Exception("La colonne _id ne peut pas etre modifiée")
+            indice = noms.index(nom_col)
+            try:
+                modifications[indice] = normaliser_valeur(valeur, structure[indice][1])
+            except ValueError:
+                raise Exception(f"Valeur invalide pour la colonne {structure[indice][1]} {nom_col} : {valeur!r}")
+        return modifications
+
+    def modifier_slots(self, table, meta, modifications, filtre, colonnes_filtre, positions):
+        """UPDATE d'une table en lignes : chaque slot choisi est réécrit sur place. Renvoie les positions modifiées"""
+        types = [type_col for _, type_col in meta['colonnes']]
+        compteurs = list(meta['compteurs'])
+        fin_tas = compteurs[format_fixe.TAILLE_TAS]
+        slots = [] #(position, octets du slot modifié)
+        textes = []
+        for position, champs in self.slots_choisis(meta, filtre, colonnes_filtre, positions):
+            champs, ajout, liberes = format_fixe.modifier_champs(champs, modifications, types, meta['places'], fin_tas)
+            fin_tas += len(ajout)
+            textes.append(ajout)
+            compteurs[format_fixe.TAS_LIBRE] += liberes
+            slots.append((position, meta['format_slot'].pack(*champs)))
+
+        #1. les nouveaux textes a la fin du tas, comptés AVANT que les slots n'y pointent
+        textes = b''.join(textes)
+        if textes:
+            with self.ouvrir_ecriture(self.chemin_tas(meta['nom'])) as tas:
+                tas.seek(compteurs[format_fixe.TAILLE_TAS])
+                tas.write(textes)
+            compteurs[format_fixe.TAILLE_TAS] = fin_tas
+            self.ecrire_compteurs(table, meta, list(compteurs), ()) #les slots ne pointent pas encore vers eux
+
+        #2. chaque slot sur place (meme taille), puis les octets libérés du tas
+        for position, slot in slots:
+            table.seek(position)
+            table.write(slot)
+        table.flush()
+        positions = [position for position, _ in slots]
+        self.ecrire_compteurs(table, meta, compteurs, positions)
+        return positions
+
+    def modifier_colonnes(self, meta, modifications, numeros):
+        """UPDATE d'une table en colonnes, sans texte modifié : valeurs et bits des nulls réécrits sur place"""
+        for indice, valeur in modifications.items():
+            nom_col, type_col = meta['colonnes'][indice]
+            octets, _, _ = format_colonnes.encoder_colonne(type_col, [valeur])
+            largeur = format_colonnes.LARGEURS[type_col]
+            with self.ouvrir_ecriture(self.chemin_colonne(meta['nom'], nom_col, '.col')) as fichier_col:
+                for numero in numeros:
+                    fichier_col.seek(numero * largeur)
+                    fichier_col.write(octets)
+            with self.ouvrir_ecriture(self.chemin_colonne(meta['nom'], nom_col, '.nul')) as fichier_nul:
+                format_colonnes.changer_bits(fichier_nul, numeros, valeur is None)
+
+    def compacter_table(self, nom_table, taille_lot=TAILLE_LOT_VACUUM):
+        """
+        VACUUM : récupère la place des lignes supprimées, puis reconstruit les index.
+        Renvoie le nombre de lignes supprimées récupérées. La table reste verrouillée en écriture jusqu'a la fin
+        (un DELETE entre deux étapes changerait la liste des slots libres)
+        """
+        with self.ecriture(nom_table):
+            meta = self.meta_table(nom_table)
+            if meta['version'] != format_fixe.VERSION_FIXE:
+                raise Exception(f"La table '{nom_table}' est au format {meta['version']} : MIGRATE TABLE {nom_table} d'abord")
+            if meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+                recuperees = self.compacter_colonnes(nom_table)
+            else:
+                recuperees = self.compacter_slots(nom_table, taille_lot)
+                meta = self.meta_table(nom_table)
+                compteurs = meta['compteurs']
+                if compteurs[format_fixe.TAS_LIBRE] and 2 * compteurs[format_fixe.TAS_LIBRE] >= compteurs[format_fixe.TAILLE_TAS]:
+                    self.compacter_tas(nom_table) #au moins la moitié du tas est inutilisée
+            self.reconstruire_index(nom_table) #positions déplacées et entrées périmées
+            return recuperees
+
+    def compacter_slots(self, nom_table, taille_lot):
+        """
+        bouche les slots supprimés avec les derniers slots de la table, puis coupe la fin du fichier.
+        Se fait par étapes d'au plus taille_lot slots déplacés : la table est rouverte a chaque étape
+        et reste lisible entre deux étapes (les index recoivent la nouvelle position de chaque ligne déplacée)
+        """
+        meta = self.meta_table(nom_table)
+        #1. les numéros des slots supprimés, en un parcours des drapeaux
+        with open(self.chemin_table(nom_table), 'rb', buffering=TAILLE_TAMPON) as table:
+            trous = [
+                (position - meta['taille_entete']) // meta['taille_slot']
+                for bloc in self.blocs_slots(table, meta) for position, champs in bloc
+                if champs[0] & format_fixe.DRAPEAU_SUPPRIMEE
+            ]
+        with self.operation(nom_table):
+            table, meta = self.ouvrir_modification(nom_table)
+            with table: #les trous vont etre bouchés : plus de slot libre a réutiliser pendant ce temps
+                compteurs = list(meta['compteurs'])
+                compteurs[format_fixe.LIBRE] = 0
+                compteurs[format_fixe.NBR_VIVANTES] = meta['nbr_lignes'] - len(trous) #recompté au passage
+                self.ecrire_compteurs(table, meta, compteurs)
+
+        recuperees = 0
+        premier = 0 #trous[premier:] : les trous pas encore bouchés, triés
+        while premier < len(trous):
+            with self.operation(nom_table): #une étape = une opération du journal
+                table, meta = self.ouvrir_modification(nom_table)
+                with table:
+                    taille_entete, taille_slot = meta['taille_entete'], meta['taille_slot']
+                    nbr = meta['nbr_lignes']
+                    deplacements = [] #(slot déplacé, trou)
+                    while premier < len(trous) and len(deplacements) < taille_lot:
+                        if trous[-1] >= nbr: #deja coupé
+                            trous.pop()
+                            continue
+                        if trous[-1] == nbr - 1: #trou en fin de table : il disparait avec la fin du fichier
+                            trous.pop()
+                        else: #le dernier slot (non supprimé) va dans le premier trou
+                            deplacements.append((nbr - 1, trous[premier]))
+                            premier += 1
+                        nbr -= 1
+
+                    deplaces = [] #(nouvelle position, champs)
+                    for source, trou in deplacements:
+                        table.seek(taille_entete + source * taille_slot)
+                        slot = table.read(taille_slot)
+                        table.seek(taille_entete + trou * taille_slot)
+                        table.write(slot)
+                        deplaces.append((taille_entete + trou * taille_slot, meta['format_slot'].unpack(slot)))
+                    table.flush()
+                    self.indexer_slots(nom_table, meta, deplaces)
+
+                    #les slots déplacés sont comptés a leur nouvelle place : on coupe la fin
+                    recuperees += meta['nbr_lignes'] - nbr
+                    compteurs = list(meta['compteurs'])
+                    compteurs[format_fixe.NBR_LIGNES] = nbr
+                    self.ecrire_compteurs(table, meta, compteurs)
+                    table.truncate(taille_entete + nbr * taille_slot)
+                    meta['fin'] = meta['taille'] = taille_entete + nbr * taille_slot
+        return recuperees
 
-    def lister_tables(self): 
+    def indexer_slots(self, nom_table, meta, slots):
+        """ajoute aux index de la table les slots [(position, champs décodés)] sous leur position"""
+        index = self.index_de_table(nom_table)
+        if not slots or not index:
+            return
+        noms = [nom_col for nom_col, _ in meta['colonnes']]
+        textes = [type_col in format_fixe.TYPES_TEXTE for _, type_col in meta['colonnes']]
+        lignes = [
+            (position, champs, int.from_bytes(champs[1], 'little'), [None] * len(noms)) for position, champs in slots
+        ]
+        with open(self.chemin_tas(nom_table), 'rb') as tas:
+            self.remplir_slots(lignes, sorted({noms.index(idx.colonne) for idx in index.values()}),
+                               meta['places'], textes, tas)
+        for idx in index.values():
+            indice = noms.index(idx.colonne)
+            idx.ajouter([(valeurs[indice], position) for position, _, _, valeurs in lignes])
+
+    def compacter_tas(self, nom_table):
+        """
+        réécrit le tas sans les textes inutilisés. La table et le tas sont recopiés a coté, lot par lot,
+        puis remplacent les anciens (un lecteur deja ouvert continue sur les anciens fichiers)
+        """
+        with self.ecriture(nom_table):
+            self.point_de_controle() #les fichiers vont etre remplacés : le journal ne doit plus y écrire
+            meta = self.meta_table(nom_table)
+            chemin = self.chemin_table(nom_table)
+            chemin_tas = self.chemin_tas(nom_table)
+            structure = meta['colonnes']
+            indices_textes = [i for i, (_, type_col) in enumerate(structure) if type_col in format_fixe.TYPES_TEXTE]
+            compteurs = list(meta['compteurs'])
+            taille_tas = 0
+
+            with open(chemin, 'rb', buffering=TAILLE_TAMPON) as table, open(chemin_tas, 'rb') as tas, \
+                    open(chemin + '.vacuum', 'wb') as nouvelle, open(chemin_tas + '.vacuum', 'wb') as nouveau_tas:
+                nouvelle.write(table.read(meta['taille_entete']))
+                for bloc in self.blocs_slots(table, meta):
+                    slots = [list(champs) for _, champs in bloc]
+                    cibles = [] #(champs, place) de chaque texte
+                    references = []
+                    for champs in slots:
+                        if champs[0] & format_fixe.DRAPEAU_SUPPRIMEE:
+                            continue
+                        nulls = int.from_bytes(champs[1], 'little')
+                        for indice in indices_textes:
+                            if not nulls >> indice & 1:
+                                place = meta['places'][indice]
+                                cibles.append((champs, place))
+                                references.append((champs[place], champs[place + 1]))
+                    morceaux = []
+                    for (champs, place), texte in zip(cibles, format_fixe.lire_tas(tas, references)):
+                        texte = texte.encode('utf-8')
+                        champs[place] = taille_tas #les textes restants, les uns a la suite des autres
+                        taille_tas += len(texte)
+                        morceaux.append(texte)
+                    nouveau_tas.write(b''.join(morceaux))
+                    nouvelle.write(b''.join(meta['format_slot'].pack(*champs) for champs in slots))
+
+                liberes = compteurs[format_fixe.TAILLE_TAS] - taille_tas
+                compteurs[format_fixe.TAILLE_TAS] = taille_tas
+                compteurs[format_fixe.TAS_LIBRE] = 0
+                compteurs[format_fixe.GENERATION] += 1
+                nouvelle.seek(meta['position_compteurs'])
+                nouvelle.write(format_fixe.FORMAT_COMPTEURS.pack(*compteurs))
+
+            self.synchroniser_fichiers([chemin_tas + '.vacuum', chemin + '.vacuum'])
+            os.replace(chemin_tas + '.vacuum', chemin_tas)
+            os.replace(chemin + '.vacuum', chemin)
+            self.synchroniser_fichiers([])
+            self.cache_meta.pop(nom_table, None)
+            self.oublier_cache(nom_table)
+            return liberes
+
+    def compacter_colonnes(self, nom_table):
+        """
+        VACUUM d'une table en colonnes : les colonnes sont recopiées a coté sans les lignes supprimées,
+        par lots de TAILLE_LOT_COLONNES lignes, puis remplacent les anciennes
+        """
+        with self.ecriture(nom_table):
+            meta = self.meta_table(nom_table)
+            structure = meta['colonnes']
+            supprimees = meta['nbr_lignes'] - meta['compteurs'][format_fixe.NBR_VIVANTES]
+            if supprimees == 0:
+                return 0
+            self.point_de_controle() #les colonnes vont etre remplacées : le journal ne doit plus y écrire
+
+            fichiers = {} #colonne -> {extension: nouveau fichier}
+            fins = {nom_col: 0 for nom_col, _ in structure} #taille des nouveaux .txt
+            nbr_lignes = 0
+            try:
+                for nom_col, type_col in structure:
+                    extensions = format_colonnes.EXTENSIONS if type_col in format_colonnes.TYPES_TEXTE else ('.col', '.nul')
+                    fichiers[nom_col] = {
+                        ext: open(self.chemin_colonne(nom_table, nom_col, ext) + '.vacuum', 'w+b') for ext in extensions
+                    }
+                lignes = self.iter_lignes(nom_table) #sans les lignes supprimées
+                while True:
+                    lot = list(itertools.islice(lignes, TAILLE_LOT_COLONNES))
+                    if not lot:
+                        break
+                    for nom_col, type_col in structure:
+                        octets, textes, nulls = format_colonnes.encoder_colonne(
+                            type_col, [ligne[nom_col] for ligne in lot], fins[nom_col]
+                        )
+                        fichiers[nom_col]['.col'].write(octets)
+                        if textes:
+                            fichiers[nom_col]['.txt'].write(textes)
+                            fins[nom_col] += len(textes)
+                        format_colonnes.ecrire_nulls(fichiers[nom_col]['.nul'], nbr_lignes, nulls)
+                    nbr_lignes += len(lot)
+            finally:
+                for fichiers_col in fichiers.values():
+                    for fichier in fichiers_col.values():
+                        fichier.close()
+
+            nouveaux = [self.chemin_colonne(nom_table, nom_col, ext) for nom_col, fichiers_col in fichiers.items()
+                        for ext in fichiers_col]
+            self.synchroniser_fichiers([chemin_colonne + '.vacuum' for chemin_colonne in nouveaux])
+            for chemin_colonne in nouveaux:
+                os.replace(chemin_colonne + '.vacuum', chemin_colonne)
+            self.synchroniser_fichiers([])
+            with self.operation(nom_table):
+                table, meta = self.ouvrir_modification(nom_table)
+                with table:
+                    with self.ouvrir_ecriture(self.chemin_supprimees(nom_table)) as fichier_supprimees:
+                        fichier_supprimees.truncate(0) #plus aucune ligne supprimée
+                    compteurs = list(meta['compteurs'])
+                    compteurs[format_fixe.NBR_LIGNES] = nbr_lignes
+                    compteurs[format_fixe.NBR_VIVANTES] = nbr_lignes
+                    self.ecrire_compteurs(table, meta, compteurs)
+            return supprimees
+
+    def lister_tables(self):
         """on liste toutes les tables créées"""
         tables = [] #on crée une liste vide pour y renseigner les noms
 
@@ -309,4 +2405,167 @@ class GestionnaireDeTable: #classe = plan de construction de la db, style Pascal
                 tables.append(nom) #ajouter le nom de la table a la liste
 
         return tables #renvoyer la listes des tables
-    
\ No newline at end of file
+    
+
+    def chemin_index(self, nom_table, nom_index):
+        """Renvoie le chemin du fichier d'un index de la table"""
+        return os.path.join(self.dossier, f'table_{nom_table}.{nom_index}.idx')
+
+    def fichiers_index(self, nom_table):
+        """les chemins des fichiers d'index de la table"""
+        prefixe = f'table_{nom_table}.' #les noms de table ne contiennent pas de point
+        return [
+            os.path.join(self.dossier, fichier) for fichier in os.listdir(self.dossier)
+            if fichier.startswith(prefixe) and fichier.endswith('.idx')
+        ]
+
+    def fichiers_colonnes(self, nom_table):
+        """les chemins des fichiers de colonnes de la table et de son bitmap des lignes supprimées (stockage en colonnes)"""
+        prefixe = f'table_{nom_table}.'
+        return [
+            os.path.join(self.dossier, fichier) for fichier in os.listdir(self.dossier)
+            if fichier.startswith(prefixe)
+            and fichier.endswith(format_colonnes.EXTENSIONS + (format_colonnes.EXTENSION_SUPPRIMEES,))
+        ]
+
+    def index_de_table(self, nom_table):
+        """les index de la table : {nom_index: Index}, chargés depuis les fichiers au premier accès"""
+        with self.verrou_index:
+            if nom_table not in self.index_tables:
+                index = {}
+                longueur_prefixe = len(f'table_{nom_table}.')
+                for chemin_index in self.fichiers_index(nom_table):
+                    nom_index = os.path.basename(chemin_index)[longueur_prefixe:-4] #table_t.<nom>.idx
+                    idx = Index(chemin_index)
+                    idx.charger()
+                    index[nom_index] = idx
+                self.index_tables[nom_table] = index
+            return self.index_tables[nom_table]
+
+    def creer_index(self, nom_table, nom_index, colonne):
+        """crée l'index nom_index sur une colonne de la table, a partir des lignes existantes"""
+        with self.ecriture(nom_table):
+            meta = self.meta_table(nom_table) #vérifie aussi que la table existe
+            types = dict(meta['colonnes'])
+            if colonne not in types:
+                raise Exception(f"Pas de colonne '{colonne}' dans '{nom_table}'")
+
+            index = self.index_de_table(nom_table)
+            if nom_index in index:
+                raise Exception(f"L'index '{nom_index}' existe déjà sur '{nom_table}'")
+
+            #une seule lecture de la table, en ne décodant que la colonne indexée
+            entrees = [
+                (ligne[colonne], position)
+                for position, ligne in self.iter_lignes(nom_table, [colonne], avec_positions=True)
+            ]
+            index[nom_index] = Index.creer(self.chemin_index(nom_table, nom_index), colonne, types[colonne], entrees)
+            return True
+
+    def supprimer_index(self, nom_index, nom_table=None):
+        """supprime un index (nom_table peut etre omis si un seul index porte ce nom)"""
+        if nom_table is None: #on cherche la table de l'index
+            tables = [t for t in self.lister_tables() if os.path.exists(self.chemin_index(t, nom_index))]
+            if not tables:
+                raise Exception(f"Pas d'index '{nom_index}'")
+            if len(tables) > 1:
+                raise Exception(f"Plusieurs index '{nom_index}', précisez : DROP INDEX {nom_index} ON <table>")
+            nom_table = tables[0]
+
+        if nom_index == '_id':
+            raise Exception("L'index implicite _id ne peut pas etre supprimé")
+        with self.ecriture(nom_table):
+            chemin_index = self.chemin_index(nom_table, nom_index)
+            if not os.path.exists(chemin_index):
+                raise Exception(f"Pas d'index '{nom_index}' sur '{nom_table}'")
+
+            os.remove(chemin_index)
+            self.index_tables.get(nom_table, {}).pop(nom_index, None)
+        return nom_table
+
+    def rattraper_index(self, nom_table, index, meta):
+        """ajoute a l'index les lignes de la table qu'il ne couvre pas encore (ajoutées par un autre programme, crash...)"""
+        index.synchroniser() #les entrées ajoutées au fichier par quelqu'un d'autre
+        #format 2 : on repart de la ligne qui suit la derniere indexée (UPDATE ajoute des entrées sans ajouter
+        #de ligne, le nombre d'entrées ne dit donc rien). Format 1 : on compte les entrées
+        if meta['version'] == format_fixe.VERSION_FIXE and meta['stockage'] == format_fixe.STOCKAGE_COLONNES:
+            debut = 0 if index.derniere_position is None else index.derniere_position + 1 #numéros de ligne
+            nbr = meta['nbr_lignes'] - debut
+        elif meta['version'] == format_fixe.VERSION_FIXE: #slots de taille fixe : on repart du slot suivant
+            debut = meta['taille_entete']
+            if index.derniere_position is not None:
+                debut = index.derniere_position + meta['taille_slot']
+            nbr = (meta['fin'] - debut) // meta['taille_slot']
+        else:
+            manquantes = meta['nbr_lignes'] - index.nbr_entrees
+            nbr = manquantes
+        if nbr <= 0:
+            return
+
+        table = open(self.chemin_table(nom_table), 'rb')
+        if meta['version'] == format_fixe.VERSION_FIXE:
+            lignes = self.parcourir_lignes(table, meta, [index.colonne], debut=debut, nbr=nbr, avec_positions=True)
+        elif index.derniere_position is None: #index vide : depuis la premiere ligne
+            lignes = self.parcourir_lignes(table, meta, [index.colonne], debut=meta['taille_entete'],
+                                           nbr=manquantes, avec_positions=True)
+        else: #depuis la derniere ligne indexée, qu'on saute
+            lignes = self.parcourir_lignes(table, meta, [index.colonne], debut=index.derniere_position,
+                                           nbr=manquantes + 1, avec_positions=True)
+            next(lignes)
+        index.ajouter([(ligne[index.colonne], position) for position, ligne in lignes])
+
+    def choisir_index(self, nom_table, contraintes):
+        """
+        choisit l'index a utiliser pour les contraintes du WHERE (voir expressions.contraintes_index) :
+        renvoie (nom_index, contrainte), ou None s'il faut parcourir toute la table.
+        Une égalité est préférée a un intervalle
+        """
+        if not contraintes:
+            return None
+        index = self.index_de_table(nom_table)
+        par_colonne = {idx.colonne: nom_index for nom_index, idx in index.items()}
+
+        if '_id' not in par_colonne and any(c[1] == '_id' for c in contraintes): #table créée avant les index
+            self.creer_index(nom_table, '_id', '_id')
+            par_colonne['_id'] = '_id'
+
+        choix = None
+        for contrainte in contraintes:
+            nom_index = par_colonne.get(contrainte[1])
+            if nom_index is None:
+                continue
+            if contrainte[0] == 'egal':
+                return nom_index, contrainte
+            if choix is None:
+                choix = (nom_index, contrainte)
+        return choix
+
+    def positions_index(self, nom_table, nom_index, contrainte):
+        """les positions (triées) des lignes qui vérifient la contrainte, d'après l'index"""
+        with self.lecture(nom_table), self.verrou_index:
+            meta = self.meta_table(nom_table)
+            index = self.index_de_table(nom_table)[nom_index]
+            self.rattraper_index(nom_table, index, meta) #l'index doit couvrir toutes les lignes
+
+            if contrainte[0] == 'egal':
+                positions = index.egal(contrainte[2])
+            else:
+                positions = index.intervalle(*contrainte[2:])
+            return sorted(set(positions)) #dans l'ordre du fichier : lecture vers l'avant (sans doublon si IN (1, 1))
+
+
+#Les taches des parcours parallèles, exécutées dans les processus du pool (des fonctions du module : picklables)
+def lire_plage(dossier, nom_table, debut, nbr, colonnes, condition):
+    """les valeurs (tuples dans l'ordre des colonnes) des lignes gardées d'une plage"""
+    gestionnaire = GestionnaireDeTable(dossier, avec_journal=False) #le journal est rejoué par le programme principal
+    return [tuple(ligne.values()) for ligne in gestionnaire.lire_plage(nom_table, debut, nbr, colonnes, condition)]
+
+
+def agreger_plage(dossier, nom_table, debut, nbr, colonnes, condition, groupes, fonctions, types):
+    """les accumulateurs de chaque groupe pour les lignes gardées d'une plage"""
+    gestionnaire = GestionnaireDeTable(dossier, avec_journal=False)
+    agregation = agregats.Agregation(groupes, fonctions, types)
+    lignes = gestionnaire.lire_plage(nom_table, debut, nbr, colonnes, condition)
+    for nbr_lignes, lot in gestionnaire.lots_de_lignes(lignes, colonnes):
+        agregation.ajouter_lot(lot, nbr_lignes)
+    return agregation.etats
@@ -0,0 +1,189 @@
+"""
+Transactions : BEGIN, COMMIT, ROLLBACK
+
+Entre BEGIN et COMMIT, rien n'est écrit dans les tables : chaque table modifiée a un tampon en mémoire
+    lignes   : les lignes ajoutées par la transaction (INSERT, et les lignes validées modifiées par un UPDATE)
+    retirees : les _id des lignes validées supprimées ou modifiées par la transaction
+Les lectures de la session voient les lignes validées (sans les retirées) suivies des lignes du tampon.
+COMMIT fait tout en une opération du journal (tout ou rien) : par table, un DELETE des lignes retirées
+puis un seul ajout des lignes du tampon et une seule mise a jour de l'en-tête.
+ROLLBACK oublie les tampons.
+Un UPDATE d'une ligne validée devient donc au COMMIT une suppression et un ajout (meme _id)
+"""
+
+import itertools
+
+from serveur.stockage import generer_id, normaliser_valeur
+from serveur import format_fixe
+
+
+class Tampon:
+    """les écritures d'une transaction sur une table"""
+
+    def __init__(self, structure):
+        self.structure = structure
+        self.noms = [nom_col for nom_col, _ in structure]
+        self.lignes = [] #dictionnaires complets, dans l'ordre des colonnes
+        self.retirees = set() #_id des lignes validées a supprimer
+
+    def choisies(self, filtre):
+        """les lignes du tampon qui vérifient le filtre (appelé sur la liste des valeurs, comme a la lecture)"""
+        if filtre is None:
+            return list(self.lignes)
+        return [ligne for ligne in self.lignes if filtre(list(ligne.values())) is True]
+
+
+class Transaction:
+    """les tampons d'une session entre BEGIN et COMMIT / ROLLBACK, avec les memes méthodes que GestionnaireDeTable"""
+
+    def __init__(self, gestionnaire):
+        self.gestionnaire = gestionnaire
+        self.tampons = {} #nom_table -> Tampon
+
+    def tampon(self, nom_table):
+        tampon = self.tampons.get(nom_table)
+        if tampon is None:
+            tampon = self.tampons[nom_table] = Tampon(self.gestionnaire.lire_struct(nom_table))
+        return tampon
+
+    def verifier_modifiable(self, nom_table):
+        """UPDATE / DELETE demandent le format 2 (comme GestionnaireDeTable.ouvrir_modification)"""
+        version = self.gestionnaire.meta_table(nom_table)['version']
+        if version != format_fixe.VERSION_FIXE:
+            raise Exception(f"La table '{nom_table}' est au format {version} : MIGRATE TABLE {nom_table} d'abord")
+
+    #--- écritures : dans le tampon ---
+
+    def inserer_lignes(self, nom_table, lignes):
+        """ajoute les lignes au tampon de la table, renvoie leurs _id"""
+        tampon = self.tampon(nom_table)
+        ids = None
+        if dict(tampon.structure).get('_id') == 'BIGSERIAL': #numéros réservés dans l'en-tête de la table
+            manquants = sum(1 for valeurs in lignes if valeurs.get('_id') is None)
+            ids = iter(self.gestionnaire.reserver_ids(nom_table, manquants))
+        nouvelles = []
+        for valeurs in lignes:
+            ligne = {}
+            for nom_col, type_col in tampon.structure: #converties comme a l'écriture : relues telles quelles
+                valeur = valeurs.get(nom_col)
+                if nom_col == '_id' and valeur is None:
+                    valeur = generer_id() if ids is None else next(ids)
+                try:
+                    ligne[nom_col] = normaliser_valeur(valeur, type_col)
+                except ValueError:
+                    raise Exception(f"Valeur invalide pour la colonne {type_col} {nom_col} : {valeur!r}")
+            nouvelles.append(ligne)
+        tampon.lignes.extend(nouvelles) #tout le lot ou rien
+        return [ligne['_id'] for ligne in nouvelles]
+
+    def supprimer_lignes(self, nom_table, filtre=None, colonnes_filtre=(), positions=None):
+        """DELETE : les lignes validées sont retirées, celles du tampon oubliées. Renvoie le nombre de lignes"""
+        self.verifier_modifiable(nom_table)
+        tampon = self.tampon(nom_table)
+        validees = [ligne['_id'] for ligne in self.lignes_validees(nom_table, ['_id'], filtre, colonnes_filtre, positions)]
+        choisies = tampon.choisies(filtre)
+        tampon.retirees.update(validees)
+        if choisies:
+            identites = {id(ligne) for ligne in choisies}
+            tampon.lignes = [ligne for ligne in tampon.lignes if id(ligne) not in identites]
+        return len(validees) + len(choisies)
+
+    def modifier_lignes(self, nom_table, valeurs, filtre=None, colonnes_filtre=(), positions=None):
+        """UPDATE : les lignes du tampon sont modifiées, les lignes validées retirées et copiées modifiées dans le tampon"""
+        self.verifier_modifiable(nom_table)
+        tampon = self.tampon(nom_table)
+        modifications = self.gestionnaire.preparer_modifications(nom_table, tampon.structure, valeurs)
+        modifications = {tampon.noms[indice]: valeur for indice, valeur in modifications.items()}
+        validees = list(self.lignes_validees(nom_table, None, filtre, colonnes_filtre, positions))
+        choisies = tampon.choisies(filtre)
+        for ligne in choisies:
+            ligne.update(modifications)
+        for ligne in validees:
+            tampon.retirees.add(ligne['_id'])
+            ligne.update(modifications)
+            tampon.lignes.append(ligne)
+        return len(validees) + len(choisies)
+
+    #--- lectures : lignes validées puis lignes du tampon ---
+
+    def filtre_validees(self, nom_table, filtre, colonnes_filtre):
+        """le filtre des lignes validées, qui écarte aussi les lignes retirées par la transaction"""
+        tampon = self.tampons.get(nom_table)
+        if tampon is None or not tampon.retirees:
+            return filtre, colonnes_filtre
+        retirees = tampon.retirees
+        indice_id = tampon.noms.index('_id')
+        if filtre is None:
+            return (lambda valeurs: valeurs[indice_id] not in retirees), ('_id',)
+        return (lambda valeurs: valeurs[indice_id] not in retirees and filtre(valeurs)), (*colonnes_filtre, '_id')
+
+    def lignes_validees(self, nom_table, colonnes, filtre, colonnes_filtre, positions):
+        filtre, colonnes_filtre = self.filtre_validees(nom_table, filtre, colonnes_filtre)
+        return self.gestionnaire.iter_lignes(nom_table, colonnes, filtre, colonnes_filtre, positions=positions)
+
+    def iter_lignes(self, nom_table, colonnes=None, filtre=None, colonnes_filtre=(),
+                    positions=None, decalage=0, limite=None):
+        """comme GestionnaireDeTable.iter_lignes, avec les écritures de la transaction"""
+        tampon = self.tampons.get(nom_table)
+        if tampon is None: #table pas touchée par la transaction
+            return self.gestionnaire.iter_lignes(nom_table, colonnes, filtre, colonnes_filtre, positions=positions,
+                                                 decalage=decalage, limite=limite)
+        for col in colonnes or ():
+            if col not in tampon.noms:
+                raise Exception(f"Pas de colonne '{col}' dans '{nom_table}'")
+        ajoutees = tampon.choisies(filtre)
+        if colonnes is not None:
+            ajoutees = [{col: ligne[col] for col in colonnes} for ligne in ajoutees]
+        else:
+            ajoutees = [dict(ligne) for ligne in ajoutees] #copies : le client peut modifier ce qu'il lit
+        lignes = itertools.chain(self.lignes_validees(nom_table, colonnes, filtre, colonnes_filtre, positions), ajoutees)
+        if decalage or limite is not None:
+            return itertools.islice(lignes, decalage, None if limite is None else decalage + limite)
+        return lignes
+
+    def lots_colonnes(self, nom_table, colonnes, filtre=None, colonnes_filtre=(), positions=None):
+        """comme GestionnaireDeTable.lots_colonnes : les lots des lignes validées, puis un lot des lignes du tampon"""
+        filtre_validees, colonnes_validees = self.filtre_validees(nom_table, filtre, colonnes_filtre)
+        yield from self.gestionnaire.lots_colonnes(nom_table, colonnes, filtre_validees, colonnes_validees, positions)
+        tampon = self.tampons.get(nom_table)
+        if tampon is not None:
+            ajoutees = tampon.choisies(filtre)
+            if ajoutees:
+                lot = {}
+                for col in colonnes:
+                    valeurs = [ligne[col] for ligne in ajoutees]
+                    lot[col] = (valeurs, [valeur is None for valeur in valeurs])
+                yield len(ajoutees), lot
+
+    def compter_lignes(self, nom_table):
+        nbr = self.gestionnaire.compter_lignes(nom_table)
+        tampon = self.tampons.get(nom_table)
+        if tampon is not None:
+            nbr += len(tampon.lignes) - len(tampon.retirees)
+        return nbr
+
+    #--- fin de la transaction ---
+
+    def valider(self):
+        """COMMIT : toutes les tables en une seule opération du journal. Renvoie le nombre de lignes ajoutées ou supprimées"""
+        tampons = {nom: tampon for nom, tampon in self.tampons.items() if tampon.lignes or tampon.retirees}
+        nbr_lignes = 0
+        with self.gestionnaire.operation(*tampons):
+            for nom_table, tampon in tampons.items():
+                if tampon.retirees:
+                    retirees = tampon.retirees
+                    indice_id = tampon.noms.index('_id')
+                    contrainte = ('egal', '_id', list(retirees))
+                    nom_index, contrainte = self.gestionnaire.choisir_index(nom_table, [contrainte])
+                    positions = self.gestionnaire.positions_index(nom_table, nom_index, contrainte)
+                    nbr_lignes += self.gestionnaire.supprimer_lignes(
+                        nom_table, lambda valeurs: valeurs[indice_id] in retirees, ('_id',), positions
+                    )
+                if tampon.lignes:
+                    nbr_lignes += len(self.gestionnaire.inserer_lignes(nom_table, tampon.lignes))
+        self.tampons = {}
+        return nbr_lignes
+
+    def annuler(self):
+        """ROLLBACK : rien n'a été écrit, on oublie les tampons"""
+        self.tampons = {}
@@ -0,0 +1,101 @@
+"""
+Tri des résultats (ORDER BY)
+- avec LIMIT : un tas borné (heapq.nsmallest), la mémoire reste en O(LIMIT + OFFSET)
+- sans LIMIT : tri en mémoire tant que le résultat tient dans le budget, sinon tri externe :
+  des paquets triés ("runs") sont écrits dans des fichiers temporaires puis fusionnés (heapq.merge)
+"""
+
+import heapq #tas borné et fusion de listes triées
+import itertools
+import pickle #les lignes (dictionnaires) écrites dans les fichiers temporaires
+import tempfile
+
+LIGNES_PAR_ECRITURE = 1000 #lignes sérialisées ensemble dans un run
+FUSION_MAX = 64 #runs fusionnés a la fois (fichiers ouverts en meme temps)
+
+
+class Inverse:
+    """enveloppe une clé pour l'ordre décroissant (DESC) dans une clé de tri composée"""
+    __slots__ = ('valeur',)
+
+    def __init__(self, valeur):
+        self.valeur = valeur
+
+    def __lt__(self, autre):
+        return autre.valeur < self.valeur
+
+    def __eq__(self, autre):
+        return self.valeur == autre.valeur
+
+
+def fonction_cle(colonnes):
+    """
+    colonnes : [(nom dans la ligne, descendant)] -> fonction ligne -> clé de tri.
+    NULL est placé apres les valeurs en ASC, avant en DESC
+    """
+    def cle(ligne):
+        morceaux = []
+        for nom, descendant in colonnes:
+            valeur = ligne[nom]
+            morceau = (valeur is None, valeur)
+            morceaux.append(Inverse(morceau) if descendant else morceau)
+        return tuple(morceaux)
+    return cle
+
+
+def trier(lignes, cle, limite=None, decalage=0, lignes_max=100000):
+    """
+    les lignes triées selon cle, sans les 'decalage' premieres et au plus 'limite' (itérateur).
+    lignes_max : nbr de lignes triées en mémoire avant de passer au tri externe
+    """
+    lignes = iter(lignes) #les runs sont pris a la suite les uns des autres
+    try:
+        if limite is not None: #top-k : on ne garde jamais plus de limite + decalage lignes
+            return iter(heapq.nsmallest(limite + decalage, lignes, key=cle)[decalage:])
+
+        paquet = list(itertools.islice(lignes, lignes_max))
+        if len(paquet) < lignes_max: #tout tient dans le budget
+            paquet.sort(key=cle)
+            return itertools.islice(paquet, decalage, None)
+    except TypeError:
+        raise Exception("ORDER BY impossible : valeurs de types différents")
+    return itertools.islice(tri_externe(paquet, lignes, cle, lignes_max), decalage, None)
+
+
+def ecrire_run(lignes):
+    """écrit des lignes triées dans un fichier temporaire (supprimé a sa fermeture)"""
+    fichier = tempfile.TemporaryFile()
+    lignes = iter(lignes)
+    while True:
+        morceau = list(itertools.islice(lignes, LIGNES_PAR_ECRITURE))
+        if not morceau:
+            break
+        pickle.dump(morceau, fichier, pickle.HIGHEST_PROTOCOL)
+    fichier.seek(0)
+    return fichier
+
+
+def lire_run(fichier):
+    """relit un run, morceau par morceau, et ferme (supprime) le fichier a la fin"""
+    with fichier:
+        while True:
+            try:
+                morceau = pickle.load(fichier)
+            except EOFError:
+                return
+            yield from morceau
+
+
+def tri_externe(paquet, lignes, cle, lignes_max):
+    """trie par runs de lignes_max lignes écrits sur disque, puis les fusionne"""
+    runs = []
+    while paquet:
+        paquet.sort(key=cle)
+        runs.append(ecrire_run(paquet))
+        paquet = list(itertools.islice(lignes, lignes_max))
+
+    while len(runs) > FUSION_MAX: #trop de fichiers a la fois : on fusionne d'abord par groupes
+        groupe, runs = runs[:FUSION_MAX], runs[FUSION_MAX:]
+        runs.append(ecrire_run(heapq.merge(*[lire_run(run) for run in groupe], key=cle)))
+
+    return heapq.merge(*[lire_run(run) for run in runs], key=cle)
@@ -0,0 +1,142 @@
+"""
+Verrous des tables : plusieurs lectures en meme temps, ou une seule écriture
+- entre les threads d'un programme : compteurs protégés par une threading.Condition.
+  Une écriture en attente passe avant les nouvelles lectures (sinon un flot de SELECT l'affamerait)
+- entre programmes : verrou consultatif fcntl.flock sur table_<nom>.verrou, partagé pour les lectures,
+  exclusif pour l'écriture. Le fichier n'est jamais supprimé (un autre programme peut l'attendre).
+  Sans fcntl (Windows), seuls les threads sont protégés
+"""
+
+import os
+import threading
+
+try:
+    import fcntl #optionnel : verrous entre programmes
+    PARTAGE, EXCLUSIF, LIBERE = fcntl.LOCK_SH, fcntl.LOCK_EX, fcntl.LOCK_UN
+except ImportError:
+    fcntl = None
+    PARTAGE = EXCLUSIF = LIBERE = None
+
+
+class VerrouFichier:
+    """flock sur un fichier, pris une seule fois pour tous les threads du programme"""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.descripteur = None
+        self.mutex = threading.Lock()
+        self.partages = 0 #nbr de lectures du programme qui comptent sur le verrou partagé
+
+    def flock(self, operation):
+        if fcntl is None:
+            return
+        if self.descripteur is None:
+            self.descripteur = os.open(self.chemin, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.descripteur, operation)
+
+    def prendre_partage(self):
+        with self.mutex: #le premier lecteur attend les écrivains des autres programmes, les suivants en profitent
+            if self.partages == 0:
+                self.flock(PARTAGE)
+            self.partages += 1
+
+    def rendre_partage(self):
+        with self.mutex:
+            self.partages -= 1
+            if self.partages == 0:
+                self.flock(LIBERE)
+
+    def prendre_exclusif(self):
+        with self.mutex: #aucune lecture du programme en cours (voir VerrouTable)
+            self.flock(EXCLUSIF)
+
+    def rendre_exclusif(self):
+        with self.mutex:
+            self.flock(LIBERE)
+
+
+class VerrouTable:
+    """verrou lecture / écriture d'une table"""
+
+    def __init__(self, chemin_verrou):
+        self.condition = threading.Condition()
+        self.lecteurs = 0
+        self.ecrivain = False
+        self.ecrivains_en_attente = 0
+        self.fichier = VerrouFichier(chemin_verrou)
+
+    def prendre_lecture(self):
+        with self.condition:
+            while self.ecrivain or self.ecrivains_en_attente:
+                self.condition.wait()
+            self.lecteurs += 1
+        try:
+            self.fichier.prendre_partage()
+        except BaseException:
+            self.rendre_lecture_threads()
+            raise
+
+    def rendre_lecture(self):
+        self.fichier.rendre_partage()
+        self.rendre_lecture_threads()
+
+    def rendre_lecture_threads(self):
+        with self.condition:
+            self.lecteurs -= 1
+            if self.lecteurs == 0:
+                self.condition.notify_all()
+
+    def prendre_ecriture(self):
+        with self.condition:
+            self.ecrivains_en_attente += 1
+            try:
+                while self.ecrivain or self.lecteurs:
+                    self.condition.wait()
+            finally:
+                self.ecrivains_en_attente -= 1
+                self.condition.notify_all() #les lectures retenues par cette attente
+            self.ecrivain = True
+        try:
+            self.fichier.prendre_exclusif()
+        except BaseException:
+            self.rendre_ecriture_threads()
+            raise
+
+    def rendre_ecriture(self):
+        self.fichier.rendre_exclusif()
+        self.rendre_ecriture_threads()
+
+    def rendre_ecriture_threads(self):
+        with self.condition:
+            self.ecrivain = False
+            self.condition.notify_all()
+
+
+class LectureVerrouillee:
+    """itérateur sur des lignes lues sous le verrou de lecture de la table, rendu a la fin, a close() ou au ramasse-miettes"""
+
+    def __init__(self, lignes, rendre):
+        self.lignes = lignes
+        self.rendre = rendre
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.lignes)
+        except BaseException: #fin des lignes ou erreur de lecture
+            self.close()
+            raise
+
+    def close(self):
+        if self.rendre is not None:
+            rendre, self.rendre = self.rendre, None
+            try:
+                if hasattr(self.lignes, 'close'): #ferme le fichier de la table
+                    self.lignes.close()
+            finally:
+                rendre()
+
+    def __del__(self):
+        self.close()